@@ -7,7 +7,7 @@ import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from . import models, database
+from . import models, database, user_cache
 
 # Configurazione
 SECRET_KEY = os.getenv("JWT_SECRET", "change-me-in-prod")  # In produzione usare variabile d'ambiente
@@ -92,8 +92,8 @@ def authenticate_user(db: Session, email: str, password: str):
     
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    """Ottiene l'utente corrente dal token JWT"""
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)) -> user_cache.CachedUser:
+    """Ottiene l'utente corrente dal token JWT (snapshot in sola lettura, vedi user_cache)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -107,7 +107,8 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.Utente).filter(models.Utente.email == email).first()
+    # La sessione apre una connessione solo in caso di miss della cache
+    user = user_cache.get_user(email, db)
     if user is None:
         raise credentials_exception
     if not user.is_active:
@@ -144,3 +145,14 @@ def require_superadmin(current_user: models.Utente = Depends(get_current_active_
         raise HTTPException(status_code=403, detail="SuperAdmin access required")
     return current_user
 
+def require_superadmin_row(
+    current_user: models.Utente = Depends(require_superadmin),
+    db: Session = Depends(database.get_db),
+) -> models.Utente:
+    """Riga ORM del superadmin corrente, per gli endpoint che modificano l'utente stesso (2FA)"""
+    user = db.get(models.Utente, current_user.id)
+    if user is None or not user.is_active:
+        # Eliminato o disattivato da un altro processo dopo il caricamento in cache
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return user
+
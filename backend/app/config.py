@@ -9,3 +9,6 @@ BACKUPS_DIR = Path(os.getenv("BACKUPS_DIR", "/app/backups")).resolve()
 
 # Directory uploads (montata dal docker-compose)
 UPLOADS_DIR = Path(os.getenv("UPLOADS_DIR", "/app/uploads")).resolve()
+
+# Documenti privati (PDF finali firmati): fuori da uploads/, che è servito pubblicamente su /uploads
+DOCUMENTI_DIR = Path(os.getenv("DOCUMENTI_DIR", "/app/documenti")).resolve()
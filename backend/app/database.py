@@ -1,13 +1,107 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+import bisect
 import os
+import re
+import threading
+import time
 
 # Legge la stringa di connessione dalle variabili d'ambiente di Docker
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://admin:sistema54secure@db:5432/sistema54_db")
 
+# -------------------- POOL CONNESSIONI --------------------
+# Gli endpoint sincroni girano in un threadpool più grande del pool: dimensioni e timeout
+# configurabili permettono di adeguare il pool al numero di worker/thread.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # secondi di attesa massima per una connessione
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # secondi, -1 = mai
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = nessun limite
+
+# Limiti (ms) degli intervalli dell'istogramma dei tempi di attesa per una connessione
+POOL_WAIT_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool che misura quanto si attende per ottenere una connessione."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._wait_buckets = [0] * (len(POOL_WAIT_BUCKETS_MS) + 1)
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._checkouts = 0
+        self._timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            self._record_wait((time.perf_counter() - start) * 1000)
+
+    def _record_wait(self, wait_ms: float) -> None:
+        with self._stats_lock:
+            self._checkouts += 1
+            self._wait_total_ms += wait_ms
+            self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+            self._wait_buckets[bisect.bisect_left(POOL_WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            labels = [f"<={b}ms" for b in POOL_WAIT_BUCKETS_MS] + [f">{POOL_WAIT_BUCKETS_MS[-1]}ms"]
+            return {
+                "pid": os.getpid(),
+                "size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": self.overflow(),
+                "timeout_s": self._timeout,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_ms_total": round(self._wait_total_ms, 1),
+                "wait_ms_max": round(self._wait_max_ms, 1),
+                "wait_ms_histogram": dict(zip(labels, self._wait_buckets)),
+            }
+
+
+_connect_args = {}
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    _connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
 # Creazione Engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_connect_args,
+)
+
+
+def pool_stats() -> dict:
+    """Statistiche del pool del processo corrente (ogni worker uvicorn ha il proprio pool)."""
+    pool = engine.pool
+    if isinstance(pool, InstrumentedQueuePool):
+        return pool.stats()
+    return {"pid": os.getpid(), "status": pool.status()}
+# ------------------ /POOL CONNESSIONI ---------------------
 
 # Session Local: ogni richiesta avrà la sua sessione DB isolata
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -21,4 +115,84 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# -------------------- STRUMENTAZIONE SQL PER RICHIESTA --------------------
+# Conta le query e il tempo DB di ogni richiesta HTTP (vedi middleware in main.py).
+# Le statistiche vivono in una ContextVar: FastAPI copia il contesto nel threadpool degli
+# endpoint sincroni, quindi anche le query eseguite lì vengono attribuite alla richiesta.
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "1") == "1"
+# Numero di esecuzioni della stessa query (stessa forma) in una richiesta oltre cui si segnala un N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Liste IN espanse (id_1_1, id_1_2, ...): stessa forma indipendentemente dal numero di valori
+_EXPANDED_PARAMS_RE = re.compile(r"%\(([a-zA-Z_]+)_\d+(?:_\d+)?\)s(?:\s*,\s*%\(\1_\d+(?:_\d+)?\)s)*")
+
+
+class RequestSqlStats:
+    """Statistiche SQL di una singola richiesta."""
+
+    __slots__ = ("count", "duration_ms", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, duration_ms: float) -> None:
+        self.count += 1
+        self.duration_ms += duration_ms
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated_shapes(self, threshold: int = None):
+        """Forme di query eseguite almeno `threshold` volte (probabili N+1), più frequenti prima."""
+        threshold = SQL_N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+_request_sql_stats: ContextVar[Optional[RequestSqlStats]] = ContextVar("request_sql_stats", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    """Forma normalizzata di una query (i parametri sono già placeholder nel testo SQL)."""
+    shape = _WHITESPACE_RE.sub(" ", statement).strip()
+    return _EXPANDED_PARAMS_RE.sub(r"%(\1)s", shape)
+
+
+def start_request_sql_stats():
+    """Attiva il conteggio per la richiesta corrente; restituisce (stats, token) per il reset."""
+    stats = RequestSqlStats()
+    return stats, _request_sql_stats.set(stats)
+
+
+def stop_request_sql_stats(token) -> None:
+    _request_sql_stats.reset(token)
+
+
+if SQL_INSTRUMENTATION:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _sql_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _request_sql_stats.get() is not None:
+            conn.info.setdefault("_sql_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _sql_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_sql_stats.get()
+        if stats is None:
+            return
+        starts = conn.info.get("_sql_start")
+        if not starts:
+            return
+        stats.record(statement, (time.perf_counter() - starts.pop()) * 1000)
+
+    @event.listens_for(engine, "handle_error")
+    def _sql_handle_error(exception_context):
+        # La query fallita non arriva ad after_cursor_execute: scarta il suo tempo di inizio
+        conn = exception_context.connection
+        if conn is None or _request_sql_stats.get() is None:
+            return
+        starts = conn.info.get("_sql_start")
+        if starts:
+            starts.pop()
+# ------------------ /STRUMENTAZIONE SQL PER RICHIESTA ---------------------
@@ -0,0 +1,246 @@
+"""
+Gestione degli indici richiesti dall'applicazione (ricerca e paginazione).
+
+- Le ricerche `ILIKE '%q%'` (clienti, magazzino, RIT, DDT) non possono usare un B-tree:
+  senza un indice GIN trigram scansionano sempre l'intera tabella.
+- La paginazione a cursore (app.pagination) ordina per (data, id) e richiede indici
+  compositi con lo stesso ordinamento, così la pagina N costa quanto la pagina 1.
+- I controlli pianificati che cercano "l'ultimo record per chiave" (ultima lettura copie
+  di ogni asset) leggono una sola riga per chiave da un B-tree (chiave, data DESC).
+
+Qui è dichiarato l'elenco degli indici necessari, applicato in modo idempotente
+all'avvio (DB_ENSURE_INDEXES=1, default) oppure da riga di comando:
+
+    python -m app.db_indexes            # report indici presenti/mancanti/inutilizzati
+    python -m app.db_indexes --apply    # crea gli indici mancanti (CONCURRENTLY)
+"""
+import argparse
+import logging
+import sys
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Lock advisory per serializzare la creazione indici tra più worker uvicorn
+ADVISORY_LOCK_KEY = 54_000_001
+
+# Funzione IMMUTABLE usata dall'indice su ritiri_prodotti.prodotti (vedi search_service).
+# I campi vuoti vengono esclusi; \x1f separa i campi e \x1e i prodotti, così un termine
+# non può corrispondere "a cavallo" di due valori diversi.
+DDT_PRODOTTI_SEARCH_FUNCTION_DDL = r"""
+CREATE OR REPLACE FUNCTION ddt_prodotti_search_text(prodotti jsonb)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$
+    SELECT coalesce(string_agg(campi, E'\x1e'), '')
+    FROM (
+        SELECT concat_ws(
+            E'\x1f',
+            nullif(p->>'tipo_prodotto', ''),
+            nullif(p->>'marca', ''),
+            nullif(p->>'modello', ''),
+            nullif(p->>'serial_number', ''),
+            nullif(p->>'descrizione_prodotto', ''),
+            nullif(p->>'difetto_segnalato', ''),
+            nullif(p->>'difetto_appurato', '')
+        ) AS campi
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(prodotti) = 'array' THEN prodotti ELSE '[]'::jsonb END
+        ) AS p
+        WHERE jsonb_typeof(p) = 'object'
+    ) AS s
+    WHERE campi <> ''
+$$;
+"""
+
+# Prerequisiti eseguiti prima della creazione degli indici
+PREREQUISITES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    DDT_PRODOTTI_SEARCH_FUNCTION_DDL,
+]
+
+def _trgm(expression: str) -> str:
+    """Definizione di un indice GIN trigram; le espressioni vanno racchiuse tra parentesi."""
+    indexed = f"({expression})" if "(" in expression else expression
+    return f"USING gin ({indexed} gin_trgm_ops)"
+
+
+# (nome indice, tabella, definizione) - indici GIN trigram per le ricerche
+TRIGRAM_INDEXES = [
+    # Clienti (search_clienti, search_clienti_paginated)
+    ("ix_clienti_ragione_sociale_trgm", "clienti", _trgm("ragione_sociale")),
+    ("ix_clienti_p_iva_trgm", "clienti", _trgm("p_iva")),
+    ("ix_clienti_codice_fiscale_trgm", "clienti", _trgm("codice_fiscale")),
+    # Magazzino (read_magazzino)
+    ("ix_magazzino_codice_articolo_trgm", "magazzino", _trgm("codice_articolo")),
+    ("ix_magazzino_descrizione_trgm", "magazzino", _trgm("descrizione")),
+    # RIT (search_service.interventi_search_filter)
+    ("ix_interventi_numero_relazione_trgm", "interventi", _trgm("numero_relazione")),
+    ("ix_interventi_cliente_ragione_sociale_trgm", "interventi", _trgm("cliente_ragione_sociale")),
+    ("ix_dettagli_intervento_serial_number_trgm", "dettagli_intervento", _trgm("serial_number")),
+    ("ix_dettagli_intervento_part_number_trgm", "dettagli_intervento", _trgm("part_number")),
+    ("ix_dettagli_intervento_marca_modello_trgm", "dettagli_intervento", _trgm("marca_modello")),
+    ("ix_movimenti_ricambi_descrizione_trgm", "movimenti_ricambi", _trgm("descrizione")),
+    # DDT (search_service.ddt_search_filter)
+    ("ix_ritiri_prodotti_numero_ddt_trgm", "ritiri_prodotti", _trgm("numero_ddt")),
+    ("ix_ritiri_prodotti_cliente_ragione_sociale_trgm", "ritiri_prodotti", _trgm("cliente_ragione_sociale")),
+    ("ix_ritiri_prodotti_tipo_prodotto_trgm", "ritiri_prodotti", _trgm("tipo_prodotto")),
+    ("ix_ritiri_prodotti_marca_trgm", "ritiri_prodotti", _trgm("marca")),
+    ("ix_ritiri_prodotti_modello_trgm", "ritiri_prodotti", _trgm("modello")),
+    ("ix_ritiri_prodotti_prodotti_search_trgm", "ritiri_prodotti", _trgm("ddt_prodotti_search_text(prodotti)")),
+]
+
+# (nome indice, tabella, definizione) - B-tree compositi per la paginazione a cursore.
+# L'ordinamento (DESC, NULLS FIRST di default) coincide con app.pagination.keyset_order.
+KEYSET_INDEXES = [
+    ("ix_interventi_keyset", "interventi", "(data_creazione DESC, id DESC) WHERE deleted_at IS NULL"),
+    ("ix_ritiri_prodotti_keyset", "ritiri_prodotti", "(data_ritiro DESC, id DESC) WHERE deleted_at IS NULL"),
+    ("ix_audit_logs_keyset", "audit_logs", "(timestamp DESC, id DESC)"),
+]
+
+# (nome indice, tabella, definizione) - B-tree per i controlli pianificati
+SCHEDULER_INDEXES = [
+    # Ultima lettura per asset (main.asset_letture_in_scadenza)
+    ("ix_letture_copie_asset_data", "letture_copie", "(asset_id, data_lettura DESC)"),
+]
+
+REQUIRED_INDEXES = TRIGRAM_INDEXES + KEYSET_INDEXES + SCHEDULER_INDEXES
+
+
+def index_ddl(name: str, table: str, definition: str, concurrently: bool = True) -> str:
+    """DDL idempotente per un indice dichiarato."""
+    concurrent = "CONCURRENTLY " if concurrently else ""
+    return f"CREATE INDEX {concurrent}IF NOT EXISTS {name} ON {table} {definition}"
+
+
+def _required_names() -> List[str]:
+    return [name for name, _, _ in REQUIRED_INDEXES]
+
+
+def index_report(conn) -> Dict[str, List]:
+    """
+    Confronta gli indici dichiarati con quelli presenti nel database.
+
+    Returns:
+        dict con chiavi:
+        - present: indici dichiarati e validi
+        - missing: indici dichiarati ma assenti
+        - invalid: indici presenti ma non validi (es. CREATE CONCURRENTLY interrotto)
+        - unused: indici dichiarati mai usati dal planner dall'ultimo reset statistiche
+          (lista di dict con name, table, size)
+    """
+    names = _required_names()
+    rows = conn.execute(
+        text("""
+            SELECT c.relname AS name,
+                   t.relname AS table_name,
+                   i.indisvalid AS is_valid,
+                   coalesce(s.idx_scan, 0) AS idx_scan,
+                   pg_size_pretty(pg_relation_size(c.oid)) AS size
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            JOIN pg_class t ON t.oid = i.indrelid
+            LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = c.oid
+            WHERE c.relkind = 'i' AND c.relname = ANY(:names)
+        """),
+        {"names": names},
+    ).mappings().all()
+    found = {row["name"]: row for row in rows}
+
+    report = {"present": [], "missing": [], "invalid": [], "unused": []}
+    for name in names:
+        row = found.get(name)
+        if row is None:
+            report["missing"].append(name)
+        elif not row["is_valid"]:
+            report["invalid"].append(name)
+        else:
+            report["present"].append(name)
+            if row["idx_scan"] == 0:
+                report["unused"].append({"name": name, "table": row["table_name"], "size": row["size"]})
+    return report
+
+
+def ensure_indexes(engine: Engine) -> Dict[str, List]:
+    """
+    Crea in modo idempotente gli indici dichiarati mancanti.
+
+    Usa CREATE INDEX CONCURRENTLY (nessun lock in scrittura sulle tabelle) in autocommit;
+    gli indici rimasti INVALID da un tentativo interrotto vengono eliminati e ricreati.
+    Un advisory lock evita che più worker creino gli stessi indici in parallelo.
+
+    Returns:
+        il report di index_report() arricchito con `created` ed `errors`.
+    """
+    created: List[str] = []
+    errors: List[Dict[str, str]] = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # La creazione di un indice può durare ben oltre DB_STATEMENT_TIMEOUT_MS
+        conn.execute(text("SET statement_timeout = 0"))
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            for ddl in PREREQUISITES:
+                conn.execute(text(ddl))
+
+            report = index_report(conn)
+            for name in report["invalid"]:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+            to_create = set(report["missing"]) | set(report["invalid"])
+            for name, table, definition in REQUIRED_INDEXES:
+                if name not in to_create:
+                    continue
+                try:
+                    conn.execute(text(index_ddl(name, table, definition)))
+                    created.append(name)
+                    logger.info(f"[DB INDEXES] Creato indice {name} su {table}")
+                except Exception as e:
+                    errors.append({"name": name, "error": str(e)})
+                    logger.error(f"[DB INDEXES] Errore creazione indice {name}: {e}")
+
+            report = index_report(conn)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+    report["created"] = created
+    report["errors"] = errors
+    return report
+
+
+def _print_report(report: Dict[str, List]) -> None:
+    print(f"✅ Presenti: {len(report['present'])}/{len(REQUIRED_INDEXES)}")
+    for name in report.get("created", []):
+        print(f"  + creato: {name}")
+    for name in report["missing"]:
+        print(f"  ❌ mancante: {name}")
+    for name in report["invalid"]:
+        print(f"  ⚠️ non valido: {name}")
+    for item in report["unused"]:
+        print(f"  ℹ️ mai usato: {item['name']} ({item['table']}, {item['size']})")
+    for item in report.get("errors", []):
+        print(f"  ❌ errore {item['name']}: {item['error']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Verifica/crea gli indici di ricerca e paginazione.")
+    parser.add_argument("--apply", action="store_true", help="Crea gli indici mancanti")
+    args = parser.parse_args(argv)
+
+    from .database import engine
+
+    if args.apply:
+        report = ensure_indexes(engine)
+    else:
+        with engine.connect() as conn:
+            report = index_report(conn)
+    _print_report(report)
+    return 1 if report["missing"] or report["invalid"] or report.get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Listener LISTEN/NOTIFY condiviso dalle cache di processo.
+
+Ogni processo (worker uvicorn, scheduler) tiene una sola connessione dedicata in LISTEN
+su tutti i canali registrati con subscribe(). Le notifiche arrivano dai trigger creati
+dalle migrazioni (migrate_impostazioni_notify.py, migrate_utenti_notify.py), quindi
+anche le modifiche fatte fuori dall'applicazione invalidano le cache.
+
+Le callback ricevono il payload della notifica oppure None quando il listener si
+(ri)collega: le notifiche perse nel frattempo non arriveranno più, la cache va svuotata.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from . import database
+
+logger = logging.getLogger(__name__)
+
+DB_LISTEN = os.getenv("DB_LISTEN", "1") == "1"
+_LISTENER_RETRY_SECONDS = 5
+_LISTENER_KEEPALIVE_SECONDS = 60
+
+_lock = threading.Lock()
+_subscribers: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+_stats = {
+    "connected": False,
+    "errors": 0,
+    "notifications": 0,
+}
+
+
+def subscribe(channel: str, callback: Callable[[Optional[str]], None]) -> None:
+    """Registra `callback` sul canale (da chiamare all'import, prima di start_listener)."""
+    with _lock:
+        _subscribers.setdefault(channel, []).append(callback)
+
+
+def listener_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats["channels"] = sorted(_subscribers)
+    return stats
+
+
+def _dispatch(channel: str, payload: Optional[str]) -> None:
+    with _lock:
+        callbacks = list(_subscribers.get(channel, ()))
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception as e:
+            logger.warning(f"[DB NOTIFY] Callback su {channel} fallita: {e}")
+
+
+def _set_connected(connected: bool) -> None:
+    with _lock:
+        _stats["connected"] = connected
+
+
+def _listen_once() -> None:
+    # Connessione dedicata, sottratta al pool: resta in LISTEN per tutta la vita del processo
+    fairy = database.engine.raw_connection()
+    fairy.detach()
+    conn = fairy.dbapi_connection
+    try:
+        conn.autocommit = True
+        with _lock:
+            channels = sorted(_subscribers)
+        with conn.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f"LISTEN {channel}")
+        _set_connected(True)
+        for channel in channels:
+            _dispatch(channel, None)
+        while True:
+            readable, _, _ = select.select([conn], [], [], _LISTENER_KEEPALIVE_SECONDS)
+            if not readable:
+                # Nessuna notifica: verifica che la connessione sia ancora viva
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                continue
+            conn.poll()
+            if conn.notifies:
+                notifies = list(conn.notifies)
+                conn.notifies.clear()
+                with _lock:
+                    _stats["notifications"] += len(notifies)
+                for notify in notifies:
+                    _dispatch(notify.channel, notify.payload)
+    finally:
+        _set_connected(False)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _listen_forever() -> None:
+    while True:
+        try:
+            _listen_once()
+        except Exception as e:
+            with _lock:
+                _stats["errors"] += 1
+            logger.warning(f"[DB NOTIFY] Listener interrotto: {e}")
+        time.sleep(_LISTENER_RETRY_SECONDS)
+
+
+_listener_started = False
+
+
+def start_listener() -> None:
+    """Avvia (una volta per processo) il thread che ascolta i canali registrati."""
+    global _listener_started
+    if not DB_LISTEN or _listener_started:
+        return
+    _listener_started = True
+    threading.Thread(target=_listen_forever, name="db-notify-listener", daemon=True).start()
@@ -0,0 +1,103 @@
+"""
+Sparse fieldsets per gli endpoint elenco (`?fields=id,ragione_sociale,sedi`).
+
+Con `fields` la risposta contiene solo i campi richiesti (più `id`, sempre presente):
+- la SELECT legge solo le colonne necessarie (load_only)
+- le relazioni vengono caricate solo se richieste esplicitamente; le altre sono in
+  raiseload, così un accesso involontario emerge subito invece di generare query N+1
+- il payload viene validato con uno schema ridotto, derivato da quello completo
+
+Senza `fields` gli endpoint restituiscono lo schema completo come prima.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, raiseload
+
+from .serialization import dump_many
+
+FIELDS_QUERY_DESCRIPTION = (
+    "Campi da restituire separati da virgola (es. id,ragione_sociale). "
+    "Le relazioni sono incluse solo se elencate; vuoto = tutti i campi"
+)
+
+
+@lru_cache(maxsize=None)
+def _narrow_schema(schema: Type[BaseModel], names: Tuple[str, ...]) -> Type[BaseModel]:
+    """Schema con i soli campi `names`: tipi, default e validatori restano quelli di `schema`."""
+    fields = {name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in names}
+    return create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **fields,
+    )
+
+
+class FieldSet:
+    """
+    Campi selezionabili di un endpoint elenco.
+
+    - schema: schema di risposta completo (definisce i campi ammessi)
+    - model: modello ORM interrogato
+    - relations: campo -> opzioni di caricamento necessarie (relazioni o property che
+      leggono relazioni, es. tecnico_nome -> joinedload(tecnico_rel))
+    - load_always: colonne lette comunque (es. la colonna di ordinamento del cursore)
+    """
+
+    def __init__(
+        self,
+        schema: Type[BaseModel],
+        model,
+        relations: Optional[Dict[str, Sequence[Any]]] = None,
+        load_always: Sequence[str] = (),
+    ):
+        self.schema = schema
+        self.model = model
+        self.relations = dict(relations or {})
+        self.load_always = tuple(load_always)
+        column_keys = {attr.key for attr in inspect(model).column_attrs}
+        self.allowed = tuple(schema.model_fields)
+        self.columns = {name for name in self.allowed if name in column_keys}
+        missing = set(self.allowed) - self.columns - set(self.relations)
+        if missing:
+            # Errore di configurazione: ogni campo dello schema deve essere una colonna o una relazione dichiarata
+            raise ValueError(f"{schema.__name__}: campi senza colonna o relazione: {', '.join(sorted(missing))}")
+
+    def parse(self, raw: Optional[str]) -> Optional[Tuple[str, ...]]:
+        """Valida il parametro `fields`; None = nessuna selezione (schema completo)."""
+        if raw is None or not raw.strip():
+            return None
+        requested = {name.strip() for name in raw.split(",") if name.strip()}
+        unknown = sorted(requested - set(self.allowed))
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Campi non validi: {', '.join(unknown)} (ammessi: {', '.join(self.allowed)})",
+            )
+        requested.add("id")
+        # Ordine dei campi come nello schema completo
+        return tuple(name for name in self.allowed if name in requested)
+
+    def query_options(self, names: Optional[Tuple[str, ...]], default: Sequence[Any] = ()) -> List[Any]:
+        """
+        Opzioni della query: `default` senza selezione, altrimenti colonne con load_only e
+        relazioni solo se richieste.
+        """
+        if names is None:
+            return list(default)
+        columns = [name for name in names if name in self.columns]
+        columns += [name for name in self.load_always if name not in columns]
+        options = [load_only(*(getattr(self.model, name) for name in columns))]
+        for name in names:
+            options.extend(self.relations.get(name, ()))
+        options.append(raiseload("*"))
+        return options
+
+    def dump(self, items: Iterable[Any], names: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+        """Serializza gli elementi con lo schema completo o, con `names`, con lo schema ridotto."""
+        if names is None:
+            return dump_many(self.schema, items)
+        return dump_many(_narrow_schema(self.schema, names), items)
@@ -0,0 +1,177 @@
+"""
+GET condizionali: ETag forti, Last-Modified e risposte 304.
+
+Gli endpoint calcolano l'ETag da una versione economica da leggere (updated_at della
+riga, o max(updated_at) per gli aggregati) e, se il client ha già quella versione
+(If-None-Match / If-Modified-Since), rispondono 304 prima di caricare e serializzare
+il contenuto. Cache-Control viene scelto per endpoint: le risposte autenticate sono
+`private, no-cache` (il browser le conserva ma le rivalida sempre), quelle pubbliche
+possono essere riutilizzate anche da nginx.
+
+file_response() serve un file archiviato (PDF finali) con ETag, 304 e richieste
+Range a intervallo singolo (206 / 416). GZipSenzaPDF esclude dalla compressione i
+download PDF e le richieste Range, i cui Content-Range/Content-Length si riferiscono
+ai byte del file.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
+
+# Dati autenticati: conservati solo dal browser e sempre rivalidati con l'ETag
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """ETag forte dalle parti che identificano la versione (tipo, id, updated_at, ...)."""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _to_utc(value: datetime) -> datetime:
+    # I timestamp del DB sono naive in ora locale del server (datetime.now)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def cache_headers(etag: str, cache_control: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_to_utc(last_modified), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """True se il client ha già la versione corrente (If-None-Match ha la precedenza)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Confronto debole come da RFC 9110: un proxy con gzip può trasformare l'ETag in W/"..."
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return _to_utc(last_modified) <= since
+    return False
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def _byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (inizio, fine) inclusi di un header "Range: bytes=..." a intervallo singolo.
+    None se l'header va ignorato (unità diversa, più intervalli, sintassi non valida,
+    ultima posizione minore della prima come "bytes=5-2": RFC 9110 lo considera non valido);
+    ValueError se l'intervallo non è soddisfacibile (416).
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Più intervalli: RFC 9110 consente di rispondere con il file intero
+        return None
+    start, sep, end = spec.strip().partition("-")
+    if not sep or not (start or end) or (start and not start.isdigit()) or (end and not end.isdigit()):
+        return None
+    if not start:
+        # "bytes=-N": ultimi N byte
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError("intervallo vuoto")
+        return max(size - length, 0), size - 1
+    first = int(start)
+    last = int(end) if end else size - 1
+    if last < first:
+        return None
+    if first >= size:
+        raise ValueError("intervallo fuori dal file")
+    return first, min(last, size - 1)
+
+
+def _read_range(path: Path, start: int, end: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def file_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    etag: str,
+    headers: Optional[Dict[str, str]] = None,
+    cache_control: str = PRIVATE_REVALIDATE,
+) -> Response:
+    """
+    Risposta per un file immutabile su disco: 304 se il client ha già `etag`, 206 per
+    un Range valido (anche con If-Range uguale all'ETag), 416 se fuori dal file,
+    altrimenti il file intero in streaming.
+    """
+    stat = path.stat()
+    last_modified = datetime.fromtimestamp(stat.st_mtime)
+    response_headers = {
+        **cache_headers(etag, cache_control, last_modified),
+        "Accept-Ranges": "bytes",
+        **(headers or {}),
+    }
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(response_headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = _byte_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**response_headers, "Content-Range": f"bytes */{stat.st_size}"},
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                _read_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **response_headers,
+                    "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                    "Content-Length": str(end - start + 1),
+                },
+            )
+
+    return FileResponse(path, media_type=media_type, headers=response_headers, stat_result=stat)
+
+
+class GZipSenzaPDF(GZipMiddleware):
+    """
+    GZipMiddleware che lascia passare invariati i download PDF (path che finiscono in
+    /pdf) e le richieste con Range: comprimere un PDF rende poco e renderebbe errati
+    Content-Range/Content-Length dei 206.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and (
+            scope["path"].endswith("/pdf") or "range" in Headers(scope=scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
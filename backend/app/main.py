@@ -1,20 +1,28 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, status, UploadFile, File, Query, Request
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer, joinedload, selectinload
 from sqlalchemy.orm.attributes import flag_modified
-from sqlalchemy import desc, or_, and_
+from sqlalchemy import Date, Integer, and_, case, cast, column, desc, exists, func, or_, select, true, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List, Optional
 from datetime import datetime, timedelta, time as dt_time
 from fastapi.responses import Response, FileResponse
-from starlette.middleware.gzip import GZipMiddleware
-from . import models, schemas, database, auth
-from .services import pdf_service, email_service, two_factor_service
+from . import models, schemas, database, auth, db_indexes
+from .services import email_service, two_factor_service, search_service, versioni_service, ddt_contatori_service, pdf_cache, pdf_render_pool, pdf_finali_service, email_outbox, job_queue
+from .services import job_handlers  # registra anche gli handler dei job
 from .services.backup_service import list_backups, create_backup, delete_backup, restore_backup, get_backup_info, get_backup_status
 from .routers.auth import router as auth_router
-from .routers.impostazioni import router as impostazioni_router, get_settings_or_default as get_settings_or_default_cached
+from .routers.impostazioni import router as impostazioni_router
 from .routers.backups import router as backups_router
+from .routers.firme import router as firme_router
+from .routers.jobs import router as jobs_router
 from .utils import get_default_permessi
+from .pagination import DEFAULT_TOTAL_CAP, fetch_offset_page, fetch_page
+from .serialization import dump_many, json_response, rows_to_dicts
+from .fieldsets import FIELDS_QUERY_DESCRIPTION, FieldSet
+from .http_cache import PRIVATE_REVALIDATE, GZipSenzaPDF, cache_headers, is_not_modified, make_etag, not_modified_response
+from . import db_notify, settings_cache, user_cache
 from .audit_logger import log_action, get_changes_dict
 from .validators import validate_partita_iva, validate_codice_fiscale, sanitize_input, sanitize_email, sanitize_text_field
 import os
@@ -25,8 +33,11 @@ import logging
 from pathlib import Path
 import asyncio
 import re
+import threading
+import time
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from fastapi.responses import JSONResponse
 import traceback
 
@@ -61,6 +72,9 @@ class StructuredFormatter(logging.Formatter):
             log_data["request_id"] = record.request_id
         if hasattr(record, 'endpoint'):
             log_data["endpoint"] = record.endpoint
+        if hasattr(record, 'sql_queries'):
+            log_data["sql_queries"] = record.sql_queries
+            log_data["sql_ms"] = record.sql_ms
         
         # Aggiungi exception info se presente
         if record.exc_info:
@@ -110,24 +124,104 @@ def convert_intervento_time_fields(intervento: models.Intervento) -> dict:
             data[key] = value.strftime('%H:%M')
         else:
             data[key] = value
+    # Le firme sono property (data URI risolto dalla tabella firme), non compaiono in __dict__
+    data['firma_tecnico'] = intervento.firma_tecnico
+    data['firma_cliente'] = intervento.firma_cliente
     return data
 
+# Caricamento eager delle relazioni serializzate nelle risposte: una query per relazione
+# (selectinload per le collezioni, JOIN per i tecnici many-to-one) invece di una per riga.
+INTERVENTO_RELAZIONI_OPTIONS = (
+    selectinload(models.Intervento.dettagli),
+    selectinload(models.Intervento.ricambi_utilizzati),
+)
+DDT_TECNICI_OPTIONS = (
+    joinedload(models.RitiroProdotto.tecnico_rel),
+    joinedload(models.RitiroProdotto.tecnico_assegnato_rel),
+    joinedload(models.RitiroProdotto.tecnico_pending_rel),
+)
+CLIENTE_RELAZIONI_OPTIONS = (
+    selectinload(models.Cliente.sedi),
+    selectinload(models.Cliente.assets_noleggio),
+)
+
+# Opzioni di caricamento per le viste elenco: le firme inline (PNG base64, decine di KB per
+# riga sui record non ancora migrati nella tabella firme) non vengono lette dal DB;
+# raiseload segnala subito un accesso involontario. Le firme restano disponibili dagli
+# endpoint di dettaglio e da /firme/{hash}.
+INTERVENTO_LIST_OPTIONS = INTERVENTO_RELAZIONI_OPTIONS + (
+    defer(models.Intervento.firma_tecnico_inline, raiseload=True),
+    defer(models.Intervento.firma_cliente_inline, raiseload=True),
+)
+DDT_LIST_OPTIONS = DDT_TECNICI_OPTIONS + (
+    defer(models.RitiroProdotto.firma_tecnico_inline, raiseload=True),
+    defer(models.RitiroProdotto.firma_cliente_inline, raiseload=True),
+)
+
+# Campi selezionabili con ?fields= sugli endpoint elenco (vedi fieldsets.py)
+CLIENTI_FIELDS = FieldSet(
+    schemas.ClienteResponse, models.Cliente,
+    relations={
+        "sedi": (selectinload(models.Cliente.sedi),),
+        "assets_noleggio": (selectinload(models.Cliente.assets_noleggio),),
+    },
+)
+INTERVENTI_FIELDS = FieldSet(
+    schemas.InterventoSummaryResponse, models.Intervento,
+    relations={
+        "dettagli": (selectinload(models.Intervento.dettagli),),
+        "ricambi_utilizzati": (selectinload(models.Intervento.ricambi_utilizzati),),
+    },
+    load_always=("data_creazione",),  # colonna del cursore keyset
+)
+DDT_FIELDS = FieldSet(
+    schemas.RitiroProdottoSummaryResponse, models.RitiroProdotto,
+    relations={
+        "tecnico_nome": (joinedload(models.RitiroProdotto.tecnico_rel),),
+        "tecnico_assegnato_nome": (joinedload(models.RitiroProdotto.tecnico_assegnato_rel),),
+        "tecnico_assegnazione_pending_nome": (joinedload(models.RitiroProdotto.tecnico_pending_rel),),
+    },
+    load_always=("data_ritiro",),  # colonna del cursore keyset
+)
+MAGAZZINO_FIELDS = FieldSet(schemas.ProdottoResponse, models.ProdottoMagazzino)
+
 # Creazione Tabelle (In produzione useremo Alembic, per ora va bene così)
 models.Base.metadata.create_all(bind=database.engine)
 
-# Set globale per tracciare gli interventi per cui l'email è già stata programmata
-# Questo evita di inviare email multiple quando vengono create più letture copie rapidamente
-_interventi_email_programmate = set()
-# Set globale per evitare duplicati promemoria DDT (chiave: (ddt_id, soglia_giorni))
-_ddt_reminder_sent = set()
+# Indici di ricerca (trigram) e paginazione (keyset): idempotente, in background per non ritardare l'avvio
+def _ensure_search_indexes():
+    try:
+        report = db_indexes.ensure_indexes(database.engine)
+        if report["created"]:
+            logger.info(f"[DB INDEXES] Indici creati: {', '.join(report['created'])}")
+        if report["missing"] or report["invalid"]:
+            logger.warning(f"[DB INDEXES] Indici mancanti: {report['missing']}, non validi: {report['invalid']}")
+        if report["unused"]:
+            logger.info(f"[DB INDEXES] Indici mai usati: {[i['name'] for i in report['unused']]}")
+    except Exception as e:
+        logger.warning(f"[DB INDEXES] Verifica indici fallita: {e}")
+
+if os.getenv("DB_ENSURE_INDEXES", "1") == "1":
+    threading.Thread(target=_ensure_search_indexes, name="ensure-search-indexes", daemon=True).start()
+
+# Invalidazione delle cache di processo (impostazioni, utenti) quando un altro processo modifica le righe
+db_notify.start_listener()
+
+# Processi di rendering PDF avviati e riscaldati subito (template, CSS, font)
+pdf_render_pool.start()
+
+# Worker della coda job nel processo API (con un servizio `python -m app.worker` dedicato: JOBS_WORKER_EMBEDDED=0)
+if job_queue.JOBS_WORKER_EMBEDDED:
+    job_queue.avvia_in_background()
+
 
 app = FastAPI(title="SISTEMA54 Digital API - CMMS")
 
 # -------------------- GZIP COMPRESSION --------------------
 # Compressione automatica delle risposte (minimo 500 bytes per attivare la compressione)
-# Comprime automaticamente JSON, HTML, CSS, JS, XML, ecc.
+# Comprime automaticamente JSON, HTML, CSS, JS, XML, ecc. (non i download PDF e le richieste Range)
 app.add_middleware(
-    GZipMiddleware,
+    GZipSenzaPDF,
     minimum_size=500,  # Comprimi solo se la risposta è > 500 bytes
     compresslevel=6    # Livello di compressione bilanciato (1-9, 6 è un buon compromesso)
 )
@@ -404,6 +498,41 @@ async def _security_headers_middleware(request: Request, call_next):
     
     return resp
 # ------------------ /SECURITY HEADERS ---------------------
+
+# -------------------- SQL PER RICHIESTA (Server-Timing / N+1) --------------------
+def _endpoint_name(request: Request) -> str:
+    endpoint = request.scope.get("endpoint")
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    name = getattr(endpoint, "__name__", "?")
+    return f"{request.method} {path} ({name})"
+
+@app.middleware("http")
+async def _sql_stats_middleware(request: Request, call_next):
+    """Conta query e tempo DB della richiesta: header Server-Timing, log e avviso N+1."""
+    if not database.SQL_INSTRUMENTATION:
+        return await call_next(request)
+
+    stats, token = database.start_request_sql_stats()
+    try:
+        resp = await call_next(request)
+    finally:
+        database.stop_request_sql_stats(token)
+
+    if stats.count:
+        resp.headers["Server-Timing"] = f'db;dur={stats.duration_ms:.1f};desc="{stats.count} query"'
+        endpoint = _endpoint_name(request)
+        logger.debug(
+            f"[SQL] {endpoint}: {stats.count} query, {stats.duration_ms:.1f} ms",
+            extra={"endpoint": endpoint, "sql_queries": stats.count, "sql_ms": round(stats.duration_ms, 1)},
+        )
+        for shape, n in stats.repeated_shapes():
+            logger.warning(
+                f"[SQL] Possibile N+1 in {endpoint}: query eseguita {n} volte: {shape[:300]}",
+                extra={"endpoint": endpoint, "sql_queries": stats.count, "sql_ms": round(stats.duration_ms, 1)},
+            )
+    return resp
+# ------------------ /SQL PER RICHIESTA ---------------------
 # ------------------ /CORS ----------------------
 
 # Collega il limiter al router auth (per evitare circular imports)
@@ -437,6 +566,8 @@ app.include_router(v1.router_v1)
 app.include_router(auth_router)
 app.include_router(impostazioni_router)
 app.include_router(backups_router)
+app.include_router(firme_router)
+app.include_router(jobs_router)
 
 # Middleware per aggiungere deprecation warning agli endpoint vecchi /api/ (escludendo /api/v1/)
 @app.middleware("http")
@@ -479,16 +610,7 @@ def check_scadenze_contratti():
         oggi = datetime.now().date()
         
         # Ottieni impostazioni azienda
-        settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings:
-            settings = models.ImpostazioniAzienda(
-                nome_azienda="GIT - Gestione Interventi Tecnici",
-                indirizzo_completo="Configurazione Richiesta",
-                tariffe_categorie={}
-            )
-            db.add(settings)
-            db.commit()
-            db.refresh(settings)
+        settings = settings_cache.get_settings(db)
         
         if not settings.contratti_alert_abilitato:
             return
@@ -774,15 +896,17 @@ def check_scadenze_contratti():
         db.close()
 
 # --- FUNZIONE HELPER PER CALCOLARE GIORNI DA CADENZA ---
+# Giorni per cadenza letture copie (usati anche nel CASE SQL di check_scadenze_letture_copie)
+GIORNI_CADENZA_LETTURE = {
+    "mensile": 30,
+    "bimestrale": 60,
+    "trimestrale": 90,
+    "semestrale": 180
+}
+
 def get_giorni_da_cadenza(cadenza: str) -> int:
     """Converte la cadenza letture copie in giorni"""
-    cadenze = {
-        "mensile": 30,
-        "bimestrale": 60,
-        "trimestrale": 90,
-        "semestrale": 180
-    }
-    return cadenze.get(cadenza or "trimestrale", 90)  # Default trimestrale
+    return GIORNI_CADENZA_LETTURE.get(cadenza or "trimestrale", 90)  # Default trimestrale
 
 def get_mesi_da_cadenza(cadenza: str) -> int:
     """Converte la cadenza letture copie in numero di mesi"""
@@ -802,22 +926,63 @@ def parse_email_list(value: Optional[str]) -> set:
     return {p.strip() for p in parts if p and p.strip()}
 
 # --- FUNZIONE PER CONTROLLARE SCADENZE LETTURE COPIE ---
+def asset_letture_in_scadenza(db: Session, soglie_giorni: List[int], adesso: Optional[datetime] = None) -> list:
+    """
+    Asset Printing la cui prossima lettura copie scade tra un numero di giorni in `soglie_giorni`,
+    in una sola query: ultima lettura per asset (subquery correlata con LIMIT 1 sull'indice
+    ix_letture_copie_asset_data), cadenza convertita in giorni con un CASE e scadenza calcolata
+    nel database. Senza letture il riferimento è la data di installazione (o adesso).
+    Righe ordinate per cliente: (asset, ragione_sociale, cadenza, data_riferimento, ultima_lettura, scadenza).
+    """
+    adesso = adesso or datetime.now()
+    Asset = models.AssetCliente
+    cadenza = func.coalesce(func.nullif(Asset.cadenza_letture_copie, ""), "trimestrale")
+    giorni_cadenza = case(GIORNI_CADENZA_LETTURE, value=cadenza, else_=90)
+    ultima_lettura = (
+        select(models.LetturaCopie.data_lettura)
+        .where(models.LetturaCopie.asset_id == Asset.id)
+        .order_by(desc(models.LetturaCopie.data_lettura))
+        .limit(1)
+        .correlate(Asset)
+        .scalar_subquery()
+    )
+    ultime = (
+        select(
+            Asset.id.label("asset_id"),
+            cadenza.label("cadenza"),
+            giorni_cadenza.label("giorni_cadenza"),
+            ultima_lettura.label("ultima_lettura"),
+        )
+        .where(Asset.tipo_asset == "Printing")
+        .subquery()
+    )
+    riferimento = func.coalesce(ultime.c.ultima_lettura, Asset.data_installazione, adesso)
+    scadenza = riferimento + func.make_interval(0, 0, 0, ultime.c.giorni_cadenza)
+    date_scadenza = [(adesso + timedelta(days=giorni)).date() for giorni in soglie_giorni]
+    return db.query(
+        Asset,
+        models.Cliente.ragione_sociale,
+        ultime.c.cadenza,
+        riferimento.label("data_riferimento"),
+        ultime.c.ultima_lettura,
+        scadenza.label("scadenza"),
+    ).join(
+        ultime, ultime.c.asset_id == Asset.id
+    ).join(
+        models.Cliente, models.Cliente.id == Asset.cliente_id
+    ).filter(
+        cast(scadenza, Date).in_(date_scadenza)
+    ).order_by(Asset.cliente_id, Asset.id).all()
+
+
 def check_scadenze_letture_copie():
-    """Controlla le scadenze delle letture copie e invia alert 7 giorni prima della scadenza basata sulla cadenza configurata"""
+    """Controlla le scadenze delle letture copie e invia alert ai giorni configurati prima della scadenza basata sulla cadenza"""
+    inizio = time.perf_counter()
     db = next(database.get_db())
     try:
-        # Trova tutti gli asset Printing a noleggio
-        assets_printing = db.query(models.AssetCliente).filter(
-            models.AssetCliente.tipo_asset == "Printing"
-        ).all()
-        
-        if not assets_printing:
-            print("Nessun asset Printing trovato")
-            return
-        
         # Ottieni impostazioni azienda
-        settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings or not settings.letture_copie_alert_abilitato:
+        settings = settings_cache.get_settings(db)
+        if not settings.letture_copie_alert_abilitato:
             return
 
         recipients_promemoria = parse_email_list(settings.letture_copie_alert_emails)
@@ -836,60 +1001,31 @@ def check_scadenze_letture_copie():
         if not soglie_giorni:
             return
         
+        righe = asset_letture_in_scadenza(db, soglie_giorni)
+        durata_query = time.perf_counter() - inizio
+        
         # Raggruppa per cliente
         clienti_da_notificare: dict = {}
-        
-        for asset in assets_printing:
-            # Ottieni cadenza letture copie (default trimestrale)
-            cadenza = asset.cadenza_letture_copie or "trimestrale"
-            giorni_cadenza = get_giorni_da_cadenza(cadenza)
-            
-            # Ottieni ultima lettura
-            ultima_lettura = db.query(models.LetturaCopie).filter(
-                models.LetturaCopie.asset_id == asset.id
-            ).order_by(desc(models.LetturaCopie.data_lettura)).first()
-            
-            if not ultima_lettura:
-                # Se non c'è lettura, usa data installazione
-                data_riferimento = asset.data_installazione or datetime.now()
-            else:
-                data_riferimento = ultima_lettura.data_lettura
-            
-            # Calcola quando scade la lettura in base alla cadenza configurata
-            data_scadenza_lettura = data_riferimento + timedelta(days=giorni_cadenza)
-            
-            giorni_alla_scadenza = (data_scadenza_lettura.date() - datetime.now().date()).days
-            if giorni_alla_scadenza in soglie_giorni:
-                cliente_id = asset.cliente_id
-                if cliente_id not in clienti_da_notificare:
-                    cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
-                    if cliente:
-                        clienti_da_notificare[cliente_id] = {
-                            'cliente': cliente,
-                            'assets': []
-                        }
-                
-                # Calcola prossima lettura dovuta
-                prossima_lettura_dovuta = data_riferimento + timedelta(days=giorni_cadenza)
-                
-                clienti_da_notificare[cliente_id]['assets'].append({
-                    'marca': asset.marca or '',
-                    'modello': asset.modello or '',
-                    'matricola': asset.matricola or '',
-                    'data_ultima_lettura': ultima_lettura.data_lettura if ultima_lettura else data_riferimento,
-                    'cadenza': cadenza,
-                    'prossima_lettura_dovuta': prossima_lettura_dovuta
-                })
+        for asset, ragione_sociale, cadenza, data_riferimento, ultima_lettura, scadenza in righe:
+            dati = clienti_da_notificare.setdefault(asset.cliente_id, {
+                'ragione_sociale': ragione_sociale,
+                'assets': []
+            })
+            dati['assets'].append({
+                'marca': asset.marca or '',
+                'modello': asset.modello or '',
+                'matricola': asset.matricola or '',
+                'data_ultima_lettura': ultima_lettura or data_riferimento,
+                'cadenza': cadenza,
+                'prossima_lettura_dovuta': scadenza
+            })
         
         # Invia email per ogni cliente
         for cliente_id, dati in clienti_da_notificare.items():
-            cliente = dati['cliente']
-            assets = dati['assets']
-            
             subject, body_html = email_service.generate_alert_letture_copie_email(
-                cliente_nome=cliente.ragione_sociale,
+                cliente_nome=dati['ragione_sociale'],
                 cliente_id=cliente_id,
-                assets_info=assets,
+                assets_info=dati['assets'],
                 azienda_nome=settings.nome_azienda or "GIT - Gestione Interventi Tecnici"
             )
             
@@ -901,7 +1037,13 @@ def check_scadenze_letture_copie():
                     db=db,
                     from_name=from_name
                 )
-            print(f"Alert letture copie inviato per cliente {cliente.ragione_sociale} (ID: {cliente_id})")
+            print(f"Alert letture copie accodato per cliente {dati['ragione_sociale']} (ID: {cliente_id})")
+        
+        logger.info(
+            f"[LETTURE COPIE] Controllo scadenze: {len(righe)} asset in scadenza per {len(clienti_da_notificare)} clienti "
+            f"(soglie {soglie_giorni} giorni), query {durata_query * 1000:.0f} ms, "
+            f"invio {(time.perf_counter() - inizio - durata_query) * 1000:.0f} ms, totale {(time.perf_counter() - inizio) * 1000:.0f} ms"
+        )
         
     except Exception as e:
         print(f"Errore controllo scadenze letture copie: {e}")
@@ -911,12 +1053,46 @@ def check_scadenze_letture_copie():
         db.close()
 
 # --- FUNZIONE PER AVVISI DDT NON CHIUSI ---
+def ddt_promemoria_da_inviare(db: Session, soglie_giorni: List[int], adesso: Optional[datetime] = None) -> list:
+    """
+    Promemoria DDT non chiusi da inviare, in una sola query: DDT aperti con tecnico assegnato
+    (con email) per ogni soglia superata dall'inizio dello stato corrente (stato_updated_at,
+    altrimenti data_ritiro), esclusi quelli già presenti in ddt_reminder_log.
+    Righe ordinate per tecnico: (ddt, tecnico, soglia, stato_since).
+    """
+    adesso = adesso or datetime.now()
+    Ddt = models.RitiroProdotto
+    Log = models.DdtReminderLog
+    soglie = values(column("soglia", Integer), name="soglie").data([(giorni,) for giorni in soglie_giorni])
+    stato_since = func.coalesce(Ddt.stato_updated_at, Ddt.data_ritiro)
+    gia_inviato = exists().where(
+        Log.ddt_id == Ddt.id,
+        Log.stato == Ddt.stato,
+        Log.soglia == soglie.c.soglia,
+        Log.stato_since == stato_since,
+    )
+    return db.query(Ddt, models.Utente, soglie.c.soglia, stato_since.label("stato_since")).join(
+        models.Utente, models.Utente.id == Ddt.tecnico_assegnato_id
+    ).join(
+        soglie, true()
+    ).filter(
+        Ddt.deleted_at.is_(None),
+        Ddt.stato != "consegnato",
+        Ddt.data_ritiro.isnot(None),
+        models.Utente.email.isnot(None),
+        models.Utente.email != "",
+        stato_since <= adesso - func.make_interval(0, 0, 0, soglie.c.soglia),
+        ~gia_inviato,
+    ).order_by(models.Utente.id, Ddt.id, soglie.c.soglia).all()
+
+
 def check_ddt_ritardi():
-    """Invia promemoria per DDT non chiusi oltre le soglie configurate"""
+    """Invia a ogni tecnico un riepilogo dei DDT non chiusi oltre le soglie configurate (una volta per soglia e stato)"""
+    inizio = time.perf_counter()
     db = next(database.get_db())
     try:
-        settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings or not settings.ddt_alert_abilitato:
+        settings = settings_cache.get_settings(db)
+        if not settings.ddt_alert_abilitato:
             return
 
         smtp_config = email_service.get_smtp_config(db)
@@ -933,44 +1109,59 @@ def check_ddt_ritardi():
         if not soglie_giorni:
             return
         oggi = datetime.now()
+        from_name = f"GIT - {settings.nome_azienda or 'GIT'} - DDT"
 
-        ddts_aperti = db.query(models.RitiroProdotto).filter(
-            models.RitiroProdotto.deleted_at.is_(None),
-            models.RitiroProdotto.stato != "consegnato"
-        ).all()
-
-        if not ddts_aperti:
-            return
+        # Raggruppa per tecnico: una riga di registro per soglia, una riga di riepilogo per DDT
+        per_tecnico: dict = {}
+        for ddt, tecnico, soglia, stato_since in ddt_promemoria_da_inviare(db, soglie_giorni, adesso=oggi):
+            dati = per_tecnico.setdefault(tecnico.id, {'tecnico': tecnico, 'registro': [], 'ddts': {}})
+            dati['registro'].append({
+                'ddt_id': ddt.id,
+                'stato': ddt.stato,
+                'soglia': soglia,
+                'stato_since': stato_since,
+                'tecnico_id': tecnico.id,
+                'inviato_at': oggi,
+            })
+            dati['ddts'].setdefault(ddt.id, {
+                'numero_ddt': ddt.numero_ddt,
+                'stato': ddt.stato,
+                'giorni': (oggi - stato_since).days,
+                'cliente': ddt.cliente_ragione_sociale,
+                'data_ritiro': ddt.data_ritiro,
+            })
 
-        for ddt in ddts_aperti:
-            if not ddt.data_ritiro:
-                continue
-            if not ddt.tecnico_assegnato_id:
-                continue
-            tecnico = db.query(models.Utente).filter(models.Utente.id == ddt.tecnico_assegnato_id).first()
-            if not tecnico or not tecnico.email:
+        inviati = 0
+        for dati in per_tecnico.values():
+            tecnico = dati['tecnico']
+            # Registro ed email nella stessa transazione; se un altro processo ha già registrato
+            # una soglia (ON CONFLICT DO NOTHING) il DDT non viene ripetuto nel riepilogo
+            registrati = set(db.execute(
+                pg_insert(models.DdtReminderLog.__table__).values(dati['registro']).on_conflict_do_nothing(
+                    index_elements=["ddt_id", "stato", "soglia", "stato_since"]
+                ).returning(models.DdtReminderLog.__table__.c.ddt_id)
+            ).scalars())
+            ddts = [info for ddt_id, info in dati['ddts'].items() if ddt_id in registrati]
+            if not ddts:
+                db.rollback()
                 continue
+            subject, body_html = email_service.generate_ddt_ritardi_email(tecnico.nome_completo, ddts)
+            email_outbox.accoda(
+                db,
+                destinatario=tecnico.email,
+                oggetto=subject,
+                corpo_html=body_html,
+                mittente_nome=from_name,
+            )
+            db.commit()
+            inviati += len(ddts)
 
-            stato_time = ddt.stato_updated_at or ddt.data_ritiro
-            if not stato_time:
-                continue
-            giorni_aperto = (oggi - stato_time).days
-            for soglia in soglie_giorni:
-                key = (ddt.id, ddt.stato, soglia, stato_time.date().isoformat())
-                if giorni_aperto >= soglia and key not in _ddt_reminder_sent:
-                    subject = f"Promemoria DDT {ddt.numero_ddt} in stato {ddt.stato}"
-                    body_html = f"""
-                    <div style="font-family: Arial, sans-serif; color: #333;">
-                        <p>Gentile {tecnico.nome_completo or 'Tecnico'},</p>
-                        <p>il DDT <strong>{ddt.numero_ddt}</strong> è nello stato <strong>{ddt.stato}</strong> da <strong>{giorni_aperto} giorni</strong>.</p>
-                        <p>Cliente: <strong>{ddt.cliente_ragione_sociale}</strong></p>
-                        <p>Data ritiro: {ddt.data_ritiro.strftime('%d/%m/%Y') if ddt.data_ritiro else '-'}</p>
-                    </div>
-                    """
-                    from_name = f"GIT - {settings.nome_azienda or 'GIT'} - DDT"
-                    email_service.send_email(tecnico.email, subject, body_html, db=db, from_name=from_name)
-                    _ddt_reminder_sent.add(key)
+        logger.info(
+            f"[DDT PROMEMORIA] {inviati} DDT in {len(per_tecnico)} riepiloghi per tecnico "
+            f"(soglie {soglie_giorni} giorni), {(time.perf_counter() - inizio) * 1000:.0f} ms"
+        )
     except Exception as e:
+        db.rollback()
         print(f"Errore invio promemoria DDT: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -982,9 +1173,7 @@ def check_ddt_assegnazioni():
     """Invia promemoria ogni 24h per DDT in magazzino da assegnare (modalità manuale)."""
     db = next(database.get_db())
     try:
-        settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings:
-            return
+        settings = settings_cache.get_settings(db)
         if settings.ddt_assegnazione_modalita != "manual" or not settings.ddt_assegnazione_alert_abilitato:
             return
 
@@ -1047,10 +1236,7 @@ def run_scheduled_backup(backup_type: str, target_ids: Optional[List[int]] = Non
     """
     db = next(database.get_db())
     try:
-        settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings:
-            print(f"[BACKUP SCHEDULER] Impostazioni non trovate, skip backup {backup_type}")
-            return
+        settings = settings_cache.get_settings(db)
         
         # Verifica se lo scheduler è abilitato per questo tipo
         schedule_enabled = False
@@ -1124,11 +1310,7 @@ def setup_backup_schedulers():
         except Exception as e:
             logger.debug(f"[BACKUP SCHEDULER] Nessun job backup_cloud da rimuovere: {e}")
         
-        settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings:
-            logger.warning("[BACKUP SCHEDULER] Impostazioni non trovate, scheduler backup non configurati")
-            print("[BACKUP SCHEDULER] ⚠️ Impostazioni non trovate, scheduler backup non configurati")
-            return
+        settings = settings_cache.get_settings(db)
         
         local_enabled = getattr(settings, 'backup_local_schedule_enabled', None)
         nas_enabled = getattr(settings, 'backup_nas_schedule_enabled', None)
@@ -1240,6 +1422,34 @@ scheduler.add_job(
     name='Promemoria DDT da assegnare',
     replace_existing=True
 )
+scheduler.add_job(
+    ddt_contatori_service.ricalcola_contatori_job,
+    trigger=CronTrigger(hour=3, minute=30),  # Ogni giorno alle 3:30
+    id='ricalcola_contatori_ddt',
+    name='Ricalcolo contatori dashboard DDT',
+    replace_existing=True
+)
+scheduler.add_job(
+    email_outbox.richiedi_drain,
+    trigger=IntervalTrigger(seconds=email_outbox.EMAIL_OUTBOX_INTERVALLO),  # Retry e email accodate da altri processi
+    id='email_outbox_drain',
+    name='Invio email in coda (outbox)',
+    replace_existing=True
+)
+scheduler.add_job(
+    email_outbox.pulizia_job,
+    trigger=CronTrigger(hour=4, minute=0),  # Ogni giorno alle 4:00
+    id='email_outbox_pulizia',
+    name='Pulizia outbox email',
+    replace_existing=True
+)
+scheduler.add_job(
+    job_queue.pulizia_job,
+    trigger=CronTrigger(hour=4, minute=15),  # Ogni giorno alle 4:15
+    id='jobs_pulizia',
+    name='Pulizia coda job',
+    replace_existing=True
+)
 
 # --- SCHEDULER PER BACKUP AUTOMATICI ---
 # Configura gli scheduler backup dopo l'avvio dello scheduler principale
@@ -1249,6 +1459,9 @@ print("  - Contratti (noleggio e assistenza): ogni lunedì alle 9:00")
 print("  - Letture copie: ogni giorno alle 9:00")
 print("  - DDT non chiusi: ogni giorno alle 9:00")
 print("  - DDT da assegnare: ogni giorno alle 9:00")
+print("  - Ricalcolo contatori DDT: ogni giorno alle 3:30")
+print(f"  - Outbox email: ogni {email_outbox.EMAIL_OUTBOX_INTERVALLO} secondi (pulizia alle 4:00)")
+print("  - Pulizia coda job: ogni giorno alle 4:15")
 
 # Setup backup schedulers dopo l'avvio
 try:
@@ -1259,173 +1472,6 @@ except Exception as e:
     import traceback
     traceback.print_exc()
 
-# --- FUNZIONE MOCK EMAIL ---
-def send_email_background(
-    email_to: str, 
-    pdf_content: bytes, 
-    numero_rit: str, 
-    azienda_nome: str, 
-    data_intervento: datetime,
-    azienda_indirizzo: str = "",
-    azienda_telefono: str = "",
-    azienda_email: str = "",
-    db: Session = None,
-    from_name: Optional[str] = None
-):
-    """
-    Invia email con PDF del RIT al destinatario specificato.
-    Se db è fornito, usa il servizio email reale, altrimenti usa mock.
-    """
-    if not db:
-        # Mock mode (per compatibilità)
-        print(f"--- [EMAIL MOCK] ---")
-        print(f"TO: {email_to}")
-        print(f"OGGETTO: Rapporto Intervento Tecnico {azienda_nome} del {data_intervento.strftime('%d/%m/%Y')}")
-        print("--------------------")
-        return
-    
-    try:
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.text import MIMEText
-        from email.mime.base import MIMEBase
-        from email import encoders
-        from email.utils import formataddr
-        import base64
-        
-        # Ottieni configurazione SMTP
-        smtp_config = email_service.get_smtp_config(db)
-        if not smtp_config.get('username') or not smtp_config.get('password'):
-            # Se SMTP non configurato, usa mock
-            print(f"--- [EMAIL MOCK - SMTP non configurato] ---")
-            print(f"TO: {email_to}")
-            print(f"OGGETTO: Rapporto Intervento Tecnico {azienda_nome} del {data_intervento.strftime('%d/%m/%Y')}")
-            print("--------------------")
-            return
-        
-        # Formatta data intervento
-        data_intervento_formattata = data_intervento.strftime('%d/%m/%Y')
-        
-        # Crea messaggio
-        msg = MIMEMultipart()
-        smtp_from = smtp_config.get('from_email', smtp_config.get('username'))
-        msg['From'] = formataddr((from_name, smtp_from)) if from_name else smtp_from
-        msg['To'] = email_to
-        msg['Subject'] = f"Rapporto Intervento Tecnico {azienda_nome} del {data_intervento_formattata}"
-        
-        # Prepara dati azienda per il footer
-        footer_azienda = azienda_nome
-        if azienda_indirizzo:
-            footer_azienda += f"\n{azienda_indirizzo}"
-        if azienda_telefono:
-            footer_azienda += f"\nTel: {azienda_telefono}"
-        if azienda_email:
-            footer_azienda += f"\nEmail: {azienda_email}"
-        
-        # Corpo email formale con GDPR
-        body_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.8; color: #333; }}
-                .container {{ max-width: 700px; margin: 0 auto; padding: 20px; }}
-                .content {{ background-color: #ffffff; padding: 30px; border: 1px solid #e5e7eb; }}
-                .footer {{ background-color: #f3f4f6; padding: 20px; font-size: 11px; color: #6b7280; border-top: 2px solid #e5e7eb; margin-top: 30px; }}
-                p {{ margin-bottom: 15px; }}
-                .signature {{ margin-top: 30px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="content">
-                    <p>Gentile Cliente,</p>
-                    
-                    <p>con la presente Le trasmettiamo in allegato il Rapporto di Intervento Tecnico, relativo all'attività svolta presso la Sua sede e/o sul sistema di Sua competenza il giorno <strong>{data_intervento_formattata}</strong>, a seguito della chiusura del RIT aperto per intervento richiesto o intervento ordinario.</p>
-                    
-                    <p>Il documento riepiloga le operazioni effettuate, le eventuali verifiche eseguite e l'esito finale dell'intervento, e viene inviato per finalità di:</p>
-                    
-                    <ul>
-                        <li>adempimento contrattuale e/o precontrattuale;</li>
-                        <li>corretta gestione del rapporto commerciale e tecnico in essere;</li>
-                        <li>tracciabilità e documentazione delle attività svolte.</li>
-                    </ul>
-                    
-                    <p>Ai sensi del Regolamento (UE) 2016/679 (GDPR) e della normativa nazionale vigente in materia di protezione dei dati personali, il trattamento dei dati contenuti nel rapporto avviene esclusivamente per le finalità sopra indicate, nel rispetto dei principi di liceità, correttezza, trasparenza e minimizzazione dei dati.</p>
-                    
-                    <p>La base giuridica del trattamento è costituita dall'esecuzione di obblighi contrattuali e/o di misure precontrattuali (art. 6, par. 1, lett. b GDPR), nonché dall'adempimento di obblighi di legge e da legittimi interessi del Titolare del trattamento connessi alla gestione tecnica e amministrativa del servizio.</p>
-                    
-                    <p>Il documento allegato è destinato esclusivamente al destinatario indicato. Qualora lo abbia ricevuto per errore, La invitiamo a darcene tempestiva comunicazione e a procedere alla sua cancellazione, astenendosi da qualsiasi utilizzo o diffusione non autorizzata.</p>
-                    
-                    <p>Restiamo a disposizione per eventuali chiarimenti o ulteriori necessità.</p>
-                    
-                    <p class="signature">Cordiali saluti,<br>
-                    <strong>{footer_azienda}</strong></p>
-                </div>
-                <div class="footer">
-                    <p><strong>Nota:</strong> Questa è una comunicazione automatica. Si prega di non rispondere direttamente a questa email.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        body_text = f"""Rapporto Intervento Tecnico
-
-Gentile Cliente,
-
-con la presente Le trasmettiamo in allegato il Rapporto di Intervento Tecnico, relativo all'attività svolta presso la Sua sede e/o sul sistema di Sua competenza il giorno {data_intervento_formattata}, a seguito della chiusura del RIT aperto per intervento richiesto o intervento ordinario.
-
-Il documento riepiloga le operazioni effettuate, le eventuali verifiche eseguite e l'esito finale dell'intervento, e viene inviato per finalità di:
-
-- adempimento contrattuale e/o precontrattuale;
-- corretta gestione del rapporto commerciale e tecnico in essere;
-- tracciabilità e documentazione delle attività svolte.
-
-Ai sensi del Regolamento (UE) 2016/679 (GDPR) e della normativa nazionale vigente in materia di protezione dei dati personali, il trattamento dei dati contenuti nel rapporto avviene esclusivamente per le finalità sopra indicate, nel rispetto dei principi di liceità, correttezza, trasparenza e minimizzazione dei dati.
-
-La base giuridica del trattamento è costituita dall'esecuzione di obblighi contrattuali e/o di misure precontrattuali (art. 6, par. 1, lett. b GDPR), nonché dall'adempimento di obblighi di legge e da legittimi interessi del Titolare del trattamento connessi alla gestione tecnica e amministrativa del servizio.
-
-Il documento allegato è destinato esclusivamente al destinatario indicato. Qualora lo abbia ricevuto per errore, La invitiamo a darcene tempestiva comunicazione e a procedere alla sua cancellazione, astenendosi da qualsiasi utilizzo o diffusione non autorizzata.
-
-Restiamo a disposizione per eventuali chiarimenti o ulteriori necessità.
-
-Cordiali saluti,
-{footer_azienda}
-
----
-Nota: Questa è una comunicazione automatica. Si prega di non rispondere direttamente a questa email.
-        """
-        
-        # Aggiungi corpo
-        msg.attach(MIMEText(body_text, 'plain'))
-        msg.attach(MIMEText(body_html, 'html'))
-        
-        # Aggiungi PDF come allegato
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(pdf_content)
-        encoders.encode_base64(part)
-        part.add_header(
-            'Content-Disposition',
-            f'attachment; filename= "{numero_rit}.pdf"'
-        )
-        msg.attach(part)
-        
-        # Invia email
-        import smtplib
-        with smtplib.SMTP(smtp_config.get('host', 'smtp.gmail.com'), smtp_config.get('port', 587)) as server:
-            if smtp_config.get('use_tls', True):
-                server.starttls()
-            server.login(smtp_config.get('username'), smtp_config.get('password'))
-            server.send_message(msg)
-        
-        print(f"✅ Email inviata con successo a {email_to} per RIT {numero_rit}")
-        
-    except Exception as e:
-        print(f"⚠️ Errore invio email a {email_to}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-
 def genera_numero_rit(db: Session) -> str:
     anno_corrente = datetime.now().year
     prefix = f"RIT-{anno_corrente}-"
@@ -1577,19 +1623,9 @@ def select_available_tecnico(db: Session, settings: Optional[models.Impostazioni
 
     return candidates[0]
 
-def get_settings_or_default(db: Session):
-    settings = db.query(models.ImpostazioniAzienda).first()
-    if not settings:
-        settings = models.ImpostazioniAzienda(
-            nome_azienda="GIT - Gestione Interventi Tecnici",
-            indirizzo_completo="Configurazione Richiesta",
-            p_iva=None,
-            tariffe_categorie={}
-        )
-        db.add(settings)
-        db.commit()
-        db.refresh(settings)
-    return settings
+def get_settings_or_default(db: Session) -> settings_cache.SettingsSnapshot:
+    """Snapshot in sola lettura delle impostazioni azienda (per modificarle: settings_cache.get_settings_row)."""
+    return settings_cache.get_settings(db)
 
 # --- INIZIALIZZAZIONE SUPERADMIN (Solo se non esiste) ---
 def init_superadmin(db: Session):
@@ -1767,6 +1803,31 @@ async def metrics(db: Session = Depends(database.get_db), current_user: models.U
             ).scalar() or 0
         }
         
+        # Stato indici dichiarati (mancanti / non validi / mai usati)
+        try:
+            stats["search_indexes"] = db_indexes.index_report(db.connection())
+        except Exception as e:
+            stats["search_indexes"] = {"error": str(e)}
+        
+        # Pool connessioni del worker che risponde (occupazione, overflow, attese)
+        stats["db_pool"] = database.pool_stats()
+        # Cache impostazioni azienda del worker che risponde (hit/miss, notifiche ricevute)
+        stats["settings_cache"] = settings_cache.cache_stats()
+        # Cache utenti autenticati del worker che risponde (hit/miss, evizioni)
+        stats["user_cache"] = user_cache.cache_stats()
+        # Listener LISTEN/NOTIFY che invalida le cache tra processi
+        stats["db_notify"] = db_notify.listener_stats()
+        # Cache su disco dei PDF RIT/DDT (condivisa tra i worker)
+        stats["pdf_cache"] = pdf_cache.cache_stats()
+        # Pool di rendering PDF del worker che risponde (coda, tempi di render/attesa)
+        stats["pdf_render_pool"] = pdf_render_pool.pool_stats()
+        # PDF finali dei documenti firmati (revisioni archiviate, download serviti)
+        stats["pdf_finali"] = pdf_finali_service.finali_stats()
+        # Outbox email: profondità coda, latenza accodamento -> invio, circuit breaker SMTP
+        stats["email_outbox"] = email_outbox.outbox_stats(db)
+        # Coda job: job per tipo e stato, tempi di attesa/esecuzione del worker di questo processo
+        stats["jobs"] = job_queue.jobs_stats(db)
+        
         return stats
     except Exception as e:
         logger.error(f"Errore nel calcolo delle metrics: {e}")
@@ -2109,8 +2170,8 @@ def upload_logo(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        # Aggiorna impostazioni
-        settings = get_settings_or_default(db)
+        # Aggiorna impostazioni (riga ORM: lo snapshot in cache è in sola lettura)
+        settings = settings_cache.get_settings_row(db)
         # Rimuovi vecchio logo se esiste
         if settings.logo_url and settings.logo_url.startswith("/uploads/logos/"):
             old_path = UPLOAD_DIR / settings.logo_url.replace("/uploads/", "")
@@ -2308,6 +2369,7 @@ def search_clienti(
     q: str = "", 
     skip: int = 0, 
     limit: int = 50, 
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
     db: Session = Depends(database.get_db), 
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
@@ -2318,11 +2380,15 @@ def search_clienti(
         q: Termine di ricerca (ragione_sociale, p_iva, codice_fiscale)
         skip: Numero di record da saltare (per paginazione)
         limit: Numero massimo di record da restituire (default: 50, max: 200)
+        fields: Campi da restituire (sedi e assets_noleggio solo se elencati)
     """
     # Limita il limite massimo a 200 per evitare query troppo pesanti
     limit = min(limit, 200)
+    field_names = CLIENTI_FIELDS.parse(fields)
     
-    query = db.query(models.Cliente).filter(models.Cliente.deleted_at.is_(None))  # Escludi clienti cancellati
+    query = db.query(models.Cliente).options(
+        *CLIENTI_FIELDS.query_options(field_names, CLIENTE_RELAZIONI_OPTIONS)
+    ).filter(models.Cliente.deleted_at.is_(None))  # Escludi clienti cancellati
     if q:
         search = f"%{q}%"
         query = query.filter(
@@ -2334,20 +2400,26 @@ def search_clienti(
         )
     result = query.order_by(models.Cliente.ragione_sociale.asc()).offset(skip).limit(limit).all()
     logger.debug(f"Endpoint /clienti/ chiamato - query: '{q}', skip: {skip}, limit: {limit}, risultati: {len(result)}")
-    return result
+    return json_response(CLIENTI_FIELDS.dump(result, field_names))
 
 @app.get("/clienti/paginated", response_model=schemas.PaginatedClientiResponse, tags=["Clienti"])
 def search_clienti_paginated(
     q: str = "",
     skip: int = 0,
     limit: int = 50,
+    total_mode: str = Query("exact", description="Calcolo del totale: exact, window (stessa query delle righe), estimate, capped"),
+    total_cap: int = Query(DEFAULT_TOTAL_CAP, ge=1, description="Soglia per total_mode=capped"),
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
     """Cerca clienti con paginazione e total count."""
     limit = min(limit, 200)
+    field_names = CLIENTI_FIELDS.parse(fields)
 
-    query = db.query(models.Cliente).filter(models.Cliente.deleted_at.is_(None))
+    query = db.query(models.Cliente).options(
+        *CLIENTI_FIELDS.query_options(field_names, CLIENTE_RELAZIONI_OPTIONS)
+    ).filter(models.Cliente.deleted_at.is_(None))
     if q:
         search = f"%{q}%"
         query = query.filter(
@@ -2358,14 +2430,27 @@ def search_clienti_paginated(
             )
         )
 
-    total = query.order_by(None).count()
-    items = query.order_by(models.Cliente.ragione_sociale.asc()).offset(skip).limit(limit).all()
-    return {"items": items, "total": total}
+    items, page_meta = fetch_offset_page(
+        query.order_by(models.Cliente.ragione_sociale.asc(), models.Cliente.id.asc()),
+        skip=skip, limit=limit, total_mode=total_mode, total_cap=total_cap
+    )
+    return json_response({"items": CLIENTI_FIELDS.dump(items, field_names), **page_meta})
 
 @app.get("/clienti/{cliente_id}", response_model=schemas.ClienteResponse, tags=["Clienti"])
-def get_cliente(cliente_id: int, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
+def get_cliente(cliente_id: int, request: Request, response: Response, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
     """Ottiene un cliente con le sue sedi e assets"""
-    db_cliente = db.query(models.Cliente).filter(
+    # GET condizionale: la versione (updated_at, aggiornato anche da sedi/asset) si legge
+    # con una lookup per chiave primaria, prima di caricare le relazioni
+    updated_at = db.query(models.Cliente.updated_at).filter(
+        models.Cliente.id == cliente_id,
+        models.Cliente.deleted_at.is_(None)
+    ).scalar()
+    if updated_at is not None:
+        headers = cache_headers(make_etag("cliente", cliente_id, updated_at), PRIVATE_REVALIDATE, updated_at)
+        if is_not_modified(request, headers["ETag"], updated_at):
+            return not_modified_response(headers)
+
+    db_cliente = db.query(models.Cliente).options(*CLIENTE_RELAZIONI_OPTIONS).filter(
         models.Cliente.id == cliente_id,
         models.Cliente.deleted_at.is_(None)  # Escludi clienti cancellati
     ).first()
@@ -2398,6 +2483,10 @@ def get_cliente(cliente_id: int, db: Session = Depends(database.get_db), current
     # Forza il caricamento delle relazioni
     _ = db_cliente.sedi  # Carica sedi
     _ = db_cliente.assets_noleggio  # Carica assets noleggio
+    # ETag della versione restituita (la creazione automatica della sede legale la cambia)
+    response.headers.update(cache_headers(
+        make_etag("cliente", cliente_id, db_cliente.updated_at), PRIVATE_REVALIDATE, db_cliente.updated_at
+    ))
     return db_cliente
 
 @app.get("/clienti/{cliente_id}/sedi", response_model=List[schemas.SedeClienteResponse], tags=["Clienti"])
@@ -3005,6 +3094,8 @@ def update_cliente(cliente_id: int, cliente: schemas.ClienteCreate, request: Req
                     models.SedeCliente.cliente_id == cliente_id
                 ).delete()
         
+        # Le eliminazioni bulk delle sedi non passano dal flush: nuova versione esplicita (ETag)
+        versioni_service.touch(db_cliente)
         db.commit()
         db.refresh(db_cliente)
         
@@ -3060,8 +3151,18 @@ def create_prodotto(prodotto: schemas.ProdottoCreate, request: Request, db: Sess
     return db_prodotto
 
 @app.get("/magazzino/", response_model=List[schemas.ProdottoResponse], tags=["Magazzino"])
-def read_magazzino(q: str = "", skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
-    query = db.query(models.ProdottoMagazzino).filter(models.ProdottoMagazzino.deleted_at.is_(None))  # Escludi prodotti cancellati
+def read_magazzino(
+    q: str = "",
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    field_names = MAGAZZINO_FIELDS.parse(fields)
+    query = db.query(models.ProdottoMagazzino).options(
+        *MAGAZZINO_FIELDS.query_options(field_names)
+    ).filter(models.ProdottoMagazzino.deleted_at.is_(None))  # Escludi prodotti cancellati
     if q:
         search = f"%{q}%"
         query = query.filter(
@@ -3070,7 +3171,8 @@ def read_magazzino(q: str = "", skip: int = 0, limit: int = 100, db: Session = D
                 models.ProdottoMagazzino.descrizione.ilike(search)
             )
         )
-    return query.order_by(models.ProdottoMagazzino.descrizione.asc()).offset(skip).limit(limit).all()
+    prodotti = query.order_by(models.ProdottoMagazzino.descrizione.asc()).offset(skip).limit(limit).all()
+    return json_response(MAGAZZINO_FIELDS.dump(prodotti, field_names))
 
 @app.put("/magazzino/{prodotto_id}", response_model=schemas.ProdottoResponse, tags=["Magazzino"])
 def update_prodotto(prodotto_id: int, prodotto: schemas.ProdottoUpdate, request: Request, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
@@ -3196,7 +3298,6 @@ def delete_prodotto(
 @app.post("/interventi/", response_model=schemas.InterventoResponse, tags=["R.I.T."])
 def create_intervento(
     intervento: schemas.InterventoCreate, 
-    background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
@@ -3428,196 +3529,24 @@ def create_intervento(
             ip_address=get_client_ip(request)
         )
 
-        # 6. Invio Email (Gestito fuori dalla transazione DB)
-        # IMPORTANTE: Per i prelievi copie, le letture copie vengono create DOPO la creazione dell'intervento
-        # dal frontend. Quindi durante la creazione iniziale, le letture copie potrebbero non essere ancora disponibili.
-        # L'email verrà inviata durante l'update quando le letture copie sono disponibili.
-        # Tuttavia, se le letture copie vengono create immediatamente dopo la creazione dell'intervento,
-        # verranno trovate e l'email verrà inviata.
+        # 6. Invio Email: render del PDF e accodamento delle email nel job "email_rit" (worker),
+        # la risposta non attende il render. I prelievi copie ricevono le letture dal frontend DOPO
+        # la creazione dell'intervento: senza letture l'email parte da create_lettura_copie / update
         try:
-            # Verifica se è un prelievo copie
-            if db_intervento.is_prelievo_copie:
-                # Per i prelievi copie, verifica se ci sono già letture copie associate
-                # Le letture copie vengono create dal frontend DOPO la creazione dell'intervento,
-                # quindi potrebbero non essere ancora disponibili durante la creazione iniziale
-                letture_copie_count = db.query(models.LetturaCopie).filter(
-                    models.LetturaCopie.intervento_id == db_intervento.id
-                ).count()
-                
-                print(f"[CREATE EMAIL PDF] Prelievo copie rilevato - Letture copie trovate: {letture_copie_count}")
-                
-                if letture_copie_count == 0:
-                    print(f"[CREATE EMAIL PDF] Prelievo copie senza letture copie - Email NON inviata durante creazione")
-                    print(f"[CREATE EMAIL PDF] L'email verrà inviata durante l'update quando le letture copie saranno disponibili")
-                    # Non inviare email durante la creazione per prelievi copie senza letture
-                    pass
-                else:
-                    # Se ci sono già letture copie, procedi con l'invio
-                    print(f"[CREATE EMAIL PDF] Prelievo copie con {letture_copie_count} letture copie - Generazione PDF per email")
-                    
-                    # Ricarica completamente l'intervento dalla sessione per assicurarsi che tutte le modifiche siano salvate
-                    db_intervento_fresh = db.query(models.Intervento).filter(models.Intervento.id == db_intervento.id).first()
-                    if not db_intervento_fresh:
-                        print(f"[CREATE EMAIL PDF] ERRORE: Intervento {db_intervento.id} non trovato dopo il commit!")
-                        raise Exception(f"Intervento {db_intervento.id} non trovato")
-                    
-                    # Forza il caricamento delle relazioni
-                    _ = db_intervento_fresh.dettagli  # Carica dettagli
-                    _ = db_intervento_fresh.ricambi_utilizzati  # Carica ricambi
-                    
-                    # Carica letture copie con informazioni asset
-                    db_intervento_fresh.letture_copie = db.query(models.LetturaCopie).filter(
-                        models.LetturaCopie.intervento_id == db_intervento_fresh.id
-                    ).all()
-                    
-                    print(f"[CREATE EMAIL PDF] Letture copie caricate dal DB: {len(db_intervento_fresh.letture_copie)}")
-                    
-                    # Carica informazioni asset per ogni lettura copie
-                    for lettura in db_intervento_fresh.letture_copie:
-                        if lettura.asset_id:
-                            asset = db.query(models.AssetCliente).filter(models.AssetCliente.id == lettura.asset_id).first()
-                            if asset:
-                                # Aggiungi informazioni asset alla lettura (come attributi temporanei)
-                                lettura.asset_marca = asset.marca or ''
-                                lettura.asset_modello = asset.modello or ''
-                                lettura.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
-                                print(f"[CREATE EMAIL PDF] Asset caricato per lettura {lettura.id}: {lettura.asset_marca_modello}")
-                    
-                    # Ricarica anche le impostazioni azienda
-                    settings_refreshed = get_settings_or_default(db)
-                    
-                    cliente = db.query(models.Cliente).filter(models.Cliente.id == db_intervento_fresh.cliente_id).first()
-                    pdf_bytes = pdf_service.genera_pdf_intervento(db_intervento_fresh, settings_refreshed)
-                    
-                    # Invia email (codice esistente)
-                    data_intervento_email = db_intervento_fresh.data_creazione
-                    azienda_indirizzo = settings_refreshed.indirizzo_completo or ""
-                    azienda_telefono = settings_refreshed.telefono or ""
-                    azienda_email_contatto = settings_refreshed.email or ""
-                    
-                    if cliente and cliente.email_amministrazione:
-                        background_tasks.add_task(
-                            send_email_background,
-                            cliente.email_amministrazione,
-                            pdf_bytes,
-                            db_intervento_fresh.numero_relazione,
-                            settings_refreshed.nome_azienda,
-                            data_intervento_email,
-                            azienda_indirizzo,
-                            azienda_telefono,
-                            azienda_email_contatto,
-                            db,
-                            f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                        )
-                    
-                    if db_intervento_fresh.sede_id:
-                        sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento_fresh.sede_id).first()
-                        if sede and sede.email:
-                            background_tasks.add_task(
-                                send_email_background,
-                                sede.email,
-                                pdf_bytes,
-                                db_intervento_fresh.numero_relazione,
-                                settings_refreshed.nome_azienda,
-                                data_intervento_email,
-                                azienda_indirizzo,
-                                azienda_telefono,
-                                azienda_email_contatto,
-                                db,
-                                f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                            )
-                    
-                    email_azienda = settings_refreshed.email
-                    if email_azienda:
-                        background_tasks.add_task(
-                            send_email_background,
-                            email_azienda,
-                            pdf_bytes,
-                            db_intervento_fresh.numero_relazione,
-                            settings_refreshed.nome_azienda,
-                            data_intervento_email,
-                            azienda_indirizzo,
-                            azienda_telefono,
-                            azienda_email_contatto,
-                            db,
-                            f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                        )
-                    
-                    print(f"[CREATE EMAIL PDF] PDF generato e email programmate per RIT {db_intervento_fresh.numero_relazione}")
+            if db_intervento.is_prelievo_copie and not db.query(models.LetturaCopie.id).filter(
+                models.LetturaCopie.intervento_id == db_intervento.id
+            ).first():
+                print(f"[CREATE EMAIL PDF] Prelievo copie senza letture copie - Email NON inviata durante creazione")
             else:
-                # Per interventi normali (non prelievo copie), invia email normalmente
-                # Ricarica l'intervento con tutte le relazioni per generare il PDF corretto
-                db.refresh(db_intervento)
-                # Forza il caricamento delle relazioni
-                _ = db_intervento.dettagli  # Carica dettagli
-                _ = db_intervento.ricambi_utilizzati  # Carica ricambi
-                
-                # Ricarica anche le impostazioni azienda per assicurarsi che siano aggiornate
-                settings_refreshed = get_settings_or_default(db)
-                
-                cliente = db.query(models.Cliente).filter(models.Cliente.id == db_intervento.cliente_id).first()
-                pdf_bytes = pdf_service.genera_pdf_intervento(db_intervento, settings_refreshed)
-                
-                # Data intervento (usa data_creazione se non c'è data_intervento specifica)
-                data_intervento_email = db_intervento.data_creazione
-                
-                # Dati azienda per footer email
-                azienda_indirizzo = settings_refreshed.indirizzo_completo or ""
-                azienda_telefono = settings_refreshed.telefono or ""
-                azienda_email_contatto = settings_refreshed.email or ""
-                
-                # Email al cliente (se ha email amministrazione)
-                if cliente and cliente.email_amministrazione:
-                    background_tasks.add_task(
-                        send_email_background,
-                        cliente.email_amministrazione,
-                        pdf_bytes,
-                        db_intervento.numero_relazione,
-                        settings_refreshed.nome_azienda,
-                        data_intervento_email,
-                        azienda_indirizzo,
-                        azienda_telefono,
-                        azienda_email_contatto,
-                        db,
-                        f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                    )
-                
-                # Email alla sede di intervento (se presente e ha email)
-                if db_intervento.sede_id:
-                    sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento.sede_id).first()
-                    if sede and sede.email:
-                        background_tasks.add_task(
-                            send_email_background,
-                            sede.email,
-                            pdf_bytes,
-                            db_intervento.numero_relazione,
-                            settings_refreshed.nome_azienda,
-                            data_intervento_email,
-                            azienda_indirizzo,
-                            azienda_telefono,
-                            azienda_email_contatto,
-                            db,
-                            f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                        )
-                
-                # Email all'azienda (se configurata)
-                email_azienda = settings_refreshed.email
-                if email_azienda:
-                    background_tasks.add_task(
-                        send_email_background,
-                        email_azienda,
-                        pdf_bytes,
-                        db_intervento.numero_relazione,
-                        settings_refreshed.nome_azienda,
-                        data_intervento_email,
-                        azienda_indirizzo,
-                        azienda_telefono,
-                        azienda_email_contatto,
-                        db,
-                        f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                    )
+                job_queue.accoda(
+                    db, "email_rit", {"intervento_id": db_intervento.id},
+                    chiave=f"intervento:{db_intervento.id}",
+                    utente_id=current_user.id
+                )
+                db.commit()
         except Exception as e:
-            print(f"Warning: Errore generazione email: {e}")
+            db.rollback()
+            print(f"Warning: Errore accodamento email: {e}")
             import traceback
             traceback.print_exc()
 
@@ -3634,67 +3563,29 @@ def create_intervento(
         print(f"Errore creazione intervento: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/interventi/", response_model=List[schemas.InterventoResponse], tags=["R.I.T."])
+@app.get("/interventi/", response_model=List[schemas.InterventoSummaryResponse], tags=["R.I.T."])
 def read_interventi(
     skip: int = 0, 
     limit: int = 100, 
     q: str = "", 
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
     db: Session = Depends(database.get_db), 
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
     """Ottiene la lista degli interventi con ricerca opzionale per cliente, seriale, part number o prodotto"""
-    base_query = db.query(models.Intervento).filter(models.Intervento.deleted_at.is_(None))  # Escludi interventi eliminati
-    
-    # Se c'è un termine di ricerca, filtra gli interventi
-    if q and q.strip():
-        search_term = f"%{q.strip()}%"
-        raw_term = q.strip().lower()
-        # Cerca per:
-        # 1. Numero relazione
-        # 2. Cliente (ragione sociale)
-        # 3. Serial number nei dettagli
-        # 4. Part number nei dettagli
-        # 5. Descrizione prodotto nei ricambi
-        from sqlalchemy import or_
-        
-        # Cerca nei campi principali dell'intervento
-        # Cerca anche nei dettagli (seriale, part number) e nei ricambi (descrizione)
-        interventi_matching = base_query.all()
-        matching_ids = set()
-        
-        for intervento in interventi_matching:
-            # Verifica dettagli (seriale, part number)
-            for dettaglio in intervento.dettagli:
-                if (dettaglio.serial_number and raw_term in (dettaglio.serial_number or '').lower()) or \
-                   (dettaglio.part_number and raw_term in (dettaglio.part_number or '').lower()) or \
-                   (dettaglio.marca_modello and raw_term in (dettaglio.marca_modello or '').lower()):
-                    matching_ids.add(intervento.id)
-                    break
-            
-            # Verifica ricambi (descrizione prodotto)
-            for ricambio in intervento.ricambi_utilizzati:
-                if ricambio.descrizione and raw_term in ricambio.descrizione.lower():
-                    matching_ids.add(intervento.id)
-                    break
-        
-        filters = [
-            models.Intervento.numero_relazione.ilike(search_term),
-            models.Intervento.cliente_ragione_sociale.ilike(search_term)
-        ]
-        if matching_ids:
-            filters.append(models.Intervento.id.in_(matching_ids))
-        base_query = base_query.filter(or_(*filters))
+    field_names = INTERVENTI_FIELDS.parse(fields)
+    base_query = db.query(models.Intervento).options(
+        *INTERVENTI_FIELDS.query_options(field_names, INTERVENTO_LIST_OPTIONS)
+    ).filter(models.Intervento.deleted_at.is_(None))  # Escludi interventi eliminati
+    
+    # Se c'è un termine di ricerca, filtra gli interventi (numero relazione, cliente,
+    # seriale/part number/marca-modello nei dettagli, descrizione ricambi) direttamente in SQL
+    base_query = search_service.apply_interventi_search(base_query, q)
     
     query = base_query
     
     interventi = query.order_by(desc(models.Intervento.data_creazione)).offset(skip).limit(limit).all()
-    result = []
-    for i in interventi:
-        intervento_dict = convert_intervento_time_fields(i)
-        intervento_dict['dettagli'] = [schemas.DettaglioAssetResponse.model_validate(d) for d in i.dettagli]
-        intervento_dict['ricambi_utilizzati'] = [schemas.RicambioResponse.model_validate(r) for r in i.ricambi_utilizzati]
-        result.append(schemas.InterventoResponse.model_validate(intervento_dict))
-    return result
+    return json_response(INTERVENTI_FIELDS.dump(interventi, field_names))
 
 @app.get("/interventi/paginated", response_model=schemas.PaginatedInterventiResponse, tags=["R.I.T."])
 def read_interventi_paginated(
@@ -3705,11 +3596,18 @@ def read_interventi_paginated(
     date: Optional[str] = None,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Paginazione a cursore: vuoto per la prima pagina, poi il next_cursor ricevuto"),
+    total_mode: str = Query("exact", description="Calcolo del totale: exact, window (stessa query delle righe), estimate, capped"),
+    total_cap: int = Query(DEFAULT_TOTAL_CAP, ge=1, description="Soglia per total_mode=capped"),
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
-    """Ottiene la lista degli interventi con paginazione e total count."""
-    base_query = db.query(models.Intervento).filter(models.Intervento.deleted_at.is_(None))
+    """Ottiene la lista degli interventi con paginazione (offset o cursore) e total count."""
+    field_names = INTERVENTI_FIELDS.parse(fields)
+    base_query = db.query(models.Intervento).options(
+        *INTERVENTI_FIELDS.query_options(field_names, INTERVENTO_LIST_OPTIONS)
+    ).filter(models.Intervento.deleted_at.is_(None))
 
     if today or date or date_from or date_to:
         try:
@@ -3746,49 +3644,30 @@ def read_interventi_paginated(
         if end_dt:
             base_query = base_query.filter(models.Intervento.data_creazione < end_dt)
 
-    if q and q.strip():
-        search_term = f"%{q.strip()}%"
-        raw_term = q.strip().lower()
-        from sqlalchemy import or_
-
-        interventi_matching = base_query.all()
-        matching_ids = set()
-
-        for intervento in interventi_matching:
-            for dettaglio in intervento.dettagli:
-                if (dettaglio.serial_number and raw_term in (dettaglio.serial_number or '').lower()) or \
-                   (dettaglio.part_number and raw_term in (dettaglio.part_number or '').lower()) or \
-                   (dettaglio.marca_modello and raw_term in (dettaglio.marca_modello or '').lower()):
-                    matching_ids.add(intervento.id)
-                    break
-
-            for ricambio in intervento.ricambi_utilizzati:
-                if ricambio.descrizione and raw_term in ricambio.descrizione.lower():
-                    matching_ids.add(intervento.id)
-                    break
-
-        filters = [
-            models.Intervento.numero_relazione.ilike(search_term),
-            models.Intervento.cliente_ragione_sociale.ilike(search_term)
-        ]
-        if matching_ids:
-            filters.append(models.Intervento.id.in_(matching_ids))
-        base_query = base_query.filter(or_(*filters))
+    base_query = search_service.apply_interventi_search(base_query, q)
 
     query = base_query
-    total = query.order_by(None).count()
-    interventi = query.order_by(desc(models.Intervento.data_creazione)).offset(skip).limit(limit).all()
-    items = []
-    for i in interventi:
-        intervento_dict = convert_intervento_time_fields(i)
-        intervento_dict['dettagli'] = [schemas.DettaglioAssetResponse.model_validate(d) for d in i.dettagli]
-        intervento_dict['ricambi_utilizzati'] = [schemas.RicambioResponse.model_validate(r) for r in i.ricambi_utilizzati]
-        items.append(schemas.InterventoResponse.model_validate(intervento_dict))
-    return {"items": items, "total": total}
+    interventi, page_meta = fetch_page(
+        query, models.Intervento.data_creazione, models.Intervento.id,
+        skip=skip, limit=limit, cursor=cursor, total_mode=total_mode, total_cap=total_cap
+    )
+    return json_response({"items": INTERVENTI_FIELDS.dump(interventi, field_names), **page_meta})
 
 @app.get("/interventi/{intervento_id}", response_model=schemas.InterventoResponse, tags=["R.I.T."])
-def read_intervento(intervento_id: int, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
-    intervento = db.query(models.Intervento).filter(
+def read_intervento(intervento_id: int, request: Request, response: Response, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
+    # GET condizionale prima di caricare dettagli, ricambi e firme
+    updated_at = db.query(models.Intervento.updated_at).filter(
+        models.Intervento.id == intervento_id,
+        models.Intervento.deleted_at.is_(None)
+    ).scalar()
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    headers = cache_headers(make_etag("intervento", intervento_id, updated_at), PRIVATE_REVALIDATE, updated_at)
+    if is_not_modified(request, headers["ETag"], updated_at):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+
+    intervento = db.query(models.Intervento).options(*INTERVENTO_RELAZIONI_OPTIONS).filter(
         models.Intervento.id == intervento_id,
         models.Intervento.deleted_at.is_(None)  # Escludi interventi eliminati
     ).first()
@@ -3802,7 +3681,6 @@ def read_intervento(intervento_id: int, db: Session = Depends(database.get_db),
 def update_intervento(
     intervento_id: int,
     intervento_update: schemas.InterventoCreate,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
@@ -3999,124 +3877,22 @@ def update_intervento(
         ip_address=get_client_ip(request)
     )
     
-    # Genera e invia PDF per email se è un prelievo copie con letture copie associate
-    # Questo è necessario perché le letture copie vengono aggiunte durante l'update
-    # IMPORTANTE: Non inviare email durante la creazione iniziale se è un prelievo copie
-    # perché le letture copie non sono ancora disponibili. Invia solo durante l'update.
+    # Prelievo copie con letture copie associate: PDF ed email nel job "email_rit" (worker).
+    # Le letture copie vengono aggiunte dopo la creazione, quindi l'invio parte dall'update
     try:
-        # Verifica se ci sono letture copie associate all'intervento
-        letture_copie_count = db.query(models.LetturaCopie).filter(
+        if db_intervento.is_prelievo_copie and db.query(models.LetturaCopie.id).filter(
             models.LetturaCopie.intervento_id == db_intervento.id
-        ).count()
-        
-        print(f"[UPDATE EMAIL PDF] Verifica prelievo copie: is_prelievo_copie={db_intervento.is_prelievo_copie}, letture_copie_count={letture_copie_count}")
-        
-        # Se è un prelievo copie e ci sono letture copie associate, genera e invia il PDF
-        if db_intervento.is_prelievo_copie and letture_copie_count > 0:
-            print(f"[UPDATE EMAIL PDF] Rilevato prelievo copie con {letture_copie_count} letture copie - Generazione PDF per email")
-            
-            # IMPORTANTE: Ricarica l'intervento DOPO il commit per assicurarsi che tutte le modifiche siano salvate
-            # Non usare db.refresh perché potrebbe non funzionare correttamente dopo il commit
-            # Ricarica completamente l'intervento dalla sessione
-            db_intervento_fresh = db.query(models.Intervento).filter(models.Intervento.id == db_intervento.id).first()
-            if not db_intervento_fresh:
-                print(f"[UPDATE EMAIL PDF] ERRORE: Intervento {db_intervento.id} non trovato dopo il commit!")
-                raise Exception(f"Intervento {db_intervento.id} non trovato")
-            
-            # Forza il caricamento delle relazioni
-            _ = db_intervento_fresh.dettagli  # Carica dettagli
-            _ = db_intervento_fresh.ricambi_utilizzati  # Carica ricambi
-            
-            # Carica letture copie con informazioni asset
-            db_intervento_fresh.letture_copie = db.query(models.LetturaCopie).filter(
-                models.LetturaCopie.intervento_id == db_intervento_fresh.id
-            ).all()
-            
-            print(f"[UPDATE EMAIL PDF] Letture copie caricate dal DB: {len(db_intervento_fresh.letture_copie)}")
-            
-            # Carica informazioni asset per ogni lettura copie
-            for lettura in db_intervento_fresh.letture_copie:
-                if lettura.asset_id:
-                    asset = db.query(models.AssetCliente).filter(models.AssetCliente.id == lettura.asset_id).first()
-                    if asset:
-                        # Aggiungi informazioni asset alla lettura (come attributi temporanei)
-                        lettura.asset_marca = asset.marca or ''
-                        lettura.asset_modello = asset.modello or ''
-                        lettura.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
-                        print(f"[UPDATE EMAIL PDF] Asset caricato per lettura {lettura.id}: {lettura.asset_marca_modello}")
-                    else:
-                        print(f"[UPDATE EMAIL PDF] ATTENZIONE: Asset {lettura.asset_id} non trovato per lettura {lettura.id}")
-                else:
-                    print(f"[UPDATE EMAIL PDF] ATTENZIONE: Lettura {lettura.id} senza asset_id")
-            
-            # Ricarica le impostazioni azienda
-            settings_refreshed = get_settings_or_default(db)
-            
-            # Genera il PDF usando l'intervento ricaricato
-            pdf_bytes = pdf_service.genera_pdf_intervento(db_intervento_fresh, settings_refreshed)
-            
-            # Data intervento
-            data_intervento_email = db_intervento_fresh.data_creazione
-            
-            # Dati azienda per footer email
-            azienda_indirizzo = settings_refreshed.indirizzo_completo or ""
-            azienda_telefono = settings_refreshed.telefono or ""
-            azienda_email_contatto = settings_refreshed.email or ""
-            
-            # Carica cliente
-            cliente = db.query(models.Cliente).filter(models.Cliente.id == db_intervento_fresh.cliente_id).first()
-            
-            # Email al cliente (se ha email amministrazione)
-            if cliente and cliente.email_amministrazione:
-                background_tasks.add_task(
-                    send_email_background,
-                    cliente.email_amministrazione,
-                    pdf_bytes,
-                    db_intervento_fresh.numero_relazione,
-                    settings_refreshed.nome_azienda,
-                    data_intervento_email,
-                    azienda_indirizzo,
-                    azienda_telefono,
-                    azienda_email_contatto,
-                    db
-                )
-            
-            # Email alla sede di intervento (se presente e ha email)
-            if db_intervento_fresh.sede_id:
-                sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento_fresh.sede_id).first()
-                if sede and sede.email:
-                    background_tasks.add_task(
-                        send_email_background,
-                        sede.email,
-                        pdf_bytes,
-                        db_intervento_fresh.numero_relazione,
-                        settings_refreshed.nome_azienda,
-                        data_intervento_email,
-                        azienda_indirizzo,
-                        azienda_telefono,
-                        azienda_email_contatto,
-                        db
-                    )
-            
-            # Email all'azienda (se configurata)
-            email_azienda = settings_refreshed.email
-            if email_azienda:
-                background_tasks.add_task(
-                    send_email_background,
-                    email_azienda,
-                    pdf_bytes,
-                    db_intervento_fresh.numero_relazione,
-                    settings_refreshed.nome_azienda,
-                    data_intervento_email,
-                    azienda_indirizzo,
-                    azienda_telefono,
-                    azienda_email_contatto,
-                    db
-                )
-            
-            print(f"[UPDATE EMAIL PDF] PDF generato e email programmate per RIT {db_intervento_fresh.numero_relazione}")
+        ).first():
+            job_id = job_queue.accoda(
+                db, "email_rit", {"intervento_id": db_intervento.id},
+                chiave=f"intervento:{db_intervento.id}",
+                utente_id=current_user.id
+            )
+            db.commit()
+            print(f"[UPDATE EMAIL PDF] Email prelievo copie per RIT {db_intervento.numero_relazione} nel job {job_id}")
     except Exception as e:
-        print(f"[UPDATE EMAIL PDF] Warning: Errore generazione email durante update: {e}")
+        db.rollback()
+        print(f"[UPDATE EMAIL PDF] Warning: Errore accodamento email durante update: {e}")
         import traceback
         traceback.print_exc()
     
@@ -4192,33 +3968,23 @@ def delete_intervento(
 # In backend/app/main.py
 
 @app.get("/interventi/{intervento_id}/pdf", tags=["R.I.T."])
-def download_pdf_rit(intervento_id: int, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
+def download_pdf_rit(intervento_id: int, request: Request, db: Session = Depends(database.get_db), current_user: models.Utente = Depends(auth.get_current_active_user)):
     rit = db.query(models.Intervento).filter(
         models.Intervento.id == intervento_id,
         models.Intervento.deleted_at.is_(None)  # Escludi interventi eliminati
     ).first()
     if not rit: raise HTTPException(status_code=404, detail="Not found")
     
-    # Carica le letture copie associate all'intervento con informazioni asset
-    if rit.is_prelievo_copie:
-        rit.letture_copie = db.query(models.LetturaCopie).filter(
-            models.LetturaCopie.intervento_id == intervento_id
-        ).all()
-        
-        # Carica informazioni asset per ogni lettura copie
-        for lettura in rit.letture_copie:
-            if lettura.asset_id:
-                asset = db.query(models.AssetCliente).filter(models.AssetCliente.id == lettura.asset_id).first()
-                if asset:
-                    # Aggiungi informazioni asset alla lettura (come attributi temporanei)
-                    lettura.asset_marca = asset.marca or ''
-                    lettura.asset_modello = asset.modello or ''
-                    lettura.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
-    
-    azienda = get_settings_or_default(db)
-    
     try:
-        pdf_content = pdf_service.genera_pdf_intervento(rit, azienda)
+        # RIT firmato: file archiviato (nuova revisione solo se modificato dopo la firma)
+        pdf_path = pdf_finali_service.pdf_finale(db, "rit", rit)
+        if pdf_path is not None:
+            return pdf_finali_service.risposta_download(request, pdf_path, rit.numero_relazione)
+
+        # Carica le letture copie associate all'intervento con informazioni asset
+        pdf_finali_service.prepara_intervento(db, rit)
+        azienda = get_settings_or_default(db)
+        pdf_content = pdf_cache.pdf_intervento(rit, azienda)
         # Usa 'attachment' per forzare il download con il nome corretto
         # Usa filename* per supporto Unicode (RFC 5987)
         filename = rit.numero_relazione
@@ -4282,7 +4048,6 @@ def get_ultima_lettura(
 @app.post("/letture-copie/", response_model=schemas.LetturaCopieResponse, tags=["Letture Copie"])
 def create_lettura_copie(
     lettura: schemas.LetturaCopieCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
@@ -4424,200 +4189,26 @@ def create_lettura_copie(
         tecnico_id=current_user.id
     )
     db.add(db_lettura)
+    
+    # Prelievo copie: PDF ed email nel job "email_rit", dopo che il frontend ha creato tutte le letture.
+    # Ogni lettura sposta in avanti il job dell'intervento (debounce condiviso tra i processi,
+    # vedi job_handlers.programma_email_prelievo): parte un solo invio a letture concluse.
+    # Job e lettura vengono confermati nella stessa transazione
+    job_id = None
+    if db_lettura.intervento_id:
+        intervento = db.query(models.Intervento).filter(models.Intervento.id == db_lettura.intervento_id).first()
+        if not intervento:
+            print(f"[CREATE LETTURA COPIE] ATTENZIONE: Intervento {db_lettura.intervento_id} non trovato!")
+        elif intervento.is_prelievo_copie:
+            job_id = job_handlers.programma_email_prelievo(db, intervento.id, utente_id=current_user.id)
     db.commit()
     db.refresh(db_lettura)
     
     # Verifica che l'intervento_id sia stato salvato correttamente
     print(f"[CREATE LETTURA COPIE] Lettura copie creata con ID: {db_lettura.id}")
     print(f"[CREATE LETTURA COPIE] intervento_id salvato: {db_lettura.intervento_id}")
-    
-    # Se la lettura copie è associata a un intervento, verifica se è un prelievo copie
-    # e invia l'email dopo un breve delay per permettere la creazione di tutte le letture copie
-    if db_lettura.intervento_id:
-        print(f"[CREATE LETTURA COPIE] Verifica intervento {db_lettura.intervento_id} per invio email")
-        intervento = db.query(models.Intervento).filter(models.Intervento.id == db_lettura.intervento_id).first()
-        if intervento:
-            print(f"[CREATE LETTURA COPIE] Intervento trovato: id={intervento.id}, is_prelievo_copie={intervento.is_prelievo_copie}")
-        else:
-            print(f"[CREATE LETTURA COPIE] ATTENZIONE: Intervento {db_lettura.intervento_id} non trovato!")
-        
-        if intervento and intervento.is_prelievo_copie:
-            print(f"[CREATE LETTURA COPIE] Intervento {intervento.id} è un prelievo copie - Verifica programmazione email")
-            
-            # Usa un meccanismo di debouncing: programma l'email solo se non è già stata programmata
-            # per questo intervento negli ultimi 5 secondi
-            global _interventi_email_programmate
-            
-            # Rimuovi gli interventi più vecchi di 10 secondi dal set
-            import time as time_module
-            current_time = time_module.time()
-            _interventi_email_programmate = {
-                (interv_id, timestamp) for interv_id, timestamp in _interventi_email_programmate
-                if current_time - timestamp < 10
-            }
-            
-            # Verifica se l'email è già stata programmata per questo intervento
-            email_gia_programmata = any(
-                interv_id == db_lettura.intervento_id and (current_time - timestamp) < 5
-                for interv_id, timestamp in _interventi_email_programmate
-            )
-            
-            if email_gia_programmata:
-                print(f"[CREATE LETTURA COPIE] Email già programmata per intervento {db_lettura.intervento_id} - Skip")
-            else:
-                # Aggiungi l'intervento al set
-                _interventi_email_programmate.add((db_lettura.intervento_id, current_time))
-                print(f"[CREATE LETTURA COPIE] Intervento {intervento.id} è un prelievo copie - Programmazione invio email")
-                
-                # Programma l'invio email dopo 3 secondi per permettere la creazione di tutte le letture copie
-                def send_email_after_letture_copie(intervento_id: int):
-                    """Funzione che viene eseguita dopo un delay per inviare l'email"""
-                    print(f"[CREATE LETTURA COPIE EMAIL] Avvio funzione invio email per intervento {intervento_id}")
-                    # Crea una nuova sessione DB per questa operazione asincrona
-                    from .database import SessionLocal
-                    db_email = SessionLocal()
-                    try:
-                        # Attendi 3 secondi per assicurarsi che tutte le letture copie siano state create
-                        import time
-                        print(f"[CREATE LETTURA COPIE EMAIL] Attendo 3 secondi...")
-                        time.sleep(3)
-                        
-                        # Verifica se ci sono altre letture copie create negli ultimi 2 secondi
-                        # Se sì, aspetta ancora un po' per evitare di inviare email multiple
-                        from datetime import timedelta
-                        letture_recenti = db_email.query(models.LetturaCopie).filter(
-                            models.LetturaCopie.intervento_id == intervento_id,
-                            models.LetturaCopie.created_at >= (datetime.now() - timedelta(seconds=2))
-                        ).count()
-                        
-                        if letture_recenti > 0:
-                            # Ci sono letture copie create molto recentemente, aspetta ancora 2 secondi
-                            print(f"[CREATE LETTURA COPIE EMAIL] Trovate {letture_recenti} letture copie recenti, attendo altri 2 secondi...")
-                            time.sleep(2)
-                        
-                        # Rimuovi l'intervento dal set dopo che l'email è stata inviata
-                        global _interventi_email_programmate
-                        _interventi_email_programmate = {
-                            (interv_id, timestamp) for interv_id, timestamp in _interventi_email_programmate
-                            if interv_id != intervento_id
-                        }
-                        
-                        # Ricarica l'intervento
-                        db_intervento_email = db_email.query(models.Intervento).filter(models.Intervento.id == intervento_id).first()
-                        if not db_intervento_email or not db_intervento_email.is_prelievo_copie:
-                            print(f"[CREATE LETTURA COPIE EMAIL] Intervento {intervento_id} non trovato o non è un prelievo copie")
-                            return
-                        
-                        # Verifica se ci sono letture copie associate
-                        letture_copie_count = db_email.query(models.LetturaCopie).filter(
-                            models.LetturaCopie.intervento_id == intervento_id
-                        ).count()
-                        
-                        if letture_copie_count == 0:
-                            print(f"[CREATE LETTURA COPIE EMAIL] Nessuna lettura copie trovata per intervento {intervento_id}")
-                            return
-                        
-                        print(f"[CREATE LETTURA COPIE EMAIL] Trovate {letture_copie_count} letture copie per intervento {intervento_id} - Generazione PDF per email")
-                        
-                        # Forza il caricamento delle relazioni
-                        _ = db_intervento_email.dettagli  # Carica dettagli
-                        _ = db_intervento_email.ricambi_utilizzati  # Carica ricambi
-                        
-                        # Carica tutte le letture copie con informazioni asset
-                        db_intervento_email.letture_copie = db_email.query(models.LetturaCopie).filter(
-                            models.LetturaCopie.intervento_id == intervento_id
-                        ).all()
-                        
-                        print(f"[CREATE LETTURA COPIE EMAIL] Letture copie caricate: {len(db_intervento_email.letture_copie)}")
-                        
-                        # Carica informazioni asset per ogni lettura copie
-                        for lettura_item in db_intervento_email.letture_copie:
-                            if lettura_item.asset_id:
-                                asset = db_email.query(models.AssetCliente).filter(models.AssetCliente.id == lettura_item.asset_id).first()
-                                if asset:
-                                    lettura_item.asset_marca = asset.marca or ''
-                                    lettura_item.asset_modello = asset.modello or ''
-                                    lettura_item.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
-                                    print(f"[CREATE LETTURA COPIE EMAIL] Asset caricato per lettura {lettura_item.id}: {lettura_item.asset_marca_modello}")
-                        
-                        # Ricarica le impostazioni azienda
-                        settings_refreshed = get_settings_or_default(db_email)
-                        
-                        # Genera il PDF usando l'intervento ricaricato
-                        pdf_bytes = pdf_service.genera_pdf_intervento(db_intervento_email, settings_refreshed)
-                        
-                        # Data intervento
-                        data_intervento_email = db_intervento_email.data_creazione
-                        
-                        # Dati azienda per footer email
-                        azienda_indirizzo = settings_refreshed.indirizzo_completo or ""
-                        azienda_telefono = settings_refreshed.telefono or ""
-                        azienda_email_contatto = settings_refreshed.email or ""
-                        
-                        # Carica cliente
-                        cliente = db_email.query(models.Cliente).filter(models.Cliente.id == db_intervento_email.cliente_id).first()
-                        
-                        # Email al cliente (se ha email amministrazione)
-                        if cliente and cliente.email_amministrazione:
-                            send_email_background(
-                                cliente.email_amministrazione,
-                                pdf_bytes,
-                                db_intervento_email.numero_relazione,
-                                settings_refreshed.nome_azienda,
-                                data_intervento_email,
-                                azienda_indirizzo,
-                                azienda_telefono,
-                                azienda_email_contatto,
-                                db_email,
-                                f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                            )
-                            print(f"[CREATE LETTURA COPIE EMAIL] Email inviata a cliente: {cliente.email_amministrazione}")
-                        
-                        # Email alla sede di intervento (se presente e ha email)
-                        if db_intervento_email.sede_id:
-                            sede = db_email.query(models.SedeCliente).filter(models.SedeCliente.id == db_intervento_email.sede_id).first()
-                            if sede and sede.email:
-                                send_email_background(
-                                    sede.email,
-                                    pdf_bytes,
-                                    db_intervento_email.numero_relazione,
-                                    settings_refreshed.nome_azienda,
-                                    data_intervento_email,
-                                    azienda_indirizzo,
-                                    azienda_telefono,
-                                    azienda_email_contatto,
-                                    db_email,
-                                    f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                                )
-                                print(f"[CREATE LETTURA COPIE EMAIL] Email inviata a sede: {sede.email}")
-                        
-                        # Email all'azienda (se configurata)
-                        email_azienda = settings_refreshed.email
-                        if email_azienda:
-                            send_email_background(
-                                email_azienda,
-                                pdf_bytes,
-                                db_intervento_email.numero_relazione,
-                                settings_refreshed.nome_azienda,
-                                data_intervento_email,
-                                azienda_indirizzo,
-                                azienda_telefono,
-                                azienda_email_contatto,
-                                db_email,
-                                f"GIT - {settings_refreshed.nome_azienda or 'GIT'} - Gestione RIT"
-                            )
-                            print(f"[CREATE LETTURA COPIE EMAIL] Email inviata ad azienda: {email_azienda}")
-                        
-                        print(f"[CREATE LETTURA COPIE EMAIL] PDF generato e email inviate per RIT {db_intervento_email.numero_relazione}")
-                    except Exception as e:
-                        print(f"[CREATE LETTURA COPIE EMAIL] Warning: Errore generazione email durante creazione lettura copie: {e}")
-                        import traceback
-                        traceback.print_exc()
-                    finally:
-                        db_email.close()
-                
-                # Programma l'invio email dopo 3 secondi
-                background_tasks.add_task(send_email_after_letture_copie, db_lettura.intervento_id)
+    if job_id is not None:
+        print(f"[CREATE LETTURA COPIE] Email prelievo copie per intervento {db_lettura.intervento_id} nel job {job_id}")
     
     return db_lettura
 
@@ -4657,7 +4248,7 @@ def get_audit_logs(
     
     # Ordina per timestamp decrescente (più recenti prima)
     logs = query.order_by(desc(models.AuditLog.timestamp)).offset(skip).limit(limit).all()
-    return logs
+    return json_response(rows_to_dicts(schemas.AuditLogResponse, logs))
 
 @app.get("/api/audit-logs/paginated", response_model=schemas.PaginatedAuditLogResponse, tags=["Audit Log"])
 def get_audit_logs_paginated(
@@ -4669,10 +4260,13 @@ def get_audit_logs_paginated(
     action: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    cursor: Optional[str] = Query(None, description="Paginazione a cursore: vuoto per la prima pagina, poi il next_cursor ricevuto"),
+    total_mode: str = Query("exact", description="Calcolo del totale: exact, window (stessa query delle righe), estimate, capped"),
+    total_cap: int = Query(DEFAULT_TOTAL_CAP, ge=1, description="Soglia per total_mode=capped"),
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.require_admin)
 ):
-    """Recupera i log di audit con paginazione e total count."""
+    """Recupera i log di audit con paginazione (offset o cursore) e total count."""
     query = db.query(models.AuditLog)
 
     if entity_type:
@@ -4688,9 +4282,11 @@ def get_audit_logs_paginated(
     if end_date:
         query = query.filter(models.AuditLog.timestamp <= end_date)
 
-    total = query.order_by(None).count()
-    logs = query.order_by(desc(models.AuditLog.timestamp)).offset(skip).limit(limit).all()
-    return {"items": logs, "total": total}
+    logs, page_meta = fetch_page(
+        query, models.AuditLog.timestamp, models.AuditLog.id,
+        skip=skip, limit=limit, cursor=cursor, total_mode=total_mode, total_cap=total_cap
+    )
+    return json_response({"items": rows_to_dicts(schemas.AuditLogResponse, logs), **page_meta})
 
 @app.get("/api/error-stats", tags=["System"])
 @app.get("/api/v1/error-stats", tags=["System", "API v1"])
@@ -4762,7 +4358,6 @@ def get_audit_logs_stats(
 @app.post("/ddt/", response_model=schemas.RitiroProdottoResponse, tags=["DDT"])
 def create_ddt(
     ddt: schemas.RitiroProdottoCreate,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
@@ -4874,7 +4469,8 @@ def create_ddt(
             "stato_updated_at": datetime.now()
         })
 
-        # Gestione assegnazione tecnico post-ritiro
+        # Gestione assegnazione tecnico post-ritiro (riga ORM: l'ultimo tecnico assegnato
+        # viene salvato in configurazioni_avanzate)
         settings = db.query(models.ImpostazioniAzienda).first()
         assegnazione_modalita = settings.ddt_assegnazione_modalita if settings else "manual"
         ddt_data["assegnazione_stato"] = "da_assegnare"
@@ -4944,12 +4540,13 @@ def create_ddt(
         logger.error(f"Errore creazione DDT: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Errore interno durante la creazione: {str(e)}")
 
-@app.get("/ddt/", response_model=List[schemas.RitiroProdottoResponse], tags=["DDT"])
+@app.get("/ddt/", response_model=List[schemas.RitiroProdottoSummaryResponse], tags=["DDT"])
 def list_ddt(
     q: str = "",
     stato: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
@@ -4958,47 +4555,16 @@ def list_ddt(
     if current_user.ruolo != "superadmin" and current_user.ruolo != "admin":
         if not current_user.permessi.get("can_view_ddt", False):
             raise HTTPException(status_code=403, detail="Non hai i permessi per visualizzare DDT")
+    field_names = DDT_FIELDS.parse(fields)
     
-    base_query = db.query(models.RitiroProdotto).filter(
+    base_query = db.query(models.RitiroProdotto).options(
+        *DDT_FIELDS.query_options(field_names, DDT_LIST_OPTIONS)
+    ).filter(
         models.RitiroProdotto.deleted_at.is_(None)
     )
     
-    if q:
-        search = f"%{q}%"
-        raw_term = q.strip().lower()
-        ddt_matching = base_query.all()
-        matching_ids = set()
-
-        for ddt in ddt_matching:
-            for prodotto in (ddt.prodotti or []):
-                if not isinstance(prodotto, dict):
-                    continue
-                for field in (
-                    "tipo_prodotto",
-                    "marca",
-                    "modello",
-                    "serial_number",
-                    "descrizione_prodotto",
-                    "difetto_segnalato",
-                    "difetto_appurato",
-                ):
-                    value = prodotto.get(field)
-                    if value and raw_term in str(value).lower():
-                        matching_ids.add(ddt.id)
-                        break
-                if ddt.id in matching_ids:
-                    break
-
-        filters = [
-            models.RitiroProdotto.numero_ddt.ilike(search),
-            models.RitiroProdotto.cliente_ragione_sociale.ilike(search),
-            models.RitiroProdotto.tipo_prodotto.ilike(search),
-            models.RitiroProdotto.marca.ilike(search),
-            models.RitiroProdotto.modello.ilike(search),
-        ]
-        if matching_ids:
-            filters.append(models.RitiroProdotto.id.in_(matching_ids))
-        base_query = base_query.filter(or_(*filters))
+    # Ricerca su campi DDT e prodotti JSONB eseguita in SQL (indici trigram)
+    base_query = search_service.apply_ddt_search(base_query, q)
     
     if stato:
         if stato == "scartato":
@@ -5008,19 +4574,8 @@ def list_ddt(
     
     ddt_list = base_query.order_by(desc(models.RitiroProdotto.data_ritiro)).offset(skip).limit(limit).all()
     
-    # Aggiungi nome tecnico
-    result = []
-    for ddt in ddt_list:
-        ddt_dict = schemas.RitiroProdottoResponse.model_validate(ddt).model_dump()
-        if ddt.tecnico_rel:
-            ddt_dict["tecnico_nome"] = ddt.tecnico_rel.nome_completo
-        if ddt.tecnico_assegnato_rel:
-            ddt_dict["tecnico_assegnato_nome"] = ddt.tecnico_assegnato_rel.nome_completo
-        if ddt.tecnico_pending_rel:
-            ddt_dict["tecnico_assegnazione_pending_nome"] = ddt.tecnico_pending_rel.nome_completo
-        result.append(ddt_dict)
-    
-    return result
+    # I nomi dei tecnici sono property del modello (relazioni caricate con JOIN)
+    return json_response(DDT_FIELDS.dump(ddt_list, field_names))
 
 @app.get("/ddt/paginated", response_model=schemas.PaginatedDdtResponse, tags=["DDT"])
 def list_ddt_paginated(
@@ -5035,15 +4590,22 @@ def list_ddt_paginated(
     assigned: Optional[bool] = None,
     assigned_to: Optional[int] = None,
     assignment_state: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Paginazione a cursore: vuoto per la prima pagina, poi il next_cursor ricevuto"),
+    total_mode: str = Query("exact", description="Calcolo del totale: exact, window (stessa query delle righe), estimate, capped"),
+    total_cap: int = Query(DEFAULT_TOTAL_CAP, ge=1, description="Soglia per total_mode=capped"),
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
-    """Lista DDT con paginazione e total count."""
+    """Lista DDT con paginazione (offset o cursore) e total count."""
     if current_user.ruolo != "superadmin" and current_user.ruolo != "admin":
         if not current_user.permessi.get("can_view_ddt", False):
             raise HTTPException(status_code=403, detail="Non hai i permessi per visualizzare DDT")
+    field_names = DDT_FIELDS.parse(fields)
 
-    query = db.query(models.RitiroProdotto).filter(
+    query = db.query(models.RitiroProdotto).options(
+        *DDT_FIELDS.query_options(field_names, DDT_LIST_OPTIONS)
+    ).filter(
         models.RitiroProdotto.deleted_at.is_(None)
     )
 
@@ -5089,42 +4651,7 @@ def list_ddt_paginated(
         elif end_dt:
             query = query.filter(models.RitiroProdotto.data_ritiro < end_dt)
 
-    if q:
-        search = f"%{q}%"
-        raw_term = q.strip().lower()
-        ddt_matching = query.all()
-        matching_ids = set()
-
-        for ddt in ddt_matching:
-            for prodotto in (ddt.prodotti or []):
-                if not isinstance(prodotto, dict):
-                    continue
-                for field in (
-                    "tipo_prodotto",
-                    "marca",
-                    "modello",
-                    "serial_number",
-                    "descrizione_prodotto",
-                    "difetto_segnalato",
-                    "difetto_appurato",
-                ):
-                    value = prodotto.get(field)
-                    if value and raw_term in str(value).lower():
-                        matching_ids.add(ddt.id)
-                        break
-                if ddt.id in matching_ids:
-                    break
-
-        filters = [
-            models.RitiroProdotto.numero_ddt.ilike(search),
-            models.RitiroProdotto.cliente_ragione_sociale.ilike(search),
-            models.RitiroProdotto.tipo_prodotto.ilike(search),
-            models.RitiroProdotto.marca.ilike(search),
-            models.RitiroProdotto.modello.ilike(search),
-        ]
-        if matching_ids:
-            filters.append(models.RitiroProdotto.id.in_(matching_ids))
-        query = query.filter(or_(*filters))
+    query = search_service.apply_ddt_search(query, q)
 
     if stato:
         if stato == "scartato":
@@ -5155,25 +4682,18 @@ def list_ddt_paginated(
     if assignment_state:
         query = query.filter(models.RitiroProdotto.assegnazione_stato == assignment_state)
 
-    total = query.order_by(None).count()
-    ddt_list = query.order_by(desc(models.RitiroProdotto.data_ritiro)).offset(skip).limit(limit).all()
-
-    items = []
-    for ddt in ddt_list:
-        ddt_dict = schemas.RitiroProdottoResponse.model_validate(ddt).model_dump()
-        if ddt.tecnico_rel:
-            ddt_dict["tecnico_nome"] = ddt.tecnico_rel.nome_completo
-        if ddt.tecnico_assegnato_rel:
-            ddt_dict["tecnico_assegnato_nome"] = ddt.tecnico_assegnato_rel.nome_completo
-        if ddt.tecnico_pending_rel:
-            ddt_dict["tecnico_assegnazione_pending_nome"] = ddt.tecnico_pending_rel.nome_completo
-        items.append(ddt_dict)
+    ddt_list, page_meta = fetch_page(
+        query, models.RitiroProdotto.data_ritiro, models.RitiroProdotto.id,
+        skip=skip, limit=limit, cursor=cursor, total_mode=total_mode, total_cap=total_cap
+    )
 
-    return {"items": items, "total": total}
+    return json_response({"items": DDT_FIELDS.dump(ddt_list, field_names), **page_meta})
 
 
 @app.get("/ddt/stats", tags=["DDT"])
 def get_ddt_stats(
+    request: Request,
+    response: Response,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
@@ -5183,16 +4703,13 @@ def get_ddt_stats(
         if not current_user.permessi.get("can_view_ddt", False):
             raise HTTPException(status_code=403, detail="Non hai i permessi per visualizzare DDT")
 
-    from sqlalchemy import func
+    # Contatori mantenuti a ogni modifica dei DDT (ddt_contatori_service): un solo lookup
+    counts = ddt_contatori_service.leggi_ambito(db, "stato")
+    headers = cache_headers(make_etag("ddt-stats", sorted(counts.items())), PRIVATE_REVALIDATE)
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
+    response.headers.update(headers)
 
-    stato_expr = func.coalesce(func.nullif(models.RitiroProdotto.stato, ""), "in_magazzino")
-    rows = (
-        db.query(stato_expr, func.count(models.RitiroProdotto.id))
-        .filter(models.RitiroProdotto.deleted_at.is_(None))
-        .group_by(stato_expr)
-        .all()
-    )
-    counts = {stato: count for stato, count in rows}
     total = sum(counts.values())
     non_consegnati = total - counts.get("consegnato", 0)
 
@@ -5203,7 +4720,7 @@ def get_ddt_stats(
     }
 
 
-@app.get("/ddt/oldest", response_model=List[schemas.RitiroProdottoResponse], tags=["DDT"])
+@app.get("/ddt/oldest", response_model=List[schemas.RitiroProdottoSummaryResponse], tags=["DDT"])
 def list_oldest_ddt(
     limit: int = 10,
     exclude_consegnato: bool = True,
@@ -5218,7 +4735,7 @@ def list_oldest_ddt(
 
     from sqlalchemy import func
 
-    query = db.query(models.RitiroProdotto).filter(
+    query = db.query(models.RitiroProdotto).options(*DDT_LIST_OPTIONS).filter(
         models.RitiroProdotto.deleted_at.is_(None)
     )
     if exclude_consegnato:
@@ -5230,21 +4747,12 @@ def list_oldest_ddt(
         .all()
     )
 
-    result = []
-    for ddt in ddt_list:
-        ddt_dict = schemas.RitiroProdottoResponse.model_validate(ddt).model_dump()
-        if ddt.tecnico_rel:
-            ddt_dict["tecnico_nome"] = ddt.tecnico_rel.nome_completo
-        if ddt.tecnico_assegnato_rel:
-            ddt_dict["tecnico_assegnato_nome"] = ddt.tecnico_assegnato_rel.nome_completo
-        if ddt.tecnico_pending_rel:
-            ddt_dict["tecnico_assegnazione_pending_nome"] = ddt.tecnico_pending_rel.nome_completo
-        result.append(ddt_dict)
-
-    return result
+    return json_response(dump_many(schemas.RitiroProdottoSummaryResponse, ddt_list))
 
 @app.get("/ddt/pending-accept-count", tags=["DDT"])
 def get_ddt_pending_accept_count(
+    request: Request,
+    response: Response,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
@@ -5252,11 +4760,15 @@ def get_ddt_pending_accept_count(
     if current_user.ruolo != "tecnico":
         return {"count": 0}
 
-    count = db.query(models.RitiroProdotto).filter(
-        models.RitiroProdotto.deleted_at.is_(None),
-        models.RitiroProdotto.tecnico_assegnazione_pending_id == current_user.id,
-        models.RitiroProdotto.assegnazione_stato.in_(["in_attesa_accettazione", "trasferimento_in_attesa"])
-    ).count()
+    contatori = ddt_contatori_service.leggi(db, [
+        ("tecnico_pending", f"{current_user.id}:in_attesa_accettazione"),
+        ("tecnico_pending", f"{current_user.id}:trasferimento_in_attesa"),
+    ])
+    count = sum(contatori.values())
+    headers = cache_headers(make_etag("ddt-pending", current_user.id, count), PRIVATE_REVALIDATE)
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
+    response.headers.update(headers)
     return {"count": count}
 
 @app.get("/ddt/assignment-stats", tags=["DDT"])
@@ -5268,30 +4780,18 @@ def get_ddt_assignment_stats(
     if current_user.ruolo != "tecnico":
         return {"pending_accept": 0, "assigned": 0, "transfer_pending": 0, "unassigned": 0}
 
-    pending_accept = db.query(models.RitiroProdotto).filter(
-        models.RitiroProdotto.deleted_at.is_(None),
-        models.RitiroProdotto.tecnico_assegnazione_pending_id == current_user.id,
-        models.RitiroProdotto.assegnazione_stato == "in_attesa_accettazione"
-    ).count()
-    transfer_pending = db.query(models.RitiroProdotto).filter(
-        models.RitiroProdotto.deleted_at.is_(None),
-        models.RitiroProdotto.tecnico_assegnazione_pending_id == current_user.id,
-        models.RitiroProdotto.assegnazione_stato == "trasferimento_in_attesa"
-    ).count()
-    assigned = db.query(models.RitiroProdotto).filter(
-        models.RitiroProdotto.deleted_at.is_(None),
-        models.RitiroProdotto.tecnico_assegnato_id == current_user.id
-    ).count()
-    unassigned = db.query(models.RitiroProdotto).filter(
-        models.RitiroProdotto.deleted_at.is_(None),
-        models.RitiroProdotto.tecnico_assegnato_id.is_(None),
-        models.RitiroProdotto.tecnico_assegnazione_pending_id.is_(None)
-    ).count()
+    chiavi = {
+        "pending_accept": ("tecnico_pending", f"{current_user.id}:in_attesa_accettazione"),
+        "transfer_pending": ("tecnico_pending", f"{current_user.id}:trasferimento_in_attesa"),
+        "assigned": ("tecnico_assegnato", str(current_user.id)),
+        "unassigned": ("non_assegnati", "totale"),
+    }
+    contatori = ddt_contatori_service.leggi(db, chiavi.values())
     return {
-        "pending_accept": pending_accept,
-        "assigned": assigned,
-        "transfer_pending": transfer_pending,
-        "unassigned": unassigned
+        "pending_accept": contatori[chiavi["pending_accept"]],
+        "assigned": contatori[chiavi["assigned"]],
+        "transfer_pending": contatori[chiavi["transfer_pending"]],
+        "unassigned": contatori[chiavi["unassigned"]]
     }
 
 @app.get("/ddt/{ddt_id}", response_model=schemas.RitiroProdottoResponse, tags=["DDT"])
@@ -5306,7 +4806,7 @@ def get_ddt(
         if not current_user.permessi.get("can_view_ddt", False):
             raise HTTPException(status_code=403, detail="Non hai i permessi per visualizzare DDT")
     
-    db_ddt = db.query(models.RitiroProdotto).filter(
+    db_ddt = db.query(models.RitiroProdotto).options(*DDT_TECNICI_OPTIONS).filter(
         models.RitiroProdotto.id == ddt_id,
         models.RitiroProdotto.deleted_at.is_(None)
     ).first()
@@ -5327,7 +4827,6 @@ def get_ddt(
 def update_ddt(
     ddt_id: int,
     ddt: schemas.RitiroProdottoUpdate,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
@@ -5479,7 +4978,7 @@ def assign_ddt(
     db.refresh(db_ddt)
 
     try:
-        settings = db.query(models.ImpostazioniAzienda).first()
+        settings = settings_cache.get_settings(db)
         send_ddt_assignment_email(db, db_ddt, tecnico, settings)
     except Exception as e:
         logger.warning(f"Errore invio email assegnazione DDT: {e}")
@@ -5656,7 +5155,7 @@ def request_ddt_transfer(
             recipients = set()
             if tecnico.email:
                 recipients.add(tecnico.email)
-            settings = db.query(models.ImpostazioniAzienda).first()
+            settings = settings_cache.get_settings(db)
             if settings and settings.email_responsabile_ddt:
                 recipients.update(parse_email_list(settings.email_responsabile_ddt))
             if recipients:
@@ -5733,7 +5232,7 @@ def request_ddt_assignment(
 
     # Email ai responsabili DDT
     try:
-        settings = db.query(models.ImpostazioniAzienda).first()
+        settings = settings_cache.get_settings(db)
         smtp_config = email_service.get_smtp_config(db)
         if smtp_config.get("username") and smtp_config.get("password") and settings and settings.email_responsabile_ddt:
             recipients = parse_email_list(settings.email_responsabile_ddt)
@@ -5878,7 +5377,6 @@ def upload_foto_ddt(
 @app.post("/ddt/{ddt_id}/send-email", tags=["DDT"])
 def send_ddt_email(
     ddt_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
@@ -5907,15 +5405,15 @@ def send_ddt_email(
     if not recipients:
         raise HTTPException(status_code=400, detail="Nessun destinatario email configurato")
 
-    for email_to in recipients:
-        background_tasks.add_task(
-            send_email_ddt_background,
-            db_ddt.id,
-            email_to,
-            db=db
-        )
+    # PDF ed email nel job "email_ddt" (worker): la risposta non attende il render
+    job_id = job_queue.accoda(
+        db, "email_ddt", {"ddt_id": db_ddt.id, "destinatari": sorted(recipients)},
+        utente_id=current_user.id
+    )
+    db.commit()
 
-    return {"ok": True, "sent": len(recipients)}
+    # "queued": le email partono dal worker, l'esito è in GET /api/jobs/{job_id}
+    return {"ok": True, "queued": len(recipients), "job_id": job_id}
 
 @app.post("/superadmin/import/clienti", tags=["SuperAdmin"])
 def import_clienti(
@@ -6246,6 +5744,7 @@ def set_sede_legale_from_import(
 @app.get("/ddt/{ddt_id}/pdf", tags=["DDT"])
 def download_pdf_ddt(
     ddt_id: int,
+    request: Request,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.get_current_active_user)
 ):
@@ -6263,10 +5762,14 @@ def download_pdf_ddt(
     if not db_ddt:
         raise HTTPException(status_code=404, detail="DDT non trovato")
     
-    azienda = get_settings_or_default(db)
-    
     try:
-        pdf_content = pdf_service.genera_pdf_ddt(db_ddt, azienda)
+        # DDT firmato: file archiviato (nuova revisione solo se modificato dopo la firma)
+        pdf_path = pdf_finali_service.pdf_finale(db, "ddt", db_ddt)
+        if pdf_path is not None:
+            return pdf_finali_service.risposta_download(request, pdf_path, db_ddt.numero_ddt)
+
+        azienda = get_settings_or_default(db)
+        pdf_content = pdf_cache.pdf_ddt(db_ddt, azienda)
         filename = db_ddt.numero_ddt
         return Response(
             content=pdf_content,
@@ -6279,71 +5782,6 @@ def download_pdf_ddt(
         logger.error(f"Errore generazione PDF DDT: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Errore generazione PDF: {str(e)}")
 
-def send_email_ddt_background(ddt_id: int, email_to: str, db: Session = None):
-    """Invia email con PDF DDT in background"""
-    if not db:
-        logger.info(f"[EMAIL MOCK] Invio email DDT {ddt_id} a {email_to}")
-        return
-
-    try:
-        db_ddt = db.query(models.RitiroProdotto).filter(
-            models.RitiroProdotto.id == ddt_id,
-            models.RitiroProdotto.deleted_at.is_(None)
-        ).first()
-        if not db_ddt:
-            logger.warning(f"DDT {ddt_id} non trovato per invio email")
-            return
-
-        settings = get_settings_or_default(db)
-        smtp_config = email_service.get_smtp_config(db)
-        if not smtp_config.get('username') or not smtp_config.get('password'):
-            logger.info(f"[EMAIL MOCK - SMTP non configurato] DDT {db_ddt.numero_ddt} -> {email_to}")
-            return
-
-        pdf_content = pdf_service.genera_pdf_ddt(db_ddt, settings)
-
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.text import MIMEText
-        from email.mime.base import MIMEBase
-        from email import encoders
-
-        data_ddt = db_ddt.data_ritiro.strftime('%d/%m/%Y') if db_ddt.data_ritiro else datetime.now().strftime('%d/%m/%Y')
-        subject = f"DDT {db_ddt.numero_ddt} - {settings.nome_azienda or 'Documento di Trasporto'}"
-
-        body_html = f"""
-        <div style="font-family: Arial, sans-serif; color: #333;">
-            <p>Gentile Cliente,</p>
-            <p>in allegato trova il Documento di Trasporto <strong>{db_ddt.numero_ddt}</strong> del <strong>{data_ddt}</strong>.</p>
-            <p>Cordiali saluti,<br>{settings.nome_azienda or ''}</p>
-        </div>
-        """
-
-        from email.utils import formataddr
-        msg = MIMEMultipart()
-        smtp_from = smtp_config.get('from_email', smtp_config.get('username'))
-        msg['From'] = formataddr((f"GIT - {settings.nome_azienda or 'GIT'} - DDT", smtp_from))
-        msg['To'] = email_to
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body_html, 'html'))
-
-        # Allegato PDF
-        part = MIMEBase('application', 'pdf')
-        part.set_payload(pdf_content)
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f'attachment; filename="{db_ddt.numero_ddt}.pdf"')
-        msg.attach(part)
-
-        import smtplib
-        with smtplib.SMTP(smtp_config.get('host'), smtp_config.get('port')) as server:
-            if smtp_config.get('use_tls', True):
-                server.starttls()
-            server.login(smtp_config.get('username'), smtp_config.get('password'))
-            server.send_message(msg)
-
-        logger.info(f"Email DDT {db_ddt.numero_ddt} inviata a {email_to}")
-    except Exception as e:
-        logger.error(f"Errore invio email DDT {ddt_id} a {email_to}: {str(e)}", exc_info=True)
-
 def get_ddt_email_recipients(
     db: Session,
     ddt: models.RitiroProdotto,
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Time, Enum as SqlEnum, Numeric
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Time, Enum as SqlEnum, Numeric, LargeBinary
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session
 from datetime import datetime
+import base64
 import enum
 from .database import Base
 
@@ -94,6 +95,7 @@ class Cliente(Base):
     
     # Soft delete
     deleted_at = Column(DateTime, nullable=True, index=True)  # Timestamp di cancellazione (null = non cancellato)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)  # Versione per ETag/Last-Modified (vedi versioni_service)
     
     # Relazioni
     assets_noleggio = relationship("AssetCliente", back_populates="cliente", cascade="all, delete-orphan")
@@ -165,6 +167,48 @@ class ProdottoMagazzino(Base):
     deleted_at = Column(DateTime, nullable=True, index=True)  # Timestamp di cancellazione (null = non cancellato)
 
 # --- MODELLO INTERVENTO ---
+class Firma(Base):
+    """Immagine di una firma, salvata una sola volta per contenuto (sha256 dei byte decodificati)."""
+    __tablename__ = "firme"
+    hash = Column(String(64), primary_key=True)
+    mime_type = Column(String, nullable=False, default="image/png")
+    dati = Column(LargeBinary, nullable=False)
+    dimensione = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    @property
+    def data_uri(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.dati).decode('ascii')}"
+
+def _firma_property(campo: str):
+    """
+    Espone `<campo>` come data URI base64 (contratto storico delle API e dei template PDF).
+
+    Lettura: valore inline (record non ancora migrati o appena assegnati) oppure immagine
+    della tabella firme, caricata solo al primo accesso. Scrittura: il valore resta inline
+    finché firme_service non lo sposta nella tabella firme al flush.
+    """
+    inline_attr = f"{campo}_inline"
+    hash_attr = f"{campo}_hash"
+
+    def getter(self):
+        inline = getattr(self, inline_attr)
+        if inline:
+            return inline
+        firma_hash = getattr(self, hash_attr)
+        if not firma_hash:
+            return None
+        session = object_session(self)
+        firma = session.get(Firma, firma_hash) if session is not None else None
+        return firma.data_uri if firma else None
+
+    def setter(self, value):
+        setattr(self, inline_attr, value or None)
+        if not value:
+            setattr(self, hash_attr, None)
+
+    return property(getter, setter)
+
 class Intervento(Base):
     __tablename__ = "interventi"
 
@@ -210,14 +254,26 @@ class Intervento(Base):
     ora_inizio = Column(Time, nullable=True)
     ora_fine = Column(Time, nullable=True)
     
-    # Dati Firma (Nuovi) - Salviamo il Base64 direttamente o il path
-    firma_tecnico = Column(Text, nullable=True) # Text perché base64 è lungo
-    firma_cliente = Column(Text, nullable=True)
+    # Dati Firma: immagine nella tabella firme (per hash); la colonna inline resta solo per i record non migrati
+    firma_tecnico_inline = Column("firma_tecnico", Text, nullable=True)
+    firma_cliente_inline = Column("firma_cliente", Text, nullable=True)
+    firma_tecnico_hash = Column(String(64), ForeignKey("firme.hash"), nullable=True)
+    firma_cliente_hash = Column(String(64), ForeignKey("firme.hash"), nullable=True)
+    firma_tecnico = _firma_property("firma_tecnico")
+    firma_cliente = _firma_property("firma_cliente")
     nome_cliente = Column(String, nullable=True)  # Nome del cliente che firma
     cognome_cliente = Column(String, nullable=True)  # Cognome del cliente che firma
+
+    # PDF finale (documento con entrambe le firme, vedi pdf_finali_service)
+    pdf_finale_path = Column(String, nullable=True)  # Relativo a uploads/
+    pdf_finale_hash = Column(String(64), nullable=True)  # sha256 del file
+    pdf_finale_impronta = Column(String(64), nullable=True)  # Contenuto da cui è stato generato
+    pdf_finale_revisione = Column(Integer, default=0, nullable=False)
+    pdf_finalizzato_at = Column(DateTime, nullable=True)
     
     # Soft delete
     deleted_at = Column(DateTime, nullable=True, index=True)  # Timestamp di cancellazione (null = non cancellato)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)  # Versione per ETag/Last-Modified (vedi versioni_service)
     
     # Relazioni
     cliente_rel = relationship("Cliente", back_populates="interventi")
@@ -227,7 +283,7 @@ class Intervento(Base):
 class DettaglioIntervento(Base):
     __tablename__ = "dettagli_intervento"
     id = Column(Integer, primary_key=True, index=True)
-    intervento_id = Column(Integer, ForeignKey("interventi.id"))
+    intervento_id = Column(Integer, ForeignKey("interventi.id"), index=True)
     categoria_it = Column(SqlEnum(CategoriaIT), default=CategoriaIT.GENERICO)
     marca_modello = Column(String)
     serial_number = Column(String, nullable=True)
@@ -240,7 +296,7 @@ class DettaglioIntervento(Base):
 class MovimentoRicambio(Base):
     __tablename__ = "movimenti_ricambi"
     id = Column(Integer, primary_key=True, index=True)
-    intervento_id = Column(Integer, ForeignKey("interventi.id"))
+    intervento_id = Column(Integer, ForeignKey("interventi.id"), index=True)
     prodotto_id = Column(Integer, ForeignKey("magazzino.id"), nullable=True)
     descrizione = Column(String) 
     quantita = Column(Integer, default=1)
@@ -319,8 +375,12 @@ class RitiroProdotto(Base):
     note_log = Column(JSONB, default=[])
     
     # Dati Firma (stessa logica del RIT)
-    firma_tecnico = Column(Text, nullable=True)  # Base64
-    firma_cliente = Column(Text, nullable=True)  # Base64
+    firma_tecnico_inline = Column("firma_tecnico", Text, nullable=True)
+    firma_cliente_inline = Column("firma_cliente", Text, nullable=True)
+    firma_tecnico_hash = Column(String(64), ForeignKey("firme.hash"), nullable=True)
+    firma_cliente_hash = Column(String(64), ForeignKey("firme.hash"), nullable=True)
+    firma_tecnico = _firma_property("firma_tecnico")
+    firma_cliente = _firma_property("firma_cliente")
     nome_cliente = Column(String, nullable=True)
     cognome_cliente = Column(String, nullable=True)
     
@@ -332,9 +392,17 @@ class RitiroProdotto(Base):
     ricambi_utilizzati = Column(JSONB, default=[])  # Array di ricambi utilizzati
     costi_extra = Column(Numeric(10, 2), default=0, nullable=False)  # Costi extra
     descrizione_extra = Column(Text, nullable=True)  # Descrizione costi extra
+
+    # PDF finale (documento con entrambe le firme, vedi pdf_finali_service)
+    pdf_finale_path = Column(String, nullable=True)  # Relativo a uploads/
+    pdf_finale_hash = Column(String(64), nullable=True)  # sha256 del file
+    pdf_finale_impronta = Column(String(64), nullable=True)  # Contenuto da cui è stato generato
+    pdf_finale_revisione = Column(Integer, default=0, nullable=False)
+    pdf_finalizzato_at = Column(DateTime, nullable=True)
     
     # Soft delete
     deleted_at = Column(DateTime, nullable=True, index=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False, index=True)  # Versione per ETag (anche aggregata: max)
     
     # Relazioni
     cliente_rel = relationship("Cliente", backref="ritiri_prodotti")
@@ -342,9 +410,33 @@ class RitiroProdotto(Base):
     tecnico_assegnato_rel = relationship("Utente", foreign_keys=[tecnico_assegnato_id], backref="ddt_assegnati")
     tecnico_pending_rel = relationship("Utente", foreign_keys=[tecnico_assegnazione_pending_id], backref="ddt_assegnazioni_pending")
 
+    # Nomi dei tecnici per la serializzazione (schemi RitiroProdotto*Response)
+    @property
+    def tecnico_nome(self):
+        return self.tecnico_rel.nome_completo if self.tecnico_rel else None
+
+    @property
+    def tecnico_assegnato_nome(self):
+        return self.tecnico_assegnato_rel.nome_completo if self.tecnico_assegnato_rel else None
+
+    @property
+    def tecnico_assegnazione_pending_nome(self):
+        return self.tecnico_pending_rel.nome_completo if self.tecnico_pending_rel else None
+
+class ContatoreDDT(Base):
+    """
+    Conteggi dei DDT non eliminati per la dashboard, mantenuti a ogni flush da
+    ddt_contatori_service (stessa transazione della modifica) e ricalcolabili da zero.
+    """
+    __tablename__ = "ddt_contatori"
+    ambito = Column(String, primary_key=True)  # stato, assegnazione, tecnico_assegnato, tecnico_pending, non_assegnati
+    chiave = Column(String, primary_key=True)  # es. "riparato", "12", "12:in_attesa_accettazione"
+    valore = Column(Integer, nullable=False, default=0)
+
 class ImpostazioniAzienda(Base):
     __tablename__ = "impostazioni_azienda"
     id = Column(Integer, primary_key=True, index=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)  # Versione per ETag di /impostazioni/public
     nome_azienda = Column(String, default="GIT - Gestione Interventi Tecnici")
     indirizzo_completo = Column(String)
     p_iva = Column(String)
@@ -446,4 +538,68 @@ class BackupTarget(Base):
     config = Column(JSONB, default={})  # token/credenziali e parametri specifici
     enabled = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.now, nullable=False)
-    updated_at = Column(DateTime, default=datetime.now, nullable=False)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
+# --- MODELLO OUTBOX EMAIL ---
+class EmailOutbox(Base):
+    """Email da inviare, scritta nella transazione che la genera e inviata dal worker (vedi email_outbox)."""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    destinatario = Column(String, nullable=False)
+    oggetto = Column(String, nullable=False)
+    corpo_html = Column(Text, nullable=False)
+    corpo_testo = Column(Text, nullable=True)
+    mittente_nome = Column(String, nullable=True)  # Nome visualizzato; l'indirizzo è quello SMTP al momento dell'invio
+    allegati = Column(JSONB, default=[])  # [{"filename", "content_type", "hash", "dimensione"}] -> email_allegati
+    stato = Column(String, default="in_coda", nullable=False)  # in_coda, inviata, fallita
+    tentativi = Column(Integer, default=0, nullable=False)
+    prossimo_tentativo_at = Column(DateTime, default=datetime.now, nullable=False)  # Indice parziale sulle righe in coda (migrate_email_outbox.py)
+    ultimo_errore = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    inviata_at = Column(DateTime, nullable=True)
+
+
+class EmailAllegato(Base):
+    """Allegato email salvato una sola volta per contenuto (sha256), come le firme."""
+    __tablename__ = "email_allegati"
+
+    hash = Column(String(64), primary_key=True)
+    dati = Column(LargeBinary, nullable=False)
+    dimensione = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+# --- MODELLO CODA JOB ---
+class Job(Base):
+    """Lavoro in background (render PDF + email, backup), eseguito dal worker (vedi services/job_queue)."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String, nullable=False)  # Nome dell'handler registrato (es. "email_rit", "backup")
+    payload = Column(JSONB, default={})
+    chiave = Column(String, nullable=True)  # Deduplica: un solo job in coda per (tipo, chiave), indice parziale unico
+    stato = Column(String, default="in_coda", nullable=False)  # in_coda, in_esecuzione, completato, fallito
+    tentativi = Column(Integer, default=0, nullable=False)
+    max_tentativi = Column(Integer, default=3, nullable=False)
+    esegui_dopo = Column(DateTime, default=datetime.now, nullable=False)  # Indice parziale sui job in coda (migrate_jobs.py)
+    worker = Column(String, nullable=True)  # host:pid del worker che lo sta eseguendo
+    avviato_at = Column(DateTime, nullable=True)
+    bloccato_fino = Column(DateTime, nullable=True)  # Oltre questa data un job in esecuzione è considerato abbandonato
+    completato_at = Column(DateTime, nullable=True)
+    risultato = Column(JSONB, nullable=True)
+    ultimo_errore = Column(Text, nullable=True)
+    creato_da_id = Column(Integer, ForeignKey("utenti.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+# --- MODELLO REGISTRO PROMEMORIA DDT ---
+class DdtReminderLog(Base):
+    """Promemoria "DDT non chiuso" già inviati: uno per (ddt, stato, soglia, inizio dello stato) (vedi check_ddt_ritardi)."""
+    __tablename__ = "ddt_reminder_log"
+
+    id = Column(Integer, primary_key=True, index=True)
+    ddt_id = Column(Integer, ForeignKey("ritiri_prodotti.id", ondelete="CASCADE"), nullable=False)
+    stato = Column(String, nullable=False)
+    soglia = Column(Integer, nullable=False)  # Giorni della soglia di promemoria
+    stato_since = Column(DateTime, nullable=False)  # stato_updated_at (o data_ritiro) al momento dell'invio; indice unico in migrate_ddt_reminder_log.py
+    tecnico_id = Column(Integer, ForeignKey("utenti.id", ondelete="SET NULL"), nullable=True)
+    inviato_at = Column(DateTime, default=datetime.now, nullable=False)
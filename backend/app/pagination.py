@@ -0,0 +1,233 @@
+"""
+Paginazione a cursore (keyset) per le liste ordinate per (data, id) decrescenti.
+
+Con `offset(skip)` PostgreSQL deve leggere e scartare tutte le righe precedenti, quindi
+le pagine profonde diventano linearmente più lente. Il cursore codifica invece la coppia
+(data, id) dell'ultima riga restituita e la pagina successiva parte da lì, usando gli
+indici compositi dichiarati in app.db_indexes.KEYSET_INDEXES.
+
+Il cursore è opaco per il client: va solo ripassato così com'è nel parametro `cursor`.
+
+Il totale delle liste paginate si calcola secondo `total_mode` (vedi count_total):
+- exact: COUNT(*) esatto con gli stessi filtri (comportamento storico)
+- window: totale esatto letto insieme alle righe con `count(*) OVER ()`, una sola query
+- estimate: stima del planner (pg_class.reltuples senza filtri, EXPLAIN con filtri)
+- capped: conta al massimo `total_cap + 1` righe e riporta "1000+" oltre la soglia
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, desc, func, or_, text, tuple_
+from sqlalchemy.orm import Query
+
+TOTAL_MODES = ("exact", "window", "estimate", "capped")
+DEFAULT_TOTAL_CAP = 1000
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    """Codifica (valore di ordinamento, id) in un cursore opaco URL-safe."""
+    payload = {"s": sort_value.isoformat() if sort_value else None, "i": row_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Decodifica un cursore prodotto da encode_cursor (HTTP 400 se non valido)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        sort_value = datetime.fromisoformat(payload["s"]) if payload["s"] is not None else None
+        return sort_value, int(payload["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursore di paginazione non valido")
+
+
+def keyset_order(sort_col, id_col) -> list:
+    """Ordinamento deterministico usato sia dalla paginazione offset sia da quella a cursore."""
+    # DESC in PostgreSQL equivale a DESC NULLS FIRST, come gli indici di KEYSET_INDEXES
+    return [desc(sort_col), desc(id_col)]
+
+
+def keyset_filter(sort_col, id_col, sort_value: Optional[datetime], row_id: int):
+    """Condizione "righe successive al cursore" per l'ordinamento (sort DESC NULLS FIRST, id DESC)."""
+    if sort_value is None:
+        # Il cursore è tra le righe senza data (in testa): restano le altre senza data
+        # con id minore e poi tutte quelle datate
+        return or_(
+            and_(sort_col.is_(None), id_col < row_id),
+            sort_col.isnot(None),
+        )
+    return tuple_(sort_col, id_col) < tuple_(sort_value, row_id)
+
+
+def paginate(
+    query: Query,
+    sort_col,
+    id_col,
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    window_total: bool = False,
+) -> Tuple[List[Any], Optional[str], Optional[int]]:
+    """
+    Restituisce una pagina di risultati, il cursore della pagina successiva e, con
+    `window_total`, il totale letto nella stessa query (altrimenti None).
+
+    - cursor=None: paginazione classica offset(skip).limit(limit)
+    - cursor="": prima pagina in modalità cursore
+    - cursor="<opaco>": pagina successiva a quella che ha generato il cursore
+
+    In entrambe le modalità viene letta una riga in più per sapere se esiste una pagina
+    successiva; `next_cursor` è None sull'ultima pagina.
+    """
+    count_query = query
+    query = query.order_by(None).order_by(*keyset_order(sort_col, id_col))
+    if cursor is None:
+        query = query.offset(skip)
+    elif cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(keyset_filter(sort_col, id_col, sort_value, row_id))
+
+    # Con un cursore il filtro keyset restringe l'insieme: il conteggio a finestra
+    # riporterebbe solo le righe restanti, quindi vale solo per la prima pagina / offset
+    use_window = window_total and not cursor
+    if use_window:
+        query = query.add_columns(func.count().over().label("_total"))
+
+    rows = query.limit(limit + 1).all()
+    total = None
+    if use_window:
+        if rows:
+            total = rows[0][-1]
+            rows = [row[0] for row in rows]
+        elif skip == 0:
+            total = 0
+    if window_total and total is None:
+        total = count_total(count_query, "exact")[0]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key))
+    return rows, next_cursor, total
+
+
+def _check_total_mode(total_mode: str) -> None:
+    if total_mode not in TOTAL_MODES:
+        raise HTTPException(status_code=400, detail=f"total_mode non valido (valori ammessi: {', '.join(TOTAL_MODES)})")
+
+
+def _query_table_name(query: Query) -> Optional[str]:
+    entity = query.column_descriptions[0].get("entity")
+    table = getattr(entity, "__table__", None)
+    return table.name if table is not None else None
+
+
+def _planner_estimate(query: Query) -> Optional[int]:
+    """Stima del numero di righe dalle statistiche del planner (None se non disponibile)."""
+    session = query.session
+    table_name = _query_table_name(query)
+    if query.whereclause is None and table_name:
+        reltuples = session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+            {"t": table_name},
+        ).scalar()
+        # reltuples = -1: tabella mai analizzata (PostgreSQL 14+)
+        return int(reltuples) if reltuples is not None and reltuples >= 0 else None
+
+    stmt = query.order_by(None).statement
+    conn = session.connection()
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_total(query: Query, total_mode: str = "exact", total_cap: int = DEFAULT_TOTAL_CAP) -> Tuple[int, Optional[str]]:
+    """
+    Calcola il totale di una query filtrata secondo `total_mode`.
+
+    Returns:
+        (totale, etichetta) dove l'etichetta è None per i totali esatti, "~N" per le
+        stime e "N+" quando il conteggio capped supera la soglia.
+    """
+    _check_total_mode(total_mode)
+    query = query.order_by(None)
+
+    if total_mode == "estimate":
+        estimate = _planner_estimate(query)
+        if estimate is not None:
+            return estimate, f"~{estimate}"
+        total_mode = "exact"
+
+    if total_mode == "capped":
+        total_cap = max(total_cap, 1)
+        limited = query.limit(total_cap + 1).subquery()
+        counted = query.session.query(func.count()).select_from(limited).scalar()
+        if counted > total_cap:
+            return total_cap, f"{total_cap}+"
+        return counted, None
+
+    return query.count(), None
+
+
+def fetch_page(
+    query: Query,
+    sort_col,
+    id_col,
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    total_mode: str = "exact",
+    total_cap: int = DEFAULT_TOTAL_CAP,
+) -> Tuple[List[Any], Dict[str, Any]]:
+    """
+    Pagina + totale per gli endpoint `*/paginated`.
+
+    Returns:
+        (righe, metadati) con metadati = total, total_mode, total_label, next_cursor,
+        da unire alla risposta accanto a `items`.
+    """
+    _check_total_mode(total_mode)
+    if total_mode == "window":
+        rows, next_cursor, total = paginate(
+            query, sort_col, id_col, skip=skip, limit=limit, cursor=cursor, window_total=True
+        )
+        label = None
+    else:
+        total, label = count_total(query, total_mode, total_cap)
+        rows, next_cursor, _ = paginate(query, sort_col, id_col, skip=skip, limit=limit, cursor=cursor)
+    return rows, {"total": total, "total_mode": total_mode, "total_label": label, "next_cursor": next_cursor}
+
+
+def fetch_offset_page(
+    query: Query,
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    total_mode: str = "exact",
+    total_cap: int = DEFAULT_TOTAL_CAP,
+) -> Tuple[List[Any], Dict[str, Any]]:
+    """Come fetch_page, per liste con ordinamento proprio (già applicato) e solo offset."""
+    _check_total_mode(total_mode)
+    if total_mode != "window":
+        total, label = count_total(query, total_mode, total_cap)
+        rows = query.offset(skip).limit(limit).all()
+        return rows, {"total": total, "total_mode": total_mode, "total_label": label}
+
+    rows = query.add_columns(func.count().over().label("_total")).offset(skip).limit(limit).all()
+    if rows:
+        total = rows[0][-1]
+        rows = [row[0] for row in rows]
+    else:
+        total = 0 if skip == 0 else count_total(query, "exact")[0]
+    return rows, {"total": total, "total_mode": total_mode, "total_label": None}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status, UploadFile, File, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.responses import Response, FileResponse
 from sqlalchemy.orm import Session
@@ -13,6 +13,7 @@ from ..services import pdf_service, email_service, two_factor_service
 from ..services.app_audit import log_app_event
 from ..utils import get_default_permessi
 from ..validators import sanitize_email, sanitize_input
+from ..settings_cache import get_settings
 from ..services.backup_service import (
     list_backups,
     create_backup,
@@ -154,7 +155,6 @@ def login(
 def register(
     request: Request,
     user_data: schemas.UserCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.require_admin),
 ):
@@ -314,7 +314,7 @@ def register(
     # 6) Email invito (usa la stessa logica/config azienda)
     def _send():
         try:
-            company = db.query(models.ImpostazioniAzienda).first()
+            company = get_settings(db)
             nome_azienda = (company.nome_azienda if company else None) or "GIT - Gestione Interventi Tecnici"
             subject = f"[{nome_azienda}] Invito accesso - imposta la password"
             instructions = (
@@ -343,9 +343,9 @@ def register(
             traceback.print_exc()
 
 
-    # Pianifica invio email invito (background)
-    background_tasks.add_task(_send)
-    print(f"📧 Invito password pianificato per {db_user.email}")
+    # Email invito accodata nell'outbox: solo un INSERT, la sessione della richiesta è ancora aperta
+    _send()
+    print(f"📧 Invito password accodato per {db_user.email}")
 
     return db_user
 
@@ -355,7 +355,6 @@ def register(
 def regenerate_access(
     request: Request,
     user_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.Utente = Depends(auth.require_admin),
 ):
@@ -448,7 +447,7 @@ def regenerate_access(
             user2 = db2.query(models.Utente).filter(models.Utente.id == user_id).first()
             if not user2:
                 return
-            company = db2.query(models.ImpostazioniAzienda).first()
+            company = get_settings(db2)
             nome_azienda = (company.nome_azienda if company else None) or "GIT - Gestione Interventi Tecnici"
             subject = f"[{nome_azienda}] Rigenerazione accesso - imposta la password"
             body_text = (
@@ -463,14 +462,15 @@ def regenerate_access(
             <p><em>Requisiti:</em> almeno 10 caratteri, 1 speciale, 1 maiuscola, 1 numero.</p>
             """
             email_service.send_email(user2.email, subject, body_html, body_text=body_text, db=db2)
-            print(f"✅ Email rigenerazione inviata a {user2.email}")
+            print(f"✅ Email rigenerazione accodata per {user2.email}")
         except Exception as e:
             print("❌ Errore invio email rigenerazione:", repr(e))
             traceback.print_exc()
         finally:
             db2.close()
 
-    background_tasks.add_task(_send)
+    # Email accodata nell'outbox (sessione propria), senza attendere il server SMTP
+    _send()
     return {"ok": True}
 
 
@@ -541,7 +541,7 @@ def get_current_user_info(current_user: models.Utente = Depends(auth.get_current
 
 @router.post("/api/auth/2fa/setup", response_model=schemas.TwoFactorSetupResponse, tags=["Autenticazione"])
 def setup_2fa(
-    current_user: models.Utente = Depends(auth.require_superadmin),
+    current_user: models.Utente = Depends(auth.require_superadmin_row),
     db: Session = Depends(database.get_db)
 ):
     """Genera secret e QR code per configurare 2FA (solo superadmin)"""
@@ -572,7 +572,7 @@ def setup_2fa(
 @router.post("/api/auth/2fa/enable", tags=["Autenticazione"])
 def enable_2fa(
     verify_request: schemas.TwoFactorVerifyRequest,
-    current_user: models.Utente = Depends(auth.require_superadmin),
+    current_user: models.Utente = Depends(auth.require_superadmin_row),
     db: Session = Depends(database.get_db)
 ):
     """Abilita 2FA dopo aver verificato il codice (solo superadmin)"""
@@ -598,7 +598,7 @@ def enable_2fa(
 @router.post("/api/auth/2fa/disable", tags=["Autenticazione"])
 def disable_2fa(
     verify_request: schemas.TwoFactorVerifyRequest,
-    current_user: models.Utente = Depends(auth.require_superadmin),
+    current_user: models.Utente = Depends(auth.require_superadmin_row),
     db: Session = Depends(database.get_db)
 ):
     """Disabilita 2FA dopo aver verificato il codice (solo superadmin)"""
@@ -633,7 +633,7 @@ def disable_2fa(
 
 @router.post("/api/auth/2fa/regenerate-backup", tags=["Autenticazione"])
 def regenerate_backup_codes(
-    current_user: models.Utente = Depends(auth.require_superadmin),
+    current_user: models.Utente = Depends(auth.require_superadmin_row),
     db: Session = Depends(database.get_db)
 ):
     """Rigenera codici di backup per 2FA (solo superadmin)"""
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status, UploadFile, File, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.responses import Response, FileResponse
 from sqlalchemy.orm import Session
@@ -11,16 +11,16 @@ import shutil
 import json
 
 from .. import models, schemas, database, auth
-from ..services import pdf_service, email_service, two_factor_service
+from ..services import pdf_service, email_service, two_factor_service, job_queue
 from ..config import BACKUPS_DIR
 from ..audit_logger import log_action
 from ..services.backup_service import (
     list_backups,
-    create_backup,
     delete_backup,
     restore_backup,
     get_backup_info,
     get_backup_status,
+    mark_backup_queued,
     list_backup_targets,
     upsert_backup_target,
     delete_backup_target,
@@ -83,7 +83,6 @@ def get_backup(
 
 @router.post("/api/backups/create", response_model=schemas.BackupCreateResponse, tags=["Backup"])
 def create_backup_endpoint(
-    background_tasks: BackgroundTasks,
     request: Request,
     target_ids: str | None = None,
     db: Session = Depends(database.get_db),
@@ -109,8 +108,13 @@ def create_backup_endpoint(
             except Exception:
                 raise HTTPException(status_code=400, detail="target_ids non valido (usa lista separata da virgole)")
 
-        result = create_backup(background=True, db=db, target_ids=ids)
-        return result
+        # Backup nel job "backup" (worker, uno alla volta): l'avanzamento resta su /api/backups/status
+        job_id = job_queue.accoda(db, "backup", {"target_ids": ids}, utente_id=current_user.id)
+        db.commit()
+        mark_backup_queued()
+        return {"status": "started", "message": "Backup avviato", "job_id": job_id}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Errore create_backup_endpoint")
         raise HTTPException(status_code=500, detail=f"Errore durante la creazione del backup: {str(e)}")
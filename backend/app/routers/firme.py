@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+import re
+
+from .. import models, database, auth
+from ..http_cache import is_not_modified, not_modified_response
+from ..services import firme_service
+
+router = APIRouter()
+
+FIRMA_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Il contenuto di un hash non cambia mai: il browser può riusarlo senza rivalidare
+FIRMA_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+@router.get("/firme/{firma_hash}", tags=["Firme"])
+def get_firma(
+    firma_hash: str,
+    request: Request,
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Restituisce l'immagine di una firma (RIT/DDT) dal suo hash sha256."""
+    if not FIRMA_HASH_RE.match(firma_hash):
+        raise HTTPException(status_code=404, detail="Firma non trovata")
+
+    etag = f'"{firma_hash}"'
+    headers = {"ETag": etag, "Cache-Control": FIRMA_CACHE_CONTROL}
+    if is_not_modified(request, etag):
+        return not_modified_response(headers)
+
+    firma = firme_service.get_firma(db, firma_hash)
+    if not firma:
+        raise HTTPException(status_code=404, detail="Firma non trovata")
+    return Response(content=firma.dati, media_type=firma.mime_type, headers=headers)
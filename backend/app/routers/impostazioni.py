@@ -6,6 +6,8 @@ from typing import List, Optional
 from datetime import datetime, timedelta, time as dt_time
 
 from .. import models, schemas, database, auth
+from ..http_cache import cache_headers, is_not_modified, make_etag, not_modified_response
+from ..settings_cache import SettingsSnapshot, get_settings, invalidate_settings_cache
 from ..services import pdf_service, email_service, two_factor_service
 from ..services.backup_service import (
     list_backups,
@@ -24,64 +26,30 @@ from typing import Optional
 logger = logging.getLogger(__name__)
 
 # -------------------- CACHING SETTINGS AZIENDA --------------------
-# Cache in memoria per settings azienda (TTL: 5 minuti)
-_settings_cache = {
-    "data": None,
-    "timestamp": None,
-    "ttl_seconds": 300  # 5 minuti
-}
-
-def get_settings_or_default(db: Session, force_refresh: bool = False) -> models.ImpostazioniAzienda:
-    """
-    Restituisce le impostazioni azienda con caching.
-    Cache invalidata automaticamente dopo TTL o manualmente con force_refresh=True.
-    """
-    global _settings_cache
-    
-    # Verifica se la cache è valida
-    if not force_refresh and _settings_cache["data"] and _settings_cache["timestamp"]:
-        age = (datetime.now() - _settings_cache["timestamp"]).total_seconds()
-        if age < _settings_cache["ttl_seconds"]:
-            # Cache valida, ritorna dati cached
-            return _settings_cache["data"]
-    
-    # Cache scaduta o force_refresh, carica da DB
-    settings = db.query(models.ImpostazioniAzienda).first()
-    if settings:
-        # Aggiorna cache
-        _settings_cache["data"] = settings
-        _settings_cache["timestamp"] = datetime.now()
-        return settings
+# Snapshot immutabile condiviso tra tutti i moduli e invalidato tra processi (vedi settings_cache)
+def get_settings_or_default(db: Session, force_refresh: bool = False) -> SettingsSnapshot:
+    """Restituisce lo snapshot delle impostazioni azienda (creando i default se mancano)."""
+    return get_settings(db, force_refresh=force_refresh)
+# ------------------ /CACHING SETTINGS AZIENDA ---------------------
 
-    # crea defaults (evita 500 su /impostazioni/public al primo avvio)
-    settings = models.ImpostazioniAzienda(
-        logo_url="",
-        nome_azienda="GIT - Gestione Interventi Tecnici",
-        colore_primario="#4F46E5",
-    )
-    db.add(settings)
-    db.commit()
-    db.refresh(settings)
-    
-    # Aggiorna cache
-    _settings_cache["data"] = settings
-    _settings_cache["timestamp"] = datetime.now()
-    
-    return settings
 
-def invalidate_settings_cache():
-    """Invalida la cache delle settings (chiamato dopo update)"""
-    global _settings_cache
-    _settings_cache["data"] = None
-    _settings_cache["timestamp"] = None
-# ------------------ /CACHING SETTINGS AZIENDA ---------------------
+# Dati pubblici (logo, nome, colore): riutilizzabili da browser e nginx per 5 minuti
+PUBLIC_SETTINGS_CACHE_CONTROL = "public, max-age=300"
 
 
 @router.get("/impostazioni/public", tags=["Configurazione"])
-def read_impostazioni_public(db: Session = Depends(database.get_db)):
+def read_impostazioni_public(request: Request, response: Response, db: Session = Depends(database.get_db)):
     """Endpoint pubblico per ottenere logo, nome azienda e colore primario (senza autenticazione)"""
     try:
         settings = get_settings_or_default(db)
+        headers = cache_headers(
+            make_etag("impostazioni-public", settings.id, settings.updated_at),
+            PUBLIC_SETTINGS_CACHE_CONTROL,
+            settings.updated_at,
+        )
+        if is_not_modified(request, headers["ETag"], settings.updated_at):
+            return not_modified_response(headers)
+        response.headers.update(headers)
         return {
             "logo_url": settings.logo_url if settings.logo_url else "",
             "nome_azienda": settings.nome_azienda if settings.nome_azienda else "GIT - Gestione Interventi Tecnici",
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from .. import models, schemas, database, auth
+
+router = APIRouter()
+
+
+def _is_admin(user: models.Utente) -> bool:
+    return user.ruolo in (models.RuoloUtente.ADMIN, models.RuoloUtente.SUPERADMIN)
+
+
+@router.get("/api/jobs/{job_id}", response_model=schemas.JobResponse, tags=["Job"])
+def get_job(
+    job_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.get_current_active_user)
+):
+    """Stato di un job in background (gli utenti non admin vedono solo i job che hanno avviato)."""
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job or (not _is_admin(current_user) and job.creato_da_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return job
+
+
+@router.get("/api/jobs", response_model=List[schemas.JobResponse], tags=["Job"])
+def list_jobs(
+    tipo: Optional[str] = None,
+    stato: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(database.get_db),
+    current_user: models.Utente = Depends(auth.require_admin)
+):
+    """Ultimi job in background, filtrabili per tipo e stato (solo admin)."""
+    query = db.query(models.Job)
+    if tipo:
+        query = query.filter(models.Job.tipo == tipo)
+    if stato:
+        query = query.filter(models.Job.stato == stato)
+    return query.order_by(models.Job.id.desc()).limit(limit).all()
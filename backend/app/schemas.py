@@ -1,8 +1,18 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel, BeforeValidator
+from typing import Annotated, Optional, List, Dict, Any
+from datetime import datetime, time
 from .models import MacroCategoria, RuoloUtente
 
+
+def _ora_hhmm(value):
+    # Le colonne Time del DB vengono esposte come "HH:MM" (validazione diretta da ORM)
+    if isinstance(value, time):
+        return value.strftime("%H:%M")
+    return value
+
+# Orario "HH:MM": il validatore fa parte del tipo, quindi vale anche negli schemi ridotti (?fields=)
+OraHHMM = Annotated[Optional[str], BeforeValidator(_ora_hhmm)]
+
 # --- SCHEMAS UTENTE ---
 class UserBase(BaseModel):
     email: str
@@ -150,6 +160,8 @@ class ClienteResponse(ClienteBase):
 class PaginatedClientiResponse(BaseModel):
     items: List[ClienteResponse]
     total: int
+    total_mode: str = "exact"  # exact | window | estimate | capped
+    total_label: Optional[str] = None  # "~N" per le stime, "N+" oltre la soglia capped
 
 # --- SCHEMAS INTERVENTO ---
 class DettaglioAssetBase(BaseModel):
@@ -183,7 +195,8 @@ class RicambioResponse(RicambioBase):
     class Config:
         from_attributes = True
 
-class InterventoBase(BaseModel):
+class InterventoFieldsBase(BaseModel):
+    """Campi dell'intervento senza le firme (usato dalle viste elenco)."""
     macro_categoria: MacroCategoria
     cliente_id: int
     cliente_ragione_sociale: str 
@@ -196,16 +209,13 @@ class InterventoBase(BaseModel):
     is_garanzia: bool = False
     is_chiamata: bool = False
     flag_diritto_chiamata: bool = True
-    # Firme (Base64)
-    firma_tecnico: Optional[str] = None
-    firma_cliente: Optional[str] = None
     nome_cliente: Optional[str] = None
     cognome_cliente: Optional[str] = None
     costi_extra: Optional[float] = 0.0
     descrizione_extra: Optional[str] = None
     difetto_segnalato: Optional[str] = None
-    ora_inizio: Optional[str] = None
-    ora_fine: Optional[str] = None
+    ora_inizio: OraHHMM = None
+    ora_fine: OraHHMM = None
     # Dati Contratto Assistenza (snapshot)
     chiamate_utilizzate_contratto: Optional[int] = None
     chiamate_rimanenti_contratto: Optional[int] = None
@@ -213,6 +223,11 @@ class InterventoBase(BaseModel):
     # Prelievo copie (solo per Printing)
     is_prelievo_copie: Optional[bool] = False
 
+class InterventoBase(InterventoFieldsBase):
+    # Firme (Base64)
+    firma_tecnico: Optional[str] = None
+    firma_cliente: Optional[str] = None
+
 class InterventoCreate(InterventoBase):
     dettagli: List[DettaglioAssetCreate] = []
     ricambi: List[RicambioCreate] = []
@@ -220,14 +235,30 @@ class InterventoCreate(InterventoBase):
 class InterventoResponse(InterventoBase):
     id: int
     data_creazione: datetime
+    firma_tecnico_hash: Optional[str] = None  # Immagine servita da GET /firme/{hash}
+    firma_cliente_hash: Optional[str] = None
+    dettagli: List[DettaglioAssetResponse] = []
+    ricambi_utilizzati: List[RicambioResponse] = []
+    class Config:
+        from_attributes = True
+
+class InterventoSummaryResponse(InterventoFieldsBase):
+    """Intervento per le liste: senza firme, che restano disponibili da GET /interventi/{id}."""
+    id: int
+    data_creazione: datetime
+    firma_tecnico_hash: Optional[str] = None  # Immagine servita da GET /firme/{hash}
+    firma_cliente_hash: Optional[str] = None
     dettagli: List[DettaglioAssetResponse] = []
     ricambi_utilizzati: List[RicambioResponse] = []
     class Config:
         from_attributes = True
 
 class PaginatedInterventiResponse(BaseModel):
-    items: List[InterventoResponse]
+    items: List[InterventoSummaryResponse]
     total: int
+    total_mode: str = "exact"  # exact | window | estimate | capped
+    total_label: Optional[str] = None  # "~N" per le stime, "N+" oltre la soglia capped
+    next_cursor: Optional[str] = None  # Cursore opaco per la pagina successiva (None = ultima pagina)
 
 # --- SCHEMAS DDT (RITIRO PRODOTTO) ---
 class ProdottoDDT(BaseModel):
@@ -241,7 +272,8 @@ class ProdottoDDT(BaseModel):
     difetto_appurato: Optional[str] = None
     foto_prodotto: Optional[List[str]] = []
 
-class RitiroProdottoBase(BaseModel):
+class RitiroProdottoFieldsBase(BaseModel):
+    """Campi del DDT senza le firme (usato dalle viste elenco)."""
     cliente_id: int
     cliente_ragione_sociale: str
     cliente_indirizzo: Optional[str] = ""
@@ -268,9 +300,6 @@ class RitiroProdottoBase(BaseModel):
     ricambi_utilizzati: Optional[List[Dict[str, Any]]] = []  # Array di ricambi utilizzati
     costi_extra: Optional[float] = 0.0  # Costi extra
     descrizione_extra: Optional[str] = None  # Descrizione costi extra
-    # Firme (Base64)
-    firma_tecnico: Optional[str] = None
-    firma_cliente: Optional[str] = None
     nome_cliente: Optional[str] = None
     cognome_cliente: Optional[str] = None
     data_consegna: Optional[datetime] = None
@@ -281,6 +310,11 @@ class RitiroProdottoBase(BaseModel):
     assegnazioni_log: Optional[List[Dict[str, Any]]] = []
     note_log: Optional[List[Dict[str, Any]]] = []
 
+class RitiroProdottoBase(RitiroProdottoFieldsBase):
+    # Firme (Base64)
+    firma_tecnico: Optional[str] = None
+    firma_cliente: Optional[str] = None
+
 class RitiroProdottoCreate(RitiroProdottoBase):
     pass
 
@@ -325,12 +359,32 @@ class RitiroProdottoResponse(RitiroProdottoBase):
     tecnico_nome: Optional[str] = None
     tecnico_assegnato_nome: Optional[str] = None
     tecnico_assegnazione_pending_nome: Optional[str] = None
+    firma_tecnico_hash: Optional[str] = None  # Immagine servita da GET /firme/{hash}
+    firma_cliente_hash: Optional[str] = None
+    class Config:
+        from_attributes = True
+
+class RitiroProdottoSummaryResponse(RitiroProdottoFieldsBase):
+    """DDT per le liste: senza firme, che restano disponibili da GET /ddt/{id}."""
+    id: int
+    numero_ddt: str
+    anno_riferimento: int
+    data_ritiro: datetime
+    tecnico_id: int
+    tecnico_nome: Optional[str] = None
+    tecnico_assegnato_nome: Optional[str] = None
+    tecnico_assegnazione_pending_nome: Optional[str] = None
+    firma_tecnico_hash: Optional[str] = None  # Immagine servita da GET /firme/{hash}
+    firma_cliente_hash: Optional[str] = None
     class Config:
         from_attributes = True
 
 class PaginatedDdtResponse(BaseModel):
-    items: List[RitiroProdottoResponse]
+    items: List[RitiroProdottoSummaryResponse]
     total: int
+    total_mode: str = "exact"  # exact | window | estimate | capped
+    total_label: Optional[str] = None  # "~N" per le stime, "N+" oltre la soglia capped
+    next_cursor: Optional[str] = None  # Cursore opaco per la pagina successiva (None = ultima pagina)
 
 class DdtAssignRequest(BaseModel):
     tecnico_id: int
@@ -470,6 +524,9 @@ class AuditLogResponse(BaseModel):
 class PaginatedAuditLogResponse(BaseModel):
     items: List[AuditLogResponse]
     total: int
+    total_mode: str = "exact"  # exact | window | estimate | capped
+    total_label: Optional[str] = None  # "~N" per le stime, "N+" oltre la soglia capped
+    next_cursor: Optional[str] = None  # Cursore opaco per la pagina successiva (None = ultima pagina)
 
 # --- SCHEMAS BACKUP ---
 class BackupInfo(BaseModel):
@@ -488,6 +545,7 @@ class BackupCreateResponse(BaseModel):
     message: str
     output: Optional[str] = None
     error: Optional[str] = None
+    job_id: Optional[int] = None  # Job "backup" in coda (stato da /api/jobs/{job_id})
 
 class BackupRestoreRequest(BaseModel):
     restore_type: str = "full"  # full, database, volumes, config
@@ -502,4 +560,21 @@ class BackupStatusResponse(BaseModel):
     progress: int  # 0-100
     message: str
     error: Optional[str] = None
-    timestamp: Optional[str] = None
\ No newline at end of file
+    timestamp: Optional[str] = None
+
+# --- SCHEMAS CODA JOB ---
+class JobResponse(BaseModel):
+    id: int
+    tipo: str
+    stato: str  # in_coda, in_esecuzione, completato, fallito
+    tentativi: int
+    max_tentativi: int
+    esegui_dopo: datetime
+    avviato_at: Optional[datetime] = None
+    completato_at: Optional[datetime] = None
+    risultato: Optional[Dict[str, Any]] = None
+    ultimo_errore: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,63 @@
+"""
+Serializzazione veloce delle risposte elenco.
+
+Il percorso standard (model_validate per riga + model_dump + nuova validazione FastAPI
+contro `response_model` + json.dumps) valida ogni riga più volte. Qui:
+- dump_many: una sola validazione dell'intera lista con TypeAdapter in cache, letta
+  direttamente dagli oggetti ORM (from_attributes) e già pronta per il JSON
+- rows_to_dicts: righe ORM/Core -> dict senza validazione, per schemi piatti i cui
+  campi coincidono con colonne del DB
+- json_response: risposta JSON serializzata con orjson (se installato); restituendo una
+  Response, FastAPI non rivalida il contenuto contro `response_model`
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+    HAS_ORJSON = True
+except ImportError:
+    FastJSONResponse = JSONResponse
+    HAS_ORJSON = False
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp) -> TypeAdapter:
+    """TypeAdapter riutilizzabile (costruirne uno ricompila lo schema di validazione)."""
+    return TypeAdapter(tp)
+
+
+def dump_many(schema: Type[BaseModel], items: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Valida una volta la lista di oggetti contro `schema` e la restituisce come dati JSON."""
+    adapter = type_adapter(List[schema])
+    validated = adapter.validate_python(list(items), from_attributes=True)
+    return adapter.dump_python(validated, mode="json")
+
+
+def rows_to_dicts(schema: Type[BaseModel], rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    Converte righe ORM o Core in dict con i soli campi di `schema`, senza validazione.
+
+    Da usare solo per schemi piatti i cui tipi coincidono con quelli delle colonne.
+    """
+    fields = list(schema.model_fields)
+    result = []
+    for row in rows:
+        source = getattr(row, "_mapping", None)
+        if source is not None:
+            result.append({name: source.get(name) for name in fields})
+        else:
+            result.append({name: getattr(row, name, None) for name in fields})
+    return result
+
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None):
+    if not HAS_ORJSON:
+        # json standard: datetime/Decimal vanno convertiti prima (orjson li gestisce nativamente)
+        content = jsonable_encoder(content)
+    return FastJSONResponse(content=content, status_code=status_code, headers=headers)
@@ -586,6 +586,11 @@ def get_backup_status() -> Dict[str, Any]:
     return _read_status()
 
 
+def mark_backup_queued() -> None:
+    """Stato "running" dall'accodamento del job: il polling non legge l'esito del backup precedente."""
+    _write_status("running", 0, "Backup in coda...")
+
+
 def create_backup(background: bool = False, db: Optional[Session] = None, target_ids: Optional[List[int]] = None):
     """Crea backup locale.
 
@@ -1104,15 +1109,12 @@ def _send_backup_notification_email(
         upload_results: Lista risultati upload [{"name": str, "success": bool, "error": str?}] (opzionale)
         error: Messaggio di errore se fallito (opzionale)
     """
-    from .. import models
     from ..services import email_service
+    from ..settings_cache import get_settings
     
     try:
         # Ottieni impostazioni azienda
-        settings = db.query(models.ImpostazioniAzienda).first()
-        if not settings:
-            logger.warning("Impostazioni azienda non trovate, impossibile inviare email notifica backup")
-            return
+        settings = get_settings(db)
         
         if settings.backup_alert_abilitato is False:
             return
@@ -1135,19 +1137,19 @@ def _send_backup_notification_email(
             azienda_nome=azienda_nome
         )
         
-        # Invia email
+        # Accoda email (outbox)
         for email_destinatario in recipients:
-            email_sent = email_service.send_email(
+            email_accodata = email_service.send_email(
                 to_email=email_destinatario,
                 subject=subject,
                 body_html=body_html,
                 db=db
             )
             
-            if email_sent:
-                logger.info(f"Email notifica backup inviata con successo a {email_destinatario}")
+            if email_accodata:
+                logger.info(f"Email notifica backup accodata per {email_destinatario}")
             else:
-                logger.warning(f"Impossibile inviare email notifica backup a {email_destinatario}")
+                logger.warning(f"Impossibile accodare email notifica backup per {email_destinatario}")
             
     except Exception as e:
         logger.error(f"Errore durante invio email notifica backup: {e}", exc_info=True)
@@ -0,0 +1,211 @@
+"""
+Contatori DDT per la dashboard (tabella ddt_contatori).
+
+/ddt/stats, /ddt/pending-accept-count e /ddt/assignment-stats leggono i conteggi per
+chiave primaria invece di aggregare ritiri_prodotti a ogni polling.
+
+Ogni DDT non eliminato contribuisce con +1 a:
+- ("stato", stato)
+- ("assegnazione", assegnazione_stato)
+- ("tecnico_assegnato", "<id>") se ha un tecnico assegnato
+- ("tecnico_pending", "<id>:<assegnazione_stato>") se ha un tecnico in attesa di accettazione
+- ("non_assegnati", "totale") se non ha né tecnico assegnato né pending
+
+L'hook after_flush calcola la differenza tra i contributi prima e dopo il flush di ogni
+DDT inserito, modificato o eliminato (creazione, modifica, assegnazione, accettazione,
+rifiuto, trasferimento, soft delete) e la applica con un upsert nella stessa
+transazione. ricalcola() ricostruisce la tabella da zero (migrazione e job notturno) e
+corregge eventuali derive, ad esempio modifiche fatte fuori dall'applicazione.
+"""
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import event, inspect, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+# Campi di ritiri_prodotti da cui dipendono i contatori
+CAMPI_CONTATI = (
+    "stato",
+    "assegnazione_stato",
+    "tecnico_assegnato_id",
+    "tecnico_assegnazione_pending_id",
+    "deleted_at",
+)
+
+Chiave = Tuple[str, str]
+
+
+def _contributi(valori: Dict) -> List[Chiave]:
+    """Chiavi incrementate da un DDT con questi valori (nessuna se eliminato)."""
+    if valori["deleted_at"] is not None:
+        return []
+    assegnazione = valori["assegnazione_stato"] or "da_assegnare"
+    chiavi = [
+        ("stato", valori["stato"] or "in_magazzino"),
+        ("assegnazione", assegnazione),
+    ]
+    assegnato = valori["tecnico_assegnato_id"]
+    pending = valori["tecnico_assegnazione_pending_id"]
+    if assegnato is not None:
+        chiavi.append(("tecnico_assegnato", str(assegnato)))
+    if pending is not None:
+        chiavi.append(("tecnico_pending", f"{pending}:{assegnazione}"))
+    if assegnato is None and pending is None:
+        chiavi.append(("non_assegnati", "totale"))
+    return chiavi
+
+
+def _valori(obj, precedenti: bool) -> Dict:
+    state = inspect(obj)
+    valori = {}
+    for campo in CAMPI_CONTATI:
+        valore = getattr(obj, campo)
+        if precedenti:
+            history = state.attrs[campo].history
+            if history.deleted:
+                valore = history.deleted[0]
+        valori[campo] = valore
+    return valori
+
+
+def leggi(db: Session, chiavi: Iterable[Chiave]) -> Dict[Chiave, int]:
+    """Valori dei contatori richiesti (0 per quelli mai creati), con un solo lookup per PK."""
+    chiavi = list(chiavi)
+    tabella = models.ContatoreDDT
+    rows = db.query(tabella.ambito, tabella.chiave, tabella.valore).filter(
+        tuple_(tabella.ambito, tabella.chiave).in_(chiavi)
+    ).all()
+    valori = {chiave: 0 for chiave in chiavi}
+    valori.update({(ambito, chiave): valore for ambito, chiave, valore in rows})
+    return valori
+
+
+def leggi_ambito(db: Session, ambito: str) -> Dict[str, int]:
+    """Contatori non nulli di un ambito (prefisso della chiave primaria)."""
+    tabella = models.ContatoreDDT
+    rows = db.query(tabella.chiave, tabella.valore).filter(
+        tabella.ambito == ambito, tabella.valore != 0
+    ).all()
+    return {chiave: valore for chiave, valore in rows}
+
+
+_RICALCOLO_SQL = """
+    INSERT INTO ddt_contatori (ambito, chiave, valore)
+    SELECT 'stato', COALESCE(NULLIF(stato, ''), 'in_magazzino'), COUNT(*)
+    FROM ritiri_prodotti WHERE deleted_at IS NULL GROUP BY 2
+    UNION ALL
+    SELECT 'assegnazione', COALESCE(NULLIF(assegnazione_stato, ''), 'da_assegnare'), COUNT(*)
+    FROM ritiri_prodotti WHERE deleted_at IS NULL GROUP BY 2
+    UNION ALL
+    SELECT 'tecnico_assegnato', tecnico_assegnato_id::text, COUNT(*)
+    FROM ritiri_prodotti WHERE deleted_at IS NULL AND tecnico_assegnato_id IS NOT NULL GROUP BY 2
+    UNION ALL
+    SELECT 'tecnico_pending',
+           tecnico_assegnazione_pending_id::text || ':' || COALESCE(NULLIF(assegnazione_stato, ''), 'da_assegnare'),
+           COUNT(*)
+    FROM ritiri_prodotti WHERE deleted_at IS NULL AND tecnico_assegnazione_pending_id IS NOT NULL GROUP BY 2
+    UNION ALL
+    SELECT 'non_assegnati', 'totale', COUNT(*)
+    FROM ritiri_prodotti
+    WHERE deleted_at IS NULL AND tecnico_assegnato_id IS NULL AND tecnico_assegnazione_pending_id IS NULL
+"""
+
+
+def ricalcola(connection) -> int:
+    """
+    Ricostruisce ddt_contatori da ritiri_prodotti nella transazione di `connection`
+    (il chiamante fa commit). Restituisce il numero di contatori che erano sbagliati.
+    """
+    # SHARE blocca le scritture sui DDT (non le letture) fino al commit: nessun delta
+    # concorrente può andare perso tra il conteggio e la sostituzione dei contatori
+    connection.execute(text("LOCK TABLE ritiri_prodotti IN SHARE MODE"))
+    prima = {
+        (ambito, chiave): valore
+        for ambito, chiave, valore in connection.execute(
+            text("SELECT ambito, chiave, valore FROM ddt_contatori WHERE valore <> 0")
+        )
+    }
+    connection.execute(text("DELETE FROM ddt_contatori"))
+    connection.execute(text(_RICALCOLO_SQL))
+    dopo = {
+        (ambito, chiave): valore
+        for ambito, chiave, valore in connection.execute(
+            text("SELECT ambito, chiave, valore FROM ddt_contatori WHERE valore <> 0")
+        )
+    }
+    return sum(1 for chiave in set(prima) | set(dopo) if prima.get(chiave) != dopo.get(chiave))
+
+
+def ricalcola_contatori_job() -> None:
+    """Job dello scheduler: ricalcolo completo, le derive vengono registrate nel log."""
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        corretti = ricalcola(db.connection())
+        db.commit()
+        if corretti:
+            logger.warning(f"[DDT CONTATORI] Ricalcolo: corretti {corretti} contatori")
+        else:
+            logger.info("[DDT CONTATORI] Ricalcolo: contatori allineati")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[DDT CONTATORI] Ricalcolo fallito: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+# -------------------- AGGIORNAMENTO INCREMENTALE --------------------
+def _carica_valore_precedente(target, value, oldvalue, initiator):
+    pass
+
+
+# active_history: assegnare un campo non ancora caricato legge comunque il valore
+# precedente, altrimenti la history del flush non saprebbe quale contatore decrementare
+for _campo in CAMPI_CONTATI:
+    event.listen(
+        getattr(models.RitiroProdotto, _campo), "set", _carica_valore_precedente,
+        active_history=True,
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    # In after_flush new/dirty/deleted e la history riflettono ancora lo stato prima del flush
+    delta = Counter()
+    for obj in session.new:
+        if isinstance(obj, models.RitiroProdotto):
+            delta.update(_contributi(_valori(obj, precedenti=False)))
+    for obj in session.dirty:
+        if not isinstance(obj, models.RitiroProdotto):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[campo].history.has_changes() for campo in CAMPI_CONTATI):
+            continue
+        delta.subtract(_contributi(_valori(obj, precedenti=True)))
+        delta.update(_contributi(_valori(obj, precedenti=False)))
+    for obj in session.deleted:
+        if isinstance(obj, models.RitiroProdotto):
+            delta.subtract(_contributi(_valori(obj, precedenti=True)))
+
+    righe = [
+        {"ambito": ambito, "chiave": chiave, "valore": valore}
+        for (ambito, chiave), valore in sorted(delta.items())
+        if valore
+    ]
+    if not righe:
+        return
+    # Ordine fisso delle chiavi: transazioni concorrenti bloccano le righe nello stesso ordine
+    stmt = pg_insert(models.ContatoreDDT.__table__).values(righe)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["ambito", "chiave"],
+        set_={"valore": models.ContatoreDDT.__table__.c.valore + stmt.excluded.valore},
+    )
+    session.connection().execute(stmt)
+# ------------------ /AGGIORNAMENTO INCREMENTALE ---------------------
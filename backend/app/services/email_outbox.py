@@ -0,0 +1,423 @@
+"""
+Outbox delle email (tabelle email_outbox ed email_allegati).
+
+Le email non vengono più inviate dentro la richiesta aprendo una connessione SMTP
+(STARTTLS + LOGIN) per ogni messaggio:
+- accoda() aggiunge la riga alla sessione del chiamante: l'email esiste solo se la
+  transazione che la genera va a buon fine
+- gli allegati sono salvati una sola volta per contenuto (sha256): il PDF del RIT
+  spedito a cliente, sede e azienda occupa una sola riga di email_allegati
+- drain() prende fino a EMAIL_OUTBOX_BATCH righe con FOR UPDATE SKIP LOCKED (più worker
+  non inviano mai la stessa email) e le invia tutte sulla stessa sessione SMTP
+  autenticata
+- errori temporanei: nuovo tentativo dopo EMAIL_OUTBOX_BACKOFF_BASE * 2^(tentativi-1)
+  secondi (al massimo EMAIL_OUTBOX_BACKOFF_MAX) fino a EMAIL_OUTBOX_MAX_TENTATIVI; i
+  rifiuti permanenti del server (codici 5xx) chiudono subito la riga come "fallita"
+- circuit breaker: dopo EMAIL_OUTBOX_CB_SOGLIA connessioni fallite di fila il server è
+  considerato irraggiungibile e il processo non ci riprova per EMAIL_OUTBOX_CB_PAUSA
+  secondi; le righe restano in coda senza consumare tentativi
+- il drain parte subito dopo il commit che accoda (hook after_commit, thread dedicato)
+  e ogni EMAIL_OUTBOX_INTERVALLO secondi dallo scheduler, per i retry e per le righe
+  accodate da altri processi
+
+Consegna "almeno una volta": se il commit dopo l'invio fallisce la riga viene reinviata.
+"""
+import hashlib
+import logging
+import os
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_BATCH = int(os.getenv("EMAIL_OUTBOX_BATCH", "20"))
+EMAIL_OUTBOX_MAX_TENTATIVI = int(os.getenv("EMAIL_OUTBOX_MAX_TENTATIVI", "8"))
+EMAIL_OUTBOX_BACKOFF_BASE = int(os.getenv("EMAIL_OUTBOX_BACKOFF_BASE", "30"))  # secondi
+EMAIL_OUTBOX_BACKOFF_MAX = int(os.getenv("EMAIL_OUTBOX_BACKOFF_MAX", "3600"))  # secondi
+EMAIL_OUTBOX_CB_SOGLIA = int(os.getenv("EMAIL_OUTBOX_CB_SOGLIA", "3"))  # connessioni fallite di fila
+EMAIL_OUTBOX_CB_PAUSA = int(os.getenv("EMAIL_OUTBOX_CB_PAUSA", "300"))  # secondi
+EMAIL_OUTBOX_INTERVALLO = int(os.getenv("EMAIL_OUTBOX_INTERVALLO", "30"))  # secondi (job scheduler)
+EMAIL_OUTBOX_RETENZIONE_GIORNI = int(os.getenv("EMAIL_OUTBOX_RETENZIONE_GIORNI", "30"))
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))  # secondi
+
+# (nome file, contenuto, content type)
+Allegato = Tuple[str, bytes, str]
+
+_lock = threading.Lock()
+_stats = {
+    "inviate": 0,
+    "ritentate": 0,
+    "fallite": 0,
+    "lotti": 0,
+    "sessioni_smtp": 0,
+    "connessioni_fallite": 0,
+    "aperture_circuito": 0,
+    "latenza_secondi_totale": 0.0,
+    "latenza_secondi_max": 0.0,
+}
+_circuito = {"fallimenti_consecutivi": 0, "aperto_fino": 0.0}
+_drain_in_attesa = {"value": False}
+# Un solo drain alla volta per processo: tra processi diversi decide SKIP LOCKED
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email-outbox")
+
+
+# -------------------- ACCODAMENTO --------------------
+def _salva_allegato(db: Session, dati: bytes) -> str:
+    digest = hashlib.sha256(dati).hexdigest()
+    salvati = db.info.setdefault("email_allegati_salvati", set())
+    if digest in salvati:
+        return digest
+    stmt = pg_insert(models.EmailAllegato.__table__).values(hash=digest, dati=dati, dimensione=len(dati))
+    # Allegato già presente: aggiorna created_at, così pulizia() non lo considera orfano
+    db.execute(stmt.on_conflict_do_update(index_elements=["hash"], set_={"created_at": datetime.now()}))
+    salvati.add(digest)
+    return digest
+
+
+def accoda(
+    db: Session,
+    destinatario: str,
+    oggetto: str,
+    corpo_html: str,
+    corpo_testo: Optional[str] = None,
+    mittente_nome: Optional[str] = None,
+    allegati: Iterable[Allegato] = (),
+) -> models.EmailOutbox:
+    """Aggiunge un'email all'outbox nella transazione di `db` (il chiamante fa commit)."""
+    descrittori = []
+    for filename, dati, content_type in allegati:
+        descrittori.append({
+            "filename": filename,
+            "content_type": content_type,
+            "hash": _salva_allegato(db, dati),
+            "dimensione": len(dati),
+        })
+    riga = models.EmailOutbox(
+        destinatario=destinatario,
+        oggetto=oggetto,
+        corpo_html=corpo_html,
+        corpo_testo=corpo_testo,
+        mittente_nome=mittente_nome,
+        allegati=descrittori,
+        stato="in_coda",
+        tentativi=0,
+        prossimo_tentativo_at=datetime.now(),
+    )
+    db.add(riga)
+    return riga
+# ------------------ /ACCODAMENTO ---------------------
+
+
+# -------------------- CIRCUIT BREAKER --------------------
+def _circuito_aperto() -> bool:
+    with _lock:
+        return time.monotonic() < _circuito["aperto_fino"]
+
+
+def _connessione_fallita(errore: Exception) -> None:
+    with _lock:
+        _stats["connessioni_fallite"] += 1
+        _circuito["fallimenti_consecutivi"] += 1
+        apri = _circuito["fallimenti_consecutivi"] >= EMAIL_OUTBOX_CB_SOGLIA
+        if apri:
+            # Dopo la pausa un solo tentativo: se fallisce il circuito si riapre subito
+            _circuito["aperto_fino"] = time.monotonic() + EMAIL_OUTBOX_CB_PAUSA
+            _stats["aperture_circuito"] += 1
+    if apri:
+        logger.error(f"[EMAIL OUTBOX] Server SMTP irraggiungibile, invii sospesi per {EMAIL_OUTBOX_CB_PAUSA}s: {errore}")
+    else:
+        logger.warning(f"[EMAIL OUTBOX] Connessione SMTP fallita: {errore}")
+
+
+def _connessione_riuscita() -> None:
+    with _lock:
+        _circuito["fallimenti_consecutivi"] = 0
+        _circuito["aperto_fino"] = 0.0
+        _stats["sessioni_smtp"] += 1
+# ------------------ /CIRCUIT BREAKER ---------------------
+
+
+# -------------------- INVIO --------------------
+def _connetti(config: Dict[str, Any]) -> smtplib.SMTP:
+    server = smtplib.SMTP(config["host"], config["port"], timeout=SMTP_TIMEOUT)
+    try:
+        if config.get("use_tls", True):
+            server.starttls()
+        if config.get("username"):
+            server.login(config["username"], config["password"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def _chiudi(server: smtplib.SMTP) -> None:
+    try:
+        server.quit()
+    except (OSError, smtplib.SMTPException):
+        server.close()
+
+
+def _messaggio(riga: models.EmailOutbox, config: Dict[str, Any], allegati: Dict[str, bytes]) -> EmailMessage:
+    msg = EmailMessage()
+    mittente = config.get("from_email") or config.get("username")
+    msg["From"] = formataddr((riga.mittente_nome, mittente)) if riga.mittente_nome else mittente
+    msg["To"] = riga.destinatario
+    msg["Subject"] = riga.oggetto
+    if riga.corpo_testo:
+        msg.set_content(riga.corpo_testo)
+        msg.add_alternative(riga.corpo_html, subtype="html")
+    else:
+        msg.set_content(riga.corpo_html, subtype="html")
+    for allegato in riga.allegati or []:
+        maintype, _, subtype = allegato["content_type"].partition("/")
+        msg.add_attachment(
+            allegati[allegato["hash"]],
+            maintype=maintype,
+            subtype=subtype or "octet-stream",
+            filename=allegato["filename"],
+        )
+    return msg
+
+
+def _carica_allegati(db: Session, righe: List[models.EmailOutbox]) -> Dict[str, bytes]:
+    hashes = {allegato["hash"] for riga in righe for allegato in (riga.allegati or [])}
+    if not hashes:
+        return {}
+    rows = db.query(models.EmailAllegato.hash, models.EmailAllegato.dati).filter(
+        models.EmailAllegato.hash.in_(hashes)
+    ).all()
+    return {digest: bytes(dati) for digest, dati in rows}
+
+
+def _errore_permanente(errore: Exception) -> bool:
+    if isinstance(errore, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _msg in errore.recipients.values())
+    if isinstance(errore, smtplib.SMTPResponseException):
+        return errore.smtp_code >= 500
+    # Messaggio non costruibile (allegato mancante, intestazioni non valide)
+    return isinstance(errore, (KeyError, ValueError))
+
+
+def _registra_errore(riga: models.EmailOutbox, errore: Exception, esito: Dict[str, int]) -> None:
+    riga.tentativi += 1
+    riga.ultimo_errore = str(errore)[:1000]
+    if _errore_permanente(errore) or riga.tentativi >= EMAIL_OUTBOX_MAX_TENTATIVI:
+        riga.stato = "fallita"
+        chiave = "fallite"
+        logger.error(f"[EMAIL OUTBOX] Email {riga.id} a {riga.destinatario} non inviata dopo {riga.tentativi} tentativi: {errore}")
+    else:
+        attesa = min(EMAIL_OUTBOX_BACKOFF_BASE * 2 ** (riga.tentativi - 1), EMAIL_OUTBOX_BACKOFF_MAX)
+        riga.prossimo_tentativo_at = datetime.now() + timedelta(seconds=attesa)
+        chiave = "ritentate"
+        logger.warning(f"[EMAIL OUTBOX] Email {riga.id} a {riga.destinatario}: nuovo tentativo tra {attesa}s ({errore})")
+    esito[chiave] += 1
+    with _lock:
+        _stats[chiave] += 1
+
+
+def _registra_invio(riga: models.EmailOutbox, esito: Dict[str, int]) -> None:
+    riga.stato = "inviata"
+    riga.tentativi += 1
+    riga.inviata_at = datetime.now()
+    riga.ultimo_errore = None
+    latenza = (riga.inviata_at - riga.created_at).total_seconds()
+    esito["inviate"] += 1
+    with _lock:
+        _stats["inviate"] += 1
+        _stats["latenza_secondi_totale"] += latenza
+        _stats["latenza_secondi_max"] = max(_stats["latenza_secondi_max"], latenza)
+
+
+def drain(db: Optional[Session] = None, config: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Invia le email in coda già scadute, a lotti, riusando la stessa sessione SMTP.
+    `config` sostituisce la configurazione SMTP delle impostazioni (test).
+    Restituisce quante email sono state inviate, riprogrammate e chiuse come fallite.
+    """
+    from ..database import SessionLocal
+    from .email_service import get_smtp_config
+
+    esito = {"inviate": 0, "ritentate": 0, "fallite": 0}
+    if _circuito_aperto():
+        return esito
+
+    propria = db is None
+    if propria:
+        db = SessionLocal()
+    server = None
+    try:
+        if config is None:
+            config = get_smtp_config(db)
+        while True:
+            righe = db.query(models.EmailOutbox).filter(
+                models.EmailOutbox.stato == "in_coda",
+                models.EmailOutbox.prossimo_tentativo_at <= datetime.now()
+            ).order_by(models.EmailOutbox.id).limit(EMAIL_OUTBOX_BATCH).with_for_update(skip_locked=True).all()
+            if not righe:
+                db.commit()
+                break
+            allegati = _carica_allegati(db, righe)
+            with _lock:
+                _stats["lotti"] += 1
+
+            for riga in righe:
+                if server is None:
+                    try:
+                        server = _connetti(config)
+                    except OSError as e:  # include SMTPException (STARTTLS, LOGIN)
+                        _connessione_fallita(e)
+                        # Le righe non inviate restano in coda (lock rilasciati dal commit)
+                        db.commit()
+                        return esito
+                    _connessione_riuscita()
+                try:
+                    server.send_message(_messaggio(riga, config, allegati))
+                except smtplib.SMTPServerDisconnected as e:
+                    # Sessione chiusa dal server (timeout, limite messaggi): si riapre per la prossima riga
+                    server.close()
+                    server = None
+                    _registra_errore(riga, e, esito)
+                except smtplib.SMTPException as e:
+                    # Risposta di errore del server: la sessione resta utilizzabile
+                    _registra_errore(riga, e, esito)
+                except OSError as e:
+                    # Connessione interrotta (SMTPException è anch'essa un OSError, gestita sopra)
+                    server.close()
+                    server = None
+                    _registra_errore(riga, e, esito)
+                except Exception as e:
+                    _registra_errore(riga, e, esito)
+                else:
+                    _registra_invio(riga, esito)
+            db.commit()
+            if len(righe) < EMAIL_OUTBOX_BATCH:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if server is not None:
+            _chiudi(server)
+        if propria:
+            db.close()
+    if esito["inviate"] or esito["ritentate"] or esito["fallite"]:
+        logger.info(f"[EMAIL OUTBOX] Drain: {esito['inviate']} inviate, {esito['ritentate']} da ritentare, {esito['fallite']} fallite")
+    return esito
+
+
+def _drain_in_background() -> None:
+    with _lock:
+        _drain_in_attesa["value"] = False
+    try:
+        drain()
+    except Exception as e:
+        logger.error(f"[EMAIL OUTBOX] Drain fallito: {e}", exc_info=True)
+
+
+def richiedi_drain() -> None:
+    """Programma un drain nel thread dell'outbox (al massimo uno in attesa)."""
+    with _lock:
+        if _drain_in_attesa["value"]:
+            return
+        _drain_in_attesa["value"] = True
+    _executor.submit(_drain_in_background)
+# ------------------ /INVIO ---------------------
+
+
+# -------------------- MANUTENZIONE E METRICHE --------------------
+def pulizia(db: Session) -> Tuple[int, int]:
+    """Elimina le email chiuse più vecchie della retenzione e gli allegati non più usati."""
+    limite = datetime.now() - timedelta(days=EMAIL_OUTBOX_RETENZIONE_GIORNI)
+    email = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.stato.in_(("inviata", "fallita")),
+        models.EmailOutbox.created_at < limite
+    ).delete(synchronize_session=False)
+    allegati = db.execute(text("""
+        DELETE FROM email_allegati a
+        WHERE a.created_at < :limite
+          AND NOT EXISTS (
+              SELECT 1
+              FROM email_outbox o, jsonb_array_elements(COALESCE(o.allegati, '[]'::jsonb)) AS x
+              WHERE x->>'hash' = a.hash
+          )
+    """), {"limite": limite}).rowcount
+    return email, allegati
+
+
+def pulizia_job() -> None:
+    """Job dello scheduler: pulizia dell'outbox."""
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        email, allegati = pulizia(db)
+        db.commit()
+        logger.info(f"[EMAIL OUTBOX] Pulizia: eliminate {email} email e {allegati} allegati")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[EMAIL OUTBOX] Pulizia fallita: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def outbox_stats(db: Session) -> Dict[str, Any]:
+    """Profondità della coda (dal database) e invii/latenze del processo corrente."""
+    per_stato = dict(
+        db.query(models.EmailOutbox.stato, func.count(models.EmailOutbox.id))
+        .group_by(models.EmailOutbox.stato).all()
+    )
+    piu_vecchia = db.query(func.min(models.EmailOutbox.created_at)).filter(
+        models.EmailOutbox.stato == "in_coda"
+    ).scalar()
+    with _lock:
+        stats = dict(_stats)
+        fallimenti = _circuito["fallimenti_consecutivi"]
+        riapertura = _circuito["aperto_fino"] - time.monotonic()
+    inviate = stats["inviate"]
+    stats["latenza_secondi_media"] = round(stats["latenza_secondi_totale"] / inviate, 3) if inviate else None
+    for key in ("latenza_secondi_totale", "latenza_secondi_max"):
+        stats[key] = round(stats[key], 3)
+    stats["coda"] = per_stato.get("in_coda", 0)
+    stats["per_stato"] = per_stato
+    stats["eta_piu_vecchia_secondi"] = round((datetime.now() - piu_vecchia).total_seconds(), 1) if piu_vecchia else None
+    stats["circuito"] = {
+        "aperto": riapertura > 0,
+        "riapertura_tra_secondi": round(riapertura, 1) if riapertura > 0 else None,
+        "fallimenti_consecutivi": fallimenti,
+    }
+    return stats
+# ------------------ /MANUTENZIONE E METRICHE ---------------------
+
+
+# -------------------- DRAIN DOPO COMMIT --------------------
+@event.listens_for(Session, "after_flush")
+def _mark_email_accodate(session, flush_context):
+    if any(isinstance(obj, models.EmailOutbox) for obj in session.new):
+        session.info["email_accodate"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _drain_after_commit(session):
+    session.info.pop("email_allegati_salvati", None)
+    if session.info.pop("email_accodate", False):
+        richiedi_drain()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("email_allegati_salvati", None)
+    session.info.pop("email_accodate", None)
+# ------------------ /DRAIN DOPO COMMIT ---------------------
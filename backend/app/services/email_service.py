@@ -1,20 +1,17 @@
 """
 Servizio per l'invio di email
 """
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.utils import formataddr
 from typing import Optional, List, Dict, Any
+from datetime import datetime
 import os
 from sqlalchemy.orm import Session
 from .. import models
+from ..settings_cache import get_settings
+from . import email_outbox
 
 def get_smtp_config(db: Session) -> dict:
-    """Ottiene la configurazione SMTP dalle impostazioni azienda"""
-    settings = db.query(models.ImpostazioniAzienda).first()
-    if not settings:
-        return {}
+    """Ottiene la configurazione SMTP dalle impostazioni azienda (snapshot in cache)"""
+    settings = get_settings(db)
     
     return {
         'host': settings.smtp_server or os.getenv("SMTP_HOST", "smtp.gmail.com"),
@@ -34,7 +31,12 @@ def send_email(
     from_name: Optional[str] = None
 ) -> bool:
     """
-    Invia un'email usando SMTP
+    Accoda un'email nell'outbox: l'invio SMTP avviene nel worker dell'outbox
+    (vedi email_outbox), con una sessione SMTP riusata per più messaggi e retry.
+    
+    L'email viene scritta con una sessione propria e subito confermata, quindi resta
+    in coda anche se il chiamante non fa commit. Per legarla alla transazione del
+    chiamante usare email_outbox.accoda(db, ...).
     
     Args:
         to_email: Email destinatario
@@ -44,27 +46,21 @@ def send_email(
         db: Sessione database per ottenere configurazione SMTP (opzionale)
     
     Returns:
-        True se inviata con successo, False altrimenti
+        True se l'email è stata accodata (o stampata in modalità mock senza SMTP),
+        False se l'accodamento non è riuscito. True non significa consegnata: l'esito
+        dell'invio è nello stato della riga dell'outbox (inviata / fallita).
     """
     # Ottieni configurazione SMTP
     if db:
         smtp_config = get_smtp_config(db)
-        smtp_host = smtp_config.get('host', os.getenv("SMTP_HOST", "smtp.gmail.com"))
-        smtp_port = smtp_config.get('port', int(os.getenv("SMTP_PORT", "587")))
-        smtp_user = smtp_config.get('username', os.getenv("SMTP_USER", ""))
-        smtp_password = smtp_config.get('password', os.getenv("SMTP_PASSWORD", ""))
-        smtp_from = smtp_config.get('from_email', smtp_user)
-        use_tls = smtp_config.get('use_tls', True)
     else:
-        smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        smtp_user = os.getenv("SMTP_USER", "")
-        smtp_password = os.getenv("SMTP_PASSWORD", "")
-        smtp_from = os.getenv("SMTP_FROM", smtp_user)
-        use_tls = True
+        smtp_config = {
+            'username': os.getenv("SMTP_USER", ""),
+            'password': os.getenv("SMTP_PASSWORD", ""),
+        }
     
     # Se non configurato, usa mock
-    if not smtp_user or not smtp_password:
+    if not smtp_config.get('username') or not smtp_config.get('password'):
         print(f"--- [EMAIL MOCK] ---")
         print(f"TO: {to_email}")
         if from_name:
@@ -74,34 +70,191 @@ def send_email(
         print("--------------------")
         return True
     
+    from ..database import SessionLocal
+    outbox_db = SessionLocal()
     try:
-        # Crea messaggio
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = formataddr((from_name, smtp_from)) if from_name else smtp_from
-        msg['To'] = to_email
-        
-        # Aggiungi corpo
-        if body_text:
-            part1 = MIMEText(body_text, 'plain')
-            msg.attach(part1)
-        
-        part2 = MIMEText(body_html, 'html')
-        msg.attach(part2)
-        
-        # Invia email
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            if use_tls:
-                server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
-        
-        print(f"Email inviata con successo a {to_email}")
+        email_outbox.accoda(
+            outbox_db,
+            destinatario=to_email,
+            oggetto=subject,
+            corpo_html=body_html,
+            corpo_testo=body_text,
+            mittente_nome=from_name
+        )
+        outbox_db.commit()
+        print(f"Email accodata per {to_email}")
         return True
         
     except Exception as e:
-        print(f"Errore invio email a {to_email}: {str(e)}")
+        outbox_db.rollback()
+        print(f"Errore accodamento email a {to_email}: {str(e)}")
         return False
+    finally:
+        outbox_db.close()
+
+def generate_rit_email(
+    data_intervento: datetime,
+    azienda_nome: str,
+    azienda_indirizzo: str = "",
+    azienda_telefono: str = "",
+    azienda_email: str = ""
+) -> tuple[str, str, str]:
+    """
+    Genera il contenuto dell'email di trasmissione del RIT (PDF in allegato)
+    
+    Returns:
+        (subject, body_html, body_text)
+    """
+    # Formatta data intervento
+    data_intervento_formattata = data_intervento.strftime('%d/%m/%Y')
+    
+    # Prepara dati azienda per il footer
+    footer_azienda = azienda_nome
+    if azienda_indirizzo:
+        footer_azienda += f"\n{azienda_indirizzo}"
+    if azienda_telefono:
+        footer_azienda += f"\nTel: {azienda_telefono}"
+    if azienda_email:
+        footer_azienda += f"\nEmail: {azienda_email}"
+    
+    # Corpo email formale con GDPR
+    body_html = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.8; color: #333; }}
+            .container {{ max-width: 700px; margin: 0 auto; padding: 20px; }}
+            .content {{ background-color: #ffffff; padding: 30px; border: 1px solid #e5e7eb; }}
+            .footer {{ background-color: #f3f4f6; padding: 20px; font-size: 11px; color: #6b7280; border-top: 2px solid #e5e7eb; margin-top: 30px; }}
+            p {{ margin-bottom: 15px; }}
+            .signature {{ margin-top: 30px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="content">
+                <p>Gentile Cliente,</p>
+                
+                <p>con la presente Le trasmettiamo in allegato il Rapporto di Intervento Tecnico, relativo all'attività svolta presso la Sua sede e/o sul sistema di Sua competenza il giorno <strong>{data_intervento_formattata}</strong>, a seguito della chiusura del RIT aperto per intervento richiesto o intervento ordinario.</p>
+                
+                <p>Il documento riepiloga le operazioni effettuate, le eventuali verifiche eseguite e l'esito finale dell'intervento, e viene inviato per finalità di:</p>
+                
+                <ul>
+                    <li>adempimento contrattuale e/o precontrattuale;</li>
+                    <li>corretta gestione del rapporto commerciale e tecnico in essere;</li>
+                    <li>tracciabilità e documentazione delle attività svolte.</li>
+                </ul>
+                
+                <p>Ai sensi del Regolamento (UE) 2016/679 (GDPR) e della normativa nazionale vigente in materia di protezione dei dati personali, il trattamento dei dati contenuti nel rapporto avviene esclusivamente per le finalità sopra indicate, nel rispetto dei principi di liceità, correttezza, trasparenza e minimizzazione dei dati.</p>
+                
+                <p>La base giuridica del trattamento è costituita dall'esecuzione di obblighi contrattuali e/o di misure precontrattuali (art. 6, par. 1, lett. b GDPR), nonché dall'adempimento di obblighi di legge e da legittimi interessi del Titolare del trattamento connessi alla gestione tecnica e amministrativa del servizio.</p>
+                
+                <p>Il documento allegato è destinato esclusivamente al destinatario indicato. Qualora lo abbia ricevuto per errore, La invitiamo a darcene tempestiva comunicazione e a procedere alla sua cancellazione, astenendosi da qualsiasi utilizzo o diffusione non autorizzata.</p>
+                
+                <p>Restiamo a disposizione per eventuali chiarimenti o ulteriori necessità.</p>
+                
+                <p class="signature">Cordiali saluti,<br>
+                <strong>{footer_azienda}</strong></p>
+            </div>
+            <div class="footer">
+                <p><strong>Nota:</strong> Questa è una comunicazione automatica. Si prega di non rispondere direttamente a questa email.</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    
+    body_text = f"""Rapporto Intervento Tecnico
+
+Gentile Cliente,
+
+con la presente Le trasmettiamo in allegato il Rapporto di Intervento Tecnico, relativo all'attività svolta presso la Sua sede e/o sul sistema di Sua competenza il giorno {data_intervento_formattata}, a seguito della chiusura del RIT aperto per intervento richiesto o intervento ordinario.
+
+Il documento riepiloga le operazioni effettuate, le eventuali verifiche eseguite e l'esito finale dell'intervento, e viene inviato per finalità di:
+
+- adempimento contrattuale e/o precontrattuale;
+- corretta gestione del rapporto commerciale e tecnico in essere;
+- tracciabilità e documentazione delle attività svolte.
+
+Ai sensi del Regolamento (UE) 2016/679 (GDPR) e della normativa nazionale vigente in materia di protezione dei dati personali, il trattamento dei dati contenuti nel rapporto avviene esclusivamente per le finalità sopra indicate, nel rispetto dei principi di liceità, correttezza, trasparenza e minimizzazione dei dati.
+
+La base giuridica del trattamento è costituita dall'esecuzione di obblighi contrattuali e/o di misure precontrattuali (art. 6, par. 1, lett. b GDPR), nonché dall'adempimento di obblighi di legge e da legittimi interessi del Titolare del trattamento connessi alla gestione tecnica e amministrativa del servizio.
+
+Il documento allegato è destinato esclusivamente al destinatario indicato. Qualora lo abbia ricevuto per errore, La invitiamo a darcene tempestiva comunicazione e a procedere alla sua cancellazione, astenendosi da qualsiasi utilizzo o diffusione non autorizzata.
+
+Restiamo a disposizione per eventuali chiarimenti o ulteriori necessità.
+
+Cordiali saluti,
+{footer_azienda}
+
+---
+Nota: Questa è una comunicazione automatica. Si prega di non rispondere direttamente a questa email.
+    """
+    
+    subject = f"Rapporto Intervento Tecnico {azienda_nome} del {data_intervento_formattata}"
+    return subject, body_html, body_text
+
+def generate_ddt_email(numero_ddt: str, data_ddt: str, azienda_nome: Optional[str]) -> tuple[str, str]:
+    """
+    Genera il contenuto dell'email di trasmissione del DDT (PDF in allegato)
+    
+    Returns:
+        (subject, body_html)
+    """
+    subject = f"DDT {numero_ddt} - {azienda_nome or 'Documento di Trasporto'}"
+    body_html = f"""
+    <div style="font-family: Arial, sans-serif; color: #333;">
+        <p>Gentile Cliente,</p>
+        <p>in allegato trova il Documento di Trasporto <strong>{numero_ddt}</strong> del <strong>{data_ddt}</strong>.</p>
+        <p>Cordiali saluti,<br>{azienda_nome or ''}</p>
+    </div>
+    """
+    return subject, body_html
+
+def generate_ddt_ritardi_email(tecnico_nome: Optional[str], ddts: List[dict]) -> tuple[str, str]:
+    """
+    Genera il riepilogo dei DDT non chiusi assegnati a un tecnico
+
+    Args:
+        tecnico_nome: Nome del tecnico
+        ddts: Dict con numero_ddt, stato, giorni, cliente, data_ritiro (datetime o None)
+
+    Returns:
+        (subject, body_html)
+    """
+    if len(ddts) == 1:
+        subject = f"Promemoria DDT {ddts[0]['numero_ddt']} in stato {ddts[0]['stato']}"
+    else:
+        subject = f"Promemoria: {len(ddts)} DDT non chiusi"
+    righe = "".join(
+        f"""
+            <tr>
+                <td style="padding: 6px; border-bottom: 1px solid #ddd;"><strong>{ddt['numero_ddt']}</strong></td>
+                <td style="padding: 6px; border-bottom: 1px solid #ddd;">{ddt['stato']}</td>
+                <td style="padding: 6px; border-bottom: 1px solid #ddd; text-align: right;">{ddt['giorni']}</td>
+                <td style="padding: 6px; border-bottom: 1px solid #ddd;">{ddt['cliente']}</td>
+                <td style="padding: 6px; border-bottom: 1px solid #ddd;">{ddt['data_ritiro'].strftime('%d/%m/%Y') if ddt['data_ritiro'] else '-'}</td>
+            </tr>"""
+        for ddt in ddts
+    )
+    body_html = f"""
+    <div style="font-family: Arial, sans-serif; color: #333;">
+        <p>Gentile {tecnico_nome or 'Tecnico'},</p>
+        <p>i seguenti DDT a te assegnati sono fermi nello stesso stato oltre le soglie di promemoria:</p>
+        <table style="border-collapse: collapse; font-size: 14px;">
+            <tr>
+                <th style="padding: 6px; border-bottom: 2px solid #333; text-align: left;">DDT</th>
+                <th style="padding: 6px; border-bottom: 2px solid #333; text-align: left;">Stato</th>
+                <th style="padding: 6px; border-bottom: 2px solid #333; text-align: right;">Giorni</th>
+                <th style="padding: 6px; border-bottom: 2px solid #333; text-align: left;">Cliente</th>
+                <th style="padding: 6px; border-bottom: 2px solid #333; text-align: left;">Data ritiro</th>
+            </tr>{righe}
+        </table>
+    </div>
+    """
+    return subject, body_html
 
 def generate_scadenza_contratto_email(
     cliente_nome: str,
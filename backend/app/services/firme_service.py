@@ -0,0 +1,99 @@
+"""
+Archivio delle firme (RIT e DDT) indirizzato per contenuto.
+
+Le firme arrivano dal frontend come data URI base64 (`data:image/png;base64,...`).
+Invece di salvarle inline in interventi/ritiri_prodotti, l'immagine decodificata viene
+salvata una sola volta nella tabella `firme` con chiave sha256 dei byte: la stessa firma
+del tecnico ripetuta su migliaia di record occupa una sola riga.
+
+I modelli espongono ancora `firma_tecnico` / `firma_cliente` come data URI (vedi
+models._firma_property); questo modulo registra l'hook before_flush che sposta i valori
+inline appena assegnati nella tabella firme.
+"""
+import base64
+import binascii
+import hashlib
+import re
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+
+DATA_URI_RE = re.compile(r"^data:(?P<mime>image/[\w.+-]+);base64,(?P<data>.+)$", re.DOTALL)
+
+# Modelli con firme e nome dei campi (property data URI sul modello)
+MODELLI_CON_FIRME = {
+    models.Intervento: ("firma_tecnico", "firma_cliente"),
+    models.RitiroProdotto: ("firma_tecnico", "firma_cliente"),
+}
+
+
+def parse_data_uri(value: Optional[str]) -> Optional[Tuple[str, bytes]]:
+    """Restituisce (mime_type, byte) di un data URI immagine base64, None se non valido."""
+    if not value:
+        return None
+    match = DATA_URI_RE.match(value.strip())
+    if not match:
+        return None
+    try:
+        dati = base64.b64decode(match.group("data"), validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    if not dati:
+        return None
+    return match.group("mime"), dati
+
+
+def firma_hash(dati: bytes) -> str:
+    return hashlib.sha256(dati).hexdigest()
+
+
+def store_firma(db: Session, data_uri: str) -> Optional[str]:
+    """
+    Salva la firma nella tabella firme (se non già presente) e ne restituisce l'hash.
+
+    Restituisce None se il valore non è un data URI immagine valido: in quel caso il
+    chiamante lo lascia inline.
+    """
+    parsed = parse_data_uri(data_uri)
+    if parsed is None:
+        return None
+    mime_type, dati = parsed
+    digest = firma_hash(dati)
+    db.execute(
+        pg_insert(models.Firma.__table__)
+        .values(hash=digest, mime_type=mime_type, dati=dati, dimensione=len(dati))
+        .on_conflict_do_nothing(index_elements=["hash"])
+    )
+    return digest
+
+
+def get_firma(db: Session, digest: str) -> Optional[models.Firma]:
+    return db.get(models.Firma, digest)
+
+
+def sposta_firme_inline(db: Session, obj) -> int:
+    """Sposta nella tabella firme le firme inline già caricate di `obj`; restituisce quante."""
+    spostate = 0
+    for campo in MODELLI_CON_FIRME.get(type(obj), ()):
+        inline_attr = f"{campo}_inline"
+        # Solo valori già in memoria: non forza il caricamento di colonne deferred
+        inline = obj.__dict__.get(inline_attr)
+        if not inline:
+            continue
+        digest = store_firma(db, inline)
+        if digest:
+            setattr(obj, f"{campo}_hash", digest)
+            setattr(obj, inline_attr, None)
+            spostate += 1
+    return spostate
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if type(obj) in MODELLI_CON_FIRME:
+            sposta_firme_inline(session, obj)
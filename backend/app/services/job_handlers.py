@@ -0,0 +1,155 @@
+"""
+Handler dei job in background (registrati in job_queue all'import del modulo).
+
+- email_rit: render del PDF del RIT e accodamento delle email a cliente, sede e azienda
+- email_ddt: PDF del DDT firmato e accodamento delle email ai destinatari indicati
+- backup: backup completo con upload opzionale verso le destinazioni configurate
+
+Prelievo copie: il frontend crea le letture una per volta, e ogni lettura chiama
+programma_email_prelievo(), che sposta in avanti il job "email_rit" dell'intervento
+(job_queue.posticipa). Un solo render + invio parte EMAIL_PRELIEVO_QUIETE secondi dopo
+l'ultima lettura, e comunque entro EMAIL_PRELIEVO_ATTESA_MAX secondi dalla prima.
+
+Le email vengono scritte nell'outbox (email_outbox) nella transazione del job: se il
+render fallisce non parte nessuna email e il job viene ritentato.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .. import models, settings_cache
+from . import email_outbox, email_service, job_queue, pdf_cache, pdf_finali_service
+from .backup_service import create_backup
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PRELIEVO_QUIETE = float(os.getenv("EMAIL_PRELIEVO_QUIETE", "5"))  # secondi senza nuove letture
+EMAIL_PRELIEVO_ATTESA_MAX = float(os.getenv("EMAIL_PRELIEVO_ATTESA_MAX", "120"))  # secondi dalla prima lettura
+
+
+def _smtp_configurato(db: Session) -> bool:
+    smtp_config = email_service.get_smtp_config(db)
+    return bool(smtp_config.get("username") and smtp_config.get("password"))
+
+
+def destinatari_rit(db: Session, intervento: models.Intervento, settings) -> List[str]:
+    """Email amministrazione del cliente, email della sede di intervento ed email azienda (senza duplicati)."""
+    destinatari = []
+    cliente = db.query(models.Cliente).filter(models.Cliente.id == intervento.cliente_id).first()
+    if cliente and cliente.email_amministrazione:
+        destinatari.append(cliente.email_amministrazione)
+    if intervento.sede_id:
+        sede = db.query(models.SedeCliente).filter(models.SedeCliente.id == intervento.sede_id).first()
+        if sede and sede.email:
+            destinatari.append(sede.email)
+    if settings.email:
+        destinatari.append(settings.email)
+    return list(dict.fromkeys(destinatari))
+
+
+def _pdf_rit(db: Session, intervento: models.Intervento, settings) -> bytes:
+    # RIT firmato: stesso file dei download (PDF finale archiviato)
+    path = pdf_finali_service.pdf_finale(db, "rit", intervento)
+    if path is not None:
+        return path.read_bytes()
+    pdf_finali_service.prepara_intervento(db, intervento)
+    return pdf_cache.pdf_intervento(intervento, settings)
+
+
+@job_queue.handler("email_rit", concorrenza=2, max_tentativi=3, timeout=600)
+def email_rit(db: Session, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """PDF del RIT via email. Un prelievo copie viene inviato solo quando ha letture."""
+    intervento_id = payload["intervento_id"]
+    intervento = db.query(models.Intervento).filter(
+        models.Intervento.id == intervento_id,
+        models.Intervento.deleted_at.is_(None)
+    ).first()
+    if intervento is None:
+        return {"accodate": 0, "motivo": "Intervento non trovato"}
+    if intervento.is_prelievo_copie and not intervento.letture_copie:
+        return {"accodate": 0, "motivo": "Prelievo copie senza letture copie"}
+    if not _smtp_configurato(db):
+        logger.info(f"[EMAIL MOCK - SMTP non configurato] RIT {intervento.numero_relazione}")
+        return {"accodate": 0, "motivo": "SMTP non configurato"}
+
+    settings = settings_cache.get_settings(db)
+    destinatari = destinatari_rit(db, intervento, settings)
+    if not destinatari:
+        return {"accodate": 0, "motivo": "Nessun destinatario email configurato"}
+
+    pdf = _pdf_rit(db, intervento, settings)
+    oggetto, corpo_html, corpo_testo = email_service.generate_rit_email(
+        intervento.data_creazione,
+        settings.nome_azienda,
+        settings.indirizzo_completo or "",
+        settings.telefono or "",
+        settings.email or "",
+    )
+    for destinatario in destinatari:
+        email_outbox.accoda(
+            db,
+            destinatario=destinatario,
+            oggetto=oggetto,
+            corpo_html=corpo_html,
+            corpo_testo=corpo_testo,
+            mittente_nome=f"GIT - {settings.nome_azienda or 'GIT'} - Gestione RIT",
+            allegati=[(f"{intervento.numero_relazione}.pdf", pdf, "application/pdf")],
+        )
+    logger.info(f"[JOBS] RIT {intervento.numero_relazione}: email accodate per {', '.join(destinatari)}")
+    return {"accodate": len(destinatari), "numero_relazione": intervento.numero_relazione}
+
+
+def programma_email_prelievo(db: Session, intervento_id: int, utente_id: Optional[int] = None) -> int:
+    """Sposta in avanti (o accoda) il job email_rit del prelievo copie. Nella transazione di `db`."""
+    return job_queue.posticipa(
+        db, "email_rit",
+        chiave=f"intervento:{intervento_id}",
+        quiete=EMAIL_PRELIEVO_QUIETE,
+        attesa_massima=EMAIL_PRELIEVO_ATTESA_MAX,
+        payload={"intervento_id": intervento_id},
+        utente_id=utente_id,
+    )
+
+
+@job_queue.handler("email_ddt", concorrenza=2, max_tentativi=3, timeout=600)
+def email_ddt(db: Session, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """PDF del DDT via email ai destinatari calcolati dall'endpoint di invio."""
+    ddt = db.query(models.RitiroProdotto).filter(
+        models.RitiroProdotto.id == payload["ddt_id"],
+        models.RitiroProdotto.deleted_at.is_(None)
+    ).first()
+    if ddt is None:
+        return {"accodate": 0, "motivo": "DDT non trovato"}
+    if not _smtp_configurato(db):
+        logger.info(f"[EMAIL MOCK - SMTP non configurato] DDT {ddt.numero_ddt}")
+        return {"accodate": 0, "motivo": "SMTP non configurato"}
+
+    settings = settings_cache.get_settings(db)
+    # DDT firmato: stesso file dei download (PDF finale archiviato)
+    pdf_path = pdf_finali_service.pdf_finale(db, "ddt", ddt)
+    pdf = pdf_path.read_bytes() if pdf_path is not None else pdf_cache.pdf_ddt(ddt, settings)
+
+    data_ddt = (ddt.data_ritiro or datetime.now()).strftime('%d/%m/%Y')
+    oggetto, corpo_html = email_service.generate_ddt_email(ddt.numero_ddt, data_ddt, settings.nome_azienda)
+    destinatari = payload["destinatari"]
+    for destinatario in destinatari:
+        email_outbox.accoda(
+            db,
+            destinatario=destinatario,
+            oggetto=oggetto,
+            corpo_html=corpo_html,
+            mittente_nome=f"GIT - {settings.nome_azienda or 'GIT'} - DDT",
+            allegati=[(f"{ddt.numero_ddt}.pdf", pdf, "application/pdf")],
+        )
+    logger.info(f"[JOBS] DDT {ddt.numero_ddt}: email accodate per {', '.join(destinatari)}")
+    return {"accodate": len(destinatari), "numero_ddt": ddt.numero_ddt}
+
+
+@job_queue.handler("backup", concorrenza=1, max_tentativi=1, timeout=6 * 3600)
+def backup(db: Session, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Backup completo avviato dall'amministrazione (l'avanzamento resta in /api/backups/status)."""
+    result = create_backup(background=False, db=db, target_ids=payload.get("target_ids"))
+    return {"backup_id": result.get("backup_id")}
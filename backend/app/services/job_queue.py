@@ -0,0 +1,502 @@
+"""
+Coda dei job in background (tabella jobs).
+
+I lavori lenti (render PDF + email del RIT, email DDT, backup) non girano più nella
+richiesta o in BackgroundTasks, che occupano il threadpool delle API e in alcuni casi
+riusavano la sessione db della richiesta già chiusa:
+- accoda() scrive il job nella transazione del chiamante: il job esiste solo se la
+  transazione che lo genera va a buon fine; con `chiave` resta un solo job in coda per
+  (tipo, chiave) e le richieste successive restituiscono quello già accodato
+- posticipa() è la variante con debounce: ogni chiamata sposta in avanti l'esecuzione
+  del job in coda per (tipo, chiave), che parte una sola volta dopo il periodo di quiete
+- ogni tipo di job ha un handler registrato con @handler(tipo, concorrenza,
+  max_tentativi, timeout) (vedi job_handlers.py); l'handler riceve una sessione propria
+  e il payload JSON, e i suoi effetti vengono confermati insieme alla chiusura del job
+- il worker (python -m app.worker, oppure un thread nel processo API con
+  JOBS_WORKER_EMBEDDED=1) prende i job pronti con FOR UPDATE SKIP LOCKED; la presa di
+  un tipo avviene sotto un lock advisory, così `concorrenza` vale per tutti i processi
+- errori: nuovo tentativo dopo JOBS_BACKOFF_BASE * 2^(tentativi-1) secondi (al massimo
+  JOBS_BACKOFF_MAX) fino a max_tentativi, poi stato "fallito"
+- un job "in_esecuzione" oltre il timeout del suo tipo (worker terminato) torna in coda
+  e il tentativo viene conteggiato
+- stato dei job consultabile da GET /api/jobs/{id} (routers/jobs.py)
+
+Esecuzione "almeno una volta": un worker terminato a metà job lo fa rieseguire.
+"""
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, event, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+JOBS_INTERVALLO = float(os.getenv("JOBS_INTERVALLO", "1"))  # secondi tra due controlli della coda
+JOBS_BACKOFF_BASE = int(os.getenv("JOBS_BACKOFF_BASE", "15"))  # secondi
+JOBS_BACKOFF_MAX = int(os.getenv("JOBS_BACKOFF_MAX", "1800"))  # secondi
+JOBS_RECUPERO_INTERVALLO = int(os.getenv("JOBS_RECUPERO_INTERVALLO", "60"))  # secondi tra due ricerche di job abbandonati
+JOBS_RETENZIONE_GIORNI = int(os.getenv("JOBS_RETENZIONE_GIORNI", "14"))
+# Worker nel processo API; con un servizio `python -m app.worker` dedicato impostare 0
+JOBS_WORKER_EMBEDDED = os.getenv("JOBS_WORKER_EMBEDDED", "1") == "1"
+
+# Classe dei lock advisory di presa: pg_advisory_xact_lock(classe, hashtext(tipo))
+ADVISORY_LOCK_CLASSE = 54_000_002
+
+_handler: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+_stats = {
+    "posticipati": 0,
+    "presi": 0,
+    "completati": 0,
+    "ritentati": 0,
+    "falliti": 0,
+    "recuperati": 0,
+    "esecuzione_secondi_totale": 0.0,
+    "esecuzione_secondi_max": 0.0,
+    "attesa_secondi_totale": 0.0,
+    "attesa_secondi_max": 0.0,
+}
+# Job in esecuzione nel processo corrente, per tipo (slot locali del worker)
+_in_esecuzione: Dict[str, int] = {}
+# Risveglia il ciclo del worker: job accodati da questo processo o slot liberati
+_sveglia = threading.Event()
+_worker = {"thread": None, "stop": None}
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# -------------------- REGISTRO HANDLER --------------------
+def handler(tipo: str, concorrenza: int = 1, max_tentativi: int = 3, timeout: int = 600):
+    """
+    Registra `funzione(db, payload) -> dict | None` come handler dei job `tipo`.
+
+    concorrenza: job del tipo in esecuzione contemporaneamente, in tutti i processi
+    timeout: secondi dopo cui un job in esecuzione è considerato abbandonato
+    Il dict restituito viene salvato in jobs.risultato (deve essere serializzabile JSON).
+    """
+    def registra(funzione: Callable[[Session, Dict[str, Any]], Optional[Dict[str, Any]]]):
+        _handler[tipo] = {
+            "funzione": funzione,
+            "concorrenza": concorrenza,
+            "max_tentativi": max_tentativi,
+            "timeout": timeout,
+        }
+        return funzione
+    return registra
+
+
+def handler_registrati() -> Dict[str, Dict[str, Any]]:
+    """Tipi di job registrati con concorrenza, tentativi e timeout."""
+    return {
+        tipo: {key: config[key] for key in ("concorrenza", "max_tentativi", "timeout")}
+        for tipo, config in sorted(_handler.items())
+    }
+# ------------------ /REGISTRO HANDLER ---------------------
+
+
+# -------------------- ACCODAMENTO --------------------
+def accoda(
+    db: Session,
+    tipo: str,
+    payload: Optional[Dict[str, Any]] = None,
+    ritardo: float = 0,
+    chiave: Optional[str] = None,
+    utente_id: Optional[int] = None,
+) -> int:
+    """
+    Aggiunge un job nella transazione di `db` (il chiamante fa commit) e ne restituisce
+    l'id. `ritardo` in secondi. Con `chiave`, se un job dello stesso tipo e chiave è già
+    in coda non ne crea un altro e restituisce l'id di quello esistente.
+    """
+    config = _handler.get(tipo)
+    if config is None:
+        raise ValueError(f"Tipo di job sconosciuto: {tipo}")
+    adesso = datetime.now()
+    stmt = pg_insert(models.Job.__table__).values(
+        tipo=tipo,
+        payload=payload or {},
+        chiave=chiave,
+        stato="in_coda",
+        tentativi=0,
+        max_tentativi=config["max_tentativi"],
+        esegui_dopo=adesso + timedelta(seconds=ritardo),
+        creato_da_id=utente_id,
+        created_at=adesso,
+    )
+    if chiave is not None:
+        colonne = models.Job.__table__.c
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=["tipo", "chiave"],
+            index_where=and_(colonne.stato == "in_coda", colonne.chiave.isnot(None)),
+        )
+    job_id = db.execute(stmt.returning(models.Job.__table__.c.id)).scalar()
+    if job_id is None:
+        job_id = db.query(models.Job.id).filter(
+            models.Job.tipo == tipo,
+            models.Job.chiave == chiave,
+            models.Job.stato == "in_coda"
+        ).scalar()
+        if job_id is None:
+            # Il job esistente è stato preso dal worker tra l'INSERT e la SELECT
+            return accoda(db, tipo, payload, ritardo, chiave, utente_id)
+    db.info["jobs_accodati"] = True
+    return job_id
+
+
+def posticipa(
+    db: Session,
+    tipo: str,
+    chiave: str,
+    quiete: float,
+    attesa_massima: Optional[float] = None,
+    payload: Optional[Dict[str, Any]] = None,
+    utente_id: Optional[int] = None,
+) -> int:
+    """
+    Accodamento con debounce: il job (tipo, chiave) parte dopo `quiete` secondi senza
+    nuove chiamate. Se è già in coda non ne crea un altro ma ne sposta l'esecuzione a
+    `quiete` secondi da adesso (mai prima della scadenza già fissata). Con
+    `attesa_massima` la scadenza non supera created_at + attesa_massima, così una
+    sequenza continua di chiamate non rinvia il job all'infinito.
+
+    La scadenza è la riga in coda della tabella jobs: vale per tutti i processi API e
+    l'UPSERT sull'indice (tipo, chiave) serializza le chiamate concorrenti. Nella
+    transazione di `db` come accoda(); restituisce l'id del job.
+    """
+    config = _handler.get(tipo)
+    if config is None:
+        raise ValueError(f"Tipo di job sconosciuto: {tipo}")
+    tabella = models.Job.__table__
+    adesso = datetime.now()
+    # Anche il primo accodamento rispetta l'attesa massima (quiete > attesa_massima)
+    ritardo = quiete if attesa_massima is None else min(quiete, attesa_massima)
+    stmt = pg_insert(tabella).values(
+        tipo=tipo,
+        payload=payload or {},
+        chiave=chiave,
+        stato="in_coda",
+        tentativi=0,
+        max_tentativi=config["max_tentativi"],
+        esegui_dopo=adesso + timedelta(seconds=ritardo),
+        creato_da_id=utente_id,
+        created_at=adesso,
+    )
+    scadenza = stmt.excluded.esegui_dopo
+    if attesa_massima is not None:
+        scadenza = func.least(scadenza, tabella.c.created_at + timedelta(seconds=attesa_massima))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["tipo", "chiave"],
+        index_where=and_(tabella.c.stato == "in_coda", tabella.c.chiave.isnot(None)),
+        set_={"esegui_dopo": func.greatest(tabella.c.esegui_dopo, scadenza)},
+    )
+    job_id = db.execute(stmt.returning(tabella.c.id)).scalar()
+    with _lock:
+        _stats["posticipati"] += 1
+    db.info["jobs_accodati"] = True
+    return job_id
+# ------------------ /ACCODAMENTO ---------------------
+
+
+# -------------------- PRESA ED ESECUZIONE --------------------
+def _prendi(db: Session, tipo: str, slot_liberi: int) -> List[Dict[str, Any]]:
+    """Prende fino a `slot_liberi` job pronti del tipo, nel limite di concorrenza globale. Fa commit."""
+    config = _handler[tipo]
+    # Un solo processo alla volta conta e prende i job di questo tipo
+    db.execute(text("SELECT pg_advisory_xact_lock(:classe, hashtext(:tipo))"), {
+        "classe": ADVISORY_LOCK_CLASSE, "tipo": tipo
+    })
+    in_esecuzione = db.query(func.count(models.Job.id)).filter(
+        models.Job.tipo == tipo,
+        models.Job.stato == "in_esecuzione"
+    ).scalar() or 0
+    liberi = min(slot_liberi, config["concorrenza"] - in_esecuzione)
+    if liberi <= 0:
+        db.commit()
+        return []
+
+    adesso = datetime.now()
+    jobs = db.query(models.Job).filter(
+        models.Job.tipo == tipo,
+        models.Job.stato == "in_coda",
+        models.Job.esegui_dopo <= adesso
+    ).order_by(models.Job.esegui_dopo, models.Job.id).limit(liberi).with_for_update(skip_locked=True).all()
+    presi = []
+    for job in jobs:
+        job.stato = "in_esecuzione"
+        job.tentativi += 1
+        job.worker = _worker_id()
+        job.avviato_at = adesso
+        job.bloccato_fino = adesso + timedelta(seconds=config["timeout"])
+        presi.append({
+            "id": job.id,
+            "tipo": tipo,
+            "payload": dict(job.payload or {}),
+            "attesa": max((adesso - job.esegui_dopo).total_seconds(), 0.0),
+        })
+    db.commit()
+    return presi
+
+
+def _prendi_pronti(slot: Dict[str, int]) -> List[Dict[str, Any]]:
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    presi = []
+    try:
+        pronti = [
+            tipo for (tipo,) in db.query(models.Job.tipo).filter(
+                models.Job.stato == "in_coda",
+                models.Job.esegui_dopo <= datetime.now(),
+                models.Job.tipo.in_(slot)
+            ).distinct().all()
+        ]
+        db.rollback()
+        for tipo in pronti:
+            with _lock:
+                liberi = slot[tipo] - _in_esecuzione.get(tipo, 0)
+            if liberi <= 0:
+                continue
+            nuovi = _prendi(db, tipo, liberi)
+            with _lock:
+                _in_esecuzione[tipo] = _in_esecuzione.get(tipo, 0) + len(nuovi)
+                _stats["presi"] += len(nuovi)
+            presi.extend(nuovi)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return presi
+
+
+def _errore_permanente(errore: Exception) -> bool:
+    # Payload non valido: ritentare non cambia l'esito
+    return isinstance(errore, (KeyError, ValueError, TypeError))
+
+
+def _ripianifica(db: Session, job: models.Job, errore: str, permanente: bool = False) -> str:
+    """Riprogramma il job dopo un errore o lo chiude come fallito. Restituisce la chiave delle statistiche."""
+    job.ultimo_errore = errore[:2000]
+    job.bloccato_fino = None
+    gemello = None
+    if job.chiave is not None:
+        # Un job con la stessa chiave accodato nel frattempo farà lo stesso lavoro
+        gemello = db.query(models.Job.id).filter(
+            models.Job.tipo == job.tipo,
+            models.Job.chiave == job.chiave,
+            models.Job.stato == "in_coda"
+        ).scalar()
+    if permanente or gemello is not None or job.tentativi >= job.max_tentativi:
+        job.stato = "fallito"
+        job.completato_at = datetime.now()
+        if gemello is not None:
+            job.ultimo_errore = f"{job.ultimo_errore} (sostituito dal job {gemello})"[:2000]
+        logger.error(f"[JOBS] Job {job.id} ({job.tipo}) fallito dopo {job.tentativi} tentativi: {errore}")
+        return "falliti"
+    attesa = min(JOBS_BACKOFF_BASE * 2 ** (job.tentativi - 1), JOBS_BACKOFF_MAX)
+    job.stato = "in_coda"
+    job.esegui_dopo = datetime.now() + timedelta(seconds=attesa)
+    logger.warning(f"[JOBS] Job {job.id} ({job.tipo}): nuovo tentativo tra {attesa}s ({errore})")
+    return "ritentati"
+
+
+def esegui(job: Dict[str, Any]) -> Optional[str]:
+    """
+    Esegue un job già preso (dict restituito dalla presa) con una sessione propria e ne
+    registra l'esito. Restituisce "completati", "ritentati" o "falliti".
+    """
+    from ..database import SessionLocal
+
+    config = _handler[job["tipo"]]
+    db = SessionLocal()
+    inizio = time.perf_counter()
+    esito = None
+    try:
+        risultato = config["funzione"](db, job["payload"])
+        # Effetti dell'handler e chiusura del job nella stessa transazione
+        db.query(models.Job).filter(
+            models.Job.id == job["id"],
+            models.Job.stato == "in_esecuzione"
+        ).update({
+            "stato": "completato",
+            "completato_at": datetime.now(),
+            "bloccato_fino": None,
+            "risultato": risultato,
+            "ultimo_errore": None,
+        }, synchronize_session=False)
+        db.commit()
+        esito = "completati"
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"[JOBS] Errore nel job {job['id']} ({job['tipo']}): {e}", exc_info=True)
+        try:
+            riga = db.query(models.Job).filter(models.Job.id == job["id"]).with_for_update().first()
+            if riga is not None and riga.stato == "in_esecuzione":
+                esito = _ripianifica(db, riga, f"{type(e).__name__}: {e}", permanente=_errore_permanente(e))
+            db.commit()
+        except Exception as e2:
+            # Il job resta in esecuzione e viene recuperato allo scadere del timeout
+            db.rollback()
+            logger.error(f"[JOBS] Esito del job {job['id']} non registrato: {e2}", exc_info=True)
+    finally:
+        db.close()
+        secondi = time.perf_counter() - inizio
+        with _lock:
+            _in_esecuzione[job["tipo"]] = max(_in_esecuzione.get(job["tipo"], 0) - 1, 0)
+            if esito:
+                _stats[esito] += 1
+            _stats["esecuzione_secondi_totale"] += secondi
+            _stats["esecuzione_secondi_max"] = max(_stats["esecuzione_secondi_max"], secondi)
+            _stats["attesa_secondi_totale"] += job["attesa"]
+            _stats["attesa_secondi_max"] = max(_stats["attesa_secondi_max"], job["attesa"])
+        # Slot libero: il ciclo del worker può prendere il prossimo job senza attendere
+        _sveglia.set()
+    return esito
+
+
+def recupera_abbandonati(db: Session) -> int:
+    """Rimette in coda (o chiude come falliti) i job in esecuzione oltre il timeout del tipo. Fa commit."""
+    righe = db.query(models.Job).filter(
+        models.Job.stato == "in_esecuzione",
+        models.Job.bloccato_fino < datetime.now()
+    ).with_for_update(skip_locked=True).all()
+    for riga in righe:
+        chiave = _ripianifica(db, riga, f"Job abbandonato dal worker {riga.worker} (timeout)")
+        with _lock:
+            _stats["recuperati"] += 1
+            _stats[chiave] += 1
+    db.commit()
+    return len(righe)
+# ------------------ /PRESA ED ESECUZIONE ---------------------
+
+
+# -------------------- WORKER --------------------
+def esegui_worker(stop: threading.Event, tipi: Optional[Iterable[str]] = None, intervallo: float = JOBS_INTERVALLO) -> None:
+    """
+    Ciclo del worker: prende ed esegue i job pronti dei `tipi` indicati (tutti gli handler
+    registrati se None) finché `stop` non viene impostato. Ogni tipo ha al massimo
+    `concorrenza` thread in questo processo; all'uscita attende i job in corso.
+    """
+    from ..database import SessionLocal
+
+    tipi = set(tipi or _handler)
+    sconosciuti = tipi - set(_handler)
+    if sconosciuti:
+        raise ValueError(f"Tipi di job sconosciuti: {', '.join(sorted(sconosciuti))}")
+    slot = {tipo: _handler[tipo]["concorrenza"] for tipo in tipi}
+    executor = ThreadPoolExecutor(max_workers=max(sum(slot.values()), 1), thread_name_prefix="job")
+    ultimo_recupero = 0.0
+    logger.info(f"[JOBS] Worker {_worker_id()} avviato: {', '.join(f'{t} x{n}' for t, n in sorted(slot.items()))}")
+    try:
+        while not stop.is_set():
+            _sveglia.clear()
+            try:
+                if time.monotonic() - ultimo_recupero >= JOBS_RECUPERO_INTERVALLO:
+                    ultimo_recupero = time.monotonic()
+                    db = SessionLocal()
+                    try:
+                        recuperati = recupera_abbandonati(db)
+                    finally:
+                        db.close()
+                    if recuperati:
+                        logger.warning(f"[JOBS] Recuperati {recuperati} job abbandonati")
+                for job in _prendi_pronti(slot):
+                    executor.submit(esegui, job)
+            except Exception as e:
+                logger.error(f"[JOBS] Errore nel ciclo del worker: {e}", exc_info=True)
+            _sveglia.wait(intervallo)
+    finally:
+        executor.shutdown(wait=True)
+        logger.info(f"[JOBS] Worker {_worker_id()} arrestato")
+
+
+def avvia_in_background() -> None:
+    """Worker nel processo API (JOBS_WORKER_EMBEDDED=1): thread dedicato, fuori dal threadpool delle richieste."""
+    with _lock:
+        if _worker["thread"] is not None:
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=esegui_worker, args=(stop,), name="job-worker", daemon=True)
+        _worker.update(thread=thread, stop=stop)
+    thread.start()
+    atexit.register(stop.set)
+# ------------------ /WORKER ---------------------
+
+
+# -------------------- MANUTENZIONE E METRICHE --------------------
+def pulizia(db: Session) -> int:
+    """Elimina i job chiusi più vecchi della retenzione."""
+    limite = datetime.now() - timedelta(days=JOBS_RETENZIONE_GIORNI)
+    return db.query(models.Job).filter(
+        models.Job.stato.in_(("completato", "fallito")),
+        models.Job.created_at < limite
+    ).delete(synchronize_session=False)
+
+
+def pulizia_job() -> None:
+    """Job dello scheduler: pulizia della coda job."""
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        eliminati = pulizia(db)
+        db.commit()
+        logger.info(f"[JOBS] Pulizia: eliminati {eliminati} job")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[JOBS] Pulizia fallita: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def jobs_stats(db: Session) -> Dict[str, Any]:
+    """Job per tipo e stato (dal database) e job eseguiti/tempi del processo corrente."""
+    per_tipo: Dict[str, Dict[str, int]] = {}
+    for tipo, stato, totale in db.query(
+        models.Job.tipo, models.Job.stato, func.count(models.Job.id)
+    ).group_by(models.Job.tipo, models.Job.stato).all():
+        per_tipo.setdefault(tipo, {})[stato] = totale
+    piu_vecchio = db.query(func.min(models.Job.esegui_dopo)).filter(
+        models.Job.stato == "in_coda",
+        models.Job.esegui_dopo <= datetime.now()
+    ).scalar()
+    with _lock:
+        stats = dict(_stats)
+        stats["in_esecuzione_processo"] = dict(_in_esecuzione)
+    completati = stats["completati"] + stats["ritentati"] + stats["falliti"]
+    presi = stats["presi"]
+    stats["esecuzione_secondi_media"] = round(stats["esecuzione_secondi_totale"] / completati, 3) if completati else None
+    stats["attesa_secondi_media"] = round(stats["attesa_secondi_totale"] / presi, 3) if presi else None
+    for key in ("esecuzione_secondi_totale", "esecuzione_secondi_max", "attesa_secondi_totale", "attesa_secondi_max"):
+        stats[key] = round(stats[key], 3)
+    stats["per_tipo"] = per_tipo
+    stats["ritardo_piu_vecchio_secondi"] = round((datetime.now() - piu_vecchio).total_seconds(), 1) if piu_vecchio else None
+    stats["handler"] = handler_registrati()
+    stats["worker_embedded"] = _worker["thread"] is not None
+    return stats
+# ------------------ /MANUTENZIONE E METRICHE ---------------------
+
+
+# -------------------- RISVEGLIO DOPO COMMIT --------------------
+@event.listens_for(Session, "after_commit")
+def _sveglia_after_commit(session):
+    if session.info.pop("jobs_accodati", False):
+        _sveglia.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("jobs_accodati", None)
+# ------------------ /RISVEGLIO DOPO COMMIT ---------------------
@@ -0,0 +1,331 @@
+"""
+Cache su disco dei PDF di RIT e DDT.
+
+Un render WeasyPrint costa 1-3 secondi: download ripetuti e reinvii email dello stesso
+documento riusano il file già generato. La chiave è l'impronta (sha256) di tutto ciò che
+entra nel PDF:
+- colonne dell'intervento / DDT e delle righe figlie (dettagli, ricambi, letture copie
+  con i dati asset)
+- impostazioni azienda (dati intestazione, logo, configurazioni template)
+- versione dei template (contenuto dei file in app/templates e CSS di pdf_service)
+
+Un documento modificato ha quindi un'impronta nuova e non può mai essere servito
+vecchio. I file di un'entità vengono comunque eliminati dopo il commit che la modifica
+(hook after_commit) e alla scrittura di una versione più recente; la dimensione totale
+è limitata a PDF_CACHE_MAX_MB eliminando i file usati meno di recente (LRU su mtime,
+aggiornato a ogni hit).
+
+Più worker condividono la stessa directory: le scritture sono atomiche (os.replace).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .. import models
+from . import pdf_render_pool, pdf_service
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", "cache/pdf"))
+PDF_CACHE_MAX_MB = int(os.getenv("PDF_CACHE_MAX_MB", "500"))
+PDF_CACHE_ENABLED = os.getenv("PDF_CACHE_ENABLED", "1") == "1"
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "errors": 0}
+
+
+# -------------------- IMPRONTA DEL CONTENUTO --------------------
+# Colonne che non compaiono nel PDF e cambiano quando il documento viene finalizzato
+COLONNE_NON_STAMPATE = {
+    "updated_at",
+    "pdf_finale_path",
+    "pdf_finale_hash",
+    "pdf_finale_impronta",
+    "pdf_finale_revisione",
+    "pdf_finalizzato_at",
+}
+
+
+def _colonne(obj) -> Dict[str, Any]:
+    return {
+        attr.key: getattr(obj, attr.key)
+        for attr in inspect(type(obj)).column_attrs
+        if attr.key not in COLONNE_NON_STAMPATE
+    }
+
+
+def modifica_contenuto(obj) -> bool:
+    """True se il flush in corso cambia almeno una colonna stampata di `obj`."""
+    state = inspect(obj)
+    return any(
+        state.attrs[attr.key].history.has_changes()
+        for attr in state.mapper.column_attrs
+        if attr.key not in COLONNE_NON_STAMPATE
+    )
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, "value"):  # Enum
+        return value.value
+    return str(value)
+
+
+@lru_cache(maxsize=1)
+def _versione_template_da(firma_file: tuple) -> str:
+    digest = hashlib.sha256(pdf_service.CSS_STYLE.encode("utf-8"))
+    for name, _mtime, _size in firma_file:
+        digest.update(name.encode("utf-8"))
+        digest.update((TEMPLATES_DIR / name).read_bytes())
+    return digest.hexdigest()
+
+
+def versione_template() -> str:
+    """Hash dei template PDF: ricalcolato solo se un file cambia (mtime/dimensione)."""
+    firma_file = tuple(
+        (path.name, path.stat().st_mtime_ns, path.stat().st_size)
+        for path in sorted(TEMPLATES_DIR.glob("*.html"))
+    )
+    return _versione_template_da(firma_file)
+
+
+def _impronta(tipo: str, contenuto: Dict[str, Any], azienda) -> str:
+    if hasattr(azienda, "model_dump"):
+        azienda = azienda.model_dump()
+    elif azienda is not None and not isinstance(azienda, dict):
+        azienda = _colonne(azienda)
+    payload = json.dumps(
+        {"tipo": tipo, "contenuto": contenuto, "azienda": azienda, "template": versione_template()},
+        sort_keys=True,
+        default=_json_default,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _contenuto_intervento(intervento: models.Intervento, con_asset: bool = True) -> Dict[str, Any]:
+    contenuto = {
+        "intervento": _colonne(intervento),
+        # Le property firma_* risolvono l'hash nella tabella firme: basta la colonna hash
+        "dettagli": sorted((_colonne(d) for d in intervento.dettagli), key=lambda d: d["id"] or 0),
+        "ricambi": sorted((_colonne(r) for r in intervento.ricambi_utilizzati), key=lambda r: r["id"] or 0),
+        "letture": [],
+    }
+    if intervento.is_prelievo_copie:
+        for lettura in intervento.letture_copie or []:
+            valori = _colonne(lettura)
+            if con_asset:
+                # Attributi asset aggiunti dal chiamante prima del render
+                for attr in ("asset_marca", "asset_modello", "asset_marca_modello"):
+                    valori[attr] = getattr(lettura, attr, None)
+            contenuto["letture"].append(valori)
+    return contenuto
+
+
+def _contenuto_ddt(ddt: models.RitiroProdotto) -> Dict[str, Any]:
+    # Prodotti, ricambi e foto sono colonne JSONB della riga
+    return {"ddt": _colonne(ddt)}
+
+
+def impronta_contenuto(tipo: str, documento) -> str:
+    """
+    Impronta del solo documento ("rit" o "ddt"): righe e firme, senza impostazioni
+    azienda, template e anagrafica asset. Cambia solo se il documento viene modificato.
+    """
+    if tipo == "rit":
+        contenuto = _contenuto_intervento(documento, con_asset=False)
+    else:
+        contenuto = _contenuto_ddt(documento)
+    payload = json.dumps({"tipo": tipo, "contenuto": contenuto}, sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+# ------------------ /IMPRONTA DEL CONTENUTO ---------------------
+
+
+# -------------------- ARCHIVIO SU DISCO --------------------
+def _prefisso(tipo: str, entity_id) -> str:
+    return f"{tipo}_{entity_id}_"
+
+
+def _leggi(path: Path) -> Optional[bytes]:
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)  # mtime = ultimo uso (ordine LRU)
+    except OSError:
+        pass
+    return data
+
+
+def _scrivi(path: Path, data: bytes) -> None:
+    PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _elimina(pattern: str, tranne: Optional[Path] = None) -> int:
+    eliminati = 0
+    for path in PDF_CACHE_DIR.glob(pattern):
+        if path == tranne:
+            continue
+        try:
+            path.unlink()
+            eliminati += 1
+        except FileNotFoundError:
+            pass
+    return eliminati
+
+
+def _rispetta_limite() -> None:
+    limite = PDF_CACHE_MAX_MB * 1024 * 1024
+    files = []
+    totale = 0
+    for path in PDF_CACHE_DIR.glob("*.pdf"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        totale += stat.st_size
+    if totale <= limite:
+        return
+    files.sort()
+    for _mtime, size, path in files:
+        if totale <= limite:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        totale -= size
+        with _lock:
+            _stats["evictions"] += 1
+
+
+def _get_or_render(tipo: str, entity_id, impronta: str, render: Callable[[], bytes]) -> bytes:
+    path = PDF_CACHE_DIR / f"{_prefisso(tipo, entity_id)}{impronta}.pdf"
+    data = _leggi(path)
+    if data is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return data
+
+    with _lock:
+        _stats["misses"] += 1
+    data = render()
+    # Il fallback FPDF è un documento di emergenza: non va riusato
+    if not pdf_service.HAS_WEASYPRINT:
+        return data
+    try:
+        _scrivi(path, data)
+        _elimina(f"{_prefisso(tipo, entity_id)}*.pdf", tranne=path)  # versioni superate
+        _rispetta_limite()
+    except OSError as e:
+        with _lock:
+            _stats["errors"] += 1
+        logger.warning(f"[PDF CACHE] Scrittura {path.name} fallita: {e}")
+    return data
+# ------------------ /ARCHIVIO SU DISCO ---------------------
+
+
+def pdf_intervento(intervento: models.Intervento, azienda_settings) -> bytes:
+    """PDF del RIT servito dalla cache se invariato, altrimenti renderizzato nel pool."""
+    if not PDF_CACHE_ENABLED:
+        return pdf_render_pool.render_intervento(intervento, azienda_settings)
+    impronta = _impronta("rit", _contenuto_intervento(intervento), azienda_settings)
+    return _get_or_render(
+        "rit", intervento.id, impronta,
+        lambda: pdf_render_pool.render_intervento(intervento, azienda_settings),
+    )
+
+
+def pdf_ddt(ddt: models.RitiroProdotto, azienda_settings) -> bytes:
+    """PDF del DDT servito dalla cache se invariato, altrimenti renderizzato nel pool."""
+    if not PDF_CACHE_ENABLED:
+        return pdf_render_pool.render_ddt(ddt, azienda_settings)
+    impronta = _impronta("ddt", _contenuto_ddt(ddt), azienda_settings)
+    return _get_or_render(
+        "ddt", ddt.id, impronta,
+        lambda: pdf_render_pool.render_ddt(ddt, azienda_settings),
+    )
+
+
+def invalida(tipo: str, entity_id) -> None:
+    """Elimina i PDF in cache di un'entità ("rit" o "ddt")."""
+    eliminati = _elimina(f"{_prefisso(tipo, entity_id)}*.pdf")
+    if eliminati:
+        with _lock:
+            _stats["invalidations"] += eliminati
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / total, 3) if total else None
+    files = 0
+    size = 0
+    for path in PDF_CACHE_DIR.glob("*.pdf"):
+        try:
+            size += path.stat().st_size
+        except FileNotFoundError:
+            continue
+        files += 1
+    stats["files"] = files
+    stats["size_mb"] = round(size / (1024 * 1024), 2)
+    stats["max_mb"] = PDF_CACHE_MAX_MB
+    return stats
+
+
+# -------------------- INVALIDAZIONE DOPO COMMIT --------------------
+# Modello (o figlio) -> (tipo documento, attributo con l'id dell'entità)
+_DOCUMENTI = {
+    models.Intervento: ("rit", "id"),
+    models.DettaglioIntervento: ("rit", "intervento_id"),
+    models.MovimentoRicambio: ("rit", "intervento_id"),
+    models.LetturaCopie: ("rit", "intervento_id"),
+    models.RitiroProdotto: ("ddt", "id"),
+}
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_documenti_modificati(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        spec = _DOCUMENTI.get(type(obj))
+        if spec is None:
+            continue
+        if obj in session.dirty and not modifica_contenuto(obj):
+            continue  # es. solo i campi pdf_finale_* scritti dalla finalizzazione
+        tipo, attr = spec
+        entity_id = getattr(obj, attr, None)
+        if entity_id is not None:
+            session.info.setdefault("pdf_modificati", set()).add((tipo, entity_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for tipo, entity_id in session.info.pop("pdf_modificati", ()):
+        try:
+            invalida(tipo, entity_id)
+        except OSError as e:
+            logger.warning(f"[PDF CACHE] Invalidazione {tipo} {entity_id} fallita: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("pdf_modificati", None)
+# ------------------ /INVALIDAZIONE DOPO COMMIT ---------------------
@@ -0,0 +1,274 @@
+"""
+PDF finali di RIT e DDT firmati.
+
+Con firma tecnico e firma cliente il documento è di fatto immutabile: il PDF viene
+renderizzato una volta sola e archiviato in <DOCUMENTI_DIR>/pdf_finali/<tipo>/<id>/.
+- finalizzazione automatica dopo il commit che completa le firme (hook after_commit,
+  render in un thread di background attraverso pdf_cache / pdf_render_pool)
+- i download servono il file archiviato con ETag e Range (http_cache.file_response),
+  oppure con X-Accel-Redirect se davanti all'API c'è nginx (PDF_X_ACCEL_PREFIX)
+- una modifica a un documento finalizzato crea una nuova revisione
+  (r<revisione>_<sha256>.pdf) al commit o, al più tardi, al primo download: le
+  revisioni precedenti restano su disco, la riga punta all'ultima
+- la validità della revisione è decisa da pdf_cache.impronta_contenuto: impostazioni
+  azienda e template non generano revisioni, il documento firmato resta quello emesso
+
+I PDF firmati non stanno in uploads/ (montato pubblicamente su /uploads) ma in
+DOCUMENTI_DIR, raggiungibile solo dagli endpoint di download autenticati. Un file
+mancante (ad esempio dopo il ripristino di un backup) viene rigenerato come nuova
+revisione al primo download.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .. import models, settings_cache
+from ..config import DOCUMENTI_DIR
+from ..http_cache import file_response
+from . import pdf_cache, pdf_service
+
+logger = logging.getLogger(__name__)
+
+PDF_FINALI_DIR = DOCUMENTI_DIR / "pdf_finali"
+PDF_FINALIZE_ENABLED = os.getenv("PDF_FINALIZE_ENABLED", "1") == "1"
+# Location "internal" di nginx che punta a DOCUMENTI_DIR (es. /protected-documenti/); vuoto = file servito dall'API
+PDF_X_ACCEL_PREFIX = os.getenv("PDF_X_ACCEL_PREFIX", "")
+
+_MODELLI = {"rit": models.Intervento, "ddt": models.RitiroProdotto}
+# Modello (o riga figlia) -> (tipo documento, attributo con l'id del documento)
+_DOCUMENTI = {
+    models.Intervento: ("rit", "id"),
+    models.DettaglioIntervento: ("rit", "intervento_id"),
+    models.MovimentoRicambio: ("rit", "intervento_id"),
+    models.LetturaCopie: ("rit", "intervento_id"),
+    models.RitiroProdotto: ("ddt", "id"),
+}
+
+_lock = threading.Lock()
+_stats = {"finalizzati": 0, "revisioni": 0, "download": 0, "errori": 0}
+# Un solo thread: il render vero e proprio avviene comunque nel pool di processi PDF
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-finali")
+
+
+def _firma_presente(documento, campo: str) -> bool:
+    if getattr(documento, f"{campo}_hash"):
+        return True
+    # Colonna inline solo per i record non migrati; le query di lista la differiscono
+    # con raiseload, quindi va letta solo se già caricata
+    return bool(inspect(documento).dict.get(f"{campo}_inline"))
+
+
+def firme_complete(documento) -> bool:
+    """True se il RIT / DDT ha sia la firma del tecnico sia quella del cliente."""
+    return _firma_presente(documento, "firma_tecnico") and _firma_presente(documento, "firma_cliente")
+
+
+def prepara_intervento(db: Session, intervento: models.Intervento) -> None:
+    """Aggiunge alle letture copie i dati asset usati dal template prelievo copie."""
+    if not intervento.is_prelievo_copie:
+        return
+    letture = intervento.letture_copie
+    asset_ids = {lettura.asset_id for lettura in letture if lettura.asset_id}
+    if not asset_ids:
+        return
+    assets = {
+        asset.id: asset
+        for asset in db.query(models.AssetCliente).filter(models.AssetCliente.id.in_(asset_ids)).all()
+    }
+    for lettura in letture:
+        asset = assets.get(lettura.asset_id)
+        if asset:
+            # Attributi temporanei, non colonne
+            lettura.asset_marca = asset.marca or ''
+            lettura.asset_modello = asset.modello or ''
+            lettura.asset_marca_modello = f"{asset.marca or ''} {asset.modello or ''}".strip() or 'N/A'
+
+
+# -------------------- ARCHIVIO --------------------
+def _path_valido(documento, impronta: str) -> Optional[Path]:
+    if not documento.pdf_finale_path or documento.pdf_finale_impronta != impronta:
+        return None
+    path = DOCUMENTI_DIR / documento.pdf_finale_path
+    return path if path.is_file() else None
+
+
+def _scrivi(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _documento(db: Session, tipo: str, entity_id: int, lock: bool = False):
+    model = _MODELLI[tipo]
+    query = db.query(model).filter(
+        model.id == entity_id,
+        model.deleted_at.is_(None)
+    ).populate_existing()
+    if lock:
+        # Riga bloccata da un altro finalizzatore o da una modifica in corso: si rinuncia
+        query = query.with_for_update(of=model, skip_locked=True)
+    return query.first()
+
+
+def finalizza(tipo: str, entity_id: int) -> Optional[Path]:
+    """
+    Archivia il PDF finale del documento ("rit" o "ddt") se le firme sono complete e
+    la revisione corrente manca o non corrisponde più al contenuto. Restituisce il path
+    della revisione valida (None se il documento non è finalizzabile o è bloccato).
+
+    Usa una sessione propria: la transazione del chiamante non viene mai confermata
+    né annullata. Il render avviene senza lock; FOR UPDATE viene preso solo per
+    ricontrollare la revisione e scrivere path e numero di revisione.
+    """
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        documento = _documento(db, tipo, entity_id)
+        if documento is None or not firme_complete(documento) or not pdf_service.HAS_WEASYPRINT:
+            # Il fallback FPDF è un documento di emergenza: non va archiviato
+            return None
+        impronta = pdf_cache.impronta_contenuto(tipo, documento)
+        path = _path_valido(documento, impronta)
+        if path is not None:
+            return path
+
+        azienda = settings_cache.get_settings(db)
+        if tipo == "rit":
+            prepara_intervento(db, documento)
+            pdf = pdf_cache.pdf_intervento(documento, azienda)
+        else:
+            pdf = pdf_cache.pdf_ddt(documento, azienda)
+        db.rollback()
+
+        # FOR UPDATE: due worker non possono creare la stessa revisione
+        documento = _documento(db, tipo, entity_id, lock=True)
+        if documento is None or not firme_complete(documento):
+            return None
+        if pdf_cache.impronta_contenuto(tipo, documento) != impronta:
+            # Documento modificato durante il render: lo finalizza il commit della modifica
+            return None
+        path = _path_valido(documento, impronta)
+        if path is not None:
+            # Archiviato da un altro processo durante il render
+            return path
+
+        sha = hashlib.sha256(pdf).hexdigest()
+        revisione = (documento.pdf_finale_revisione or 0) + 1
+        path = PDF_FINALI_DIR / tipo / str(entity_id) / f"r{revisione}_{sha}.pdf"
+        _scrivi(path, pdf)
+        documento.pdf_finale_path = path.relative_to(DOCUMENTI_DIR).as_posix()
+        documento.pdf_finale_hash = sha
+        documento.pdf_finale_impronta = impronta
+        documento.pdf_finale_revisione = revisione
+        documento.pdf_finalizzato_at = datetime.now()
+        db.commit()
+    except Exception:
+        db.rollback()
+        with _lock:
+            _stats["errori"] += 1
+        raise
+    finally:
+        db.close()
+    with _lock:
+        _stats["finalizzati" if revisione == 1 else "revisioni"] += 1
+    logger.info(f"[PDF FINALI] {tipo} {entity_id} revisione {revisione} archiviata ({len(pdf)} byte)")
+    return path
+
+
+def pdf_finale(db: Session, tipo: str, documento) -> Optional[Path]:
+    """
+    Path del PDF finale aggiornato di un documento già caricato: la revisione archiviata
+    se il contenuto non è cambiato, altrimenti ne crea una nuova (finalizza(), con una
+    sessione propria: la transazione di `db` resta intatta). None se le firme non sono
+    complete o se la revisione non può essere creata ora (il chiamante genera il PDF).
+    """
+    if not PDF_FINALIZE_ENABLED or not firme_complete(documento):
+        return None
+    path = _path_valido(documento, pdf_cache.impronta_contenuto(tipo, documento))
+    if path is not None:
+        return path
+    return finalizza(tipo, documento.id)
+
+
+def risposta_download(request: Request, path: Path, filename: str) -> Response:
+    """Download del PDF finale: X-Accel-Redirect verso nginx oppure file con Range."""
+    with _lock:
+        _stats["download"] += 1
+    # r<revisione>_<sha256>.pdf: lo sha256 del contenuto è l'ETag forte
+    sha = path.stem.split("_", 1)[1]
+    etag = f'"{sha}"'
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}.pdf"; filename*=UTF-8\'\'{filename}.pdf'
+    }
+    if PDF_X_ACCEL_PREFIX:
+        relativo = path.relative_to(DOCUMENTI_DIR).as_posix()
+        return Response(
+            media_type="application/pdf",
+            headers={**headers, "ETag": etag, "X-Accel-Redirect": f"{PDF_X_ACCEL_PREFIX.rstrip('/')}/{relativo}"},
+        )
+    return file_response(request, path, "application/pdf", etag, headers=headers)
+
+
+def finalizza_in_background(tipo: str, entity_id: int) -> None:
+    """Finalizzazione dopo il commit (job del thread pdf-finali)."""
+    try:
+        finalizza(tipo, entity_id)
+    except Exception as e:
+        logger.error(f"[PDF FINALI] Finalizzazione {tipo} {entity_id} fallita: {e}", exc_info=True)
+
+
+def finali_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+    stats["enabled"] = PDF_FINALIZE_ENABLED
+    stats["x_accel"] = bool(PDF_X_ACCEL_PREFIX)
+    return stats
+# ------------------ /ARCHIVIO ---------------------
+
+
+# -------------------- FINALIZZAZIONE DOPO COMMIT --------------------
+@event.listens_for(Session, "after_flush")
+def _mark_documenti_firmati(session, flush_context):
+    for obj in list(session.new) + list(session.dirty):
+        spec = _DOCUMENTI.get(type(obj))
+        if spec is None:
+            continue
+        tipo, attr = spec
+        if isinstance(obj, tuple(_MODELLI.values())):
+            if obj.deleted_at is not None or not firme_complete(obj):
+                continue
+            # Le scritture di finalizza() (solo pdf_finale_*) non generano un'altra revisione
+            if obj in session.dirty and not pdf_cache.modifica_contenuto(obj):
+                continue
+        entity_id = getattr(obj, attr, None)
+        if entity_id is not None:
+            # Righe figlie: finalizza() verifica firme e impronta del documento padre
+            session.info.setdefault("pdf_da_finalizzare", set()).add((tipo, entity_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _finalizza_after_commit(session):
+    da_finalizzare = session.info.pop("pdf_da_finalizzare", ())
+    if not PDF_FINALIZE_ENABLED:
+        return
+    for tipo, entity_id in da_finalizzare:
+        _executor.submit(finalizza_in_background, tipo, entity_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("pdf_da_finalizzare", None)
+# ------------------ /FINALIZZAZIONE DOPO COMMIT ---------------------
@@ -0,0 +1,204 @@
+"""
+Pool di processi dedicato al rendering PDF (WeasyPrint).
+
+Il render non gira più nel thread della richiesta: una raffica di download PDF non
+occupa il threadpool delle API e la memoria che WeasyPrint non rilascia resta nei
+processi di rendering, riavviati ogni PDF_POOL_MAX_TASKS job.
+
+- PDF_POOL_SIZE processi per worker uvicorn (0 = render nel processo API), avviati
+  con "spawn" e inizializzati da pdf_service.warmup_worker (template, CSS compilato, font)
+- il logo azienda viene letto una volta per processo (pdf_service.get_logo_src)
+- i job ricevono uno snapshot del documento senza sessione: colonne, righe figlie e
+  firme già risolte nel processo API, quindi il worker non tocca mai il database
+- pool_stats() espone coda, job completati/falliti e tempi di render/attesa (/metrics)
+
+API: render_intervento(intervento, azienda) e render_ddt(ddt, azienda).
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from sqlalchemy import inspect
+
+from .. import models
+from . import pdf_service
+
+logger = logging.getLogger(__name__)
+
+PDF_POOL_SIZE = int(os.getenv("PDF_POOL_SIZE", "2"))
+PDF_POOL_MAX_TASKS = int(os.getenv("PDF_POOL_MAX_TASKS", "50"))  # riavvio worker (leak WeasyPrint)
+PDF_RENDER_TIMEOUT = int(os.getenv("PDF_RENDER_TIMEOUT", "120"))  # secondi
+
+_lock = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "pool_restarts": 0,
+    "render_seconds_total": 0.0,
+    "render_seconds_max": 0.0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+_in_coda = {"value": 0}
+
+
+# -------------------- SNAPSHOT DEI DOCUMENTI --------------------
+def _snapshot(obj, **extra) -> SimpleNamespace:
+    valori = {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+    valori.update(extra)
+    return SimpleNamespace(**valori)
+
+
+def snapshot_intervento(intervento: models.Intervento) -> SimpleNamespace:
+    """Copia dell'intervento con le righe usate dai template RIT / prelievo copie."""
+    letture = []
+    if intervento.is_prelievo_copie:
+        for lettura in intervento.letture_copie or []:
+            # Attributi asset aggiunti dal chiamante prima del render
+            letture.append(_snapshot(lettura, **{
+                attr: getattr(lettura, attr, "")
+                for attr in ("asset_marca", "asset_modello", "asset_marca_modello")
+            }))
+    return _snapshot(
+        intervento,
+        firma_tecnico=intervento.firma_tecnico,
+        firma_cliente=intervento.firma_cliente,
+        dettagli=[_snapshot(d) for d in intervento.dettagli],
+        ricambi_utilizzati=[_snapshot(r) for r in intervento.ricambi_utilizzati],
+        letture_copie=letture,
+    )
+
+
+def snapshot_ddt(ddt: models.RitiroProdotto) -> SimpleNamespace:
+    """Copia del DDT (prodotti, ricambi e foto sono colonne JSON della riga)."""
+    return _snapshot(ddt, firma_tecnico=ddt.firma_tecnico, firma_cliente=ddt.firma_cliente)
+
+
+def _azienda_dict(azienda) -> Dict[str, Any]:
+    if azienda is None:
+        return {}
+    if isinstance(azienda, dict):
+        return dict(azienda)
+    if hasattr(azienda, "model_dump"):
+        return azienda.model_dump()
+    return {column.name: getattr(azienda, column.name, None) for column in azienda.__table__.columns}
+# ------------------ /SNAPSHOT DEI DOCUMENTI ---------------------
+
+
+# -------------------- POOL --------------------
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=PDF_POOL_SIZE,
+                # max_tasks_per_child non è compatibile con fork
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=pdf_service.warmup_worker,
+                max_tasks_per_child=PDF_POOL_MAX_TASKS,
+            )
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+            _stats["pool_restarts"] += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def start() -> None:
+    """Avvia i processi di rendering all'avvio dell'app (senza attendere il primo PDF)."""
+    if PDF_POOL_SIZE <= 0:
+        return
+    executor = _get_executor()
+    atexit.register(shutdown)
+    # Un job banale per worker: i processi partono e si riscaldano subito
+    for _ in range(PDF_POOL_SIZE):
+        executor.submit(os.getpid)
+
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _render(tipo: str, documento, azienda) -> bytes:
+    if PDF_POOL_SIZE <= 0:
+        pdf, seconds, _pid = pdf_service.render_job(tipo, documento, _azienda_dict(azienda))
+        _registra(seconds, 0.0, ok=True)
+        return pdf
+
+    executor = _get_executor()
+    submitted_at = time.perf_counter()
+    with _lock:
+        _stats["submitted"] += 1
+        _in_coda["value"] += 1
+    try:
+        future = executor.submit(pdf_service.render_job, tipo, documento, _azienda_dict(azienda))
+        pdf, seconds, _pid = future.result(timeout=PDF_RENDER_TIMEOUT)
+    except BrokenProcessPool:
+        # Un worker è morto (OOM, crash nativo): il pool va ricreato per i job successivi
+        _reset_executor(executor)
+        _registra(0.0, time.perf_counter() - submitted_at, ok=False)
+        logger.error(f"[PDF POOL] Pool di rendering interrotto durante il render {tipo}")
+        raise
+    except Exception:
+        _registra(0.0, time.perf_counter() - submitted_at, ok=False)
+        raise
+    finally:
+        with _lock:
+            _in_coda["value"] -= 1
+    _registra(seconds, time.perf_counter() - submitted_at - seconds, ok=True)
+    return pdf
+
+
+def _registra(render_seconds: float, wait_seconds: float, ok: bool) -> None:
+    with _lock:
+        if not ok:
+            _stats["failed"] += 1
+            return
+        _stats["completed"] += 1
+        _stats["render_seconds_total"] += render_seconds
+        _stats["render_seconds_max"] = max(_stats["render_seconds_max"], render_seconds)
+        _stats["wait_seconds_total"] += wait_seconds
+        _stats["wait_seconds_max"] = max(_stats["wait_seconds_max"], wait_seconds)
+
+
+def render_intervento(intervento: models.Intervento, azienda_settings) -> bytes:
+    """PDF del RIT renderizzato nel pool (stesso risultato di pdf_service.genera_pdf_intervento)."""
+    return _render("rit", snapshot_intervento(intervento), azienda_settings)
+
+
+def render_ddt(ddt: models.RitiroProdotto, azienda_settings) -> bytes:
+    """PDF del DDT renderizzato nel pool (stesso risultato di pdf_service.genera_pdf_ddt)."""
+    return _render("ddt", snapshot_ddt(ddt), azienda_settings)
+
+
+def pool_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats["queue_depth"] = _in_coda["value"]
+    completed = stats["completed"]
+    stats["render_seconds_avg"] = round(stats["render_seconds_total"] / completed, 3) if completed else None
+    stats["wait_seconds_avg"] = round(stats["wait_seconds_total"] / completed, 3) if completed else None
+    for key in ("render_seconds_total", "render_seconds_max", "wait_seconds_total", "wait_seconds_max"):
+        stats[key] = round(stats[key], 3)
+    stats["pool_size"] = PDF_POOL_SIZE
+    stats["max_tasks_per_child"] = PDF_POOL_MAX_TASKS
+    return stats
+# ------------------ /POOL ---------------------
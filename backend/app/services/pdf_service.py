@@ -1,14 +1,13 @@
+import base64
 import io
 import html
+import mimetypes
+import os
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from jinja2 import Template, Environment, FileSystemLoader, select_autoescape
-try:
-    from PyPDF2 import PdfWriter, PdfReader
-    HAS_PYPDF2 = True
-except ImportError:
-    HAS_PYPDF2 = False
-    print("ATTENZIONE: PyPDF2 non installato. Merge PDF non disponibile.")
 
 # TENTATIVO DI IMPORTAZIONE WEASYPRINT (Priorità Alta)
 try:
@@ -149,10 +148,12 @@ def calcola_monte_ore(ora_inizio, ora_fine):
     
     return monte_ore
 
+@lru_cache(maxsize=1)
 def get_template_environment():
     """
     Crea l'ambiente Jinja2 con FileSystemLoader per caricare template da file.
     Abilita autoescape per prevenire XSS nei template PDF.
+    Unico per processo: Jinja conserva i template compilati e li ricarica solo se il file cambia.
     """
     template_dir = Path(__file__).parent.parent / "templates"
     return Environment(
@@ -175,6 +176,64 @@ def get_ddt_template():
     env = get_template_environment()
     return env.get_template("ddt_template.html")
 
+@lru_cache(maxsize=1)
+def _compiled_css():
+    return CSS(string=CSS_STYLE)
+
+def get_stylesheets():
+    """Foglio di stile dei PDF, interpretato una sola volta per processo."""
+    return [_compiled_css()]
+
+@lru_cache(maxsize=8)
+def _logo_data_uri(path: str, mtime_ns: int) -> str:
+    mime = mimetypes.guess_type(path)[0] or "image/png"
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+def get_logo_src(path) -> str:
+    """Logo azienda come data URI: il file viene riletto solo se cambia (mtime)."""
+    path = str(path)
+    return _logo_data_uri(path, os.stat(path).st_mtime_ns)
+
+def unisci_documenti(html_documenti) -> bytes:
+    """
+    PDF unico da più documenti HTML, in un solo passaggio di scrittura: i layout
+    WeasyPrint vengono concatenati pagina per pagina, senza PDF intermedi da rileggere
+    e unire (vedi benchmark_pdf_prelievo.py).
+    """
+    documenti = [HTML(string=html_doc).render(stylesheets=get_stylesheets()) for html_doc in html_documenti]
+    pagine = [pagina for documento in documenti for pagina in documento.pages]
+    return documenti[0].copy(pagine).write_pdf()
+
+# --- WORKER DI RENDERING (vedi pdf_render_pool) ---
+def warmup_worker():
+    """
+    Inizializzatore dei processi di rendering: carica template, CSS compilato e font
+    prima del primo job, così la prima richiesta non paga l'avvio di WeasyPrint.
+    """
+    get_rit_template()
+    get_prelievo_copie_template()
+    get_ddt_template()
+    if HAS_WEASYPRINT:
+        get_stylesheets()
+        # Un render minimo inizializza fontconfig e la cache dei font del processo
+        HTML(string="<p>warmup</p>").write_pdf(stylesheets=get_stylesheets())
+
+def render_job(tipo: str, documento, azienda: dict):
+    """
+    Job eseguito nel processo di rendering: `documento` è lo snapshot (senza sessione)
+    dell'intervento o del DDT. Restituisce (pdf, secondi di render, pid del worker).
+    """
+    start = time.perf_counter()
+    if tipo == "rit":
+        pdf = genera_pdf_intervento(documento, azienda)
+    elif tipo == "ddt":
+        pdf = genera_pdf_ddt(documento, azienda)
+    else:
+        raise ValueError(f"Tipo documento non valido: {tipo}")
+    return pdf, time.perf_counter() - start, os.getpid()
+# --- /WORKER DI RENDERING ---
+
 def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
     """
     Genera il PDF. Tenta di usare WeasyPrint (HTML).
@@ -287,10 +346,9 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                         break
                 
                 if logo_path:
-                    # Usa file:// per WeasyPrint
-                    abs_path = str(logo_path.absolute()).replace('\\', '/')
-                    safe_azienda['logo_url'] = f"file://{abs_path}"
-                    print(f"✅ Logo trovato: {safe_azienda['logo_url']}")
+                    # Logo incorporato come data URI (letto una sola volta per processo)
+                    safe_azienda['logo_url'] = get_logo_src(logo_path)
+                    print(f"✅ Logo trovato: {logo_path}")
                 else:
                     print(f"⚠️ ATTENZIONE: Logo non trovato. Path cercati: {[str(p) for p in possible_paths]}")
                     safe_azienda['logo_url'] = None
@@ -363,15 +421,15 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                     hide_firme=False
                 )
                 pdf_file = io.BytesIO()
-                HTML(string=html_prelievo).write_pdf(pdf_file, stylesheets=[CSS(string=CSS_STYLE)])
+                HTML(string=html_prelievo).write_pdf(pdf_file, stylesheets=get_stylesheets())
                 pdf_file.seek(0)
                 return pdf_file.read()
             
-            # Se c'è anche manutenzione, genera entrambi i PDF e uniscili
+            # Se c'è anche manutenzione, un unico PDF: prelievo copie seguito dal RIT completo
             elif intervento.is_prelievo_copie and has_manutenzione:
                 print(f"Generazione PDF combinato (prelievo copie + manutenzione): {intervento.numero_relazione}")
                 
-                # 1. Genera PDF prelievo copie (senza firme)
+                # 1. HTML prelievo copie (senza firme)
                 template_prelievo = get_prelievo_copie_template()
                 html_prelievo = template_prelievo.render(
                     rit=intervento,
@@ -380,11 +438,8 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                     letture_copie_dettagli=letture_copie_dettagli,
                     hide_firme=True  # Nascondi firme nel PDF prelievo
                 )
-                pdf_prelievo_file = io.BytesIO()
-                HTML(string=html_prelievo).write_pdf(pdf_prelievo_file, stylesheets=[CSS(string=CSS_STYLE)])
-                pdf_prelievo_file.seek(0)
                 
-                # 2. Genera PDF RIT completo (con firme)
+                # 2. HTML RIT completo (con firme)
                 template_rit = get_rit_template()
                 html_rit = template_rit.render(
                     rit=intervento, 
@@ -402,32 +457,9 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                     is_contratto_o_prelievo=is_contratto_o_prelievo,
                     letture_copie_dettagli=letture_copie_dettagli
                 )
-                pdf_rit_file = io.BytesIO()
-                HTML(string=html_rit).write_pdf(pdf_rit_file, stylesheets=[CSS(string=CSS_STYLE)])
-                pdf_rit_file.seek(0)
                 
-                # 3. Unisci i PDF (prelievo copie + RIT completo)
-                if HAS_PYPDF2:
-                    try:
-                        merger = PdfWriter()
-                        # Aggiungi PDF prelievo copie
-                        merger.append(PdfReader(pdf_prelievo_file))
-                        # Aggiungi PDF RIT completo (con firme)
-                        merger.append(PdfReader(pdf_rit_file))
-                        # Scrivi PDF unito
-                        pdf_merged = io.BytesIO()
-                        merger.write(pdf_merged)
-                        pdf_merged.seek(0)
-                        return pdf_merged.read()
-                    except Exception as e:
-                        print(f"Errore merge PDF: {e}. Restituisco solo PDF RIT completo.")
-                        pdf_rit_file.seek(0)
-                        return pdf_rit_file.read()
-                else:
-                    # Se PyPDF2 non è disponibile, restituisci solo il PDF RIT completo
-                    print("PyPDF2 non disponibile. Restituisco solo PDF RIT completo.")
-                    pdf_rit_file.seek(0)
-                    return pdf_rit_file.read()
+                # 3. Un solo PDF in memoria con le pagine di entrambi i documenti
+                return unisci_documenti([html_prelievo, html_rit])
             
             # Se non è prelievo copie, genera PDF RIT normale
             else:
@@ -449,7 +481,7 @@ def genera_pdf_intervento(intervento, azienda_settings) -> bytes:
                     letture_copie_dettagli=letture_copie_dettagli
                 )
                 pdf_file = io.BytesIO()
-                HTML(string=html_content).write_pdf(pdf_file, stylesheets=[CSS(string=CSS_STYLE)])
+                HTML(string=html_content).write_pdf(pdf_file, stylesheets=get_stylesheets())
                 pdf_file.seek(0)
                 return pdf_file.read()
         except Exception as e:
@@ -520,7 +552,7 @@ def genera_pdf_ddt(ddt, azienda_settings) -> bytes:
             # Prova a trovare il file nel container Docker
             abs_path = Path('/app') / safe_azienda['logo_url'].lstrip('/')
             if abs_path.exists():
-                safe_azienda['logo_url'] = f"file://{abs_path}"
+                safe_azienda['logo_url'] = get_logo_src(abs_path)
             else:
                 safe_azienda['logo_url'] = None
         except Exception as e:
@@ -658,7 +690,7 @@ def genera_pdf_ddt(ddt, azienda_settings) -> bytes:
                 totale=totale
             )
             pdf_file = io.BytesIO()
-            HTML(string=html_content).write_pdf(pdf_file, stylesheets=[CSS(string=CSS_STYLE)])
+            HTML(string=html_content).write_pdf(pdf_file, stylesheets=get_stylesheets())
             pdf_file.seek(0)
             return pdf_file.read()
         except Exception as e:
@@ -0,0 +1,117 @@
+"""
+Servizio di ricerca full-database per RIT (interventi) e DDT (ritiri prodotti).
+
+La ricerca viene eseguita interamente in PostgreSQL: nessun caricamento dell'intera
+tabella in Python e nessun lazy-load di dettagli/ricambi/prodotti per riga.
+"""
+from typing import Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Query
+
+from .. import models
+
+# Funzione SQL IMMUTABLE (creata da migrate_ddt_prodotti_search.py) che concatena i campi
+# ricercabili di ogni prodotto del JSONB `ritiri_prodotti.prodotti`; è indicizzata con GIN trigram.
+DDT_PRODOTTI_SEARCH_FUNCTION = "ddt_prodotti_search_text"
+
+
+def escape_like(term: str) -> str:
+    """Esegue l'escape dei caratteri speciali di LIKE (`%`, `_`, `\\`)."""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def contains_ci(column, term: str):
+    """Match case-insensitive di una sottostringa letterale (equivalente a `term in value.lower()`)."""
+    return column.ilike(f"%{escape_like(term)}%", escape="\\")
+
+
+def interventi_search_filter(q: Optional[str]):
+    """
+    Costruisce il filtro SQL di ricerca sugli interventi.
+
+    Cerca per:
+    1. Numero relazione
+    2. Cliente (ragione sociale)
+    3. Serial number / part number / marca-modello nei dettagli
+    4. Descrizione nei ricambi utilizzati
+
+    Restituisce None se `q` è vuoto.
+    """
+    if not q or not q.strip():
+        return None
+    term = q.strip()
+    # Numero relazione e ragione sociale mantengono l'ILIKE storico (pattern non escapato)
+    search_term = f"%{term}%"
+
+    # Sottoquery non correlate: PostgreSQL le valuta una sola volta come "hashed SubPlan"
+    # sfruttando gli indici trigram su dettagli/ricambi (un EXISTS correlato dentro un OR
+    # verrebbe invece rieseguito per ogni riga di interventi).
+    dettagli_match = select(models.DettaglioIntervento.intervento_id).where(
+        models.DettaglioIntervento.intervento_id.isnot(None),
+        or_(
+            contains_ci(models.DettaglioIntervento.serial_number, term),
+            contains_ci(models.DettaglioIntervento.part_number, term),
+            contains_ci(models.DettaglioIntervento.marca_modello, term),
+        )
+    )
+    ricambi_match = select(models.MovimentoRicambio.intervento_id).where(
+        models.MovimentoRicambio.intervento_id.isnot(None),
+        contains_ci(models.MovimentoRicambio.descrizione, term),
+    )
+
+    return or_(
+        models.Intervento.numero_relazione.ilike(search_term),
+        models.Intervento.cliente_ragione_sociale.ilike(search_term),
+        models.Intervento.id.in_(dettagli_match),
+        models.Intervento.id.in_(ricambi_match),
+    )
+
+
+def apply_interventi_search(query: Query, q: Optional[str]) -> Query:
+    """Applica il filtro di ricerca a una query su `models.Intervento` (no-op se `q` è vuoto)."""
+    search_filter = interventi_search_filter(q)
+    if search_filter is None:
+        return query
+    return query.filter(search_filter)
+
+
+def ddt_prodotti_search_text(column=None):
+    """Espressione SQL indicizzata con il testo ricercabile dei prodotti di un DDT."""
+    column = models.RitiroProdotto.prodotti if column is None else column
+    return getattr(func, DDT_PRODOTTI_SEARCH_FUNCTION)(column)
+
+
+def ddt_search_filter(q: Optional[str]):
+    """
+    Costruisce il filtro SQL di ricerca sui DDT.
+
+    Cerca per numero DDT, cliente, tipo/marca/modello (campi singoli) e per tutti i campi
+    dei prodotti nel JSONB `prodotti` (seriale, marca, modello, difetti, ...).
+    Restituisce None se `q` è vuoto.
+    """
+    if not q:
+        return None
+    search = f"%{q}%"
+    filters = [
+        models.RitiroProdotto.numero_ddt.ilike(search),
+        models.RitiroProdotto.cliente_ragione_sociale.ilike(search),
+        models.RitiroProdotto.tipo_prodotto.ilike(search),
+        models.RitiroProdotto.marca.ilike(search),
+        models.RitiroProdotto.modello.ilike(search),
+    ]
+    term = q.strip()
+    if term:
+        filters.append(contains_ci(ddt_prodotti_search_text(), term))
+    else:
+        # Termine vuoto dopo strip: qualsiasi prodotto con almeno un campo valorizzato corrisponde
+        filters.append(ddt_prodotti_search_text() != "")
+    return or_(*filters)
+
+
+def apply_ddt_search(query: Query, q: Optional[str]) -> Query:
+    """Applica il filtro di ricerca a una query su `models.RitiroProdotto` (no-op se `q` è vuoto)."""
+    search_filter = ddt_search_filter(q)
+    if search_filter is None:
+        return query
+    return query.filter(search_filter)
@@ -0,0 +1,56 @@
+"""
+Versione delle righe esposte con ETag / Last-Modified (vedi app/http_cache.py).
+
+`updated_at` (onupdate) cambia a ogni UPDATE ORM della riga, ma le risposte di dettaglio
+includono anche le righe figlie: modificare una sede non tocca la riga del cliente.
+L'hook after_flush aggiorna `updated_at` del padre quando un figlio viene inserito,
+modificato o eliminato nella sessione.
+
+Le operazioni bulk (query.delete() / query.update()) non passano dal flush: dopo di
+esse va chiamato touch() sul padre.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from .. import models
+
+# Figlio -> (modello padre, colonna FK verso il padre)
+FIGLI_VERSIONATI = {
+    models.SedeCliente: (models.Cliente, "cliente_id"),
+    models.AssetCliente: (models.Cliente, "cliente_id"),
+    models.DettaglioIntervento: (models.Intervento, "intervento_id"),
+    models.MovimentoRicambio: (models.Intervento, "intervento_id"),
+}
+
+
+def touch(obj) -> None:
+    """Segna `obj` come modificato (nuova versione) anche se nessuna sua colonna cambia."""
+    obj.updated_at = datetime.now()
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    # In after_flush new/dirty/deleted riflettono ancora lo stato prima del flush
+    parent_ids = defaultdict(set)
+    dirty = set(session.dirty)
+    for obj in list(session.new) + list(dirty) + list(session.deleted):
+        spec = FIGLI_VERSIONATI.get(type(obj))
+        if spec is None:
+            continue
+        if obj in dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        parent_model, fk = spec
+        parent_id = getattr(obj, fk, None)
+        if parent_id is not None:
+            parent_ids[parent_model].add(parent_id)
+
+    if not parent_ids:
+        return
+    now = datetime.now()
+    connection = session.connection()
+    for parent_model, ids in parent_ids.items():
+        table = parent_model.__table__
+        connection.execute(update(table).where(table.c.id.in_(ids)).values(updated_at=now))
@@ -0,0 +1,166 @@
+"""
+Cache delle impostazioni azienda condivisa da tutto il codice del processo.
+
+- get_settings(db) restituisce uno snapshot immutabile della riga impostazioni_azienda
+  (SettingsSnapshot): nessun oggetto ORM legato a una sessione resta in cache
+- dopo il commit di una sessione che ha modificato la riga, la cache del processo viene
+  invalidata subito (hook after_commit)
+- gli altri processi (worker uvicorn, scheduler) ricevono l'invalidazione con
+  LISTEN/NOTIFY (app/db_notify.py): il trigger creato da migrate_impostazioni_notify.py
+  notifica ogni modifica della tabella, anche fatta fuori dall'applicazione
+- SETTINGS_CACHE_TTL resta come rete di sicurezza (listener scollegato, trigger assente)
+
+Le modifiche vanno fatte sulla riga ORM (get_settings_row), mai sullo snapshot.
+"""
+import copy
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from . import database, db_notify, models
+
+SETTINGS_CHANNEL = "impostazioni_azienda_changed"
+SETTINGS_CACHE_TTL = int(os.getenv("SETTINGS_CACHE_TTL", "300"))  # secondi
+
+# Valori della riga creata al primo avvio se la tabella è vuota
+DEFAULT_SETTINGS = {
+    "nome_azienda": "GIT - Gestione Interventi Tecnici",
+    "indirizzo_completo": "Configurazione Richiesta",
+    "logo_url": "",
+    "colore_primario": "#4F46E5",
+    "tariffe_categorie": {},
+}
+
+
+class SettingsSnapshot:
+    """Vista in sola lettura delle impostazioni azienda (attributi come il modello ORM)."""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: Dict[str, Any]):
+        object.__setattr__(self, "_values", values)
+
+    @classmethod
+    def from_row(cls, row: models.ImpostazioniAzienda) -> "SettingsSnapshot":
+        columns = inspect(models.ImpostazioniAzienda).column_attrs
+        return cls({attr.key: copy.deepcopy(getattr(row, attr.key)) for attr in columns})
+
+    def __getattr__(self, name: str):
+        try:
+            value = self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        # I campi JSON sono mutabili: ogni lettura riceve una copia, lo snapshot resta intatto
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        return value
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("Impostazioni in sola lettura: modificare la riga con get_settings_row()")
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Dizionario dei valori (usato da pdf_service per normalizzare i dati azienda)."""
+        return copy.deepcopy(self._values)
+
+
+_lock = threading.Lock()
+_cache = {"snapshot": None, "loaded_at": 0.0, "generation": 0}
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+    "notifications": 0,
+}
+
+
+def get_settings_row(db: Session) -> models.ImpostazioniAzienda:
+    """Riga ORM delle impostazioni (creata con i valori di default se manca): per le modifiche."""
+    settings = db.query(models.ImpostazioniAzienda).first()
+    if settings:
+        return settings
+    settings = models.ImpostazioniAzienda(**copy.deepcopy(DEFAULT_SETTINGS))
+    db.add(settings)
+    db.commit()
+    db.refresh(settings)
+    return settings
+
+
+def get_settings(db: Optional[Session] = None, force_refresh: bool = False) -> SettingsSnapshot:
+    """Snapshot delle impostazioni azienda; senza `db` apre una sessione solo in caso di miss."""
+    with _lock:
+        snapshot = _cache["snapshot"]
+        fresh = time.monotonic() - _cache["loaded_at"] < SETTINGS_CACHE_TTL
+        if snapshot is not None and fresh and not force_refresh:
+            _stats["hits"] += 1
+            return snapshot
+        _stats["misses"] += 1
+        generation = _cache["generation"]
+
+    if db is None:
+        with database.SessionLocal() as session:
+            snapshot = SettingsSnapshot.from_row(get_settings_row(session))
+    else:
+        snapshot = SettingsSnapshot.from_row(get_settings_row(db))
+
+    with _lock:
+        # Un'invalidazione arrivata durante la lettura rende questo snapshot già superato
+        if _cache["generation"] == generation:
+            _cache["snapshot"] = snapshot
+            _cache["loaded_at"] = time.monotonic()
+    return snapshot
+
+
+def invalidate_settings_cache() -> None:
+    """Invalida la cache del processo corrente (gli altri processi ricevono NOTIFY dal trigger)."""
+    with _lock:
+        _cache["snapshot"] = None
+        _cache["generation"] += 1
+        _stats["invalidations"] += 1
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats["cached"] = _cache["snapshot"] is not None
+    total = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / total, 3) if total else None
+    stats["pid"] = os.getpid()
+    return stats
+
+
+# -------------------- INVALIDAZIONE LOCALE DOPO COMMIT --------------------
+@event.listens_for(Session, "after_flush")
+def _mark_settings_changed(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.ImpostazioniAzienda):
+            session.info["impostazioni_modificate"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("impostazioni_modificate", False):
+        invalidate_settings_cache()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("impostazioni_modificate", None)
+# ------------------ /INVALIDAZIONE LOCALE DOPO COMMIT ---------------------
+
+
+# -------------------- INVALIDAZIONE TRA PROCESSI (LISTEN/NOTIFY) --------------------
+def _on_notify(payload: Optional[str]) -> None:
+    # payload None: il listener si è (ri)collegato e può aver perso notifiche
+    if payload is not None:
+        with _lock:
+            _stats["notifications"] += 1
+    invalidate_settings_cache()
+
+
+db_notify.subscribe(SETTINGS_CHANNEL, _on_notify)
+# ------------------ /INVALIDAZIONE TRA PROCESSI (LISTEN/NOTIFY) ---------------------
@@ -0,0 +1,168 @@
+"""
+Cache degli utenti autenticati usata da auth.get_current_user.
+
+- chiave: subject del token JWT (email); valore: snapshot immutabile con identità,
+  ruolo, permessi e stato (CachedUser), senza hash password né segreti 2FA
+- LRU limitata a USER_CACHE_SIZE voci, ognuna valida al massimo USER_CACHE_TTL secondi
+- dopo il commit di una sessione che ha inserito/modificato/eliminato un utente
+  (update_user, delete_user, set-password, 2FA, login) la voce viene scartata subito
+- gli altri processi ricevono l'invalidazione con LISTEN/NOTIFY (app/db_notify.py):
+  il trigger creato da migrate_utenti_notify.py notifica l'email di ogni riga toccata
+
+Con la cache calda una richiesta autenticata non esegue query per l'autenticazione.
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from . import db_notify, models
+
+USERS_CHANNEL = "utenti_changed"
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # secondi
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1000"))
+
+# Colonne che non devono restare in memoria fuori dalla sessione
+_ESCLUSE = {"password_hash", "two_factor_secret", "two_factor_backup_codes"}
+
+
+class CachedUser:
+    """Vista in sola lettura dell'utente corrente (attributi come il modello ORM)."""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: Dict[str, Any]):
+        object.__setattr__(self, "_values", values)
+
+    @classmethod
+    def from_row(cls, row: models.Utente) -> "CachedUser":
+        columns = inspect(models.Utente).column_attrs
+        return cls({
+            attr.key: copy.deepcopy(getattr(row, attr.key))
+            for attr in columns
+            if attr.key not in _ESCLUSE
+        })
+
+    def __getattr__(self, name: str):
+        try:
+            value = self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        # permessi è JSON mutabile: ogni lettura riceve una copia, lo snapshot resta intatto
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        return value
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("Utente corrente in sola lettura: modificare la riga ORM (auth.require_superadmin_row)")
+
+    def __repr__(self) -> str:
+        return f"<CachedUser id={self._values.get('id')} email={self._values.get('email')!r}>"
+
+
+_lock = threading.Lock()
+# email -> (snapshot, istante di caricamento)
+_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_generation = {"value": 0}
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "invalidations": 0,
+    "notifications": 0,
+}
+
+
+def get_user(email: str, db: Session) -> Optional[CachedUser]:
+    """Snapshot dell'utente con questa email (None se non esiste); query solo in caso di miss."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(email)
+        if entry is not None and now - entry[1] < USER_CACHE_TTL:
+            _cache.move_to_end(email)
+            _stats["hits"] += 1
+            return entry[0]
+        _stats["misses"] += 1
+        generation = _generation["value"]
+
+    row = db.query(models.Utente).filter(models.Utente.email == email).first()
+    if row is None:
+        # Gli utenti inesistenti non vengono memorizzati: un invito li crea in qualunque momento
+        return None
+    user = CachedUser.from_row(row)
+
+    with _lock:
+        # Un'invalidazione arrivata durante la lettura rende questo snapshot già superato
+        if _generation["value"] == generation:
+            _cache[email] = (user, time.monotonic())
+            _cache.move_to_end(email)
+            while len(_cache) > USER_CACHE_SIZE:
+                _cache.popitem(last=False)
+                _stats["evictions"] += 1
+    return user
+
+
+def invalidate_user(email: Optional[str] = None) -> None:
+    """Scarta la voce di `email` (tutta la cache se None) nel processo corrente."""
+    with _lock:
+        if email is None:
+            _cache.clear()
+        else:
+            _cache.pop(email, None)
+        _generation["value"] += 1
+        _stats["invalidations"] += 1
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_cache)
+        stats["max_size"] = USER_CACHE_SIZE
+    total = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / total, 3) if total else None
+    stats["pid"] = os.getpid()
+    return stats
+
+
+# -------------------- INVALIDAZIONE LOCALE DOPO COMMIT --------------------
+@event.listens_for(Session, "after_flush")
+def _mark_users_changed(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.Utente):
+            continue
+        emails = session.info.setdefault("utenti_modificati", set())
+        history = inspect(obj).attrs.email.history
+        # Cambio email: anche la vecchia chiave va scartata
+        for email in list(history.deleted or ()) + [obj.email]:
+            if email:
+                emails.add(email)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for email in session.info.pop("utenti_modificati", ()):
+        invalidate_user(email)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("utenti_modificati", None)
+# ------------------ /INVALIDAZIONE LOCALE DOPO COMMIT ---------------------
+
+
+# -------------------- INVALIDAZIONE TRA PROCESSI (LISTEN/NOTIFY) --------------------
+def _on_notify(payload: Optional[str]) -> None:
+    # payload None: listener (ri)collegato; payload vuoto: TRUNCATE o modifica massiva
+    if payload is not None:
+        with _lock:
+            _stats["notifications"] += 1
+    invalidate_user(payload or None)
+
+
+db_notify.subscribe(USERS_CHANNEL, _on_notify)
+# ------------------ /INVALIDAZIONE TRA PROCESSI (LISTEN/NOTIFY) ---------------------
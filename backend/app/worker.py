@@ -0,0 +1,68 @@
+"""
+Worker della coda job (vedi services/job_queue.py), separato dal processo API:
+
+    python -m app.worker                       # tutti i tipi di job registrati
+    python -m app.worker --tipi email_rit,backup
+    python -m app.worker --elenco              # tipi registrati con concorrenza e tentativi
+
+Con un worker dedicato impostare JOBS_WORKER_EMBEDDED=0 sul servizio API. SIGTERM / SIGINT
+fermano la presa di nuovi job e attendono la fine di quelli in corso.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+
+from . import db_notify
+from .services import job_handlers  # noqa: F401  (registra gli handler)
+from .services import job_queue, pdf_render_pool
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Esegue i job in background accodati nella tabella jobs.")
+    parser.add_argument("--tipi", default="", help="Tipi di job da eseguire, separati da virgole (default: tutti)")
+    parser.add_argument("--intervallo", type=float, default=job_queue.JOBS_INTERVALLO, help="Secondi tra due controlli della coda")
+    parser.add_argument("--elenco", action="store_true", help="Mostra i tipi di job registrati ed esce")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    if args.elenco:
+        for tipo, config in job_queue.handler_registrati().items():
+            print(f"{tipo:<15} concorrenza={config['concorrenza']} max_tentativi={config['max_tentativi']} timeout={config['timeout']}s")
+        return 0
+
+    tipi = [tipo.strip() for tipo in args.tipi.split(",") if tipo.strip()] or None
+    stop = threading.Event()
+
+    def _ferma(signum, frame):
+        logger.info(f"[JOBS] Segnale {signum}: attendo la fine dei job in corso")
+        stop.set()
+        job_queue._sveglia.set()
+
+    signal.signal(signal.SIGTERM, _ferma)
+    signal.signal(signal.SIGINT, _ferma)
+
+    # Cache impostazioni invalidata dalle modifiche fatte dai processi API
+    db_notify.start_listener()
+    pdf_render_pool.start()
+    try:
+        job_queue.esegui_worker(stop, tipi=tipi, intervallo=args.intervallo)
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    finally:
+        pdf_render_pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
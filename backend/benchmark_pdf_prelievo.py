@@ -0,0 +1,164 @@
+"""
+Benchmark del PDF combinato prelievo copie + RIT (interventi is_prelievo_copie con manutenzione).
+
+Confronta, su un intervento costruito in memoria (nessun accesso al DB):
+- merge: ogni documento scritto come PDF separato e poi unito con PyPDF2
+  (PdfReader / PdfWriter), come faceva genera_pdf_intervento prima
+- single: pdf_service.unisci_documenti, layout WeasyPrint concatenati e un solo PDF
+  scritto in memoria
+
+Ogni variante gira in un processo separato, così il picco di memoria (RSS massimo del
+processo, librerie native comprese) non è falsato dall'altra. Il picco Python
+(tracemalloc) è riportato a parte.
+
+Richiede WeasyPrint; per la variante merge anche PyPDF2 (pip install PyPDF2).
+
+Uso:
+    python benchmark_pdf_prelievo.py [--letture 20] [--dettagli 3] [--repeat 5]
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, time as dt_time
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_intervento(letture: int, dettagli: int):
+    from app import models
+    from app.services.pdf_render_pool import snapshot_intervento
+
+    now = datetime.now()
+    intervento = models.Intervento(
+        id=1,
+        numero_relazione="RIT-BENCH-00001",
+        anno_riferimento=now.year,
+        data_creazione=now,
+        cliente_id=1,
+        cliente_ragione_sociale="Cliente Benchmark S.r.l.",
+        cliente_indirizzo="Via Roma 1, Salerno",
+        macro_categoria=models.MacroCategoria.PRINTING,
+        is_contratto=True,
+        is_prelievo_copie=True,
+        flag_diritto_chiamata=False,
+        costo_chiamata_applicato=0.0,
+        tariffa_oraria_applicata=40.0,
+        costi_extra=0.0,
+        ora_inizio=dt_time(9, 0),
+        ora_fine=dt_time(10, 30),
+    )
+    intervento.dettagli = [
+        models.DettaglioIntervento(
+            id=k + 1, marca_modello=f"HP LaserJet {k}", serial_number=f"SN{k:05d}",
+            descrizione_lavoro="Sostituzione fusore e pulizia"
+        )
+        for k in range(dettagli)
+    ]
+    intervento.ricambi_utilizzati = [
+        models.MovimentoRicambio(id=1, descrizione="Toner nero", quantita=1, prezzo_unitario=45.0, prezzo_applicato=45.0)
+    ]
+    intervento.letture_copie = []
+    for k in range(letture):
+        lettura = models.LetturaCopie(
+            id=k + 1, asset_id=k + 1, intervento_id=1,
+            data_lettura=now - timedelta(days=k), contatore_bn=10000 + k * 250, contatore_colore=2000 + k * 50,
+            note="Copie B/N: 250 - Copie colore: 50",
+        )
+        lettura.asset_marca = "Kyocera"
+        lettura.asset_modello = f"TASKalfa {k}"
+        lettura.asset_marca_modello = f"Kyocera TASKalfa {k}"
+        intervento.letture_copie.append(lettura)
+    return snapshot_intervento(intervento)
+
+
+AZIENDA = {
+    "nome_azienda": "Azienda Benchmark S.r.l.",
+    "indirizzo_completo": "Via Napoli 2, Salerno",
+    "p_iva": "01234567890",
+    "telefono": "089 000000",
+    "email": "info@example.com",
+    "logo_url": "",
+}
+
+
+# --- Percorso legacy (prima del PDF in un solo passaggio) ---
+
+def unisci_con_pypdf2(html_documenti) -> bytes:
+    from PyPDF2 import PdfReader, PdfWriter
+    from weasyprint import HTML
+    from app.services import pdf_service
+
+    merger = PdfWriter()
+    for html_doc in html_documenti:
+        pdf_file = io.BytesIO()
+        HTML(string=html_doc).write_pdf(pdf_file, stylesheets=pdf_service.get_stylesheets())
+        pdf_file.seek(0)
+        merger.append(PdfReader(pdf_file))
+    pdf_merged = io.BytesIO()
+    merger.write(pdf_merged)
+    return pdf_merged.getvalue()
+
+
+def _run_variant(variant: str, letture: int, dettagli: int, repeat: int, queue) -> None:
+    from app.services import pdf_service
+
+    if variant == "merge":
+        pdf_service.unisci_documenti = unisci_con_pypdf2
+    intervento = build_intervento(letture, dettagli)
+
+    pdf = pdf_service.genera_pdf_intervento(intervento, dict(AZIENDA))  # warm-up (template, CSS, font)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        pdf = pdf_service.genera_pdf_intervento(intervento, dict(AZIENDA))
+    elapsed = (time.perf_counter() - start) / repeat
+    _current, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Linux: kB
+    queue.put((variant, elapsed, python_peak, rss_peak_kb, len(pdf)))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark PDF combinato prelievo copie + RIT.")
+    parser.add_argument("--letture", type=int, default=20, help="Letture copie nel prelievo")
+    parser.add_argument("--dettagli", type=int, default=3, help="Righe di manutenzione nel RIT")
+    parser.add_argument("--repeat", type=int, default=5, help="Render misurati per variante")
+    args = parser.parse_args(argv)
+
+    try:
+        import weasyprint  # noqa: F401
+    except ImportError:
+        sys.exit("WeasyPrint non installato: benchmark non eseguibile.")
+    variants = ["single"]
+    try:
+        import PyPDF2  # noqa: F401
+        variants.insert(0, "merge")
+    except ImportError:
+        print("PyPDF2 non installato: misuro solo la variante single.")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for variant in variants:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_variant, args=(variant, args.letture, args.dettagli, args.repeat, queue))
+        process.start()
+        name, elapsed, python_peak, rss_peak_kb, size = queue.get()
+        process.join()
+        results[name] = (elapsed, python_peak, rss_peak_kb, size)
+
+    print(f"Letture: {args.letture}, dettagli: {args.dettagli}, ripetizioni: {args.repeat}")
+    print(f"{'variante':<10}{'ms/PDF':>10}{'picco py MB':>14}{'picco RSS MB':>15}{'KB PDF':>9}")
+    for name, (elapsed, python_peak, rss_peak_kb, size) in results.items():
+        print(f"{name:<10}{elapsed * 1000:>10.0f}{python_peak / 2**20:>14.1f}{rss_peak_kb / 1024:>15.1f}{size / 1024:>9.0f}")
+    if "merge" in results:
+        print(f"speedup single vs merge: {results['merge'][0] / results['single'][0]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
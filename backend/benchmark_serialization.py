@@ -0,0 +1,203 @@
+"""
+Micro-benchmark della serializzazione delle pagine elenco (interventi, DDT, clienti).
+
+Confronta, su oggetti ORM costruiti in memoria (nessun accesso al DB):
+- legacy: conversione riga per riga (model_validate / model_dump), nuova validazione
+  contro il response_model e json.dumps, come facevano gli endpoint prima
+- fast: app.serialization.dump_many (una validazione con TypeAdapter in cache) e
+  json_response (orjson se installato)
+
+Uso:
+    python benchmark_serialization.py [--rows 100] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, time as dt_time
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder
+
+from app import models, schemas
+from app.serialization import HAS_ORJSON, dump_many, json_response, type_adapter
+
+
+def build_interventi(rows: int) -> list:
+    now = datetime.now()
+    result = []
+    for n in range(rows):
+        intervento = models.Intervento(
+            id=n + 1,
+            numero_relazione=f"RIT-BENCH-{n:05d}",
+            anno_riferimento=now.year,
+            data_creazione=now - timedelta(minutes=n),
+            cliente_id=n + 1,
+            cliente_ragione_sociale=f"Cliente Benchmark {n} S.r.l.",
+            cliente_indirizzo="Via Roma 1, Salerno",
+            macro_categoria=models.MacroCategoria.PRINTING,
+            is_contratto=bool(n % 2),
+            flag_diritto_chiamata=True,
+            costi_extra=0.0,
+            ora_inizio=dt_time(9, 0),
+            ora_fine=dt_time(10, 30),
+        )
+        intervento.dettagli = [
+            models.DettaglioIntervento(
+                id=n * 10 + k, marca_modello=f"HP LaserJet {k}", serial_number=f"SN{n:05d}{k}",
+                descrizione_lavoro="Sostituzione fusore e pulizia"
+            )
+            for k in range(2)
+        ]
+        intervento.ricambi_utilizzati = [
+            models.MovimentoRicambio(
+                id=n + 1, descrizione="Toner nero", quantita=1, prezzo_unitario=45.0, prezzo_applicato=45.0
+            )
+        ]
+        result.append(intervento)
+    return result
+
+
+def build_ddt(rows: int) -> list:
+    now = datetime.now()
+    tecnici = [models.Utente(id=k + 1, nome_completo=f"Tecnico {k}") for k in range(3)]
+    result = []
+    for n in range(rows):
+        ddt = models.RitiroProdotto(
+            id=n + 1,
+            numero_ddt=f"DDT-BENCH-{n:05d}",
+            anno_riferimento=now.year,
+            data_ritiro=now - timedelta(hours=n),
+            tecnico_id=tecnici[n % 3].id,
+            cliente_id=n + 1,
+            cliente_ragione_sociale=f"Cliente Benchmark {n} S.r.l.",
+            cliente_indirizzo="Via Roma 1, Salerno",
+            tipo_prodotto="Stampante",
+            difetto_segnalato="Non stampa",
+            prodotti=[{"tipo_prodotto": "Stampante", "marca": "HP", "modello": "M404",
+                       "serial_number": f"SN{n:05d}", "difetto_segnalato": "Non stampa"}],
+            tipo_ddt="ingresso",
+            stato="in_magazzino",
+            in_attesa_cliente=False,
+            costi_extra=0,
+            ricambi_utilizzati=[],
+            assegnazione_stato="assegnato",
+            assegnazioni_log=[],
+            note_log=[],
+            foto_prodotto=[],
+        )
+        ddt.tecnico_rel = tecnici[n % 3]
+        ddt.tecnico_assegnato_rel = tecnici[(n + 1) % 3]
+        result.append(ddt)
+    return result
+
+
+def build_clienti(rows: int) -> list:
+    result = []
+    for n in range(rows):
+        cliente = models.Cliente(
+            id=n + 1,
+            ragione_sociale=f"Cliente Benchmark {n} S.r.l.",
+            indirizzo="Via Roma 1",
+            citta="Salerno",
+            cap="84100",
+            p_iva=f"{n:011d}",
+            codice_sdi="",
+            is_pa=False,
+            has_contratto_assistenza=False,
+            has_noleggio=False,
+            has_multisede=True,
+            sede_legale_operativa=False,
+            chiamate_utilizzate_contratto=0,
+        )
+        cliente.sedi = [
+            models.SedeCliente(id=n * 10 + k, cliente_id=n + 1, nome_sede=f"Sede {k}", indirizzo_completo="Via Napoli 2")
+            for k in range(2)
+        ]
+        cliente.assets_noleggio = []
+        result.append(cliente)
+    return result
+
+
+# --- Percorsi legacy (come negli endpoint prima della serializzazione veloce) ---
+
+def _legacy_response(response_model, payload) -> bytes:
+    adapter = type_adapter(response_model)
+    validated = adapter.validate_python(payload, from_attributes=True)
+    return json.dumps(jsonable_encoder(adapter.dump_python(validated, mode="json"))).encode("utf-8")
+
+
+def legacy_interventi(interventi) -> bytes:
+    items = []
+    for i in interventi:
+        data = {}
+        for key, value in i.__dict__.items():
+            data[key] = value.strftime('%H:%M') if isinstance(value, dt_time) else value
+        data['dettagli'] = [schemas.DettaglioAssetResponse.model_validate(d) for d in i.dettagli]
+        data['ricambi_utilizzati'] = [schemas.RicambioResponse.model_validate(r) for r in i.ricambi_utilizzati]
+        items.append(schemas.InterventoSummaryResponse.model_validate(data))
+    return _legacy_response(schemas.PaginatedInterventiResponse, {"items": items, "total": len(items)})
+
+
+def legacy_ddt(ddt_list) -> bytes:
+    items = []
+    for ddt in ddt_list:
+        ddt_dict = schemas.RitiroProdottoSummaryResponse.model_validate(ddt).model_dump()
+        if ddt.tecnico_rel:
+            ddt_dict["tecnico_nome"] = ddt.tecnico_rel.nome_completo
+        if ddt.tecnico_assegnato_rel:
+            ddt_dict["tecnico_assegnato_nome"] = ddt.tecnico_assegnato_rel.nome_completo
+        if ddt.tecnico_pending_rel:
+            ddt_dict["tecnico_assegnazione_pending_nome"] = ddt.tecnico_pending_rel.nome_completo
+        items.append(ddt_dict)
+    return _legacy_response(schemas.PaginatedDdtResponse, {"items": items, "total": len(items)})
+
+
+def legacy_clienti(clienti) -> bytes:
+    return _legacy_response(schemas.PaginatedClientiResponse, {"items": clienti, "total": len(clienti)})
+
+
+# --- Percorso veloce ---
+
+def fast_page(schema, rows) -> bytes:
+    return json_response({"items": dump_many(schema, rows), "total": len(rows)}).body
+
+
+def _rows_per_second(fn, rows, repeat: int) -> float:
+    fn(rows)  # warm-up (compilazione schemi, cache TypeAdapter)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    elapsed = time.perf_counter() - start
+    return len(rows) * repeat / elapsed
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark serializzazione pagine elenco.")
+    parser.add_argument("--rows", type=int, default=100, help="Righe per pagina")
+    parser.add_argument("--repeat", type=int, default=20, help="Pagine serializzate per misura")
+    args = parser.parse_args(argv)
+
+    cases = [
+        ("interventi", build_interventi(args.rows), legacy_interventi,
+         lambda rows: fast_page(schemas.InterventoSummaryResponse, rows)),
+        ("ddt", build_ddt(args.rows), legacy_ddt,
+         lambda rows: fast_page(schemas.RitiroProdottoSummaryResponse, rows)),
+        ("clienti", build_clienti(args.rows), legacy_clienti,
+         lambda rows: fast_page(schemas.ClienteResponse, rows)),
+    ]
+
+    print(f"Righe per pagina: {args.rows}, ripetizioni: {args.repeat}, orjson: {'sì' if HAS_ORJSON else 'no'}")
+    print(f"{'pagina':<12}{'legacy righe/s':>16}{'fast righe/s':>16}{'speedup':>10}")
+    for name, rows, legacy, fast in cases:
+        assert json.loads(legacy(rows))["items"] == json.loads(fast(rows))["items"], f"{name}: output diverso"
+        legacy_rps = _rows_per_second(legacy, rows, args.repeat)
+        fast_rps = _rows_per_second(fast, rows, args.repeat)
+        print(f"{name:<12}{legacy_rps:>16,.0f}{fast_rps:>16,.0f}{fast_rps / legacy_rps:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
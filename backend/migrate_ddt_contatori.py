@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Migrazione per i contatori della dashboard DDT:
+- Crea la tabella ddt_contatori (ambito, chiave) -> valore
+- La popola con il ricalcolo completo da ritiri_prodotti
+
+Da qui in poi i contatori sono mantenuti a ogni flush da
+app/services/ddt_contatori_service.py e ricalcolati ogni notte dallo scheduler.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.services.ddt_contatori_service import ricalcola
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo tabella ddt_contatori (se mancante)...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS ddt_contatori (
+                ambito VARCHAR NOT NULL,
+                chiave VARCHAR NOT NULL,
+                valore INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (ambito, chiave)
+            )
+        """))
+        print("🔄 Calcolo contatori da ritiri_prodotti...")
+        ricalcola(session.connection())
+        session.commit()
+        print("✅ Contatori DDT pronti.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
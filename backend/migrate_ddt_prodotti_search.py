@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Migrazione per la ricerca DDT sui prodotti:
+- Crea (o aggiorna) la funzione SQL ddt_prodotti_search_text(jsonb) usata dal filtro
+  di ricerca dei DDT (search_service.ddt_search_filter) e dal suo indice trigram
+
+Senza la funzione la ricerca DDT con `q` fallisce; all'avvio viene creata anche da
+app.db_indexes, ma solo con DB_ENSURE_INDEXES=1.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.db_indexes import DDT_PRODOTTI_SEARCH_FUNCTION_DDL
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo funzione ddt_prodotti_search_text(jsonb)...")
+        session.execute(text(DDT_PRODOTTI_SEARCH_FUNCTION_DDL))
+        session.commit()
+        print("✅ Funzione di ricerca prodotti DDT pronta.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Migrazione per il registro dei promemoria DDT non chiusi:
+- Crea la tabella ddt_reminder_log (se mancante)
+- Crea l'indice unico (ddt_id, stato, soglia, stato_since): un promemoria per soglia e
+  per stato del DDT, anche con più processi che eseguono il controllo
+
+Il registro è scritto da check_ddt_ritardi (app/main.py) nella stessa transazione
+dell'email accodata nell'outbox.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo tabella ddt_reminder_log (se mancante)...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS ddt_reminder_log (
+                id SERIAL PRIMARY KEY,
+                ddt_id INTEGER NOT NULL REFERENCES ritiri_prodotti(id) ON DELETE CASCADE,
+                stato VARCHAR NOT NULL,
+                soglia INTEGER NOT NULL,
+                stato_since TIMESTAMP NOT NULL,
+                tecnico_id INTEGER REFERENCES utenti(id) ON DELETE SET NULL,
+                inviato_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """))
+        print("🔄 Creo indice unico (ddt_id, stato, soglia, stato_since)...")
+        session.execute(text("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_ddt_reminder_log
+            ON ddt_reminder_log (ddt_id, stato, soglia, stato_since)
+        """))
+        session.commit()
+        print("✅ Registro promemoria DDT pronto.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
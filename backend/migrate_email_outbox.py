@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Migrazione per l'outbox delle email:
+- Crea le tabelle email_outbox ed email_allegati (se mancanti)
+- Crea l'indice parziale sulle righe in coda usato dal drain (FOR UPDATE SKIP LOCKED)
+
+Le email vengono accodate e inviate da app/services/email_outbox.py.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo tabella email_allegati (se mancante)...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS email_allegati (
+                hash VARCHAR(64) PRIMARY KEY,
+                dati BYTEA NOT NULL,
+                dimensione INTEGER NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """))
+        print("🔄 Creo tabella email_outbox (se mancante)...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id SERIAL PRIMARY KEY,
+                destinatario VARCHAR NOT NULL,
+                oggetto VARCHAR NOT NULL,
+                corpo_html TEXT NOT NULL,
+                corpo_testo TEXT,
+                mittente_nome VARCHAR,
+                allegati JSONB DEFAULT '[]'::jsonb,
+                stato VARCHAR NOT NULL DEFAULT 'in_coda',
+                tentativi INTEGER NOT NULL DEFAULT 0,
+                prossimo_tentativo_at TIMESTAMP NOT NULL DEFAULT now(),
+                ultimo_errore TEXT,
+                created_at TIMESTAMP NOT NULL DEFAULT now(),
+                inviata_at TIMESTAMP
+            )
+        """))
+        print("🔄 Creo indice sulle email in coda...")
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_email_outbox_in_coda
+            ON email_outbox (prossimo_tentativo_at, id)
+            WHERE stato = 'in_coda'
+        """))
+        session.commit()
+        print("✅ Outbox email pronta.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
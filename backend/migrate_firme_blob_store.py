@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Migrazione delle firme RIT/DDT nell'archivio indirizzato per contenuto:
+- Crea la tabella firme (hash sha256 -> immagine decodificata)
+- Aggiunge firma_tecnico_hash / firma_cliente_hash a interventi e ritiri_prodotti
+- Converte a lotti le firme base64 inline: ogni immagine viene salvata una sola volta,
+  il record punta al suo hash e la colonna inline viene svuotata
+
+I valori inline non riconosciuti come data URI immagine restano invariati (la property
+del modello continua a restituirli).
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.services.firme_service import parse_data_uri, firma_hash
+
+TABLES = ["interventi", "ritiri_prodotti"]
+FIRMA_COLUMNS = ["firma_tecnico", "firma_cliente"]
+BATCH_SIZE = int(os.getenv("FIRME_MIGRATION_BATCH_SIZE", "200"))
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def _migrate_table(session, table: str) -> dict:
+    """Converte le firme inline di una tabella a lotti di BATCH_SIZE righe (una transazione per lotto)."""
+    stats = {"record": 0, "firme": 0, "non_convertite": 0}
+    last_id = 0
+    while True:
+        rows = session.execute(
+            text(f"""
+                SELECT id, firma_tecnico, firma_cliente
+                FROM {table}
+                WHERE id > :last_id AND (firma_tecnico IS NOT NULL OR firma_cliente IS NOT NULL)
+                ORDER BY id
+                LIMIT :batch_size
+            """),
+            {"last_id": last_id, "batch_size": BATCH_SIZE},
+        ).mappings().all()
+        if not rows:
+            break
+
+        for row in rows:
+            updates = {}
+            for column in FIRMA_COLUMNS:
+                value = row[column]
+                if not value:
+                    continue
+                parsed = parse_data_uri(value)
+                if parsed is None:
+                    stats["non_convertite"] += 1
+                    continue
+                mime_type, dati = parsed
+                digest = firma_hash(dati)
+                session.execute(
+                    text("""
+                        INSERT INTO firme (hash, mime_type, dati, dimensione, created_at)
+                        VALUES (:hash, :mime_type, :dati, :dimensione, NOW())
+                        ON CONFLICT (hash) DO NOTHING
+                    """),
+                    {"hash": digest, "mime_type": mime_type, "dati": dati, "dimensione": len(dati)},
+                )
+                updates[column] = digest
+                stats["firme"] += 1
+
+            if updates:
+                assignments = ", ".join(f"{column}_hash = :{column}, {column} = NULL" for column in updates)
+                session.execute(
+                    text(f"UPDATE {table} SET {assignments} WHERE id = :id"),
+                    {**updates, "id": row["id"]},
+                )
+                stats["record"] += 1
+
+        session.commit()
+        last_id = rows[-1]["id"]
+        print(f"   ... {table}: elaborati fino a id {last_id}")
+    return stats
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo tabella firme (se mancante)...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS firme (
+                hash VARCHAR(64) PRIMARY KEY,
+                mime_type VARCHAR NOT NULL DEFAULT 'image/png',
+                dati BYTEA NOT NULL,
+                dimensione INTEGER NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """))
+        for table in TABLES:
+            for column in FIRMA_COLUMNS:
+                session.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column}_hash VARCHAR(64) REFERENCES firme(hash)"
+                ))
+        session.commit()
+
+        for table in TABLES:
+            print(f"🔄 Converto firme inline di {table} (lotti da {BATCH_SIZE})...")
+            stats = _migrate_table(session, table)
+            print(f"   {table}: {stats['record']} record, {stats['firme']} firme spostate, "
+                  f"{stats['non_convertite']} valori non riconosciuti lasciati inline")
+
+        totale = session.execute(text("SELECT count(*) FROM firme")).scalar()
+        print(f"✅ Firme migrate: {totale} immagini distinte nella tabella firme.")
+        print("ℹ️ Eseguire VACUUM (FULL) su interventi e ritiri_prodotti per restituire lo spazio TOAST liberato.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
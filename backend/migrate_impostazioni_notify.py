@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Migrazione per l'invalidazione della cache impostazioni tra processi:
+- Trigger su impostazioni_azienda che esegue NOTIFY impostazioni_azienda_changed a ogni
+  INSERT/UPDATE/DELETE/TRUNCATE (anche da pgAdmin o script esterni)
+
+Ogni processo dell'applicazione resta in LISTEN sul canale (app/settings_cache.py) e
+scarta il proprio snapshot quando riceve la notifica.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+CHANNEL = "impostazioni_azienda_changed"
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo trigger NOTIFY su impostazioni_azienda...")
+        session.execute(text(f"""
+            CREATE OR REPLACE FUNCTION notify_impostazioni_azienda_changed()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+            BEGIN
+                PERFORM pg_notify('{CHANNEL}', '');
+                RETURN NULL;
+            END
+            $$
+        """))
+        session.execute(text("DROP TRIGGER IF EXISTS trg_impostazioni_azienda_notify ON impostazioni_azienda"))
+        session.execute(text("""
+            CREATE TRIGGER trg_impostazioni_azienda_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON impostazioni_azienda
+            FOR EACH STATEMENT EXECUTE PROCEDURE notify_impostazioni_azienda_changed()
+        """))
+        session.commit()
+        print(f"✅ Trigger creato: le modifiche alle impostazioni notificano il canale {CHANNEL}.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Migrazione indici per la ricerca RIT lato database:
+- Abilita l'estensione pg_trgm
+- Indici B-tree sulle FK intervento_id di dettagli_intervento e movimenti_ricambi
+- Indici GIN trigram su seriale / part number / marca-modello dei dettagli e
+  sulla descrizione dei ricambi (supportano ILIKE '%q%')
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+INDEXES = [
+    ("ix_dettagli_intervento_intervento_id", "CREATE INDEX IF NOT EXISTS ix_dettagli_intervento_intervento_id ON dettagli_intervento (intervento_id)"),
+    ("ix_movimenti_ricambi_intervento_id", "CREATE INDEX IF NOT EXISTS ix_movimenti_ricambi_intervento_id ON movimenti_ricambi (intervento_id)"),
+    ("ix_dettagli_intervento_serial_number_trgm", "CREATE INDEX IF NOT EXISTS ix_dettagli_intervento_serial_number_trgm ON dettagli_intervento USING gin (serial_number gin_trgm_ops)"),
+    ("ix_dettagli_intervento_part_number_trgm", "CREATE INDEX IF NOT EXISTS ix_dettagli_intervento_part_number_trgm ON dettagli_intervento USING gin (part_number gin_trgm_ops)"),
+    ("ix_dettagli_intervento_marca_modello_trgm", "CREATE INDEX IF NOT EXISTS ix_dettagli_intervento_marca_modello_trgm ON dettagli_intervento USING gin (marca_modello gin_trgm_ops)"),
+    ("ix_movimenti_ricambi_descrizione_trgm", "CREATE INDEX IF NOT EXISTS ix_movimenti_ricambi_descrizione_trgm ON movimenti_ricambi USING gin (descrizione gin_trgm_ops)"),
+]
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Abilito estensione pg_trgm...")
+        session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        session.commit()
+
+        for name, ddl in INDEXES:
+            print(f"🔄 Creo indice {name} (se mancante)...")
+            session.execute(text(ddl))
+            session.commit()
+
+        print("✅ Indici ricerca RIT presenti.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Migrazione per la coda dei job in background:
+- Crea la tabella jobs (se mancante)
+- Crea l'indice parziale sui job in coda usato dal worker (FOR UPDATE SKIP LOCKED)
+- Crea l'indice parziale unico su (tipo, chiave) dei job in coda (deduplica di accoda)
+
+I job vengono accodati ed eseguiti da app/services/job_queue.py (python -m app.worker).
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo tabella jobs (se mancante)...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id SERIAL PRIMARY KEY,
+                tipo VARCHAR NOT NULL,
+                payload JSONB DEFAULT '{}'::jsonb,
+                chiave VARCHAR,
+                stato VARCHAR NOT NULL DEFAULT 'in_coda',
+                tentativi INTEGER NOT NULL DEFAULT 0,
+                max_tentativi INTEGER NOT NULL DEFAULT 3,
+                esegui_dopo TIMESTAMP NOT NULL DEFAULT now(),
+                worker VARCHAR,
+                avviato_at TIMESTAMP,
+                bloccato_fino TIMESTAMP,
+                completato_at TIMESTAMP,
+                risultato JSONB,
+                ultimo_errore TEXT,
+                creato_da_id INTEGER REFERENCES utenti(id) ON DELETE SET NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """))
+        print("🔄 Creo indice sui job in coda...")
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_jobs_in_coda
+            ON jobs (tipo, esegui_dopo, id)
+            WHERE stato = 'in_coda'
+        """))
+        print("🔄 Creo indice sui job in esecuzione...")
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_jobs_in_esecuzione
+            ON jobs (tipo, bloccato_fino)
+            WHERE stato = 'in_esecuzione'
+        """))
+        print("🔄 Creo indice unico di deduplica (tipo, chiave)...")
+        session.execute(text("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_chiave_in_coda
+            ON jobs (tipo, chiave)
+            WHERE stato = 'in_coda' AND chiave IS NOT NULL
+        """))
+        session.commit()
+        print("✅ Coda job pronta.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migrazione per i PDF finali dei documenti firmati:
+- Aggiunge a interventi e ritiri_prodotti le colonne pdf_finale_path, pdf_finale_hash,
+  pdf_finale_impronta, pdf_finale_revisione e pdf_finalizzato_at
+
+I file vengono archiviati in DOCUMENTI_DIR/pdf_finali/ da app/services/pdf_finali_service.py
+(fuori da uploads/, vedi migrate_pdf_finali_privati.py):
+i documenti già firmati vengono finalizzati al primo download.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+TABELLE = ("interventi", "ritiri_prodotti")
+
+COLONNE = (
+    ("pdf_finale_path", "VARCHAR"),
+    ("pdf_finale_hash", "VARCHAR(64)"),
+    ("pdf_finale_impronta", "VARCHAR(64)"),
+    ("pdf_finale_revisione", "INTEGER NOT NULL DEFAULT 0"),
+    ("pdf_finalizzato_at", "TIMESTAMP"),
+)
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        for tabella in TABELLE:
+            print(f"🔄 Aggiungo colonne PDF finale a {tabella} (se mancanti)...")
+            for colonna, tipo in COLONNE:
+                session.execute(text(f"ALTER TABLE {tabella} ADD COLUMN IF NOT EXISTS {colonna} {tipo}"))
+        session.commit()
+        print("✅ Colonne PDF finale pronte.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Migrazione dei PDF finali fuori dalla directory pubblica:
+- Sposta i file di uploads/pdf_finali/ (servita pubblicamente su /uploads) in
+  DOCUMENTI_DIR/pdf_finali/, raggiungibile solo dagli endpoint di download
+
+pdf_finale_path resta invariato (pdf_finali/<tipo>/<id>/r<revisione>_<sha256>.pdf, ora
+relativo a DOCUMENTI_DIR). Idempotente: i file già presenti nella destinazione non
+vengono sovrascritti; un file non spostato viene rigenerato al primo download.
+"""
+import shutil
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from app.config import DOCUMENTI_DIR, UPLOADS_DIR
+
+def migrate():
+    """Esegue la migrazione"""
+    origine = UPLOADS_DIR / "pdf_finali"
+    destinazione = DOCUMENTI_DIR / "pdf_finali"
+    if not origine.is_dir():
+        print("ℹ️ Nessun PDF finale in uploads/, niente da spostare.")
+        return
+
+    print(f"🔄 Sposto i PDF finali da {origine} a {destinazione}...")
+    spostati = 0
+    for file in sorted(origine.rglob("*.pdf")):
+        target = destinazione / file.relative_to(origine)
+        if target.exists():
+            file.unlink()
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(file), str(target))
+        spostati += 1
+    # Rimuove le directory rimaste vuote (e gli eventuali .tmp di scritture interrotte)
+    shutil.rmtree(origine, ignore_errors=True)
+    print(f"✅ {spostati} PDF finali spostati in {destinazione}.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Migrazione per i GET condizionali (ETag / Last-Modified):
+- Aggiunge updated_at a clienti, interventi, ritiri_prodotti e impostazioni_azienda
+  (le righe esistenti partono dall'istante della migrazione)
+- Indice su ritiri_prodotti.updated_at per max(updated_at) (ETag di /ddt/stats)
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+TABLES = ["clienti", "interventi", "ritiri_prodotti", "impostazioni_azienda"]
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        for table in TABLES:
+            print(f"🔄 Aggiungo updated_at a {table} (se mancante)...")
+            # DEFAULT NOW() è valutato una sola volta: nessuna riscrittura della tabella
+            session.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT NOW()"
+            ))
+        session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_ritiri_prodotti_updated_at ON ritiri_prodotti (updated_at)"
+        ))
+        session.commit()
+        print("✅ Colonne updated_at pronte.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
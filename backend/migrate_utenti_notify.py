@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Migrazione per l'invalidazione della cache utenti autenticati tra processi:
+- Trigger di riga su utenti che esegue NOTIFY utenti_changed con l'email della riga
+  a ogni INSERT/UPDATE/DELETE (vecchia e nuova email se cambia)
+- Trigger di statement su TRUNCATE con payload vuoto (svuota tutta la cache)
+
+Ogni processo dell'applicazione resta in LISTEN sul canale (app/db_notify.py) e
+scarta l'utente notificato dalla cache di auth.get_current_user (app/user_cache.py).
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+CHANNEL = "utenti_changed"
+
+def _get_database_url() -> str:
+    """Ottiene DATABASE_URL dalle variabili d'ambiente"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_name = os.getenv("DB_NAME", "sistema54")
+        db_user = os.getenv("DB_USER", "postgres")
+        db_pass = os.getenv("DB_PASSWORD", "postgres")
+        return f"postgresql://{db_user}:{db_pass}@{db_host}:5432/{db_name}"
+    return db_url
+
+def migrate():
+    """Esegue la migrazione"""
+    db_url = _get_database_url()
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("🔄 Creo trigger NOTIFY su utenti...")
+        session.execute(text(f"""
+            CREATE OR REPLACE FUNCTION notify_utenti_changed()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+            BEGIN
+                IF TG_OP = 'TRUNCATE' THEN
+                    PERFORM pg_notify('{CHANNEL}', '');
+                    RETURN NULL;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.email IS NOT NULL THEN
+                    PERFORM pg_notify('{CHANNEL}', OLD.email);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.email IS NOT NULL THEN
+                    PERFORM pg_notify('{CHANNEL}', NEW.email);
+                END IF;
+                RETURN NULL;
+            END
+            $$
+        """))
+        session.execute(text("DROP TRIGGER IF EXISTS trg_utenti_notify ON utenti"))
+        session.execute(text("DROP TRIGGER IF EXISTS trg_utenti_truncate_notify ON utenti"))
+        session.execute(text("""
+            CREATE TRIGGER trg_utenti_notify
+            AFTER INSERT OR UPDATE OR DELETE ON utenti
+            FOR EACH ROW EXECUTE PROCEDURE notify_utenti_changed()
+        """))
+        session.execute(text("""
+            CREATE TRIGGER trg_utenti_truncate_notify
+            AFTER TRUNCATE ON utenti
+            FOR EACH STATEMENT EXECUTE PROCEDURE notify_utenti_changed()
+        """))
+        session.commit()
+        print(f"✅ Trigger creati: le modifiche agli utenti notificano il canale {CHANNEL}.")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Errore durante la migrazione: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    migrate()
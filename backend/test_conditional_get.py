@@ -0,0 +1,95 @@
+"""
+Test dei GET condizionali (app.http_cache) sul dettaglio intervento.
+
+- la prima risposta (200) porta ETag e Last-Modified
+- con If-None-Match uguale all'ETag la risposta è 304, senza corpo
+- dopo una modifica dell'intervento lo stesso If-None-Match riceve 200 con un ETag nuovo
+
+I dati di prova vengono inseriti in una transazione annullata al termine.
+"""
+import sys
+import os
+from datetime import datetime
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import Request, Response
+
+from app.database import SessionLocal
+from app import models
+from app.main import read_intervento
+
+SEED_TAG = "ZZETAG"
+
+
+def _request(headers=None):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    })
+
+
+def _get(db, user, intervento_id, headers=None):
+    response = Response()
+    result = read_intervento(intervento_id, _request(headers), response, db=db, current_user=user)
+    return result, response
+
+
+def seed(db):
+    cliente = models.Cliente(ragione_sociale=f"{SEED_TAG} Cliente", indirizzo="Via Test 1")
+    db.add(cliente)
+    db.flush()
+    intervento = models.Intervento(
+        numero_relazione=f"RIT-{SEED_TAG}-0001",
+        anno_riferimento=datetime.now().year,
+        cliente_id=cliente.id,
+        cliente_ragione_sociale=cliente.ragione_sociale,
+        macro_categoria=models.MacroCategoria.PRINTING,
+    )
+    db.add(intervento)
+    db.flush()
+    return intervento
+
+
+def test_etag_304_e_modifica():
+    """ETag alla prima lettura, 304 con If-None-Match, 200 dopo una modifica."""
+    print("\n" + "="*60)
+    print("TEST: GET condizionale dettaglio intervento")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        intervento = seed(db)
+        superadmin = models.Utente(nome_completo="Test", ruolo="superadmin", permessi={})
+
+        result, response = _get(db, superadmin, intervento.id)
+        etag = response.headers.get("etag")
+        assert etag and etag.startswith('"'), etag
+        assert response.headers.get("last-modified")
+        assert result.numero_relazione == f"RIT-{SEED_TAG}-0001"
+        print(f"✓ 200 con ETag {etag}")
+
+        result, _ = _get(db, superadmin, intervento.id, {"If-None-Match": etag})
+        assert isinstance(result, Response) and result.status_code == 304, result
+        assert result.headers.get("etag") == etag and not result.body
+        result, _ = _get(db, superadmin, intervento.id, {"If-None-Match": f"W/{etag}"})
+        assert result.status_code == 304
+        print("✓ 304 con If-None-Match uguale (anche in forma debole W/)")
+
+        intervento.difetto_segnalato = "Modificato dal test"
+        db.flush()
+        result, response = _get(db, superadmin, intervento.id, {"If-None-Match": etag})
+        assert not isinstance(result, Response), "304 dopo la modifica"
+        assert response.headers.get("etag") not in (None, etag)
+        print("✓ Dopo la modifica: 200 con ETag nuovo")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    test_etag_304_e_modifica()
+    print("\n✅ GET condizionali verificati")
@@ -0,0 +1,131 @@
+"""
+Test dei contatori DDT incrementali (app/services/ddt_contatori_service.py).
+
+Dopo ogni passo (creazione, riassegnazione, richiesta e accettazione di un'assegnazione,
+cambio stato, soft delete, eliminazione) i contatori aggiornati dall'hook after_flush
+devono coincidere con quelli ricostruiti da zero da ricalcola(): ricalcola() restituisce
+il numero di contatori sbagliati, che deve essere 0.
+
+Tutto avviene in una transazione annullata al termine (ricalcola blocca in scrittura
+ritiri_prodotti fino al rollback).
+"""
+import sys
+import os
+from datetime import datetime
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import models
+from app.services import ddt_contatori_service
+
+SEED_TAG = "ZZCONT"
+
+
+def _verifica(db, passo):
+    db.flush()
+    savepoint = db.begin_nested()
+    try:
+        sbagliati = ddt_contatori_service.ricalcola(db.connection())
+    finally:
+        savepoint.rollback()
+    assert sbagliati == 0, f"{passo}: {sbagliati} contatori diversi dal ricalcolo"
+    print(f"✓ {passo}: contatori uguali al ricalcolo")
+
+
+def _ricarica(db, ddt_id):
+    # Oggetto non caricato: l'hook deve leggere comunque i valori precedenti
+    db.expire_all()
+    return db.get(models.RitiroProdotto, ddt_id)
+
+
+def test_contatori_uguali_al_ricalcolo():
+    """Ogni modifica ai DDT lascia ddt_contatori uguale a ricalcola()."""
+    print("\n" + "="*60)
+    print("TEST: Contatori DDT incrementali")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        # Punto di partenza allineato (eventuali derive preesistenti del database)
+        ddt_contatori_service.ricalcola(db.connection())
+
+        cliente = models.Cliente(ragione_sociale=f"{SEED_TAG} Cliente", indirizzo="Via Test 1")
+        db.add(cliente)
+        tecnici = [
+            models.Utente(email=f"{SEED_TAG.lower()}-{n}@example.com", nome_completo=f"{SEED_TAG} {n}",
+                          ruolo=models.RuoloUtente.TECNICO, permessi={})
+            for n in range(3)
+        ]
+        db.add_all(tecnici)
+        db.flush()
+
+        def ddt(nome, **campi):
+            riga = models.RitiroProdotto(
+                numero_ddt=f"DDT-{SEED_TAG}-{nome}",
+                anno_riferimento=datetime.now().year,
+                tecnico_id=tecnici[0].id,
+                cliente_id=cliente.id,
+                cliente_ragione_sociale=cliente.ragione_sociale,
+                tipo_prodotto="Stampante",
+                difetto_segnalato="Test contatori",
+                **campi
+            )
+            db.add(riga)
+            return riga
+
+        libero = ddt("libero")
+        assegnato = ddt("assegnato", tecnico_assegnato_id=tecnici[0].id, assegnazione_stato="assegnato")
+        pending = ddt("pending")
+        db.flush()
+        ids = {"libero": libero.id, "assegnato": assegnato.id, "pending": pending.id}
+        _verifica(db, "Creazione")
+
+        riga = _ricarica(db, ids["assegnato"])
+        riga.tecnico_assegnato_id = tecnici[1].id
+        _verifica(db, "Riassegnazione")
+
+        riga = _ricarica(db, ids["pending"])
+        riga.tecnico_assegnazione_pending_id = tecnici[2].id
+        riga.assegnazione_stato = "in_attesa_accettazione"
+        _verifica(db, "Richiesta di assegnazione")
+
+        riga = _ricarica(db, ids["pending"])
+        riga.tecnico_assegnato_id = riga.tecnico_assegnazione_pending_id
+        riga.tecnico_assegnazione_pending_id = None
+        riga.assegnazione_stato = "assegnato"
+        _verifica(db, "Accettazione")
+
+        riga = _ricarica(db, ids["libero"])
+        riga.stato = "in_riparazione"
+        _verifica(db, "Cambio stato")
+
+        riga = _ricarica(db, ids["assegnato"])
+        riga.stato = "consegnato"
+        riga.tecnico_assegnato_id = None
+        riga.assegnazione_stato = "da_assegnare"
+        _verifica(db, "Cambio stato e rimozione tecnico nello stesso flush")
+
+        riga = _ricarica(db, ids["pending"])
+        riga.deleted_at = datetime.now()
+        _verifica(db, "Soft delete")
+
+        riga = _ricarica(db, ids["pending"])
+        riga.deleted_at = None
+        _verifica(db, "Ripristino")
+
+        db.delete(_ricarica(db, ids["libero"]))
+        _verifica(db, "Eliminazione")
+
+        riga = _ricarica(db, ids["assegnato"])
+        riga.difetto_appurato = "Campo non contato"
+        _verifica(db, "Modifica di un campo non contato")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    test_contatori_uguali_al_ricalcolo()
+    print("\n✅ Contatori DDT allineati al ricalcolo")
@@ -0,0 +1,163 @@
+"""
+Test dei promemoria DDT non chiusi (main.ddt_promemoria_da_inviare e ddt_reminder_log).
+
+- i candidati (DDT aperto, tecnico con email, soglia superata) arrivano da una sola query
+  qualunque sia il numero di DDT
+- le soglie già registrate in ddt_reminder_log non vengono riproposte
+- un cambio di stato (nuovo stato_since) rende di nuovo inviabili le soglie
+- il riepilogo per tecnico elenca tutti i suoi DDT in una sola email
+
+I dati di prova vengono inseriti in una transazione annullata al termine.
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import models
+from app.main import ddt_promemoria_da_inviare
+from app.services import email_service
+from test_query_count import QueryCounter
+
+SEED_TAG = "ZZDDTP"
+SOGLIE = [3, 7, 14]
+
+
+def seed(db, adesso):
+    """Due tecnici con DDT aperti da 1, 5, 10 e 20 giorni, più DDT da escludere (senza commit)."""
+    tecnici = []
+    for n in range(2):
+        tecnico = models.Utente(
+            email=f"{SEED_TAG.lower()}-{n}@example.com",
+            nome_completo=f"{SEED_TAG} Tecnico {n}",
+            ruolo=models.RuoloUtente.TECNICO,
+            permessi={},
+        )
+        db.add(tecnico)
+        tecnici.append(tecnico)
+    senza_email = models.Utente(email=None, nome_completo=f"{SEED_TAG} Senza email", ruolo=models.RuoloUtente.TECNICO, permessi={})
+    db.add(senza_email)
+    cliente = models.Cliente(ragione_sociale=f"{SEED_TAG} Cliente", indirizzo="Via Test 1")
+    db.add(cliente)
+    db.flush()
+
+    ddts = {}
+
+    def ddt(nome, giorni, tecnico, stato="in_riparazione", **extra):
+        riga = models.RitiroProdotto(
+            numero_ddt=f"DDT-{SEED_TAG}-{nome}",
+            anno_riferimento=adesso.year,
+            data_ritiro=adesso - timedelta(days=giorni + 30),
+            stato=stato,
+            stato_updated_at=adesso - timedelta(days=giorni),
+            tecnico_id=tecnici[0].id,
+            tecnico_assegnato_id=tecnico.id if tecnico else None,
+            cliente_id=cliente.id,
+            cliente_ragione_sociale=cliente.ragione_sociale,
+            tipo_prodotto="Stampante",
+            difetto_segnalato="Test promemoria",
+            **extra
+        )
+        db.add(riga)
+        ddts[nome] = riga
+
+    for n, tecnico in enumerate(tecnici):
+        for giorni in (1, 5, 10, 20):
+            ddt(f"{n}-{giorni}", giorni, tecnico)
+    ddt("consegnato", 20, tecnici[0], stato="consegnato")
+    ddt("eliminato", 20, tecnici[0], deleted_at=adesso)
+    ddt("non-assegnato", 20, None)
+    ddt("senza-email", 20, senza_email)
+    db.flush()
+    return tecnici, ddts
+
+
+def _candidati(db, adesso):
+    righe = ddt_promemoria_da_inviare(db, SOGLIE, adesso=adesso)
+    return {(ddt.numero_ddt, soglia) for ddt, _, soglia, _ in righe if ddt.numero_ddt.startswith(f"DDT-{SEED_TAG}")}, righe
+
+
+def test_candidati_e_registro():
+    """Soglie superate da una sola query, escluse quelle già registrate."""
+    print("\n" + "="*60)
+    print("TEST: Candidati promemoria DDT e registro invii")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        adesso = datetime.now()
+        tecnici, ddts = seed(db, adesso)
+
+        db.expunge_all()
+        with QueryCounter() as counter:
+            candidati, righe = _candidati(db, adesso)
+        assert counter.count == 1, f"{counter.count} query, attesa 1"
+        attesi = set()
+        for n in range(2):
+            attesi |= {(f"DDT-{SEED_TAG}-{n}-5", 3)}
+            attesi |= {(f"DDT-{SEED_TAG}-{n}-10", s) for s in (3, 7)}
+            attesi |= {(f"DDT-{SEED_TAG}-{n}-20", s) for s in (3, 7, 14)}
+        assert candidati == attesi, sorted(candidati ^ attesi)
+        print(f"✓ {len(candidati)} soglie superate su DDT aperti, assegnati e con email: 1 query")
+
+        # Registro delle soglie inviate: non vengono più proposte
+        for ddt, tecnico, soglia, stato_since in righe:
+            if ddt.numero_ddt.startswith(f"DDT-{SEED_TAG}-0-"):
+                db.add(models.DdtReminderLog(
+                    ddt_id=ddt.id, stato=ddt.stato, soglia=soglia,
+                    stato_since=stato_since, tecnico_id=tecnico.id
+                ))
+        db.flush()
+        candidati, _ = _candidati(db, adesso)
+        assert candidati == {c for c in attesi if c[0].startswith(f"DDT-{SEED_TAG}-1-")}
+        print("✓ Soglie già registrate escluse")
+
+        # Due giorni dopo: per il tecnico 0 solo le soglie superate nel frattempo
+        dopo = adesso + timedelta(days=2)
+        candidati, _ = _candidati(db, dopo)
+        assert {c for c in candidati if c[0].startswith(f"DDT-{SEED_TAG}-0-")} == {
+            (f"DDT-{SEED_TAG}-0-1", 3), (f"DDT-{SEED_TAG}-0-5", 7)
+        }, candidati
+        print("✓ Nei giorni successivi solo le soglie appena superate")
+
+        # Cambio di stato: nuovo stato_since, le soglie ripartono
+        ddt = db.get(models.RitiroProdotto, ddts["0-20"].id)
+        ddt.stato = "riparato"
+        ddt.stato_updated_at = adesso - timedelta(days=4)
+        db.flush()
+        candidati, _ = _candidati(db, adesso)
+        assert (f"DDT-{SEED_TAG}-0-20", 3) in candidati
+        assert (f"DDT-{SEED_TAG}-0-20", 7) not in candidati
+        print("✓ Cambio di stato: soglie di nuovo inviabili dal nuovo stato")
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_riepilogo_per_tecnico():
+    """Un'email per tecnico con una riga per DDT."""
+    print("\n" + "="*60)
+    print("TEST: Riepilogo promemoria per tecnico")
+    print("="*60)
+
+    ddts = [
+        {"numero_ddt": f"DDT-{SEED_TAG}-{n}", "stato": "in_riparazione", "giorni": 10 + n,
+         "cliente": f"{SEED_TAG} Cliente", "data_ritiro": datetime(2024, 1, n + 1)}
+        for n in range(3)
+    ]
+    subject, body_html = email_service.generate_ddt_ritardi_email("Mario", ddts)
+    assert subject == "Promemoria: 3 DDT non chiusi"
+    assert all(ddt["numero_ddt"] in body_html for ddt in ddts)
+    assert "02/01/2024" in body_html
+    subject, _ = email_service.generate_ddt_ritardi_email(None, ddts[:1])
+    assert subject == f"Promemoria DDT DDT-{SEED_TAG}-0 in stato in_riparazione"
+    print("✓ Oggetto e righe del riepilogo")
+
+
+if __name__ == "__main__":
+    test_candidati_e_registro()
+    test_riepilogo_per_tecnico()
+    print("\n✅ Promemoria DDT senza duplicati")
@@ -0,0 +1,103 @@
+"""
+Test della ricerca DDT lato database (search_service.apply_ddt_search).
+
+Oltre a numero DDT e cliente, la ricerca trova i DDT per i campi dei prodotti nel JSONB
+`prodotti` (funzione SQL ddt_prodotti_search_text, creata da
+migrate_ddt_prodotti_search.py / app.db_indexes):
+- seriale, marca, modello, difetti in qualunque prodotto, senza distinzione di maiuscole
+- un termine non corrisponde "a cavallo" di due campi o di due prodotti
+- % e _ nel termine sono letterali
+
+I dati di prova vengono inseriti in una transazione annullata al termine.
+"""
+import sys
+import os
+from datetime import datetime
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import models
+from app.services import search_service
+
+SEED_TAG = "ZZDSRC"
+
+PRODOTTI = {
+    "A": [
+        {"tipo_prodotto": "Stampante", "marca": "Kyocera", "modello": "TASKalfa 2554ci",
+         "serial_number": f"{SEED_TAG}-SN-0001", "difetto_segnalato": "Inceppamento carta"},
+        {"tipo_prodotto": "PC", "marca": "Lenovo", "modello": "ThinkCentre",
+         "serial_number": f"{SEED_TAG}-SN-0002", "difetto_appurato": "Alimentatore 50% guasto"},
+    ],
+    "B": [
+        {"tipo_prodotto": "Router", "marca": "Cisco", "modello": "RV340",
+         "serial_number": f"{SEED_TAG}-SN-0003", "difetto_segnalato": "Non si accende"},
+    ],
+    "C": [],
+}
+
+# (termine, DDT attesi)
+CASI = [
+    (f"{SEED_TAG}-SN-0002", {"A"}),
+    ("taskalfa", {"A"}),
+    ("INCEPPAMENTO", {"A"}),
+    ("non si accende", {"B"}),
+    (f"{SEED_TAG}-SN", {"A", "B"}),
+    ("50%", {"A"}),
+    ("5_%", set()),
+    # Fine di un campo + inizio del successivo / del prodotto successivo: nessun match
+    ("CiscoRV340", set()),
+    ("2554ciPC", set()),
+    (f"DDT-{SEED_TAG}-C", {"C"}),
+]
+
+
+def seed(db):
+    cliente = models.Cliente(ragione_sociale=f"{SEED_TAG} Cliente", indirizzo="Via Test 1")
+    tecnico = models.Utente(email=f"{SEED_TAG.lower()}@example.com", nome_completo="Test", ruolo=models.RuoloUtente.TECNICO, permessi={})
+    db.add_all([cliente, tecnico])
+    db.flush()
+    for nome, prodotti in PRODOTTI.items():
+        db.add(models.RitiroProdotto(
+            numero_ddt=f"DDT-{SEED_TAG}-{nome}",
+            anno_riferimento=datetime.now().year,
+            tecnico_id=tecnico.id,
+            cliente_id=cliente.id,
+            cliente_ragione_sociale=cliente.ragione_sociale,
+            tipo_prodotto="Vari",
+            difetto_segnalato="Test ricerca",
+            prodotti=prodotti,
+        ))
+    db.flush()
+
+
+def _cerca(db, q):
+    query = db.query(models.RitiroProdotto.numero_ddt).filter(
+        models.RitiroProdotto.numero_ddt.like(f"DDT-{SEED_TAG}-%")
+    )
+    query = search_service.apply_ddt_search(query, q)
+    return {numero.rsplit("-", 1)[1] for (numero,) in query.all()}
+
+
+def test_ricerca_prodotti():
+    """I termini trovano i DDT per i campi dei prodotti nel JSONB."""
+    print("\n" + "="*60)
+    print("TEST: Ricerca DDT sui prodotti")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        seed(db)
+        for termine, attesi in CASI:
+            trovati = _cerca(db, termine)
+            assert trovati == attesi, f"{termine!r}: trovati {sorted(trovati)}, attesi {sorted(attesi)}"
+            print(f"✓ {termine!r} -> {sorted(trovati) or 'nessuno'}")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    test_ricerca_prodotti()
+    print("\n✅ Ricerca DDT sui prodotti verificata")
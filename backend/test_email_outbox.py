@@ -0,0 +1,233 @@
+"""
+Test dell'outbox email (app/services/email_outbox.py) con un server SMTP locale.
+
+Al posto del server reale viene avviato aiosmtpd su 127.0.0.1 (pip install -r requirements-dev.txt),
+che registra connessioni, LOGIN e messaggi ricevuti:
+- un lotto di email con lo stesso PDF viene inviato su una sola sessione SMTP, con un
+  solo LOGIN, e l'allegato è salvato una sola volta
+- un destinatario rifiutato con 5xx chiude la sua riga come "fallita" senza fermare le altre
+- con il server irraggiungibile il circuit breaker si apre dopo EMAIL_OUTBOX_CB_SOGLIA
+  connessioni fallite e le righe restano in coda senza consumare tentativi
+
+Le righe di prova vengono eliminate al termine. Richiede un'outbox senza altre email
+in coda, che altrimenti verrebbero consegnate al server di prova.
+"""
+import sys
+import os
+import hashlib
+import socket
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from app.database import SessionLocal
+from app import models
+from app.services import email_outbox
+
+SEED_TAG = "zzoutbox"
+PDF_PROVA = b"%PDF-1.4\n% PDF di prova outbox\n" + b"0" * 4096
+
+
+class ServerRegistratore:
+    """Handler aiosmtpd: registra sessioni, login e messaggi; rifiuta i destinatari 'rifiuta-*'."""
+
+    def __init__(self):
+        self.sessioni = set()
+        self.login = 0
+        self.messaggi = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("rifiuta-"):
+            return "550 5.1.1 Destinatario inesistente"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessioni.add(id(session))
+        self.messaggi.append(envelope)
+        return "250 Messaggio accettato"
+
+    def autentica(self, server, session, envelope, mechanism, auth_data):
+        self.login += 1
+        return AuthResult(success=True)
+
+
+def _porta_libera() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _config(porta: int) -> dict:
+    return {
+        "host": "127.0.0.1",
+        "port": porta,
+        "username": "outbox@example.com",
+        "password": "test",
+        "use_tls": False,
+        "from_email": "outbox@example.com",
+    }
+
+
+def _accoda(db, destinatari):
+    for destinatario in destinatari:
+        email_outbox.accoda(
+            db,
+            destinatario=destinatario,
+            oggetto=f"Test outbox {destinatario}",
+            corpo_html="<p>Test outbox</p>",
+            corpo_testo="Test outbox",
+            mittente_nome="GIT - Test",
+            allegati=[("RIT-TEST.pdf", PDF_PROVA, "application/pdf")],
+        )
+    db.commit()
+
+
+def _righe(db):
+    return db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.destinatario.like(f"%{SEED_TAG}%")
+    ).order_by(models.EmailOutbox.id).all()
+
+
+def _pulisci(db):
+    db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.destinatario.like(f"%{SEED_TAG}%")
+    ).delete(synchronize_session=False)
+    db.query(models.EmailAllegato).filter(
+        models.EmailAllegato.hash == hashlib.sha256(PDF_PROVA).hexdigest()
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def _reset_circuito():
+    email_outbox._circuito.update(fallimenti_consecutivi=0, aperto_fino=0.0)
+
+
+def _prepara(db):
+    in_coda = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.stato == "in_coda",
+        ~models.EmailOutbox.destinatario.like(f"%{SEED_TAG}%")
+    ).count()
+    assert in_coda == 0, f"{in_coda} email reali in coda: verrebbero inviate al server di prova"
+    # Il drain dopo commit userebbe la configurazione SMTP reale: qui lo esegue il test
+    email_outbox.richiedi_drain = lambda: None
+    _reset_circuito()
+
+
+def test_lotto_su_una_sessione_smtp():
+    """Email con lo stesso allegato: una sessione, un LOGIN, un solo allegato salvato."""
+    print("\n" + "="*60)
+    print("TEST: Lotto inviato su una sola sessione SMTP")
+    print("="*60)
+
+    handler = ServerRegistratore()
+    porta = _porta_libera()
+    controller = Controller(
+        handler, hostname="127.0.0.1", port=porta,
+        authenticator=handler.autentica, auth_require_tls=False,
+    )
+    controller.start()
+    db = SessionLocal()
+    try:
+        _prepara(db)
+        destinatari = [f"cliente{n}-{SEED_TAG}@example.com" for n in range(5)]
+        _accoda(db, destinatari)
+
+        allegati = {a["hash"] for riga in _righe(db) for a in riga.allegati}
+        assert len(allegati) == 1, f"allegati distinti: {len(allegati)}"
+        assert db.get(models.EmailAllegato, allegati.pop()) is not None
+        print("✓ PDF salvato una sola volta per 5 destinatari")
+
+        esito = email_outbox.drain(db, config=_config(porta))
+        assert esito == {"inviate": 5, "ritentate": 0, "fallite": 0}, esito
+        assert len(handler.messaggi) == 5
+        assert len(handler.sessioni) == 1, f"sessioni SMTP: {len(handler.sessioni)}"
+        assert handler.login == 1, f"LOGIN eseguiti: {handler.login}"
+        print("✓ 5 email inviate con una sessione SMTP e un LOGIN")
+
+        db.expire_all()
+        righe = _righe(db)
+        assert all(riga.stato == "inviata" and riga.tentativi == 1 for riga in righe)
+        assert all(riga.inviata_at >= riga.created_at for riga in righe)
+        contenuto = handler.messaggi[0].content
+        assert b"RIT-TEST.pdf" in contenuto and b"Test outbox" in contenuto
+        print("✓ Righe segnate come inviate, allegato presente nel messaggio")
+    finally:
+        controller.stop()
+        _pulisci(db)
+        db.close()
+
+
+def test_rifiuto_permanente():
+    """Un destinatario rifiutato con 5xx fallisce subito, gli altri vengono inviati."""
+    print("\n" + "="*60)
+    print("TEST: Rifiuto permanente di un destinatario")
+    print("="*60)
+
+    handler = ServerRegistratore()
+    porta = _porta_libera()
+    controller = Controller(
+        handler, hostname="127.0.0.1", port=porta,
+        authenticator=handler.autentica, auth_require_tls=False,
+    )
+    controller.start()
+    db = SessionLocal()
+    try:
+        _prepara(db)
+        _accoda(db, [
+            f"ok1-{SEED_TAG}@example.com",
+            f"rifiuta-{SEED_TAG}@example.com",
+            f"ok2-{SEED_TAG}@example.com",
+        ])
+        esito = email_outbox.drain(db, config=_config(porta))
+        assert esito == {"inviate": 2, "ritentate": 0, "fallite": 1}, esito
+        assert len(handler.sessioni) == 1
+
+        db.expire_all()
+        stati = {riga.destinatario.split("-")[0]: riga for riga in _righe(db)}
+        assert stati["rifiuta"].stato == "fallita" and "550" in stati["rifiuta"].ultimo_errore
+        assert stati["ok1"].stato == stati["ok2"].stato == "inviata"
+        print("✓ Destinatario rifiutato chiuso come fallito, sessione riusata per gli altri")
+    finally:
+        controller.stop()
+        _pulisci(db)
+        db.close()
+
+
+def test_circuit_breaker():
+    """Server irraggiungibile: il circuito si apre e le righe restano in coda."""
+    print("\n" + "="*60)
+    print("TEST: Circuit breaker con server irraggiungibile")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _prepara(db)
+        _accoda(db, [f"cb{n}-{SEED_TAG}@example.com" for n in range(3)])
+        config = _config(_porta_libera())  # nessun server in ascolto
+
+        for _ in range(email_outbox.EMAIL_OUTBOX_CB_SOGLIA):
+            esito = email_outbox.drain(db, config=config)
+            assert esito == {"inviate": 0, "ritentate": 0, "fallite": 0}, esito
+        assert email_outbox._circuito_aperto(), "circuito non aperto"
+        stats = email_outbox.outbox_stats(db)
+        assert stats["circuito"]["aperto"] and stats["coda"] >= 3
+        print(f"✓ Circuito aperto dopo {email_outbox.EMAIL_OUTBOX_CB_SOGLIA} connessioni fallite")
+
+        db.expire_all()
+        assert all(riga.stato == "in_coda" and riga.tentativi == 0 for riga in _righe(db))
+        print("✓ Righe ancora in coda senza tentativi consumati")
+    finally:
+        _reset_circuito()
+        _pulisci(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    test_lotto_su_una_sessione_smtp()
+    test_rifiuto_permanente()
+    test_circuit_breaker()
+    print("\n✅ Outbox email verificata")
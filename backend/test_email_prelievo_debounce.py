@@ -0,0 +1,169 @@
+"""
+Test del debounce dell'email RIT dei prelievi copie (job_queue.posticipa e
+job_handlers.programma_email_prelievo) sul database reale.
+
+Simula raffiche di 50 letture copie sullo stesso intervento:
+- letture in sequenza e da thread concorrenti (sessioni separate, come più processi
+  API): un solo job in coda, con scadenza spostata dopo l'ultima lettura
+- durante la raffica il job non viene preso; a quiete raggiunta viene preso ed
+  eseguito una sola volta
+- con attesa_massima la scadenza non supera created_at + attesa_massima
+
+Usa un intervento inesistente per email_rit (l'handler non invia nulla) e un tipo di
+job di prova ("test_debounce") per presa ed esecuzione. I job di prova vengono
+eliminati al termine.
+"""
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import models
+from app.services import job_handlers, job_queue
+
+TIPO = "test_debounce"
+INTERVENTO_ID = -54  # inesistente: il job email_rit termina con "Intervento non trovato"
+LETTURE = 50
+esecuzioni = []
+
+
+@job_queue.handler(TIPO, concorrenza=1, max_tentativi=1, timeout=60)
+def _handler_prova(db, payload):
+    esecuzioni.append(payload)
+    return {"intervento_id": payload["intervento_id"]}
+
+
+def _pulisci(db):
+    db.query(models.Job).filter(
+        (models.Job.tipo == TIPO) | (models.Job.chiave == f"intervento:{INTERVENTO_ID}")
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def _job_in_coda(db, tipo):
+    return db.query(models.Job).filter(models.Job.tipo == tipo, models.Job.stato == "in_coda").all()
+
+
+def _lettura(intervento_id=INTERVENTO_ID):
+    """Una lettura copie: sessione e transazione proprie, come una richiesta API."""
+    db = SessionLocal()
+    try:
+        job_id = job_handlers.programma_email_prelievo(db, intervento_id)
+        db.commit()
+        return job_id
+    finally:
+        db.close()
+
+
+def test_raffica_sequenziale():
+    """50 letture in sequenza: un solo job email_rit, scadenza dopo l'ultima lettura."""
+    print("\n" + "="*60)
+    print(f"TEST: Raffica di {LETTURE} letture in sequenza")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        ids = {_lettura() for _ in range(LETTURE)}
+        ultima = datetime.now()
+        assert len(ids) == 1, ids
+        job = db.query(models.Job).filter(models.Job.chiave == f"intervento:{INTERVENTO_ID}").one()
+        assert job.stato == "in_coda" and job.tipo == "email_rit"
+        quiete = timedelta(seconds=job_handlers.EMAIL_PRELIEVO_QUIETE)
+        assert ultima + quiete - timedelta(seconds=1) <= job.esegui_dopo <= ultima + quiete, job.esegui_dopo
+        print(f"✓ {LETTURE} letture -> job {job.id}, in coda fino alle {job.esegui_dopo:%H:%M:%S.%f}")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+def test_raffica_concorrente():
+    """50 letture da thread concorrenti: l'UPSERT mantiene un solo job."""
+    print("\n" + "="*60)
+    print(f"TEST: Raffica di {LETTURE} letture concorrenti")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            ids = set(executor.map(lambda _: _lettura(), range(LETTURE)))
+        assert len(ids) == 1, ids
+        assert db.query(models.Job).filter(models.Job.chiave == f"intervento:{INTERVENTO_ID}").count() == 1
+        print(f"✓ {LETTURE} letture concorrenti -> un solo job ({ids.pop()})")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+def test_esecuzione_unica_dopo_quiete():
+    """Il job non parte durante la raffica e parte una sola volta a quiete raggiunta."""
+    print("\n" + "="*60)
+    print("TEST: Una sola esecuzione dopo il periodo di quiete")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        esecuzioni.clear()
+        quiete = 0.5
+        for _ in range(LETTURE):
+            job_queue.posticipa(db, TIPO, chiave="intervento:1", quiete=quiete, payload={"intervento_id": 1})
+            db.commit()
+            assert job_queue._prendi(db, TIPO, 1) == [], "job preso durante la raffica"
+            time.sleep(0.02)
+        print(f"✓ Nessuna presa durante {LETTURE} letture a 20 ms l'una dall'altra")
+
+        time.sleep(quiete + 0.1)
+        presi = job_queue._prendi(db, TIPO, 1)
+        assert len(presi) == 1, presi
+        assert job_queue.esegui(presi[0]) == "completati"
+        assert job_queue._prendi(db, TIPO, 1) == []
+        assert esecuzioni == [{"intervento_id": 1}], esecuzioni
+        print("✓ A quiete raggiunta: un solo job preso ed eseguito")
+
+        # Una lettura dopo l'invio programma un nuovo job (il PDF inviato non la conteneva)
+        nuovo = job_queue.posticipa(db, TIPO, chiave="intervento:1", quiete=quiete, payload={"intervento_id": 1})
+        db.commit()
+        assert nuovo != presi[0]["id"]
+        print("✓ Lettura successiva all'invio -> nuovo job")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+def test_attesa_massima():
+    """Con attesa_massima la scadenza non viene spostata oltre created_at + attesa_massima."""
+    print("\n" + "="*60)
+    print("TEST: Attesa massima")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        for _ in range(LETTURE):
+            job_id = job_queue.posticipa(
+                db, TIPO, chiave="intervento:2", quiete=60, attesa_massima=10,
+                payload={"intervento_id": 2}
+            )
+            db.commit()
+        job = db.get(models.Job, job_id)
+        assert job.esegui_dopo == job.created_at + timedelta(seconds=10), (job.created_at, job.esegui_dopo)
+        assert len(_job_in_coda(db, TIPO)) == 1
+        print(f"✓ Scadenza limitata a created_at + 10s ({job.esegui_dopo:%H:%M:%S})")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    test_raffica_sequenziale()
+    test_raffica_concorrente()
+    test_esecuzione_unica_dopo_quiete()
+    test_attesa_massima()
+    print("\n✅ Debounce email prelievo copie verificato")
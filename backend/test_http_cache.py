@@ -0,0 +1,180 @@
+"""
+Test delle richieste Range sui file archiviati (app.http_cache).
+
+- _byte_range: intervallo singolo, suffisso ("bytes=-N"), aperto ("bytes=N-"),
+  fuori dal file (ValueError -> 416), sintassi non valida o più intervalli (None)
+- file_response: 206 con Content-Range/Content-Length, 416 con "bytes */<size>",
+  200 con il file intero per Range ignorati o If-Range non più valido, 304 con ETag
+- GZipSenzaPDF: i download PDF e le richieste Range non vengono compressi
+
+Non usa il database: il file di prova è temporaneo.
+"""
+import sys
+import os
+import asyncio
+import tempfile
+from pathlib import Path
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+
+from app.http_cache import GZipSenzaPDF, _byte_range, file_response
+
+SIZE = 1000
+CONTENUTO = bytes(n % 251 for n in range(SIZE))
+ETAG = '"abc123"'
+
+# (header Range, intervallo atteso; None = ignorato, ValueError = 416)
+CASI_RANGE = [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-100", (100, 100)),
+    ("bytes=900-5000", (900, SIZE - 1)),
+    ("bytes=-100", (900, SIZE - 1)),
+    ("bytes=-5000", (0, SIZE - 1)),
+    ("bytes=500-", (500, SIZE - 1)),
+    ("BYTES = 10-19", (10, 19)),
+    ("bytes=1000-", ValueError),
+    ("bytes=2000-3000", ValueError),
+    ("bytes=-0", ValueError),
+    ("bytes=5-2", None),
+    ("bytes=0-9,20-29", None),
+    ("bytes=-", None),
+    ("bytes=a-b", None),
+    ("bytes=10", None),
+    ("items=0-9", None),
+]
+
+
+def _scope(path="/", headers=None):
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+def _esegui(app, scope):
+    """Esegue un'app ASGI (o una Response) e restituisce (status, headers, corpo)."""
+    messaggi = []
+
+    async def send(message):
+        messaggi.append(message)
+
+    asyncio.run(app(scope, _receive, send))
+    start = messaggi[0]
+    headers = {k.decode().lower(): v.decode() for k, v in start["headers"]}
+    corpo = b"".join(m.get("body", b"") for m in messaggi[1:])
+    return start["status"], headers, corpo
+
+
+def _scarica(path, headers=None):
+    scope = _scope(headers=headers)
+    response = file_response(Request(scope), path, "application/pdf", ETAG)
+    return _esegui(response, scope)
+
+
+def test_byte_range():
+    """Intervalli validi, non soddisfacibili e ignorati."""
+    print("\n" + "="*60)
+    print("TEST: Parsing dell'header Range")
+    print("="*60)
+
+    for header, atteso in CASI_RANGE:
+        if atteso is ValueError:
+            try:
+                _byte_range(header, SIZE)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{header!r}: atteso 416")
+        else:
+            assert _byte_range(header, SIZE) == atteso, f"{header!r}: {_byte_range(header, SIZE)}"
+        print(f"✓ {header!r} -> {getattr(atteso, '__name__', atteso)}")
+
+    try:
+        _byte_range("bytes=-10", 0)
+    except ValueError:
+        print("✓ Suffisso su file vuoto -> 416")
+    else:
+        raise AssertionError("bytes=-10 su file vuoto: atteso 416")
+
+
+def test_file_response():
+    """206, 416, 200 e 304 sul file archiviato."""
+    print("\n" + "="*60)
+    print("TEST: file_response con Range e If-Range")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "r1_abc123.pdf"
+        path.write_bytes(CONTENUTO)
+
+        status, headers, corpo = _scarica(path)
+        assert status == 200 and corpo == CONTENUTO
+        assert headers["etag"] == ETAG and headers["accept-ranges"] == "bytes"
+        assert "content-encoding" not in headers
+        print("✓ Senza Range: 200 con il file intero, ETag e Accept-Ranges")
+
+        for header, inizio, fine in (("bytes=0-99", 0, 99), ("bytes=-100", 900, 999), ("bytes=500-", 500, 999)):
+            status, headers, corpo = _scarica(path, {"Range": header})
+            assert status == 206, (header, status)
+            assert headers["content-range"] == f"bytes {inizio}-{fine}/{SIZE}"
+            assert headers["content-length"] == str(fine - inizio + 1)
+            assert corpo == CONTENUTO[inizio:fine + 1]
+            print(f"✓ {header}: 206 bytes {inizio}-{fine}/{SIZE}")
+
+        status, headers, corpo = _scarica(path, {"Range": "bytes=2000-"})
+        assert status == 416 and headers["content-range"] == f"bytes */{SIZE}"
+        print("✓ Fuori dal file: 416 con Content-Range bytes */size")
+
+        for header in ("bytes=5-2", "bytes=0-9,20-29", "bytes=abc"):
+            status, headers, corpo = _scarica(path, {"Range": header})
+            assert status == 200 and corpo == CONTENUTO and "content-range" not in headers, header
+        print("✓ Range non valido o a più intervalli: 200 con il file intero")
+
+        status, _, corpo = _scarica(path, {"Range": "bytes=0-9", "If-Range": ETAG})
+        assert status == 206 and corpo == CONTENUTO[:10]
+        status, _, corpo = _scarica(path, {"Range": "bytes=0-9", "If-Range": '"vecchio"'})
+        assert status == 200 and corpo == CONTENUTO
+        print("✓ If-Range uguale all'ETag: 206; If-Range non più valido: 200")
+
+        status, headers, corpo = _scarica(path, {"If-None-Match": ETAG, "Range": "bytes=0-9"})
+        assert status == 304 and corpo == b"" and headers["etag"] == ETAG
+        print("✓ If-None-Match uguale all'ETag: 304")
+
+
+def test_gzip_senza_pdf():
+    """Compressione solo per le risposte che non sono PDF né Range."""
+    print("\n" + "="*60)
+    print("TEST: GZip escluso per PDF e Range")
+    print("="*60)
+
+    app = GZipSenzaPDF(PlainTextResponse("x" * 2000), minimum_size=500)
+    gzip = {"Accept-Encoding": "gzip"}
+
+    _, headers, _ = _esegui(app, _scope("/interventi", gzip))
+    assert headers.get("content-encoding") == "gzip"
+    print("✓ JSON/testo: compresso")
+
+    _, headers, corpo = _esegui(app, _scope("/ddt/1/pdf", gzip))
+    assert "content-encoding" not in headers and corpo == b"x" * 2000
+    print("✓ Download PDF: non compresso")
+
+    _, headers, _ = _esegui(app, _scope("/interventi", {**gzip, "Range": "bytes=0-9"}))
+    assert "content-encoding" not in headers
+    print("✓ Richiesta con Range: non compressa")
+
+
+if __name__ == "__main__":
+    test_byte_range()
+    test_file_response()
+    test_gzip_senza_pdf()
+    print("\n✅ Range, If-Range e GZip sui file archiviati verificati")
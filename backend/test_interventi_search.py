@@ -0,0 +1,134 @@
+"""
+Test di regressione per la ricerca RIT lato database.
+
+Confronta i risultati di search_service.apply_interventi_search con la vecchia
+implementazione Python (scansione di tutti gli interventi + lazy-load di dettagli e
+ricambi) su dati di prova inseriti in una transazione che viene annullata al termine.
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import or_, desc
+
+from app.database import SessionLocal
+from app import models
+from app.services import search_service
+
+SEED_TAG = "ZZSRCH"
+
+QUERIES = [
+    SEED_TAG,
+    f"{SEED_TAG}-SN",
+    "sn-0042",
+    "pn-77",
+    "laserjet",
+    "toner",
+    "ROSSI",
+    "rit-zzsrch",
+    "nessun-match-qui",
+    "50%",
+    "a_b",
+    "  fusore  ",
+]
+
+
+def legacy_search_ids(db, q: str) -> list:
+    """Implementazione originale di read_interventi (prima della ricerca in SQL)."""
+    base_query = db.query(models.Intervento).filter(models.Intervento.deleted_at.is_(None))
+    if q and q.strip():
+        search_term = f"%{q.strip()}%"
+        raw_term = q.strip().lower()
+
+        interventi_matching = base_query.all()
+        matching_ids = set()
+
+        for intervento in interventi_matching:
+            for dettaglio in intervento.dettagli:
+                if (dettaglio.serial_number and raw_term in (dettaglio.serial_number or '').lower()) or \
+                   (dettaglio.part_number and raw_term in (dettaglio.part_number or '').lower()) or \
+                   (dettaglio.marca_modello and raw_term in (dettaglio.marca_modello or '').lower()):
+                    matching_ids.add(intervento.id)
+                    break
+
+            for ricambio in intervento.ricambi_utilizzati:
+                if ricambio.descrizione and raw_term in ricambio.descrizione.lower():
+                    matching_ids.add(intervento.id)
+                    break
+
+        filters = [
+            models.Intervento.numero_relazione.ilike(search_term),
+            models.Intervento.cliente_ragione_sociale.ilike(search_term)
+        ]
+        if matching_ids:
+            filters.append(models.Intervento.id.in_(matching_ids))
+        base_query = base_query.filter(or_(*filters))
+    return [i.id for i in base_query.order_by(desc(models.Intervento.data_creazione), models.Intervento.id).all()]
+
+
+def sql_search_ids(db, q: str) -> list:
+    base_query = db.query(models.Intervento.id).filter(models.Intervento.deleted_at.is_(None))
+    base_query = search_service.apply_interventi_search(base_query, q)
+    return [row.id for row in base_query.order_by(desc(models.Intervento.data_creazione), models.Intervento.id).all()]
+
+
+def seed_interventi(db, count: int = 60) -> None:
+    """Inserisce interventi di prova con dettagli e ricambi (senza commit)."""
+    now = datetime.now()
+    marche = ["HP LaserJet Pro", "Kyocera Ecosys", "Brother HL", "Canon i-SENSYS"]
+    ricambi = ["Toner nero", "Fusore 220V", "Kit manutenzione 50% usura", "Rullo a_b pescaggio"]
+    for n in range(count):
+        intervento = models.Intervento(
+            numero_relazione=f"RIT-{SEED_TAG}-{n:04d}",
+            anno_riferimento=now.year,
+            data_creazione=now - timedelta(minutes=n),
+            cliente_ragione_sociale=f"{SEED_TAG} Cliente {'Rossi' if n % 5 == 0 else 'Bianchi'} {n}",
+            macro_categoria=models.MacroCategoria.PRINTING,
+            deleted_at=now if n % 17 == 0 else None,
+        )
+        db.add(intervento)
+        db.flush()
+        if n % 3 != 0:
+            db.add(models.DettaglioIntervento(
+                intervento_id=intervento.id,
+                marca_modello=marche[n % len(marche)],
+                serial_number=f"{SEED_TAG}-SN-{n:04d}" if n % 4 else None,
+                part_number=f"PN-{n * 7}" if n % 2 else None,
+                descrizione_lavoro="Test ricerca",
+            ))
+        if n % 4 == 1:
+            db.add(models.MovimentoRicambio(
+                intervento_id=intervento.id,
+                descrizione=ricambi[n % len(ricambi)],
+                quantita=1,
+                prezzo_unitario=10.0,
+                prezzo_applicato=10.0,
+            ))
+    db.flush()
+
+
+def test_ricerca_sql_equivale_a_legacy():
+    """La ricerca SQL deve restituire esattamente gli stessi interventi della vecchia scansione Python."""
+    print("\n" + "="*60)
+    print("TEST: Ricerca RIT SQL vs legacy")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        seed_interventi(db)
+        for q in QUERIES:
+            legacy = legacy_search_ids(db, q)
+            nuova = sql_search_ids(db, q)
+            assert legacy == nuova, f"Risultati diversi per q={q!r}: legacy={len(legacy)} sql={len(nuova)}"
+            print(f"✓ q={q!r}: {len(nuova)} risultati")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    test_ricerca_sql_equivale_a_legacy()
+    print("\n✅ Ricerca RIT: risultati identici al percorso legacy")
@@ -0,0 +1,165 @@
+"""
+Test della coda job (app/services/job_queue.py) sul database reale.
+
+Usa un tipo di job di prova registrato solo qui ("test_coda"):
+- accoda con la stessa chiave restituisce il job già in coda
+- un handler che fallisce viene ritentato con backoff e chiuso come "fallito" a
+  max_tentativi; gli effetti dell'handler fallito non vengono confermati
+- la concorrenza del tipo vale per tutte le prese: con un job in esecuzione e
+  concorrenza 1 non ne viene preso un secondo
+- un job in esecuzione oltre il timeout torna in coda
+
+I job di prova vengono eliminati al termine.
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import models
+from app.services import job_queue
+
+TIPO = "test_coda"
+esecuzioni = []
+
+
+@job_queue.handler(TIPO, concorrenza=1, max_tentativi=2, timeout=60)
+def _handler_prova(db, payload):
+    esecuzioni.append(payload)
+    if payload.get("fallisci"):
+        # Effetto che non deve sopravvivere al rollback del job fallito
+        job_queue.accoda(db, TIPO, {"effetto": True})
+        raise RuntimeError("errore di prova")
+    return {"ok": True, "n": payload.get("n")}
+
+
+def _pulisci(db):
+    db.query(models.Job).filter(models.Job.tipo == TIPO).delete(synchronize_session=False)
+    db.commit()
+
+
+def _prendi_tutti(db, slot=10):
+    return job_queue._prendi(db, TIPO, slot)
+
+
+def test_deduplica_chiave():
+    """Due accodamenti con la stessa chiave: un solo job in coda."""
+    print("\n" + "="*60)
+    print("TEST: Deduplica per chiave")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        primo = job_queue.accoda(db, TIPO, {"n": 1}, chiave="k1")
+        secondo = job_queue.accoda(db, TIPO, {"n": 2}, chiave="k1")
+        altro = job_queue.accoda(db, TIPO, {"n": 3}, chiave="k2")
+        db.commit()
+        assert primo == secondo, (primo, secondo)
+        assert altro != primo
+        assert db.query(models.Job).filter(models.Job.tipo == TIPO).count() == 2
+        print("✓ Stessa chiave -> stesso job, chiave diversa -> nuovo job")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+def test_retry_e_fallimento():
+    """Handler che fallisce: ritentato con backoff, poi fallito a max_tentativi."""
+    print("\n" + "="*60)
+    print("TEST: Retry con backoff e fallimento")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        job_id = job_queue.accoda(db, TIPO, {"fallisci": True})
+        db.commit()
+
+        presi = _prendi_tutti(db)
+        assert [job["id"] for job in presi] == [job_id]
+        assert job_queue.esegui(presi[0]) == "ritentati"
+        db.expire_all()
+        job = db.get(models.Job, job_id)
+        assert job.stato == "in_coda" and job.tentativi == 1
+        assert job.esegui_dopo > datetime.now() and "errore di prova" in job.ultimo_errore
+        assert db.query(models.Job).filter(models.Job.tipo == TIPO).count() == 1, "effetto dell'handler confermato"
+        print(f"✓ Primo errore: job riprogrammato alle {job.esegui_dopo:%H:%M:%S}, effetti annullati")
+
+        assert _prendi_tutti(db) == [], "job preso prima della fine del backoff"
+        job.esegui_dopo = datetime.now()
+        db.commit()
+        assert job_queue.esegui(_prendi_tutti(db)[0]) == "falliti"
+        db.expire_all()
+        job = db.get(models.Job, job_id)
+        assert job.stato == "fallito" and job.tentativi == 2 and job.completato_at is not None
+        print("✓ Secondo errore: job chiuso come fallito")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+def test_concorrenza_e_completamento():
+    """Concorrenza 1: un solo job in esecuzione; il risultato dell'handler viene salvato."""
+    print("\n" + "="*60)
+    print("TEST: Concorrenza per tipo e completamento")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        ids = [job_queue.accoda(db, TIPO, {"n": n}) for n in range(3)]
+        db.commit()
+
+        presi = _prendi_tutti(db)
+        assert len(presi) == 1 and presi[0]["id"] == ids[0], presi
+        assert _prendi_tutti(db) == [], "superata la concorrenza del tipo"
+        print("✓ Con un job in esecuzione e concorrenza 1 non ne viene preso un altro")
+
+        assert job_queue.esegui(presi[0]) == "completati"
+        db.expire_all()
+        job = db.get(models.Job, ids[0])
+        assert job.stato == "completato" and job.risultato == {"ok": True, "n": 0}
+        assert [job["id"] for job in _prendi_tutti(db)] == [ids[1]]
+        print("✓ Job completato con risultato, slot liberato per il successivo")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+def test_recupero_abbandonati():
+    """Job in esecuzione oltre il timeout: torna in coda."""
+    print("\n" + "="*60)
+    print("TEST: Recupero job abbandonati")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        _pulisci(db)
+        job_id = job_queue.accoda(db, TIPO, {"n": 1})
+        db.commit()
+        _prendi_tutti(db)
+        db.query(models.Job).filter(models.Job.id == job_id).update({
+            "bloccato_fino": datetime.now() - timedelta(seconds=1)
+        })
+        db.commit()
+
+        assert job_queue.recupera_abbandonati(db) >= 1
+        job = db.get(models.Job, job_id)
+        db.refresh(job)
+        assert job.stato == "in_coda" and "timeout" in job.ultimo_errore
+        print("✓ Job abbandonato rimesso in coda")
+    finally:
+        _pulisci(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    test_deduplica_chiave()
+    test_retry_e_fallimento()
+    test_concorrenza_e_completamento()
+    test_recupero_abbandonati()
+    print("\n✅ Coda job verificata")
@@ -0,0 +1,228 @@
+"""
+Test del numero di query SQL eseguite dagli endpoint elenco.
+
+Con il caricamento eager (selectinload / joinedload) il numero di query di una pagina
+non deve dipendere dal numero di righe: ogni endpoint viene chiamato con due dimensioni
+di pagina diverse e deve eseguire sempre lo stesso numero fisso di query.
+I dati di prova vengono inseriti in una transazione annullata al termine.
+"""
+import sys
+import os
+import json
+from datetime import datetime, timedelta
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from app.database import SessionLocal, engine
+from app import models
+from app.main import (
+    read_interventi,
+    read_interventi_paginated,
+    list_ddt,
+    list_ddt_paginated,
+    list_oldest_ddt,
+    search_clienti,
+    search_clienti_paginated,
+)
+
+SEED_TAG = "ZZQCNT"
+SEED_COUNT = 40
+PAGE_SIZES = (5, 30)
+
+# Query attese per pagina (indipendenti dalla dimensione della pagina)
+EXPECTED_QUERIES = {
+    "/interventi/": 3,             # pagina + dettagli + ricambi
+    "/interventi/paginated": 4,    # count + pagina + dettagli + ricambi
+    "/ddt/": 1,                    # pagina con JOIN sui tecnici
+    "/ddt/paginated": 2,           # count + pagina con JOIN sui tecnici
+    "/ddt/oldest": 1,              # pagina con JOIN sui tecnici
+    "/clienti/": 3,                # pagina + sedi + asset noleggio
+    "/clienti/paginated": 4,       # count + pagina + sedi + asset noleggio
+}
+
+
+class QueryCounter:
+    """Conta le query eseguite sull'engine dentro un blocco `with`."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._on_execute)
+
+
+def seed(db):
+    """Inserisce clienti, tecnici, interventi e DDT di prova (senza commit)."""
+    now = datetime.now()
+    tecnici = []
+    for n in range(3):
+        tecnico = models.Utente(
+            email=f"{SEED_TAG.lower()}-{n}@example.com",
+            nome_completo=f"{SEED_TAG} Tecnico {n}",
+            ruolo=models.RuoloUtente.TECNICO,
+            permessi={},
+        )
+        db.add(tecnico)
+        tecnici.append(tecnico)
+    db.flush()
+
+    for n in range(SEED_COUNT):
+        cliente = models.Cliente(ragione_sociale=f"{SEED_TAG} Cliente {n:04d}", indirizzo="Via Test 1")
+        db.add(cliente)
+        db.flush()
+        db.add(models.SedeCliente(cliente_id=cliente.id, nome_sede=f"Sede {n}", indirizzo_completo="Via Test 2"))
+
+        intervento = models.Intervento(
+            numero_relazione=f"RIT-{SEED_TAG}-{n:04d}",
+            anno_riferimento=now.year,
+            data_creazione=now + timedelta(days=1, minutes=n),
+            cliente_id=cliente.id,
+            cliente_ragione_sociale=cliente.ragione_sociale,
+            macro_categoria=models.MacroCategoria.PRINTING,
+        )
+        db.add(intervento)
+        db.flush()
+        for k in range(2):
+            db.add(models.DettaglioIntervento(
+                intervento_id=intervento.id,
+                marca_modello=f"Modello {k}",
+                descrizione_lavoro="Test query count",
+            ))
+        db.add(models.MovimentoRicambio(
+            intervento_id=intervento.id,
+            descrizione="Toner",
+            quantita=1,
+            prezzo_unitario=10.0,
+            prezzo_applicato=10.0,
+        ))
+
+        db.add(models.RitiroProdotto(
+            numero_ddt=f"DDT-{SEED_TAG}-{n:04d}",
+            anno_riferimento=now.year,
+            data_ritiro=now - timedelta(days=3650, minutes=n),
+            tecnico_id=tecnici[n % 3].id,
+            tecnico_assegnato_id=tecnici[(n + 1) % 3].id,
+            tecnico_assegnazione_pending_id=tecnici[(n + 2) % 3].id if n % 2 else None,
+            cliente_id=cliente.id,
+            cliente_ragione_sociale=cliente.ragione_sociale,
+            tipo_prodotto="Stampante",
+            difetto_segnalato="Test query count",
+        ))
+    db.flush()
+
+
+# Con ?fields= le relazioni non richieste non vengono caricate: (fields, query attese, chiavi attese)
+SPARSE_EXPECTED = {
+    "/interventi/paginated": ("numero_relazione,dettagli", 3, {"id", "numero_relazione", "dettagli"}),
+    "/ddt/paginated": ("numero_ddt,stato", 2, {"id", "numero_ddt", "stato"}),
+    "/clienti/": ("ragione_sociale", 1, {"id", "ragione_sociale"}),
+    "/clienti/paginated": ("ragione_sociale,sedi", 3, {"id", "ragione_sociale", "sedi"}),
+}
+
+
+def call_endpoint(name, db, user, limit, fields=None):
+    paging = dict(skip=0, limit=limit, fields=fields, db=db, current_user=user)
+    if name == "/interventi/":
+        return read_interventi(q="", **paging)
+    if name == "/interventi/paginated":
+        return read_interventi_paginated(
+            q="", today=False, date=None, date_from=None, date_to=None,
+            cursor=None, total_mode="exact", total_cap=1000, **paging
+        )
+    if name == "/ddt/":
+        return list_ddt(q="", stato=None, **paging)
+    if name == "/ddt/paginated":
+        return list_ddt_paginated(
+            q="", stato=None, today=False, date=None, date_from=None, date_to=None,
+            assigned=None, assigned_to=None, assignment_state=None,
+            cursor=None, total_mode="exact", total_cap=1000, **paging
+        )
+    if name == "/ddt/oldest":
+        return list_oldest_ddt(limit=limit, exclude_consegnato=True, db=db, current_user=user)
+    if name == "/clienti/":
+        return search_clienti(q=SEED_TAG, **paging)
+    if name == "/clienti/paginated":
+        return search_clienti_paginated(q=SEED_TAG, total_mode="exact", total_cap=1000, **paging)
+    raise ValueError(name)
+
+
+def test_query_count_fisso_per_endpoint():
+    """Ogni endpoint elenco esegue lo stesso numero di query con pagine da 5 o da 30 righe."""
+    print("\n" + "="*60)
+    print("TEST: Numero query per endpoint elenco")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        seed(db)
+        # Identity map vuota: le relazioni devono essere caricate dagli endpoint
+        db.expunge_all()
+        superadmin = models.Utente(nome_completo="Test", ruolo="superadmin", permessi={})
+
+        for name, expected in EXPECTED_QUERIES.items():
+            counts = []
+            for limit in PAGE_SIZES:
+                db.expunge_all()
+                with QueryCounter() as counter:
+                    result = call_endpoint(name, db, superadmin, limit)
+                body = json.loads(result.body) if hasattr(result, "body") else result
+                items = body["items"] if isinstance(body, dict) else body
+                assert len(items) == limit, f"{name}: attese {limit} righe, ottenute {len(items)}"
+                counts.append(counter.count)
+            assert counts == [expected] * len(PAGE_SIZES), f"{name}: query {counts}, attese {expected}"
+            print(f"✓ {name}: {expected} query per pagina")
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_sparse_fieldsets():
+    """Con ?fields= il payload contiene solo i campi richiesti e le relazioni non richieste non generano query."""
+    print("\n" + "="*60)
+    print("TEST: Sparse fieldsets (?fields=)")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        seed(db)
+        superadmin = models.Utente(nome_completo="Test", ruolo="superadmin", permessi={})
+
+        for name, (fields, expected, keys) in SPARSE_EXPECTED.items():
+            for limit in PAGE_SIZES:
+                db.expunge_all()
+                with QueryCounter() as counter:
+                    result = call_endpoint(name, db, superadmin, limit, fields=fields)
+                body = json.loads(result.body)
+                items = body["items"] if isinstance(body, dict) else body
+                assert len(items) == limit, f"{name}: attese {limit} righe, ottenute {len(items)}"
+                assert all(set(item) == keys for item in items), f"{name}: chiavi {sorted(items[0])}, attese {sorted(keys)}"
+                assert counter.count == expected, f"{name}?fields={fields}: {counter.count} query, attese {expected}"
+            print(f"✓ {name}?fields={fields}: {expected} query, campi {sorted(keys)}")
+
+        try:
+            call_endpoint("/clienti/", db, superadmin, 5, fields="ragione_sociale,inesistente")
+            raise AssertionError("campo sconosciuto accettato")
+        except HTTPException as e:
+            assert e.status_code == 400
+        print("✓ Campo sconosciuto rifiutato con 400")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    test_query_count_fisso_per_endpoint()
+    test_sparse_fieldsets()
+    print("\n✅ Endpoint elenco senza N+1")
@@ -0,0 +1,114 @@
+"""
+Test della query delle scadenze letture copie (main.asset_letture_in_scadenza).
+
+Gli asset in scadenza vengono calcolati con una sola query qualunque sia il numero di
+asset: il risultato deve coincidere con il calcolo asset per asset (ultima lettura,
+altrimenti data installazione, più i giorni della cadenza) fatto in Python.
+I dati di prova vengono inseriti in una transazione annullata al termine.
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Aggiungi il percorso dell'app al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import models
+from app.main import asset_letture_in_scadenza, get_giorni_da_cadenza
+from test_query_count import QueryCounter
+
+SEED_TAG = "ZZLETT"
+SEED_COUNT = 60
+SOGLIE = [7, 14, 30]
+CADENZE = ["mensile", "bimestrale", "trimestrale", "semestrale", None, "", "sconosciuta"]
+
+
+def seed(db, adesso):
+    """Asset Printing con cadenze diverse, con e senza letture (senza commit)."""
+    cliente = models.Cliente(ragione_sociale=f"{SEED_TAG} Cliente", indirizzo="Via Test 1")
+    db.add(cliente)
+    db.flush()
+    assets = []
+    for n in range(SEED_COUNT):
+        cadenza = CADENZE[n % len(CADENZE)]
+        giorni = get_giorni_da_cadenza(cadenza)
+        soglia = SOGLIE[n % len(SOGLIE)]
+        # Metà degli asset scade esattamente a una soglia, gli altri un giorno dopo
+        scostamento = 0 if n % 2 == 0 else 1
+        riferimento = adesso + timedelta(days=soglia + scostamento - giorni)
+        asset = models.AssetCliente(
+            cliente_id=cliente.id,
+            tipo_asset="Printing",
+            marca=SEED_TAG,
+            modello=f"Modello {n}",
+            matricola=f"{SEED_TAG}-{n:04d}",
+            cadenza_letture_copie=cadenza,
+            data_installazione=riferimento if n % 3 == 0 else adesso - timedelta(days=2000),
+        )
+        db.add(asset)
+        db.flush()
+        if n % 3 != 0:
+            # Letture più vecchie prima dell'ultima: conta solo la più recente
+            for k in (40, 20, 0):
+                db.add(models.LetturaCopie(
+                    asset_id=asset.id,
+                    data_lettura=riferimento - timedelta(days=k),
+                    contatore_bn=1000 - k,
+                ))
+        assets.append(asset)
+    # Asset IT: mai considerato
+    db.add(models.AssetCliente(cliente_id=cliente.id, tipo_asset="IT", marca=SEED_TAG, data_installazione=adesso))
+    db.flush()
+    return assets
+
+
+def atteso(db, assets, adesso):
+    """Calcolo asset per asset, come il vecchio controllo."""
+    ids = set()
+    for asset in assets:
+        ultima = db.query(models.LetturaCopie).filter(
+            models.LetturaCopie.asset_id == asset.id
+        ).order_by(models.LetturaCopie.data_lettura.desc()).first()
+        riferimento = ultima.data_lettura if ultima else (asset.data_installazione or adesso)
+        scadenza = riferimento + timedelta(days=get_giorni_da_cadenza(asset.cadenza_letture_copie))
+        if (scadenza.date() - adesso.date()).days in SOGLIE:
+            ids.add(asset.id)
+    return ids
+
+
+def test_scadenze_una_query():
+    """Stessi asset del calcolo asset per asset, con una sola query."""
+    print("\n" + "="*60)
+    print("TEST: Scadenze letture copie in una query")
+    print("="*60)
+
+    db = SessionLocal()
+    try:
+        adesso = datetime.now()
+        assets = seed(db, adesso)
+        ids_attesi = atteso(db, assets, adesso)
+        assert len(ids_attesi) == SEED_COUNT // 2, len(ids_attesi)
+
+        db.expunge_all()
+        with QueryCounter() as counter:
+            righe = asset_letture_in_scadenza(db, SOGLIE, adesso=adesso)
+        assert counter.count == 1, f"{counter.count} query, attesa 1"
+        righe = [riga for riga in righe if riga[0].marca == SEED_TAG]
+        assert {riga[0].id for riga in righe} == ids_attesi
+        print(f"✓ {len(righe)} asset in scadenza su {SEED_COUNT}, 1 query")
+
+        for asset, ragione_sociale, cadenza, data_riferimento, ultima_lettura, scadenza in righe:
+            assert ragione_sociale == f"{SEED_TAG} Cliente"
+            assert cadenza == (asset.cadenza_letture_copie or "trimestrale")
+            assert scadenza == data_riferimento + timedelta(days=get_giorni_da_cadenza(cadenza))
+            assert (ultima_lettura is None) == (asset.data_installazione == data_riferimento)
+        print("✓ Cadenza, data di riferimento e scadenza come nel calcolo in Python")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    test_scadenze_una_query()
+    print("\n✅ Scadenze letture copie senza N+1")